@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'data_with_pi.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'data_with_pi.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'PBL_LeafMed.urls'
@@ -125,6 +127,138 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 
 PI_API_BASE_URL = os.getenv('PI_API_BASE_URL', 'http://192.168.137.251:8001')
+
+# Lượt xem Recipe được gom trong bộ nhớ và ghi DB theo lô (giây / số lượt)
+RECIPE_POPULARITY_FLUSH_INTERVAL = float(os.getenv('RECIPE_POPULARITY_FLUSH_INTERVAL', '30'))
+RECIPE_POPULARITY_FLUSH_THRESHOLD = int(os.getenv('RECIPE_POPULARITY_FLUSH_THRESHOLD', '100'))
+
+# Cache (mặc định LocMem theo process; production nên dùng Redis/Memcached dùng chung giữa các worker
+# để signal xóa cache có hiệu lực trên mọi worker)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'pbl-leafmed'),
+    }
+}
+# Thời gian giữ cache fragment / phiên bản của trang danh mục (giây)
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '3600'))
+# Trạng thái camera gộp (/api/camera/status/) được cache bấy nhiêu giây: các lần poll trong khoảng này
+# (kể cả trả 304) không gọi Pi; đổi mode/settings/preset/resolution qua server xóa cache ngay
+CAMERA_STATE_CACHE_SECONDS = int(os.getenv('CAMERA_STATE_CACHE_SECONDS', '5'))
+
+# Cache ảnh chụp từ Pi trên đĩa của server (proxy /api/pi/image/)
+PI_IMAGE_CACHE_DIR = Path(os.getenv('PI_IMAGE_CACHE_DIR', BASE_DIR / 'pi_image_cache'))
+PI_IMAGE_CACHE_MAX_BYTES = int(os.getenv('PI_IMAGE_CACHE_MAX_MB', '512')) * 1024 * 1024
+
+# Feed trạng thái Pi (SSE): chu kỳ poll Pi (giây) và các field bỏ qua khi so sánh snapshot
+PI_STATUS_POLL_INTERVAL = float(os.getenv('PI_STATUS_POLL_INTERVAL', '2'))
+PI_STATUS_IGNORED_FIELDS = [f for f in os.getenv('PI_STATUS_IGNORED_FIELDS', 'timestamp,uptime').split(',') if f]
+# Thời gian tối đa một kết nối SSE (giây) - trình duyệt tự kết nối lại (EventSource) và nhận snapshot mới.
+# Mỗi kết nối giữ một worker/thread suốt thời gian này: chạy gunicorn với worker gthread
+# (VD: -k gthread --threads 16) hoặc ASGI; worker sync chỉ vài tab đang mở là hết worker
+PI_STATUS_STREAM_MAX_AGE = int(os.getenv('PI_STATUS_STREAM_MAX_AGE', '25'))
+
+# Nhiều trạm Pi (bảng PiDevice): số lỗi liên tiếp để tạm loại một trạm, thời gian chờ trước khi thử lại,
+# số trạm thử tối đa cho một request phân tích và thời gian cache danh sách trạm (giây)
+PI_FLEET_FAILURE_THRESHOLD = int(os.getenv('PI_FLEET_FAILURE_THRESHOLD', '3'))
+PI_FLEET_COOLDOWN = float(os.getenv('PI_FLEET_COOLDOWN', '30'))
+PI_FLEET_MAX_ATTEMPTS = int(os.getenv('PI_FLEET_MAX_ATTEMPTS', '2'))
+PI_FLEET_REGISTRY_TTL = float(os.getenv('PI_FLEET_REGISTRY_TTL', '30'))
+# Số ảnh upload song song khi phân loại nhiều lá một lúc
+PI_FLEET_BATCH_WORKERS = int(os.getenv('PI_FLEET_BATCH_WORKERS', '4'))
+# Số kết nối keep-alive tối đa tới mỗi Pi
+PI_CLIENT_POOL_SIZE = int(os.getenv('PI_CLIENT_POOL_SIZE', '10'))
+
+# Classifier cục bộ trên server (cùng trọng số với Pi) - nhận việc khi hàng đợi Pi >= QUEUE_DEPTH hoặc Pi lỗi
+LOCAL_CLASSIFIER_ENABLED = os.getenv('LOCAL_CLASSIFIER_ENABLED', 'False').lower() in ('1', 'true', 'yes')
+LOCAL_CLASSIFIER_MODEL_PATH = Path(os.getenv('LOCAL_CLASSIFIER_MODEL_PATH', BASE_DIR / 'model' / 'classifier.pt'))
+LOCAL_CLASSIFIER_IMGSZ = int(os.getenv('LOCAL_CLASSIFIER_IMGSZ', '224'))
+LOCAL_CLASSIFIER_QUEUE_DEPTH = int(os.getenv('LOCAL_CLASSIFIER_QUEUE_DEPTH', '2'))
+
+# Đo hiệu năng mỗi request (Server-Timing + log JSON qua logger 'data_with_pi.perf');
+# request chậm hơn PERF_SLOW_REQUEST_MS được log ở mức WARNING
+PERF_ENABLED = os.getenv('PERF_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+PERF_SLOW_REQUEST_MS = float(os.getenv('PERF_SLOW_REQUEST_MS', '1000'))
+# Header Server-Timing lộ thời gian DB / Pi / YOLO: chỉ gửi cho staff, hoặc cho mọi người khi bật
+# PERF_SERVER_TIMING (mặc định theo DEBUG). Log và histogram luôn được ghi.
+PERF_SERVER_TIMING = os.getenv('PERF_SERVER_TIMING', str(DEBUG)).lower() in ('1', 'true', 'yes')
+
+# Endpoint /metrics (Prometheus): chỉ staff, hoặc scraper gửi header "Authorization: Bearer <METRICS_TOKEN>"
+# (METRICS_TOKEN rỗng -> chỉ staff đăng nhập mới xem được).
+# Chạy nhiều worker: đặt biến môi trường PROMETHEUS_MULTIPROC_DIR (thư mục rỗng, xóa khi khởi động lại)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Model YOLO phát hiện lá: load nền khi worker khởi động + warm-up, tự load lại khi file thay đổi
+# (kiểm tra mỗi YOLO_RELOAD_INTERVAL giây, 0 = tắt). Request đầu tiên chờ tối đa YOLO_LOAD_WAIT giây.
+YOLO_MODEL_PATH = Path(os.getenv('YOLO_MODEL_PATH', BASE_DIR / 'model' / 'best.pt'))
+YOLO_PRELOAD = os.getenv('YOLO_PRELOAD', 'True').lower() in ('1', 'true', 'yes')
+YOLO_WARMUP_SIZE = int(os.getenv('YOLO_WARMUP_SIZE', '640'))
+YOLO_RELOAD_INTERVAL = float(os.getenv('YOLO_RELOAD_INTERVAL', '5'))
+YOLO_LOAD_WAIT = float(os.getenv('YOLO_LOAD_WAIT', '30'))
+
+# Suy luận theo ô cho frame lớn (cạnh dài > YOLO_TILE_THRESHOLD px, 0 = tắt): ô YOLO_TILE_SIZE px chồng lấn
+# YOLO_TILE_OVERLAP (0 <= overlap < 1), chạy theo lô YOLO_TILE_BATCH ô. Mảnh lá bị đường nối cắt cụt được
+# ghép khi IoS > YOLO_TILE_SEAM_THRESHOLD, sau đó NMS (IoU > YOLO_TILE_NMS_THRESHOLD) bỏ box trùng.
+# YOLO_TILE_FULL_FRAME: thêm một lượt cả frame (thu nhỏ) cho lá lớn hơn một ô
+YOLO_TILE_THRESHOLD = int(os.getenv('YOLO_TILE_THRESHOLD', '1280'))
+YOLO_TILE_SIZE = int(os.getenv('YOLO_TILE_SIZE', '640'))
+YOLO_TILE_OVERLAP = float(os.getenv('YOLO_TILE_OVERLAP', '0.2'))
+YOLO_TILE_BATCH = int(os.getenv('YOLO_TILE_BATCH', '8'))
+YOLO_TILE_NMS_THRESHOLD = float(os.getenv('YOLO_TILE_NMS_THRESHOLD', '0.5'))
+YOLO_TILE_SEAM_THRESHOLD = float(os.getenv('YOLO_TILE_SEAM_THRESHOLD', '0.5'))
+YOLO_TILE_FULL_FRAME = os.getenv('YOLO_TILE_FULL_FRAME', 'True').lower() in ('1', 'true', 'yes')
+
+# Điều khiển tải phát hiện lá liên tục (api_detect_leaves), theo từng worker:
+# tối đa DETECTION_MAX_CONCURRENT inference + DETECTION_MAX_QUEUE request chờ (vượt -> 503 + Retry-After).
+# Độ trễ > DETECTION_TARGET_LATENCY_MS hoặc có hàng đợi -> giảm imgsz theo DETECTION_IMGSZ_LEVELS
+# và giãn chu kỳ quét mỗi stream (DETECTION_MIN_INTERVAL_MS..DETECTION_MAX_INTERVAL_MS); dư tải -> tăng lại
+DETECTION_IMGSZ_LEVELS = [int(v) for v in os.getenv('DETECTION_IMGSZ_LEVELS', '640,512,416,320').split(',')]
+DETECTION_TARGET_LATENCY_MS = float(os.getenv('DETECTION_TARGET_LATENCY_MS', '500'))
+DETECTION_MIN_INTERVAL_MS = int(os.getenv('DETECTION_MIN_INTERVAL_MS', '500'))
+DETECTION_MAX_INTERVAL_MS = int(os.getenv('DETECTION_MAX_INTERVAL_MS', '5000'))
+DETECTION_MAX_CONCURRENT = int(os.getenv('DETECTION_MAX_CONCURRENT', '1'))
+DETECTION_MAX_QUEUE = int(os.getenv('DETECTION_MAX_QUEUE', '4'))
+DETECTION_QUEUE_TIMEOUT = float(os.getenv('DETECTION_QUEUE_TIMEOUT', '10'))
+DETECTION_ADJUST_COOLDOWN = float(os.getenv('DETECTION_ADJUST_COOLDOWN', '3'))
+
+# Ring buffer frame trong shared memory (manage.py grab_frames): web worker đọc frame mới nhất
+# của stream từ đây thay vì mở lại stream; frame cũ hơn FRAME_RING_MAX_AGE giây -> đọc stream trực tiếp
+FRAME_RING_ENABLED = os.getenv('FRAME_RING_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+FRAME_RING_SLOTS = int(os.getenv('FRAME_RING_SLOTS', '8'))
+FRAME_RING_MAX_WIDTH = int(os.getenv('FRAME_RING_MAX_WIDTH', '1920'))
+FRAME_RING_MAX_HEIGHT = int(os.getenv('FRAME_RING_MAX_HEIGHT', '1080'))
+FRAME_RING_MAX_AGE = float(os.getenv('FRAME_RING_MAX_AGE', '1.0'))
+
+# Mã hóa / giải mã JPEG (services/image_codec.py): auto = turbojpeg (nếu có PyTurboJPEG + libturbojpeg),
+# rồi opencv, rồi pil. Subsampling: 444 / 422 / 420 / gray
+IMAGE_CODEC_BACKEND = os.getenv('IMAGE_CODEC_BACKEND', 'auto')
+TURBOJPEG_LIB_PATH = os.getenv('TURBOJPEG_LIB_PATH', '')  # Để trống: tự tìm libturbojpeg
+IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', '85'))
+IMAGE_JPEG_SUBSAMPLING = os.getenv('IMAGE_JPEG_SUBSAMPLING', '420')
+IMAGE_THUMB_QUALITY = int(os.getenv('IMAGE_THUMB_QUALITY', '75'))
+YOLO_PREVIEW_QUALITY = int(os.getenv('YOLO_PREVIEW_QUALITY', '80'))  # Ảnh preview có vẽ bounding box
+# Đọc frame từ stream: codec = tách JPEG từ MJPEG + image_codec (lỗi thì về OpenCV), opencv = cv2.VideoCapture
+YOLO_STREAM_DECODER = os.getenv('YOLO_STREAM_DECODER', 'codec')
+# Ảnh upload gửi Pi để phân loại: JPEG có cạnh dài lớn hơn được thu nhỏ (0 = gửi ảnh gốc)
+IMAGE_UPLOAD_MAX_SIDE = int(os.getenv('IMAGE_UPLOAD_MAX_SIDE', '1280'))
+# Lọc ảnh gần trùng (dedup_images, build_video_dataset --dedup): perceptual hash 64 bit (phash / dhash),
+# hai ảnh cách nhau <= DEDUP_RADIUS bit được xem là trùng
+DEDUP_HASH = os.getenv('DEDUP_HASH', 'phash')
+DEDUP_RADIUS = int(os.getenv('DEDUP_RADIUS', '4'))
+
+# Profiling view theo yêu cầu (trang /staff/profiles/). Khi PROFILING_ENABLED:
+# - header "X-LeafMed-Profile: 1" từ staff (hoặc giá trị = PROFILING_TOKEN) profile request đó
+# - PROFILING_SAMPLE_RATE (0..1) lấy mẫu ngẫu nhiên các route trong PROFILING_ROUTES (rỗng = mọi route)
+# PROFILING_MODE: 'sampling' (.folded cho flamegraph/speedscope) hoặc 'cprofile' (.prof cho snakeviz)
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() in ('1', 'true', 'yes')
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_ROUTES = [r for r in os.getenv('PROFILING_ROUTES', 'api_detect_leaves,api_crop_leaf').split(',') if r]
+PROFILING_MODE = os.getenv('PROFILING_MODE', 'sampling')
+PROFILING_INTERVAL_MS = float(os.getenv('PROFILING_INTERVAL_MS', '5'))
+PROFILING_DIR = Path(os.getenv('PROFILING_DIR', BASE_DIR / 'profiles'))
+PROFILING_KEEP = int(os.getenv('PROFILING_KEEP', '200'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
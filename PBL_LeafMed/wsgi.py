@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PBL_LeafMed.settings')
 
 application = get_wsgi_application()
+
+# Load model YOLO nền ngay khi worker khởi động (YOLO_PRELOAD)
+from data_with_pi.services.model_lifecycle import preload_models  # noqa: E402
+
+preload_models()
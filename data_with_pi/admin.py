@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Plant, CaptureResult, UserCameraPreset, Recipe, RecipeImage
+from .models import (
+    Plant, CaptureResult, UserCameraPreset, Recipe, RecipeImage, PiDevice,
+    PlantCaptureStats, UserPlantCaptureStats, DailyPlantCaptureStats,
+)
 
 @admin.register(Plant)
 class PlantAdmin(admin.ModelAdmin):
@@ -45,6 +48,23 @@ class UserCameraPresetAdmin(admin.ModelAdmin):
         }),
     )
 
+@admin.register(PiDevice)
+class PiDeviceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'base_url', 'location', 'is_active', 'accepts_inference', 'get_health', 'updated_at')
+    list_filter = ('is_active', 'accepts_inference')
+    search_fields = ('name', 'base_url', 'location')
+    filter_horizontal = ('users',)
+    readonly_fields = ('created_at', 'updated_at')
+
+    def get_health(self, obj):
+        """Sức khỏe của trạm trong process hiện tại (theo các request gần nhất)"""
+        from .services.pi_fleet import pi_fleet
+        device = pi_fleet.device_for_url(obj.base_url)
+        if device is None:
+            return '-'
+        return f"{'OK' if device.healthy else 'Lỗi'} · hàng đợi {device.in_flight}"
+    get_health.short_description = 'Sức khỏe'
+
 class RecipeImageInline(admin.TabularInline):
     """Inline để thêm nhiều ảnh cho Recipe"""
     model = RecipeImage
@@ -101,4 +121,45 @@ class RecipeImageAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'caption', 'order', 'uploaded_at')
     list_filter = ('uploaded_at', 'recipe__plant')
     search_fields = ('recipe__name', 'caption')
-    ordering = ['recipe', 'order'] 
\ No newline at end of file
+    ordering = ['recipe', 'order'] 
+
+
+class CaptureStatsAdmin(admin.ModelAdmin):
+    """Bảng thống kê chỉ đọc - dữ liệu được cập nhật tự động từ CaptureResult"""
+    readonly_fields = ('capture_count', 'confidence_count', 'confidence_sum',
+                       'confidence_min', 'confidence_max', 'last_seen_at')
+
+    def get_confidence_avg(self, obj):
+        """Độ tin cậy trung bình"""
+        avg = obj.confidence_avg
+        return f'{avg:.3f}' if avg is not None else '-'
+    get_confidence_avg.short_description = 'Độ tin cậy TB'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PlantCaptureStats)
+class PlantCaptureStatsAdmin(CaptureStatsAdmin):
+    list_display = ('plant', 'capture_count', 'get_confidence_avg', 'confidence_min', 'confidence_max', 'last_seen_at')
+    search_fields = ('plant__name', 'plant__scientific_name')
+    list_select_related = ('plant',)
+
+
+@admin.register(UserPlantCaptureStats)
+class UserPlantCaptureStatsAdmin(CaptureStatsAdmin):
+    list_display = ('user', 'plant', 'capture_count', 'get_confidence_avg', 'confidence_min', 'confidence_max', 'last_seen_at')
+    list_filter = ('plant',)
+    search_fields = ('user__username', 'plant__name')
+    list_select_related = ('user', 'plant')
+
+
+@admin.register(DailyPlantCaptureStats)
+class DailyPlantCaptureStatsAdmin(CaptureStatsAdmin):
+    list_display = ('day', 'plant', 'capture_count', 'get_confidence_avg', 'confidence_min', 'confidence_max', 'last_seen_at')
+    list_filter = ('day', 'plant')
+    date_hierarchy = 'day'
+    list_select_related = ('plant',)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DataWithPiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'data_with_pi'
+
+    def ready(self):
+        from . import signals  # noqa: F401
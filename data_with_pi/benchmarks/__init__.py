@@ -0,0 +1,4 @@
+"""
+Bộ benchmark tái lập được: Pi giả (fake_pi), dữ liệu cố định (fixtures) và các kịch bản (scenarios)
+Chạy: python manage.py run_benchmarks --output bench.json
+"""
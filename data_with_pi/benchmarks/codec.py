@@ -0,0 +1,81 @@
+"""
+Benchmark codec JPEG: đường hiện tại so với services/image_codec
+- encode: cv2.imencode mặc định (quality 95) / PIL (như trước) so với image_codec theo từng backend,
+  với quality / subsampling cấu hình -> độ trễ + kích thước file
+- decode: giải mã đủ kích thước rồi resize so với giải mã thu nhỏ trong miền DCT (target_side)
+- upload: shrink_jpeg (thu nhỏ ảnh upload trước khi gửi Pi)
+"""
+import time
+from io import BytesIO
+from typing import Callable, Dict, List, Optional
+
+from ..services import image_codec
+from .scenarios import summarize
+
+
+def _measure(func: Callable[[bytes], object], inputs: List, repeats: int) -> Dict:
+    func(inputs[0])  # warm-up
+    samples, output_bytes = [], 0
+    for _ in range(repeats):
+        for item in inputs:
+            started = time.perf_counter()
+            output = func(item)
+            samples.append((time.perf_counter() - started) * 1000)
+            if isinstance(output, (bytes, bytearray)):
+                output_bytes += len(output)
+    summary = summarize(samples, 0, sum(samples) / 1000)
+    if output_bytes:
+        summary['mean_bytes'] = round(output_bytes / len(samples))
+    return summary
+
+
+def _baseline_encode(image) -> bytes:
+    """Đường cũ: cv2.imencode mặc định nếu có OpenCV, không thì PIL"""
+    try:
+        import cv2
+    except ImportError:
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.fromarray(image[:, :, ::-1]).save(buffer, 'JPEG', quality=95)
+        return buffer.getvalue()
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+def _baseline_decode_resize(target_side: int) -> Callable[[bytes], object]:
+    """Đường cũ: giải mã đủ kích thước (PIL như các view upload) rồi resize"""
+    from PIL import Image
+
+    def decode(data: bytes):
+        with Image.open(BytesIO(data)) as image:
+            image = image.convert('RGB')
+            image.thumbnail((target_side, target_side), Image.BILINEAR)
+            return image
+    return decode
+
+
+def compare_codecs(jpegs: List[bytes], repeats: int = 5, quality: Optional[int] = None,
+                   subsampling: Optional[str] = None, target_side: int = 640) -> Dict:
+    """Chạy mọi backend đang có trên cùng bộ ảnh, trả về {phép đo: {đường: thống kê}}"""
+    backends = image_codec.available_backends()
+    frames = [image_codec.decode_jpeg(data, using='pil') for data in jpegs]
+
+    report = {'backends': list(backends), 'encode': {}, 'decode': {}, 'upload_shrink': {}}
+    report['encode']['baseline'] = _measure(_baseline_encode, frames, repeats)
+    for name in backends:
+        report['encode'][name] = _measure(
+            lambda image, name=name: image_codec.encode_jpeg(image, quality, subsampling, using=name),
+            frames, repeats)
+
+    report['decode']['baseline_full_resize'] = _measure(_baseline_decode_resize(target_side), jpegs, repeats)
+    for name in backends:
+        report['decode'][f'{name}_full'] = _measure(
+            lambda data, name=name: image_codec.decode_jpeg(data, using=name), jpegs, repeats)
+        report['decode'][f'{name}_dct_scaled'] = _measure(
+            lambda data, name=name: image_codec.decode_jpeg(data, target_side=target_side, using=name),
+            jpegs, repeats)
+
+    report['upload_shrink']['original_mean_bytes'] = round(sum(map(len, jpegs)) / len(jpegs))
+    report['upload_shrink']['shrink_jpeg'] = _measure(
+        lambda data: image_codec.shrink_jpeg(data, target_side, quality), jpegs, repeats)
+    return report
@@ -0,0 +1,312 @@
+"""
+Pi giả chạy trên máy local (thay cho Pi thật ở 192.168.137.251 khi test / benchmark)
+- Cài đặt đủ các endpoint mà PiClient dùng
+- Độ trễ cấu hình được theo endpoint (mặc định gần giống Pi thật) + jitter
+- Tỉ lệ lỗi ngẫu nhiên (HTTP 503) hoặc lỗi toàn bộ (fail=True)
+- /stream/live: stream MJPEG phát lại các frame đã ghi (hoặc ảnh tổng hợp)
+- /video/list, /video/download/<tên>: một video MJPEG (các frame nối tiếp) để test lệnh build_video_dataset
+
+Chạy độc lập: python manage.py fake_pi --port 8001
+"""
+import base64
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import unquote, urlsplit
+
+from .fixtures import LABELS, load_frames
+
+# Độ trễ mặc định (giây) - đo trên Pi 4 chạy model phân loại
+DEFAULT_LATENCY = {
+    '/capture/preview': 0.15,
+    '/capture/analyze': 0.6,
+    '/upload': 0.7,
+    '/control/restart_camera': 1.0,
+    '/control/reload_model': 2.0,
+}
+DEFAULT_ENDPOINT_LATENCY = 0.01
+
+BOUNDARY = 'frame'
+
+
+def endpoint_key(path: str) -> str:
+    """Bỏ query và tên file: '/history/image/a.jpg' -> '/history/image'"""
+    path = urlsplit(path).path.rstrip('/') or '/'
+    if path.startswith('/history/image/'):
+        return '/history/image'
+    if path.startswith('/video/download/'):
+        return '/video/download'
+    return path
+
+
+class FakePiServer:
+    """
+    Args:
+        latency: Độ trễ theo endpoint (dict) ghi đè DEFAULT_LATENCY, hoặc một số áp dụng cho mọi endpoint
+        latency_scale: Nhân hệ số độ trễ (0 -> không chờ, chỉ đo phía Django)
+        jitter: Biên độ dao động tương đối của độ trễ (0.2 -> ±20%)
+        failure_rate: Xác suất trả về 503 cho mỗi request
+        frames_dir: Thư mục ảnh .jpg dùng cho capture / stream
+        fps: Số frame mỗi giây của stream MJPEG
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency=None, latency_scale: float = 1.0,
+                 jitter: float = 0.0, failure_rate: float = 0.0, frames_dir=None, fps: float = 10.0,
+                 seed: Optional[int] = None):
+        if isinstance(latency, (int, float)):
+            self.latency: Dict[str, float] = {'*': float(latency)}
+        else:
+            self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.latency_scale = latency_scale
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.fail = False
+        self.fps = fps
+        self.frames = load_frames(frames_dir)
+        # Video "đã quay": mỗi frame lặp lại vài lần như camera quay cảnh ít thay đổi
+        self.videos: Dict[str, bytes] = {'recording_001.mjpeg': b''.join(
+            frame for frame in self.frames for _ in range(5))}
+        self.hits = Counter()
+        self.streaming = True
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._captures = itertools.count(1)
+        self._files: Dict[str, bytes] = {}
+        self._thread: Optional[threading.Thread] = None
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakePiServer':
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-pi', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self.server.serve_forever()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---------- Hành vi ----------
+
+    def _delay(self, key: str) -> float:
+        base = self.latency.get(key, self.latency.get('*', DEFAULT_ENDPOINT_LATENCY))
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter) if self.jitter else 1
+        return max(0.0, base * factor * self.latency_scale)
+
+    def _should_fail(self) -> bool:
+        if self.fail:
+            return True
+        with self._lock:
+            return self.failure_rate > 0 and self._random.random() < self.failure_rate
+
+    def _classify(self) -> Dict:
+        with self._lock:
+            return {'name': self._random.choice(LABELS), 'confidence': round(self._random.uniform(0.55, 0.99), 4)}
+
+    def _new_capture(self, prefix: str, data: Optional[bytes] = None) -> str:
+        number = next(self._captures)
+        filename = f'{prefix}_{number:06d}.jpg'
+        self._files[filename] = data if data is not None else self.frames[number % len(self.frames)]
+        return filename
+
+    def _image(self, filename: str) -> Optional[bytes]:
+        return self._files.get(filename) or (self.frames[0] if filename.endswith('.jpg') else None)
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str) -> None:
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, payload, status: int = 200) -> None:
+                self._send(status, json.dumps(payload).encode('utf-8'), 'application/json')
+
+            def _read_body(self) -> bytes:
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length) if length else b''
+
+            def _dispatch(self, method: str) -> None:
+                key = endpoint_key(self.path)
+                body = self._read_body() if method in ('POST', 'PUT') else b''
+                with fake._lock:
+                    fake.hits[key] += 1
+                if key == '/stream/live' and method == 'GET':
+                    return self._stream()
+                time.sleep(fake._delay(key))
+                if fake._should_fail():
+                    return self._json({'detail': 'Fake Pi failure'}, status=503)
+                handler = ROUTES.get((method, key))
+                if handler is None:
+                    return self._json({'detail': 'Not Found'}, status=404)
+                handler(self, body)
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+            def do_PUT(self):
+                self._dispatch('PUT')
+
+            def _stream(self) -> None:
+                self.send_response(200)
+                self.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={BOUNDARY}')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                interval = 1.0 / fake.fps if fake.fps > 0 else 0
+                try:
+                    for frame in itertools.cycle(fake.frames):
+                        self.wfile.write(
+                            f'--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(frame)}\r\n\r\n'.encode()
+                        )
+                        self.wfile.write(frame)
+                        self.wfile.write(b'\r\n')
+                        time.sleep(interval)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                self.close_connection = True
+
+            # ---------- Endpoint ----------
+
+            def status(self, body):
+                self._json({
+                    'camera': {'state': 'ready' if fake.streaming else 'paused'},
+                    'model_loaded': True,
+                    'streaming': fake.streaming,
+                    'timestamp': time.time(),
+                })
+
+            def pause(self, body):
+                fake.streaming = False
+                self._json({'success': True, 'streaming': False})
+
+            def resume(self, body):
+                fake.streaming = True
+                self._json({'success': True, 'streaming': True})
+
+            def preview(self, body):
+                filename = fake._new_capture('capture')
+                self._json({
+                    'success': True,
+                    'file': filename,
+                    'image_url': f'/history/image/{filename}',
+                    'image_b64_thumbnail': base64.b64encode(fake._files[filename][:2048]).decode('ascii'),
+                })
+
+            def analyze(self, body):
+                filename = dict(pair.split('=', 1) for pair in body.decode().split('&') if '=' in pair).get('filename', '')
+                self._json({'success': True, 'file': filename, **fake._classify()})
+
+            def upload(self, body):
+                filename = fake._new_capture('upload')
+                self._json({'success': True, 'file': filename, 'image_url': f'/history/image/{filename}', **fake._classify()})
+
+            def history(self, body):
+                files = sorted(fake._files, reverse=True)[:100]
+                self._json({'success': True, 'files': [{'file': name} for name in files]})
+
+            def history_image(self, body):
+                data = fake._image(self.path.rsplit('/', 1)[-1])
+                if data is None:
+                    return self._json({'detail': 'Not Found'}, status=404)
+                self._send(200, data, 'image/jpeg')
+
+            def settings(self, body):
+                self._json({'mode': 'auto', 'resolution': '640x480', 'framerate': 30})
+
+            def camera_settings(self, body):
+                self._json({'ExposureTime': 10000, 'AnalogueGain': 1.0, 'Brightness': 0.0})
+
+            def presets(self, body):
+                self._json({'presets': ['default', 'indoor', 'outdoor']})
+
+            def resolution(self, body):
+                self._json({'current': '640x480', 'width': 640, 'height': 480})
+
+            def resolution_profiles(self, body):
+                self._json({'profiles': ['640x480', '1280x720', '1920x1080']})
+
+            def ui_definitions(self, body):
+                self._json({'definitions': {'brightness': {'min': -1, 'max': 1, 'step': 0.1}}})
+
+            def ui_current(self, body):
+                self._json({'brightness': 0.0})
+
+            def video_status(self, body):
+                self._json({'recording': False})
+
+            def video_list(self, body):
+                self._json({'success': True, 'videos': [
+                    {'filename': name, 'size': len(data)} for name, data in fake.videos.items()
+                ]})
+
+            def video_download(self, body):
+                data = fake.videos.get(unquote(self.path.rsplit('/', 1)[-1]))
+                if data is None:
+                    return self._json({'detail': 'Not Found'}, status=404)
+                self._send(200, data, 'video/x-motion-jpeg')
+
+            def ok(self, body):
+                self._json({'success': True})
+
+        ROUTES = {
+            ('GET', '/status'): Handler.status,
+            ('POST', '/stream/pause'): Handler.pause,
+            ('POST', '/stream/resume'): Handler.resume,
+            ('POST', '/capture/preview'): Handler.preview,
+            ('POST', '/capture/analyze'): Handler.analyze,
+            ('POST', '/upload'): Handler.upload,
+            ('GET', '/history'): Handler.history,
+            ('GET', '/history/image'): Handler.history_image,
+            ('GET', '/settings'): Handler.settings,
+            ('PUT', '/settings'): Handler.ok,
+            ('POST', '/settings/mode'): Handler.ok,
+            ('GET', '/settings/current'): Handler.camera_settings,
+            ('POST', '/settings/preset'): Handler.ok,
+            ('GET', '/settings/presets'): Handler.presets,
+            ('GET', '/settings/resolution'): Handler.resolution,
+            ('POST', '/settings/resolution'): Handler.ok,
+            ('GET', '/settings/resolution/profiles'): Handler.resolution_profiles,
+            ('GET', '/settings/ui/definitions'): Handler.ui_definitions,
+            ('GET', '/settings/ui/current'): Handler.ui_current,
+            ('POST', '/settings/ui/apply'): Handler.ok,
+            ('POST', '/control/restart_camera'): Handler.ok,
+            ('POST', '/control/reload_model'): Handler.ok,
+            ('POST', '/video/start'): Handler.ok,
+            ('POST', '/video/stop'): Handler.ok,
+            ('GET', '/video/status'): Handler.video_status,
+            ('GET', '/video/list'): Handler.video_list,
+            ('GET', '/video/download'): Handler.video_download,
+        }
+        return Handler
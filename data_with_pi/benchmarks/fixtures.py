@@ -0,0 +1,98 @@
+"""
+Dữ liệu cố định cho benchmark
+- Ảnh lá tổng hợp (PIL, seed cố định -> giống hệt nhau giữa các lần chạy / commit)
+- Model YOLO fixture: kiến trúc yolov8n với trọng số khởi tạo (không cần tải best.pt),
+  đủ để đo thời gian inference
+"""
+import random
+from io import BytesIO
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFilter
+
+FRAME_SIZE = (640, 480)
+Box = Tuple[int, int, int, int]
+LABELS = ('Ocimum basilicum', 'Mentha arvensis', 'Aloe vera', 'Centella asiatica', 'Piper betle')
+
+
+def synthetic_leaf_scene(seed: int, size: Tuple[int, int] = FRAME_SIZE, leaves: int = 3,
+                         leaf_scale: Optional[Tuple[float, float]] = None) -> Tuple[Image.Image, List[Box]]:
+    """
+    Một frame nền đất/bàn với vài chiếc lá hình elip màu xanh, kèm box (x1, y1, x2, y2) của từng lá.
+    leaf_scale: chiều rộng lá tối thiểu / tối đa theo tỉ lệ chiều rộng frame (lá nhỏ -> thử suy luận theo ô).
+    Mặc định giữ cách sinh ban đầu (ảnh giống hệt các lần chạy trước).
+    """
+    rng = random.Random(seed)
+    width, height = size
+    background = tuple(rng.randint(90, 140) for _ in range(3))
+    image = Image.new('RGB', size, background)
+    draw = ImageDraw.Draw(image)
+
+    boxes = []
+    for _ in range(leaves):
+        if leaf_scale is None:
+            w = rng.randint(width // 8, width // 4)
+            h = rng.randint(height // 6, height // 3)
+        else:
+            w = max(4, rng.randint(int(width * leaf_scale[0]), int(width * leaf_scale[1])))
+            h = min(height - 1, max(4, int(w * rng.uniform(0.8, 1.6))))
+        x = rng.randint(0, width - w)
+        y = rng.randint(0, height - h)
+        green = (rng.randint(20, 70), rng.randint(110, 200), rng.randint(20, 70))
+        draw.ellipse((x, y, x + w, y + h), fill=green)
+        # Gân lá
+        draw.line((x + w // 2, y, x + w // 2, y + h), fill=(green[0] + 40, min(255, green[1] + 40), green[2] + 40), width=2)
+        boxes.append((x, y, x + w, y + h))
+
+    return image.filter(ImageFilter.GaussianBlur(1)), boxes
+
+
+def synthetic_leaf_image(seed: int, size: Tuple[int, int] = FRAME_SIZE, leaves: int = 3) -> Image.Image:
+    """Một frame nền đất/bàn với vài chiếc lá hình elip màu xanh"""
+    return synthetic_leaf_scene(seed, size, leaves)[0]
+
+
+def synthetic_leaf_jpegs(count: int = 8, size: Tuple[int, int] = FRAME_SIZE, quality: int = 85) -> List[bytes]:
+    """count frame JPEG (seed 0..count-1)"""
+    frames = []
+    for seed in range(count):
+        buffer = BytesIO()
+        synthetic_leaf_image(seed, size).save(buffer, 'JPEG', quality=quality)
+        frames.append(buffer.getvalue())
+    return frames
+
+
+def load_frames(frames_dir=None, count: int = 8) -> List[bytes]:
+    """Frame JPEG đã ghi sẵn trong frames_dir (nếu có), ngược lại sinh ảnh tổng hợp"""
+    if frames_dir:
+        paths = sorted(Path(frames_dir).glob('*.jpg')) + sorted(Path(frames_dir).glob('*.jpeg'))
+        if paths:
+            return [path.read_bytes() for path in paths]
+    return synthetic_leaf_jpegs(count)
+
+
+def write_fixture_images(directory, count: int = 8) -> List[Path]:
+    """Ghi ảnh fixture ra thư mục (dùng làm frame cho fake Pi hoặc ảnh upload)"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i, data in enumerate(synthetic_leaf_jpegs(count)):
+        path = directory / f'leaf_{i:03d}.jpg'
+        path.write_bytes(data)
+        paths.append(path)
+    return paths
+
+
+def build_fixture_yolo_model(path, architecture: str = 'yolov8n.yaml') -> Path:
+    """
+    Tạo file model YOLO fixture (cần ultralytics). Trọng số chưa huấn luyện nên không
+    phát hiện lá thật, nhưng thời gian inference giống model cùng kiến trúc.
+    """
+    from ultralytics import YOLO
+
+    path = Path(path)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        YOLO(architecture).save(str(path))
+    return path
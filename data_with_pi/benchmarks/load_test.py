@@ -0,0 +1,225 @@
+"""
+Load test qua HTTP cho server Django đang chạy (nên trỏ Pi tới FakePiServer)
+- Mỗi user ảo đăng nhập bằng form /login/ (có CSRF) rồi lặp lại các phiên làm việc
+  theo tỉ lệ trong mix (xem SESSIONS)
+- Tăng dần số user đồng thời theo từng mức (stage), mỗi mức chạy trong một khoảng thời gian
+- Mỗi mức: throughput, tỉ lệ lỗi, p50/p95/p99 (tổng và theo từng action)
+- Điểm bão hòa: mức đầu tiên mà throughput không còn tăng đáng kể, p95 vượt ngưỡng
+  hoặc tỉ lệ lỗi vượt ngưỡng
+"""
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+from .fixtures import synthetic_leaf_jpegs
+from .scenarios import summarize
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+# Phiên làm việc: chuỗi action như người dùng thật trên trang tra cứu
+SESSIONS = {
+    # Mở trang tra cứu, xem trạng thái Pi
+    'browse': ('search', 'status'),
+    # Chụp ảnh, phân tích, lưu kết quả
+    'capture': ('search', 'capture_preview', 'analyze_image', 'save_capture_result'),
+    # Chụp rồi phân tích nhưng không lưu
+    'capture_discard': ('search', 'capture_preview', 'analyze_image'),
+    # Upload ảnh có sẵn
+    'upload': ('upload_analyze',),
+}
+DEFAULT_MIX = {'browse': 3, 'capture': 5, 'capture_discard': 1, 'upload': 1}
+
+
+class SessionError(Exception):
+    pass
+
+
+class SyntheticUser:
+    """Một user ảo với requests.Session riêng (cookie sessionid + csrftoken)"""
+
+    def __init__(self, base_url: str, username: str, password: str, timeout: float = 30, images=None):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.images = images or []
+        self.session = requests.Session()
+        self.state: Dict = {}
+
+    def _url(self, path: str) -> str:
+        return f'{self.base_url}{path}'
+
+    def _headers(self) -> Dict[str, str]:
+        return {'X-CSRFToken': self.session.cookies.get('csrftoken', ''), 'Referer': self._url('/')}
+
+    def login(self) -> None:
+        page = self.session.get(self._url('/login/'), timeout=self.timeout)
+        match = CSRF_INPUT.search(page.text)
+        token = match.group(1) if match else self.session.cookies.get('csrftoken', '')
+        response = self.session.post(self._url('/login/'), timeout=self.timeout, allow_redirects=False, data={
+            'csrfmiddlewaretoken': token, 'username': self.username, 'password': self.password,
+        }, headers={'Referer': self._url('/login/')})
+        if response.status_code != 302 or 'sessionid' not in self.session.cookies:
+            raise SessionError(f'Đăng nhập thất bại cho {self.username} (HTTP {response.status_code})')
+
+    def _post_json(self, path: str, payload=None) -> Dict:
+        response = self.session.post(self._url(path), data=json.dumps(payload or {}), timeout=self.timeout,
+                                     headers={**self._headers(), 'Content-Type': 'application/json'})
+        if response.status_code != 200:
+            raise SessionError(f'{path}: HTTP {response.status_code}')
+        data = response.json()
+        if data.get('success') is False or data.get('error'):
+            raise SessionError(f'{path}: {data.get("error")}')
+        return data
+
+    # ---------- Action ----------
+
+    def search(self) -> None:
+        response = self.session.get(self._url('/search/'), timeout=self.timeout)
+        if response.status_code != 200:
+            raise SessionError(f'/search/: HTTP {response.status_code}')
+
+    def status(self) -> None:
+        response = self.session.get(self._url('/api/status/'), timeout=self.timeout)
+        if response.status_code != 200:
+            raise SessionError(f'/api/status/: HTTP {response.status_code}')
+
+    def capture_preview(self) -> None:
+        self.state['preview'] = self._post_json('/api/capture/preview/')
+
+    def analyze_image(self) -> None:
+        preview = self.state.get('preview') or {}
+        self.state['analysis'] = self._post_json('/api/capture/analyze/', {'filename': preview.get('file')})
+
+    def save_capture_result(self) -> None:
+        preview = self.state.get('preview') or {}
+        analysis = self.state.get('analysis') or {}
+        self._post_json('/api/capture/save/', {
+            'name': analysis.get('name'),
+            'confidence': analysis.get('confidence', 0),
+            'file': analysis.get('file') or preview.get('file', ''),
+            'image_url': preview.get('image_url', ''),
+        })
+
+    def upload_analyze(self) -> None:
+        data = random.choice(self.images)
+        response = self.session.post(self._url('/api/upload/analyze/'), headers=self._headers(),
+                                     files={'image': ('load_test.jpg', data, 'image/jpeg')}, timeout=self.timeout)
+        if response.status_code != 200 or not response.json().get('success'):
+            raise SessionError(f'/api/upload/analyze/: HTTP {response.status_code}')
+
+    def run_session(self, actions: Sequence[str]) -> List[Tuple[str, float, bool]]:
+        """Chạy một phiên; action lỗi thì dừng phiên (các bước sau phụ thuộc bước trước)"""
+        self.state = {}
+        samples = []
+        for action in actions:
+            started = time.perf_counter()
+            try:
+                getattr(self, action)()
+                ok = True
+            except (SessionError, requests.RequestException, ValueError):
+                ok = False
+            samples.append((action, (time.perf_counter() - started) * 1000, ok))
+            if not ok:
+                break
+        return samples
+
+
+def _pick_session(rng: random.Random, mix: Dict[str, float]) -> str:
+    names = list(mix)
+    return rng.choices(names, weights=[mix[name] for name in names])[0]
+
+
+def run_stage(users: List[SyntheticUser], duration: float, mix: Dict[str, float], think_time: float = 0.0,
+              seed: int = 0) -> Dict:
+    """Chạy len(users) user đồng thời trong `duration` giây"""
+    samples: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(index: int, user: SyntheticUser):
+        rng = random.Random(seed * 10007 + index)
+        while time.monotonic() < deadline:
+            for action, elapsed, ok in user.run_session(SESSIONS[_pick_session(rng, mix)]):
+                with lock:
+                    if ok:
+                        samples[action].append(elapsed)
+                    else:
+                        errors[action] += 1
+            if think_time:
+                time.sleep(rng.uniform(0, 2 * think_time))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i, user), daemon=True) for i, user in enumerate(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    all_samples = [value for values in samples.values() for value in values]
+    result = summarize(all_samples, sum(errors.values()), wall)
+    result['concurrency'] = len(users)
+    result['actions'] = {action: summarize(samples.get(action, []), errors.get(action, 0), wall)
+                         for action in sorted(set(samples) | set(errors))}
+    return result
+
+
+def find_saturation(stages: List[Dict], min_gain: float = 0.1, p95_limit_ms: Optional[float] = None,
+                    max_error_rate: float = 0.05) -> Optional[Dict]:
+    """
+    Mức bão hòa: mức đầu tiên mà
+    - throughput tăng ít hơn min_gain (10%) so với mức trước, hoặc
+    - p95 vượt p95_limit_ms, hoặc
+    - tỉ lệ lỗi vượt max_error_rate
+    """
+    previous = None
+    for stage in stages:
+        reasons = []
+        if stage['error_rate'] > max_error_rate:
+            reasons.append(f'error_rate {stage["error_rate"]:.1%} > {max_error_rate:.1%}')
+        if p95_limit_ms and stage['p95_ms'] > p95_limit_ms:
+            reasons.append(f'p95 {stage["p95_ms"]}ms > {p95_limit_ms}ms')
+        if previous and stage['throughput_rps'] < previous['throughput_rps'] * (1 + min_gain):
+            reasons.append(f'throughput {stage["throughput_rps"]} req/s '
+                           f'(mức trước {previous["throughput_rps"]} req/s)')
+        if reasons:
+            return {'concurrency': stage['concurrency'], 'reasons': reasons,
+                    'max_sustainable_concurrency': previous['concurrency'] if previous else None}
+        previous = stage
+    return None
+
+
+def run_load_test(base_url: str, credentials: List[Tuple[str, str]], stages: Sequence[int], stage_duration: float,
+                  mix: Optional[Dict[str, float]] = None, think_time: float = 0.0, p95_limit_ms=None,
+                  max_error_rate: float = 0.05, timeout: float = 30, seed: int = 0, progress=None) -> Dict:
+    """Đăng nhập max(stages) user rồi chạy lần lượt các mức đồng thời"""
+    mix = mix or DEFAULT_MIX
+    images = synthetic_leaf_jpegs()
+    users = []
+    for username, password in credentials[:max(stages)]:
+        user = SyntheticUser(base_url, username, password, timeout=timeout, images=images)
+        user.login()
+        users.append(user)
+    if len(users) < max(stages):
+        raise SessionError(f'Cần {max(stages)} user nhưng chỉ có {len(users)}')
+
+    results = []
+    for concurrency in stages:
+        stage = run_stage(users[:concurrency], stage_duration, mix, think_time, seed)
+        results.append(stage)
+        if progress:
+            progress(stage)
+    return {
+        'base_url': base_url,
+        'mix': mix,
+        'stages': results,
+        'saturation': find_saturation(results, p95_limit_ms=p95_limit_ms, max_error_rate=max_error_rate),
+    }
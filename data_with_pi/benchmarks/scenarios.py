@@ -0,0 +1,170 @@
+"""
+Các kịch bản benchmark (chạy qua Django test Client, Pi là FakePiServer)
+- status_polling: GET /api/status/
+- capture_analyze_save: preview -> analyze -> save (luồng chụp ảnh của người dùng)
+- upload_burst: POST /api/upload/analyze/ với ảnh fixture
+- yolo_detect_loop: đọc frame từ stream MJPEG giả + YOLO detect (cần cv2/ultralytics)
+
+Mỗi kịch bản trả về số liệu p50/p95/p99, throughput... (summarize) để so sánh giữa các commit.
+"""
+import itertools
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import close_old_connections
+from django.test import Client
+
+from .fixtures import synthetic_leaf_jpegs
+
+BENCH_USERNAME = 'bench_user'
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentile (nội suy tuyến tính) của danh sách đã sắp xếp"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100
+    low, high = math.floor(position), math.ceil(position)
+    if low == high:
+        return sorted_values[low]
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def summarize(samples_ms: List[float], errors: int, wall_s: float) -> Dict:
+    """Tổng hợp thời gian (ms) của các lần chạy thành công + số lỗi"""
+    values = sorted(samples_ms)
+    total = len(values) + errors
+    return {
+        'count': total,
+        'errors': errors,
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'p50_ms': round(percentile(values, 50), 2),
+        'p95_ms': round(percentile(values, 95), 2),
+        'p99_ms': round(percentile(values, 99), 2),
+        'mean_ms': round(sum(values) / len(values), 2) if values else 0.0,
+        'max_ms': round(values[-1], 2) if values else 0.0,
+        'throughput_rps': round(len(values) / wall_s, 2) if wall_s > 0 else 0.0,
+        'wall_s': round(wall_s, 3),
+    }
+
+
+def run_scenario(step: Callable[[object, int], bool], iterations: int, concurrency: int = 1,
+                 setup: Optional[Callable[[], object]] = None, warmup: int = 1) -> Dict:
+    """
+    Chạy step(context, i) tổng cộng `iterations` lần trên `concurrency` luồng.
+    setup() tạo context riêng cho mỗi luồng (vd: Client đã đăng nhập).
+    step trả về False (hoặc raise) được tính là lỗi.
+    """
+    counter = itertools.count()
+    samples: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker():
+        context = setup() if setup else None
+        try:
+            for i in range(warmup):
+                try:
+                    step(context, -1 - i)
+                except Exception:
+                    pass
+            while True:
+                i = next(counter)
+                if i >= iterations:
+                    return
+                started = time.perf_counter()
+                try:
+                    ok = step(context, i) is not False
+                except Exception:
+                    ok = False
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    if ok:
+                        samples.append(elapsed)
+                    else:
+                        errors[0] += 1
+        finally:
+            close_old_connections()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return summarize(samples, errors[0], time.perf_counter() - started)
+
+
+def logged_in_client(user) -> Client:
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def _json(response) -> Dict:
+    return json.loads(response.content) if response.get('Content-Type', '').startswith('application/json') else {}
+
+
+# ---------- Kịch bản ----------
+
+def status_polling(client, i) -> bool:
+    return client.get('/api/status/').status_code == 200
+
+
+def capture_analyze_save(client, i) -> bool:
+    preview = _json(client.post('/api/capture/preview/'))
+    if not preview.get('success'):
+        return False
+    analysis = _json(client.post('/api/capture/analyze/', json.dumps({'filename': preview['file']}),
+                                 content_type='application/json'))
+    if not analysis.get('name'):
+        return False
+    saved = client.post('/api/capture/save/', json.dumps({
+        'name': analysis['name'],
+        'confidence': analysis.get('confidence', 0),
+        'file': analysis.get('file', preview['file']),
+        'image_url': preview.get('image_url', ''),
+    }), content_type='application/json')
+    return saved.status_code == 200
+
+
+def make_upload_burst(images: Optional[List[bytes]] = None) -> Callable:
+    images = images or synthetic_leaf_jpegs()
+
+    def upload_burst(client, i) -> bool:
+        data = images[i % len(images)]
+        upload = SimpleUploadedFile(f'bench_{i}.jpg', data, content_type='image/jpeg')
+        return _json(client.post('/api/upload/analyze/', {'image': upload})).get('success', False)
+    return upload_burst
+
+
+def make_yolo_detect_loop(stream_url: str, model_path: str, confidence: float = 0.25) -> Callable:
+    """Vòng lặp capture frame từ stream + YOLO detect (không qua view, đo riêng phần YOLO)"""
+    from ..services.yolo_service import YOLOLeafDetector
+
+    detector = YOLOLeafDetector(model_path=model_path)
+    if detector.model is None:
+        raise RuntimeError(f'Không load được model YOLO: {model_path}')
+
+    def yolo_detect_loop(context, i) -> bool:
+        frame = detector.capture_frame_from_stream(stream_url)
+        if frame is None:
+            return False
+        detector.detect_frame(frame, confidence)
+        return True
+    return yolo_detect_loop
+
+
+def yolo_available() -> bool:
+    try:
+        import cv2  # noqa: F401
+        import ultralytics  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+SCENARIOS = ('status_polling', 'capture_analyze_save', 'upload_burst', 'yolo_detect_loop')
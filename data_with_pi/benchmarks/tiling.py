@@ -0,0 +1,107 @@
+"""
+Benchmark suy luận theo ô (sliced) so với một lượt cả frame: recall, precision và độ trễ
+- Frame có nhãn: thư mục ảnh + nhãn định dạng YOLO (<tên>.txt cạnh ảnh hoặc trong labels/)
+- Không có nhãn: frame tổng hợp độ phân giải cao với nhiều lá nhỏ (box đã biết)
+Lưu ý: đo recall cần model thật (best.pt); model fixture chưa huấn luyện chỉ dùng để đo độ trễ.
+"""
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+from .fixtures import Box, synthetic_leaf_scene
+from .scenarios import summarize
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png')
+
+
+def _read_yolo_labels(path: Path, width: int, height: int) -> List[Box]:
+    boxes = []
+    for line in path.read_text().splitlines():
+        parts = line.split()
+        if len(parts) < 5:
+            continue
+        cx, cy, w, h = (float(value) for value in parts[1:5])
+        boxes.append((int((cx - w / 2) * width), int((cy - h / 2) * height),
+                      int((cx + w / 2) * width), int((cy + h / 2) * height)))
+    return boxes
+
+
+def load_labeled_frames(frames_dir) -> List[Tuple[str, object, List[Box]]]:
+    """(tên, ảnh BGR, box thật) cho mọi ảnh có file nhãn YOLO"""
+    import cv2
+
+    frames_dir = Path(frames_dir)
+    frames = []
+    for image_path in sorted(p for p in frames_dir.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES):
+        label_path = next((path for path in (image_path.with_suffix('.txt'),
+                                             frames_dir / 'labels' / f'{image_path.stem}.txt') if path.exists()), None)
+        if label_path is None:
+            continue
+        image = cv2.imread(str(image_path))
+        if image is None:
+            continue
+        frames.append((image_path.name, image, _read_yolo_labels(label_path, image.shape[1], image.shape[0])))
+    return frames
+
+
+def synthetic_high_res_frames(count: int = 4, size: Tuple[int, int] = (3840, 2160), leaves: int = 12,
+                              leaf_scale: Tuple[float, float] = (0.015, 0.04)) -> List[Tuple[str, object, List[Box]]]:
+    """Frame 4K với các lá nhỏ (vài chục px) - loại lá bị mất khi YOLO thu frame về 640px"""
+    import numpy as np
+
+    frames = []
+    for seed in range(count):
+        image, boxes = synthetic_leaf_scene(seed, size, leaves, leaf_scale)
+        frames.append((f'synthetic_{seed}', np.ascontiguousarray(np.asarray(image)[:, :, ::-1]), boxes))
+    return frames
+
+
+def _iou(a: Sequence[float], b: Sequence[float]) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def match_boxes(truth: List[Box], predicted: List[Box], iou_threshold: float = 0.5) -> Tuple[int, int, int]:
+    """Ghép tham lam theo IoU giảm dần -> (true positive, false positive, false negative)"""
+    pairs = sorted(((_iou(t, p), ti, pi) for ti, t in enumerate(truth) for pi, p in enumerate(predicted)),
+                   reverse=True)
+    used_truth, used_predicted = set(), set()
+    for iou, ti, pi in pairs:
+        if iou < iou_threshold:
+            break
+        if ti in used_truth or pi in used_predicted:
+            continue
+        used_truth.add(ti)
+        used_predicted.add(pi)
+    tp = len(used_truth)
+    return tp, len(predicted) - tp, len(truth) - tp
+
+
+def compare_tiling(detector, frames, confidence: float = 0.25, repeats: int = 3,
+                   iou_threshold: float = 0.5) -> Dict:
+    """Chạy từng frame ở hai chế độ (single / tiled), trả về độ trễ + recall/precision mỗi chế độ"""
+    report = {}
+    for mode, tiled in (('single', False), ('tiled', True)):
+        detector.detect_frame(frames[0][1], confidence, tiled=tiled)  # warm-up
+        samples, tp, fp, fn = [], 0, 0, 0
+        for _, image, truth in frames:
+            for repeat in range(repeats):
+                started = time.perf_counter()
+                detections = detector.detect_frame(image, confidence, tiled=tiled)
+                samples.append((time.perf_counter() - started) * 1000)
+            predicted = [(d['bbox']['x1'], d['bbox']['y1'], d['bbox']['x2'], d['bbox']['y2']) for d in detections]
+            counts = match_boxes(truth, predicted, iou_threshold)
+            tp, fp, fn = tp + counts[0], fp + counts[1], fn + counts[2]
+        summary = summarize(samples, 0, sum(samples) / 1000)
+        summary.update({
+            'recall': round(tp / (tp + fn), 4) if tp + fn else None,
+            'precision': round(tp / (tp + fp), 4) if tp + fp else None,
+            'true_positives': tp,
+            'false_positives': fp,
+            'false_negatives': fn,
+        })
+        report[mode] = summary
+    return report
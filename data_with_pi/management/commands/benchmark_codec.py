@@ -0,0 +1,51 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from data_with_pi.benchmarks.codec import compare_codecs
+from data_with_pi.benchmarks.fixtures import load_frames, synthetic_leaf_jpegs
+from data_with_pi.services.image_codec import SUBSAMPLINGS
+
+
+class Command(BaseCommand):
+    help = ('So sánh codec JPEG: đường hiện tại (cv2.imencode / PIL) với image_codec theo từng backend '
+            '(turbojpeg, opencv, pil) - encode, decode thu nhỏ miền DCT, thu nhỏ ảnh upload')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--frames-dir', help='Thư mục ảnh .jpg (mặc định: ảnh tổng hợp)')
+        parser.add_argument('--count', type=int, default=8, help='Số ảnh (mặc định: 8)')
+        parser.add_argument('--width', type=int, default=1920, help='Chiều rộng ảnh tổng hợp')
+        parser.add_argument('--height', type=int, default=1080, help='Chiều cao ảnh tổng hợp')
+        parser.add_argument('--repeats', type=int, default=5)
+        parser.add_argument('--quality', type=int, default=settings.IMAGE_JPEG_QUALITY)
+        parser.add_argument('--subsampling', choices=SUBSAMPLINGS, default=settings.IMAGE_JPEG_SUBSAMPLING)
+        parser.add_argument('--target-side', type=int, default=640,
+                            help='Cạnh dài cần có khi giải mã thu nhỏ / thu nhỏ upload (mặc định: 640)')
+        parser.add_argument('--output', help='Ghi kết quả JSON ra file')
+
+    def handle(self, *args, **options):
+        if options['frames_dir']:
+            jpegs = load_frames(options['frames_dir'], options['count'])
+            if not jpegs:
+                raise CommandError(f'Không có ảnh .jpg trong {options["frames_dir"]}')
+        else:
+            jpegs = synthetic_leaf_jpegs(options['count'], (options['width'], options['height']))
+
+        report = compare_codecs(jpegs, options['repeats'], options['quality'], options['subsampling'],
+                                options['target_side'])
+        report['config'] = {key: options[key] for key in ('frames_dir', 'count', 'repeats', 'quality',
+                                                          'subsampling', 'target_side')}
+
+        for section in ('encode', 'decode'):
+            for path, result in report[section].items():
+                size = f' {result["mean_bytes"] / 1024:.0f}KB' if 'mean_bytes' in result else ''
+                self.stdout.write(f'{section:>6} {path:<22} p50={result["p50_ms"]}ms p95={result["p95_ms"]}ms{size}')
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(output, encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f'✓ Đã ghi kết quả: {options["output"]}'))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,65 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from data_with_pi.benchmarks.scenarios import yolo_available
+from data_with_pi.benchmarks.tiling import compare_tiling, load_labeled_frames, synthetic_high_res_frames
+
+
+class Command(BaseCommand):
+    help = 'So sánh suy luận theo ô (sliced) với một lượt cả frame: recall, precision, p50/p95 độ trễ'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--yolo-model', default=str(settings.YOLO_MODEL_PATH),
+                            help='Model YOLO (mặc định: YOLO_MODEL_PATH)')
+        parser.add_argument('--frames-dir', help='Ảnh + nhãn YOLO (.txt); mặc định: frame 4K tổng hợp')
+        parser.add_argument('--count', type=int, default=4, help='Số frame tổng hợp (mặc định: 4)')
+        parser.add_argument('--width', type=int, default=3840)
+        parser.add_argument('--height', type=int, default=2160)
+        parser.add_argument('--leaves', type=int, default=12, help='Số lá mỗi frame tổng hợp')
+        parser.add_argument('--confidence', type=float, default=0.25)
+        parser.add_argument('--repeats', type=int, default=3, help='Số lần chạy mỗi frame để đo độ trễ')
+        parser.add_argument('--tile-size', type=int, default=settings.YOLO_TILE_SIZE)
+        parser.add_argument('--overlap', type=float, default=settings.YOLO_TILE_OVERLAP)
+        parser.add_argument('--batch', type=int, default=settings.YOLO_TILE_BATCH)
+        parser.add_argument('--no-full-frame', action='store_true', help='Bỏ lượt cả frame trong chế độ tiled')
+        parser.add_argument('--output', help='Ghi kết quả JSON ra file')
+
+    def handle(self, *args, **options):
+        if not yolo_available():
+            raise CommandError('Cần opencv-python và ultralytics')
+        from data_with_pi.services.yolo_service import YOLOLeafDetector
+
+        if options['frames_dir']:
+            frames = load_labeled_frames(options['frames_dir'])
+            if not frames:
+                raise CommandError(f'Không có ảnh kèm nhãn YOLO trong {options["frames_dir"]}')
+        else:
+            frames = synthetic_high_res_frames(options['count'], (options['width'], options['height']),
+                                               options['leaves'])
+
+        detector = YOLOLeafDetector(model_path=options['yolo_model'])
+        if detector.model is None:
+            raise CommandError(f'Không load được model: {detector.error}')
+
+        with override_settings(YOLO_TILE_SIZE=options['tile_size'], YOLO_TILE_OVERLAP=options['overlap'],
+                               YOLO_TILE_BATCH=options['batch'], YOLO_TILE_FULL_FRAME=not options['no_full_frame']):
+            report = compare_tiling(detector, frames, options['confidence'], options['repeats'])
+
+        report['config'] = {key: options[key] for key in ('yolo_model', 'frames_dir', 'tile_size', 'overlap',
+                                                          'batch', 'confidence', 'repeats')}
+        report['frames'] = len(frames)
+        for mode in ('single', 'tiled'):
+            result = report[mode]
+            self.stdout.write(f'{mode:>7}: recall={result["recall"]} precision={result["precision"]} '
+                              f'p50={result["p50_ms"]}ms p95={result["p95_ms"]}ms')
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(output, encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f'✓ Đã ghi kết quả: {options["output"]}'))
+        else:
+            self.stdout.write(output)
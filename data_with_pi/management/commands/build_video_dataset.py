@@ -0,0 +1,136 @@
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from data_with_pi.benchmarks.scenarios import yolo_available
+from data_with_pi.services import image_dedup, video_dataset
+from data_with_pi.services.pi_client import PiClient
+
+
+class Command(BaseCommand):
+    help = ('Trích frame từ video đã quay (file local hoặc tải từ Pi) thành dataset YOLO: lấy mẫu theo '
+            'thay đổi cảnh, gán nhãn trước bằng YOLO theo lô, chạy song song, tiếp tục được khi bị ngắt')
+
+    def add_arguments(self, parser):
+        parser.add_argument('videos', nargs='*', help='File video hoặc thư mục chứa video')
+        parser.add_argument('--output', required=True, help='Thư mục dataset (images/, labels/, data.yaml)')
+        parser.add_argument('--from-pi', action='store_true', help='Tải các video đã quay trên Pi về rồi xử lý')
+        parser.add_argument('--pi-url', help='Địa chỉ Pi (mặc định: PI_API_BASE_URL)')
+        parser.add_argument('--download-dir', help='Nơi lưu video tải từ Pi (mặc định: <output>/videos)')
+        parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                            help='Số tiến trình (mặc định: min(4, số CPU))')
+        parser.add_argument('--segment-frames', type=int, default=3000,
+                            help='Chia video dài thành đoạn N frame để chạy song song (0 = không chia)')
+        parser.add_argument('--stride', type=int, default=1, help='Chỉ xét mỗi frame thứ N (mặc định: 1)')
+        parser.add_argument('--scene-threshold', type=float, default=0.05,
+                            help='Tỉ lệ điểm ảnh thay đổi tối thiểu (0..1) để giữ frame (mặc định: 0.05)')
+        parser.add_argument('--min-gap', type=int, default=5, help='Số frame tối thiểu giữa hai frame giữ')
+        parser.add_argument('--max-gap', type=int, default=0,
+                            help='Giữ một frame sau mỗi N frame dù cảnh không đổi (0 = tắt)')
+        parser.add_argument('--batch', type=int, default=16, help='Số frame mỗi lô YOLO (mặc định: 16)')
+        parser.add_argument('--yolo-model', default=str(settings.YOLO_MODEL_PATH))
+        parser.add_argument('--confidence', type=float, default=0.25)
+        parser.add_argument('--imgsz', type=int, help='Kích thước đầu vào YOLO (mặc định: của model)')
+        parser.add_argument('--no-labels', action='store_true', help='Chỉ trích frame, không gán nhãn YOLO')
+        parser.add_argument('--val-fraction', type=float, default=0.1, help='Tỉ lệ ảnh vào tập val')
+        parser.add_argument('--quality', type=int, default=90, help='Chất lượng JPEG ảnh ghi ra')
+        parser.add_argument('--restart', action='store_true', help='Bỏ tiến độ cũ, xử lý lại từ đầu')
+        parser.add_argument('--dedup', action='store_true',
+                            help='Sau khi trích, lọc ảnh gần trùng trên toàn dataset (chuyển sang <output>/duplicates)')
+        parser.add_argument('--dedup-hash', choices=image_dedup.HASH_METHODS, default=settings.DEDUP_HASH)
+        parser.add_argument('--dedup-radius', type=int, default=settings.DEDUP_RADIUS,
+                            help='Số bit khác nhau tối đa để xem là trùng')
+
+    def _collect_videos(self, options):
+        videos = []
+        for item in options['videos']:
+            path = Path(item)
+            if path.is_dir():
+                videos += sorted(p for p in path.rglob('*') if p.suffix.lower() in video_dataset.VIDEO_SUFFIXES)
+            elif path.is_file():
+                videos.append(path)
+            else:
+                raise CommandError(f'Không tìm thấy: {item}')
+
+        if options['from_pi']:
+            client = PiClient(options['pi_url'])
+            listing = client.list_videos()
+            if listing.get('error'):
+                raise CommandError(f'Không lấy được danh sách video từ Pi: {listing["error"]}')
+            download_dir = Path(options['download_dir'] or Path(options['output']) / 'videos')
+            download_dir.mkdir(parents=True, exist_ok=True)
+            for entry in listing.get('videos', []):
+                filename = Path(entry['filename']).name
+                destination = download_dir / filename
+                if not destination.exists() or (entry.get('size') and destination.stat().st_size != entry['size']):
+                    self.stdout.write(f'Tải {filename} từ Pi...')
+                    result = client.download_video(entry['filename'], destination)
+                    if not result.get('success'):
+                        self.stdout.write(self.style.WARNING(f'Bỏ qua {filename}: {result.get("error")}'))
+                        continue
+                videos.append(destination)
+        return videos
+
+    def handle(self, *args, **options):
+        out_dir = Path(options['output'])
+        labels = not options['no_labels']
+        if labels and not yolo_available():
+            raise CommandError('Gán nhãn cần opencv-python và ultralytics (hoặc dùng --no-labels)')
+        if labels and not Path(options['yolo_model']).exists():
+            raise CommandError(f'Không tìm thấy model YOLO: {options["yolo_model"]}')
+
+        videos = self._collect_videos(options)
+        if not videos:
+            raise CommandError('Không có video nào để xử lý')
+        if options['restart']:
+            shutil.rmtree(out_dir / video_dataset.PROGRESS_DIR, ignore_errors=True)
+
+        jobs = video_dataset.plan_jobs(videos, options['segment_frames'])
+        workers = max(1, min(options['workers'], len(jobs)))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        job_options = {
+            'stride': options['stride'], 'threshold': options['scene_threshold'],
+            'min_gap': options['min_gap'], 'max_gap': options['max_gap'], 'batch': max(1, options['batch']),
+            'confidence': options['confidence'], 'imgsz': options['imgsz'],
+            'val_fraction': options['val_fraction'], 'quality': options['quality'],
+        }
+        self.stdout.write(f'{len(videos)} video -> {len(jobs)} job, {workers} tiến trình')
+
+        started = time.perf_counter()
+        kept = boxes = skipped = failed = 0
+        names = None
+        with ProcessPoolExecutor(max_workers=workers, initializer=video_dataset.init_worker,
+                                 initargs=(options['yolo_model'] if labels else None, threads)) as pool:
+            futures = {pool.submit(video_dataset.process_job, job, str(out_dir), job_options): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'Lỗi {job["id"]}: {str(e)} (chạy lại để tiếp tục)'))
+                    continue
+                names = names or result['names']
+                kept += result['kept']
+                boxes += result['boxes']
+                skipped += result['skipped']
+                state = 'đã xong từ trước' if result['skipped'] else f'{result["kept"]} frame, {result["boxes"]} box'
+                self.stdout.write(f'- {job["id"]}: {state}')
+
+        if labels:
+            video_dataset.write_data_yaml(out_dir, names or {0: 'leaf'})
+        if options['dedup']:
+            report = video_dataset.remove_near_duplicates(out_dir, options['dedup_radius'], options['dedup_hash'],
+                                                          workers=os.cpu_count() or 1)
+            self.stdout.write(f'- Lọc gần trùng: giữ {report["kept"]}/{report["images"]} ảnh, '
+                              f'bỏ {report["duplicates"]} (xem {out_dir / "dedup_report.json"})')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS('\n✓ HOÀN TẤT!'))
+        self.stdout.write(f'- Frame đã giữ: {kept} ({boxes} box)')
+        self.stdout.write(f'- Job bỏ qua (đã xong): {skipped}, lỗi: {failed}')
+        self.stdout.write(f'- Thời gian: {elapsed:.1f}s')
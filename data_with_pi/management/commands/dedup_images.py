@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from data_with_pi.models import CaptureResult
+from data_with_pi.services import image_dedup
+
+
+class Command(BaseCommand):
+    help = ('Tìm ảnh gần trùng (perceptual hash + index Hamming) trong media/captures, media/yolo_crops '
+            'hoặc thư mục chỉ định; báo cáo mỗi cụm gộp bao nhiêu ảnh, tùy chọn chuyển bản trùng ra chỗ khác')
+
+    def add_arguments(self, parser):
+        parser.add_argument('folders', nargs='*',
+                            help='Thư mục ảnh (mặc định: MEDIA_ROOT/captures và MEDIA_ROOT/yolo_crops)')
+        parser.add_argument('--hash', choices=image_dedup.HASH_METHODS, default=settings.DEDUP_HASH)
+        parser.add_argument('--radius', type=int, default=settings.DEDUP_RADIUS,
+                            help='Số bit khác nhau tối đa để xem là trùng')
+        parser.add_argument('--batch', type=int, default=256, help='Số ảnh mỗi lô hash (mặc định: 256)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Số luồng giải mã ảnh')
+        parser.add_argument('--move-to', help='Chuyển bản trùng vào thư mục này (mặc định: chỉ báo cáo)')
+        parser.add_argument('--top', type=int, default=10, help='Số cụm lớn nhất in ra (mặc định: 10)')
+        parser.add_argument('--output', help='Ghi báo cáo đầy đủ (mọi cụm) ra file JSON')
+
+    def handle(self, *args, **options):
+        media_root = Path(settings.MEDIA_ROOT)
+        folders = [Path(folder) for folder in options['folders']] or [media_root / 'captures',
+                                                                       media_root / 'yolo_crops']
+        missing = [str(folder) for folder in folders if not folder.is_dir()]
+        if missing:
+            self.stdout.write(self.style.WARNING(f'Bỏ qua thư mục không tồn tại: {", ".join(missing)}'))
+
+        # Tên file có ngày giờ -> sắp theo đường dẫn gần đúng theo thời gian, ảnh cũ nhất làm đại diện cụm
+        paths = image_dedup.find_images(folders)
+        if not paths:
+            raise CommandError('Không có ảnh nào để xử lý')
+        self.stdout.write(f'{len(paths)} ảnh, hash={options["hash"]}, radius={options["radius"]}')
+
+        started = time.perf_counter()
+        hashed = image_dedup.hash_files(paths, options['hash'], max(1, options['batch']), options['workers'])
+        clusters = image_dedup.cluster_hashes(hashed, options['radius'])
+        elapsed = time.perf_counter() - started
+
+        def display(path: Path) -> str:
+            try:
+                return path.resolve().relative_to(media_root.resolve()).as_posix()
+            except ValueError:
+                return str(path)
+
+        report = image_dedup.summarize_clusters([[display(path) for path in cluster] for cluster in clusters],
+                                                top=None)
+        report.update({'method': options['hash'], 'radius': options['radius'], 'elapsed_s': round(elapsed, 2),
+                       'images_per_s': round(len(paths) / elapsed, 1) if elapsed else None})
+
+        if options['move_to']:
+            report['moved'], report['protected'] = self._move_duplicates(clusters, Path(options['move_to']),
+                                                                         display)
+
+        self.stdout.write(self.style.SUCCESS('\n✓ HOÀN TẤT!'))
+        self.stdout.write(f'- Giữ {report["kept"]}/{report["images"]} ảnh, gần trùng: {report["duplicates"]} '
+                          f'({report["reduction"]:.1%})')
+        self.stdout.write(f'- Thời gian: {elapsed:.1f}s ({report["images_per_s"]} ảnh/s)')
+        if options['move_to']:
+            self.stdout.write(f'- Đã chuyển: {report["moved"]}, giữ lại vì đang dùng trong lịch sử: '
+                              f'{report["protected"]}')
+        for cluster in report['largest'][:options['top']]:
+            self.stdout.write(f'  {cluster["keep"]}: gộp {cluster["collapsed"]} ảnh')
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f'✓ Đã ghi báo cáo: {options["output"]}'))
+
+    def _move_duplicates(self, clusters, move_to: Path, display):
+        """Chuyển bản trùng (giữ cấu trúc thư mục); ảnh CaptureResult còn trỏ tới thì không đụng"""
+        referenced = set(CaptureResult.objects.exclude(local_image='').exclude(local_image__isnull=True)
+                         .values_list('local_image', flat=True))
+        moved = protected = 0
+        for cluster in clusters:
+            for path in cluster[1:]:
+                relative = display(path)
+                if relative in referenced:
+                    protected += 1
+                    continue
+                target = move_to / relative.lstrip('/')
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(path), target)
+                moved += 1
+        return moved, protected
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from data_with_pi.benchmarks.fake_pi import FakePiServer
+
+
+class Command(BaseCommand):
+    help = 'Chạy Pi giả (đủ endpoint của PiClient + stream MJPEG) để dev / load test khi không có Pi thật'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Địa chỉ lắng nghe (mặc định: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8001, help='Cổng (mặc định: 8001)')
+        parser.add_argument('--latency-scale', type=float, default=1.0, help='Hệ số độ trễ (0 = không chờ)')
+        parser.add_argument('--jitter', type=float, default=0.1, help='Dao động độ trễ tương đối')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Tỉ lệ request trả về 503')
+        parser.add_argument('--frames-dir', help='Thư mục frame .jpg (mặc định: ảnh tổng hợp)')
+        parser.add_argument('--fps', type=float, default=10.0, help='Số frame/giây của /stream/live')
+
+    def handle(self, *args, **options):
+        server = FakePiServer(host=options['host'], port=options['port'], latency_scale=options['latency_scale'],
+                              jitter=options['jitter'], failure_rate=options['failure_rate'],
+                              frames_dir=options['frames_dir'], fps=options['fps'])
+        self.stdout.write(self.style.SUCCESS(f'Pi giả đang chạy tại {server.base_url} (Ctrl+C để dừng)'))
+        self.stdout.write(f'Đặt PI_API_BASE_URL={server.base_url} cho Django')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server.server_close()
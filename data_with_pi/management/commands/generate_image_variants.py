@@ -0,0 +1,96 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from data_with_pi.models import Plant, Recipe, RecipeImage
+from data_with_pi.services.image_variants import render_variants, store_variants
+
+MODELS = {
+    'plant': Plant,
+    'recipe': Recipe,
+    'recipe_image': RecipeImage,
+}
+
+
+def _source(name):
+    """Đường dẫn file (nếu storage là filesystem) để worker tự đọc, ngược lại đọc bytes"""
+    try:
+        return default_storage.path(name)
+    except NotImplementedError:
+        with default_storage.open(name, 'rb') as f:
+            return f.read()
+
+
+class Command(BaseCommand):
+    help = 'Sinh ảnh thumb/medium/WebP cho ảnh cây, công thức (xử lý song song)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'table',
+            type=str,
+            nargs='?',
+            default='all',
+            choices=list(MODELS) + ['all'],
+            help='Bảng cần xử lý: plant, recipe, recipe_image, hoặc all'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Sinh lại cả những ảnh đã có biến thể'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Số process xử lý song song (mặc định: số CPU)'
+        )
+
+    def handle(self, *args, **options):
+        table = options['table']
+        models = MODELS.values() if table == 'all' else [MODELS[table]]
+
+        jobs = []
+        for model in models:
+            queryset = model.objects.exclude(image='').exclude(image__isnull=True)
+            if not options['force']:
+                queryset = queryset.filter(image_variants={})
+            jobs += [(model, obj) for obj in queryset]
+
+        if not jobs:
+            self.stdout.write(self.style.SUCCESS('Không có ảnh nào cần xử lý.'))
+            return
+
+        workers = max(1, options['workers'])
+        self.stdout.write(f'Đang xử lý {len(jobs)} ảnh với {workers} process...')
+        started = time.perf_counter()
+        done = failed = 0
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for model, obj in jobs:
+                try:
+                    futures[pool.submit(render_variants, _source(obj.image.name))] = (model, obj)
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'Bỏ qua {model.__name__} #{obj.pk}: {str(e)}'))
+
+            for future in as_completed(futures):
+                model, obj = futures[future]
+                try:
+                    obj.image_variants = store_variants(*future.result())
+                    # Cập nhật updated_at (nếu có) để cache trang danh mục được làm mới
+                    update_fields = ['image_variants']
+                    if any(f.name == 'updated_at' for f in model._meta.concrete_fields):
+                        update_fields.append('updated_at')
+                    obj.save(update_fields=update_fields)
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'Lỗi {model.__name__} #{obj.pk} ({obj.image.name}): {str(e)}'))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'\n✓ HOÀN TẤT!'))
+        self.stdout.write(f'- Đã xử lý: {done}')
+        self.stdout.write(f'- Lỗi: {failed}')
+        self.stdout.write(f'- Thời gian: {elapsed:.2f}s')
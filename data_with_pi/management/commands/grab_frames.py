@@ -0,0 +1,128 @@
+import json
+import multiprocessing
+import queue
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from data_with_pi.services.frame_ring import FrameGrabber, FrameRing, ring_name
+from data_with_pi.services.pi_client import PiClient
+
+
+def _inference_worker(name, index, workers, model_path, confidence, results, stop):
+    """
+    Worker inference ở tiến trình riêng: copy frame từ ring theo seq (grabber có thể ghi đè slot
+    bất cứ lúc nào nên không inference trên view), xử lý các frame có seq % workers == index,
+    gửi kết quả (chỉ số liệu nhỏ) qua queue
+    """
+    import django
+    django.setup()  # Tiến trình spawn mới chưa có Django
+    from data_with_pi.services.frame_ring import FrameOverwritten
+    from data_with_pi.services.yolo_service import YOLOLeafDetector
+
+    ring = FrameRing.attach(name)
+    detector = YOLOLeafDetector(model_path=model_path)
+    if detector.model is None:
+        results.put({'worker': index, 'error': detector.error})
+        return
+    last = 0
+    try:
+        while not stop.is_set():
+            frame = ring.wait_newer(last, timeout=0.5)
+            if frame is None:
+                continue
+            # Frame mới nhất thuộc phần của worker này (bỏ qua frame cũ khi không theo kịp)
+            seq = frame.seq - ((frame.seq - index) % workers)
+            if seq <= last:
+                time.sleep(0.005)
+                continue
+            last = seq
+            try:
+                frame = ring.read(seq)
+                image = frame.copy()
+            except FrameOverwritten:
+                results.put({'worker': index, 'seq': seq, 'overwritten': True})
+                continue
+            started = time.perf_counter()
+            detections = detector.detect_frame(image, confidence)
+            inference_ms = (time.perf_counter() - started) * 1000
+            results.put({
+                'worker': index,
+                'seq': seq,
+                'leaves': len(detections),
+                'inference_ms': round(inference_ms, 1),
+                'lag_ms': round(frame.age * 1000, 1),
+                'overwritten': False,
+            })
+    finally:
+        ring.close()
+
+
+class Command(BaseCommand):
+    help = ('Đọc stream của Pi vào ring buffer shared memory (cho web worker crop/detect không cần '
+            'mở stream lại), tùy chọn chạy thêm N tiến trình inference YOLO song song trên ring')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stream-url', help='Stream MJPEG (mặc định: stream của PI_API_BASE_URL)')
+        parser.add_argument('--slots', type=int, default=settings.FRAME_RING_SLOTS)
+        parser.add_argument('--max-width', type=int, default=settings.FRAME_RING_MAX_WIDTH)
+        parser.add_argument('--max-height', type=int, default=settings.FRAME_RING_MAX_HEIGHT)
+        parser.add_argument('--workers', type=int, default=0, help='Số tiến trình inference (mặc định: 0)')
+        parser.add_argument('--yolo-model', default=str(settings.YOLO_MODEL_PATH))
+        parser.add_argument('--confidence', type=float, default=0.5)
+        parser.add_argument('--duration', type=float, default=0, help='Dừng sau N giây (0 = chạy tới Ctrl+C)')
+        parser.add_argument('--json', action='store_true', help='In từng kết quả inference dạng JSON')
+
+    def handle(self, *args, **options):
+        stream_url = options['stream_url'] or PiClient().get_stream_url()
+        ring = FrameRing.create(ring_name(stream_url), slots=options['slots'],
+                                max_height=options['max_height'], max_width=options['max_width'])
+        grabber = FrameGrabber(stream_url, ring)
+        grabber.start()
+        self.stdout.write(self.style.SUCCESS(
+            f'Đang đọc {stream_url} vào shared memory "{ring.name}" '
+            f'({ring.slots} slot x {ring.slot_bytes / 1e6:.1f} MB)'))
+
+        # spawn thay vì fork: tiến trình hiện tại đã có thread grabber
+        context = multiprocessing.get_context('spawn')
+        results, stop = context.Queue(), context.Event()
+        processes = [context.Process(target=_inference_worker, daemon=True,
+                                     args=(ring.name, index, options['workers'], options['yolo_model'],
+                                           options['confidence'], results, stop))
+                     for index in range(options['workers'])]
+        for process in processes:
+            process.start()
+
+        deadline = time.monotonic() + options['duration'] if options['duration'] else None
+        inferred, overwritten, report_at = 0, 0, time.monotonic() + 5
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                try:
+                    result = results.get(timeout=0.5)
+                except queue.Empty:
+                    result = None
+                if result is not None:
+                    if 'error' in result:
+                        raise CommandError(f'Worker {result["worker"]} không load được model: {result["error"]}')
+                    if result['overwritten']:
+                        overwritten += 1
+                    else:
+                        inferred += 1
+                    if options['json']:
+                        self.stdout.write(json.dumps(result))
+                if time.monotonic() >= report_at:
+                    report_at = time.monotonic() + 5
+                    self.stdout.write(f'frame={grabber.frames} lỗi stream={grabber.errors} '
+                                      f'inference={inferred} bị ghi đè={overwritten}')
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            for process in processes:
+                process.join(timeout=5)
+            grabber.stop()
+            grabber.join(timeout=5)
+            ring.close()
+            ring.unlink()
+        self.stdout.write(f'Đã dừng: {grabber.frames} frame, {inferred} lần inference, {overwritten} bị ghi đè')
@@ -1,7 +1,8 @@
-import csv
 import os
 from django.core.management.base import BaseCommand
 from data_with_pi.models import Plant, Recipe
+from data_with_pi.services import catalog_cache
+from data_with_pi.services.csv_import import BulkCSVImporter, read_csv
 
 class Command(BaseCommand):
     help = 'Load danh sách Recipes từ file CSV vào database'
@@ -13,6 +14,17 @@ class Command(BaseCommand):
             default='plant_recipes.csv', 
             help='Đường dẫn tới file plant_recipes.csv'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Số dòng mỗi lô bulk_create/bulk_update (mặc định: 500)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Chạy thử: tính toán thay đổi nhưng không ghi vào database'
+        )
 
     def handle(self, *args, **options):
         file_path = options['file']
@@ -23,55 +35,57 @@ class Command(BaseCommand):
 
         self.stdout.write(f'Đang đọc file: {file_path}...')
 
-        created_count = 0
-        skipped_count = 0
+        # Lấy toàn bộ Plant một lần (thay vì query từng dòng)
+        plants = {name.lower(): plant_id for plant_id, name in Plant.objects.values_list('id', 'name')}
+        missing_plants = {}
 
-        try:
-            with open(file_path, mode='r', encoding='utf-8') as csv_file:
-                reader = csv.DictReader(csv_file)
-                
-                for row in reader:
-                    plant_name_csv = row['plant_name'].strip()
-                    
-                    # Tìm Plant tương ứng
-                    try:
-                        plant = Plant.objects.get(name__iexact=plant_name_csv)
-                    except Plant.DoesNotExist:
-                        self.stdout.write(self.style.WARNING(f'Bỏ qua: Không tìm thấy cây "{plant_name_csv}" trong DB'))
-                        skipped_count += 1
-                        continue
+        def build(row):
+            plant_name_csv = row['plant_name'].strip()
+            plant_id = plants.get(plant_name_csv.lower())
+            if plant_id is None:
+                missing_plants[plant_name_csv] = missing_plants.get(plant_name_csv, 0) + 1
+                return None
 
-                    recipe, created = Recipe.objects.update_or_create(
-                        plant=plant,
-                        name=row['name'].strip(),
-                        defaults={
-                            'recipe_type': row['recipe_type'].strip(),
-                            'difficulty': row['difficulty'].strip(),
-                            'usage_method': row['usage_method'].strip(),
-                            'description': row['description'].strip(),
-                            'treats': row['treats'].strip(),
-                            'benefits': row['benefits'].strip(),
-                            'main_ingredient': row['main_ingredient'].strip(),
-                            'preparation_steps': row['preparation_steps'].strip(),
-                            # Chuyển đổi string sang int an toàn
-                            'preparation_time': int(row['preparation_time']) if row['preparation_time'].isdigit() else 0,
-                            'dosage': row['dosage'].strip(),
-                            'notes': row['notes'].strip(),
-                            'is_verified': True, 
-                            'source': 'Tổng hợp Y học cổ truyền'
-                        }
-                    )
+            return {
+                'plant_id': plant_id,
+                'name': row['name'].strip(),
+                'recipe_type': row['recipe_type'].strip(),
+                'difficulty': row['difficulty'].strip(),
+                'usage_method': row['usage_method'].strip(),
+                'description': row['description'].strip(),
+                'treats': row['treats'].strip(),
+                'benefits': row['benefits'].strip(),
+                'main_ingredient': row['main_ingredient'].strip(),
+                'preparation_steps': row['preparation_steps'].strip(),
+                # Chuyển đổi string sang int an toàn
+                'preparation_time': int(row['preparation_time']) if row['preparation_time'].isdigit() else 0,
+                'dosage': row['dosage'].strip(),
+                'notes': row['notes'].strip(),
+                'is_verified': True, 
+                'source': 'Tổng hợp Y học cổ truyền'
+            }
 
-                    if created:
-                        created_count += 1
-                        # self.stdout.write(self.style.SUCCESS(f'Đã tạo: {recipe.name} ({plant.name})'))
-                    else:
-                        # self.stdout.write(f'Đã cập nhật: {recipe.name} ({plant.name})')
-                        pass
+        def invalidate(result):
+            # bulk_create/bulk_update không phát signal nên phải tự xóa cache danh mục
+            catalog_cache.invalidate_many(recipes=result.changed_keys)
 
+        importer = BulkCSVImporter(
+            Recipe, key_fields=('plant_id', 'name'),
+            batch_size=options['batch_size'], dry_run=options['dry_run'],
+            track_fields=('pk', 'plant_id'),
+        )
+        try:
+            result = importer.run((build(row) for row in read_csv(file_path)), on_commit=invalidate)
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Lỗi khi import: {str(e)}'))
+            self.stdout.write(self.style.ERROR(f'Lỗi khi import (đã rollback, không có thay đổi nào): {str(e)}'))
+            return
+
+        for plant_name, count in missing_plants.items():
+            self.stdout.write(self.style.WARNING(f'Bỏ qua {count} dòng: Không tìm thấy cây "{plant_name}" trong DB'))
 
-        self.stdout.write(self.style.SUCCESS(f'\nHOÀN TẤT!'))
-        self.stdout.write(f'- Tạo mới: {created_count}')
-        self.stdout.write(f'- Bỏ qua (không tìm thấy cây): {skipped_count}')
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f'\nHOÀN TẤT!{" (DRY-RUN - đã rollback)" if result.dry_run else ""}'))
+        self.stdout.write(f'- Tạo mới: {result.created}')
+        self.stdout.write(f'- Cập nhật: {result.updated}')
+        self.stdout.write(f'- Không đổi: {result.unchanged}')
+        self.stdout.write(f'- Bỏ qua (không tìm thấy cây): {result.skipped}')
+        self.stdout.write(f'- Thời gian: {result.elapsed:.2f}s ({result.batches} lô)')
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from data_with_pi.services.import_profile import import_report
+
+
+class Command(BaseCommand):
+    help = 'Báo cáo thời gian import (kiểu python -X importtime) của một module, mặc định data_with_pi.views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modules', nargs='*', default=['data_with_pi.views'],
+                            help='Module cần đo (mặc định: data_with_pi.views)')
+        parser.add_argument('--top', type=int, default=25, help='Số module chậm nhất cần in (mặc định: 25)')
+        parser.add_argument('--sort', choices=['self', 'cumulative'], default='cumulative',
+                            help='Sắp xếp theo thời gian riêng hay tích lũy (mặc định: cumulative)')
+        parser.add_argument('--include-setup', action='store_true',
+                            help='Tính cả thời gian django.setup() (mặc định: chỉ phần do module kéo theo)')
+        parser.add_argument('--json', action='store_true', help='In kết quả dạng JSON')
+
+    def handle(self, *args, **options):
+        reports = [import_report(module, after_setup=not options['include_setup']) for module in options['modules']]
+        if options['json']:
+            self.stdout.write(json.dumps(reports, indent=2))
+            return
+
+        key = f'{options["sort"]}_us'
+        for report in reports:
+            self.stdout.write(self.style.SUCCESS(
+                f'\n{report["module"]}: {report["total_us"] / 1000:.1f} ms ({len(report["entries"])} module)'))
+            if report['heavy_modules']:
+                self.stdout.write(self.style.WARNING(f'Thư viện nặng bị import: {", ".join(report["heavy_modules"])}'))
+
+            self.stdout.write(f'\n{"self (ms)":>10} {"cumul. (ms)":>12}  module')
+            for entry in sorted(report['entries'], key=lambda e: e[key], reverse=True)[:options['top']]:
+                self.stdout.write(f'{entry["self_us"] / 1000:>10.1f} {entry["cumulative_us"] / 1000:>12.1f}  '
+                                  f'{"  " * entry["depth"]}{entry["module"]}')
+
+            self.stdout.write('\nTheo package:')
+            for package, self_us in list(report['packages'].items())[:10]:
+                self.stdout.write(f'{self_us / 1000:>10.1f} ms  {package}')
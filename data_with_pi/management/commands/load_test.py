@@ -0,0 +1,89 @@
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from data_with_pi.benchmarks.load_test import DEFAULT_MIX, SESSIONS, SessionError, run_load_test
+
+
+def _parse_mix(value: str):
+    """'browse=3,capture=5' -> {'browse': 3.0, 'capture': 5.0}"""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in SESSIONS:
+            raise CommandError(f'Phiên không hợp lệ: {name} (có: {", ".join(SESSIONS)})')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Command(BaseCommand):
+    help = ('Load test server Django đang chạy (Pi nên là fake_pi): tăng dần số user đồng thời, '
+            'báo cáo điểm bão hòa, tỉ lệ lỗi và đường cong độ trễ')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='Địa chỉ server Django')
+        parser.add_argument('--stages', default='1,2,4,8,16,32',
+                            help='Các mức user đồng thời, cách nhau bởi dấu phẩy (mặc định: 1,2,4,8,16,32)')
+        parser.add_argument('--stage-duration', type=float, default=30, help='Số giây mỗi mức (mặc định: 30)')
+        parser.add_argument('--mix', help=f'Tỉ lệ phiên, vd: browse=3,capture=5 (mặc định: {DEFAULT_MIX})')
+        parser.add_argument('--think-time', type=float, default=0.5,
+                            help='Thời gian nghỉ trung bình giữa các phiên, giây (mặc định: 0.5)')
+        parser.add_argument('--user-prefix', default='load_user_', help='Tiền tố username của user ảo')
+        parser.add_argument('--password', default='load-test-password', help='Mật khẩu của user ảo')
+        parser.add_argument('--create-users', action='store_true',
+                            help='Tạo / đặt lại mật khẩu user ảo trong database của server (dùng chung DB)')
+        parser.add_argument('--p95-limit-ms', type=float, help='Ngưỡng p95 coi là bão hòa')
+        parser.add_argument('--max-error-rate', type=float, default=0.05, help='Ngưỡng tỉ lệ lỗi (mặc định: 0.05)')
+        parser.add_argument('--timeout', type=float, default=30, help='Timeout mỗi request, giây')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Ghi kết quả JSON ra file')
+
+    def handle(self, *args, **options):
+        try:
+            stages = sorted({int(value) for value in options['stages'].split(',') if value.strip()})
+        except ValueError:
+            raise CommandError('--stages phải là danh sách số nguyên')
+        if not stages or stages[0] < 1:
+            raise CommandError('--stages phải là các số nguyên dương')
+        mix = _parse_mix(options['mix']) if options['mix'] else DEFAULT_MIX
+
+        usernames = [f'{options["user_prefix"]}{i:03d}' for i in range(stages[-1])]
+        if options['create_users']:
+            for username in usernames:
+                user, _ = User.objects.get_or_create(username=username)
+                user.set_password(options['password'])
+                user.save(update_fields=['password'])
+            self.stdout.write(f'Đã chuẩn bị {len(usernames)} user ảo')
+
+        def progress(stage):
+            self.stdout.write(f'{stage["concurrency"]:>4} user: {stage["throughput_rps"]:>8} req/s  '
+                              f'p50={stage["p50_ms"]}ms p95={stage["p95_ms"]}ms p99={stage["p99_ms"]}ms  '
+                              f'lỗi={stage["error_rate"]:.1%}')
+
+        self.stdout.write(f'Load test {options["base_url"]} - các mức: {stages}, mỗi mức {options["stage_duration"]}s')
+        try:
+            report = run_load_test(
+                options['base_url'], [(username, options['password']) for username in usernames], stages,
+                options['stage_duration'], mix=mix, think_time=options['think_time'],
+                p95_limit_ms=options['p95_limit_ms'], max_error_rate=options['max_error_rate'],
+                timeout=options['timeout'], seed=options['seed'], progress=progress,
+            )
+        except SessionError as e:
+            raise CommandError(str(e))
+
+        report['timestamp'] = datetime.now(timezone.utc).isoformat()
+        saturation = report['saturation']
+        if saturation:
+            self.stdout.write(self.style.WARNING(
+                f'Bão hòa ở {saturation["concurrency"]} user: {"; ".join(saturation["reasons"])}'))
+            self.stdout.write(f'Mức chịu được cao nhất: {saturation["max_sustainable_concurrency"]} user')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Chưa bão hòa tới {stages[-1]} user'))
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f'✓ Đã ghi kết quả: {options["output"]}'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from data_with_pi.services.capture_stats import rebuild_capture_stats
+
+class Command(BaseCommand):
+    help = 'Tính lại các bảng thống kê tra cứu từ CaptureResult'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Số bản ghi mỗi lần bulk_create (mặc định: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Đang tính lại thống kê tra cứu...')
+
+        counts = rebuild_capture_stats(batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS('\n✓ HOÀN TẤT!'))
+        self.stdout.write(f'- Thống kê theo cây: {counts["plant"]}')
+        self.stdout.write(f'- Thống kê theo người dùng: {counts["user"]}')
+        self.stdout.write(f'- Thống kê theo ngày: {counts["daily"]}')
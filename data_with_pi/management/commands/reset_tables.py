@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from data_with_pi.models import Plant, Recipe, CaptureResult
+from data_with_pi.services.capture_stats import rebuild_capture_stats
 
 class Command(BaseCommand):
     help = 'Reset dữ liệu của một table'
@@ -28,6 +29,7 @@ class Command(BaseCommand):
         if table == 'capture' or table == 'all':
             count = CaptureResult.objects.count()
             CaptureResult.objects.all().delete()
+            rebuild_capture_stats()
             self.stdout.write(self.style.SUCCESS(f'✓ Đã xóa {count} capture results'))
         
         self.stdout.write(self.style.SUCCESS('\n✓ HOÀN TẤT!'))
\ No newline at end of file
@@ -0,0 +1,109 @@
+import json
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from data_with_pi.benchmarks import scenarios
+from data_with_pi.benchmarks.fake_pi import FakePiServer
+from data_with_pi.benchmarks.fixtures import build_fixture_yolo_model, load_frames
+from data_with_pi.models import PiDevice
+from data_with_pi.services.pi_fleet import pi_fleet
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+class Command(BaseCommand):
+    help = ('Chạy bộ benchmark (Pi giả + ảnh fixture) trên database test riêng, '
+            'in p50/p95/p99 và throughput dạng JSON để so sánh giữa các commit')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=scenarios.SCENARIOS,
+                            help='Kịch bản cần chạy (lặp lại để chạy nhiều kịch bản, mặc định: tất cả)')
+        parser.add_argument('--iterations', type=int, default=50, help='Số lần chạy mỗi kịch bản (mặc định: 50)')
+        parser.add_argument('--concurrency', type=int, default=4, help='Số luồng chạy song song (mặc định: 4)')
+        parser.add_argument('--latency-scale', type=float, default=1.0,
+                            help='Hệ số độ trễ của Pi giả (0 = không chờ, mặc định: 1.0)')
+        parser.add_argument('--jitter', type=float, default=0.1, help='Dao động độ trễ tương đối (mặc định: 0.1)')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Tỉ lệ request Pi bị lỗi 503')
+        parser.add_argument('--frames-dir', help='Thư mục frame .jpg đã ghi (mặc định: ảnh tổng hợp)')
+        parser.add_argument('--yolo-model', help='Model YOLO cho yolo_detect_loop (mặc định: tạo model fixture)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed cho độ trễ / lỗi của Pi giả')
+        parser.add_argument('--output', help='Ghi kết quả JSON ra file')
+        parser.add_argument('--keepdb', action='store_true', help='Giữ lại database test sau khi chạy')
+
+    def handle(self, *args, **options):
+        selected = options['scenario'] or list(scenarios.SCENARIOS)
+        if 'yolo_detect_loop' in selected and not scenarios.yolo_available():
+            if options['scenario']:
+                raise CommandError('yolo_detect_loop cần opencv-python và ultralytics')
+            selected.remove('yolo_detect_loop')
+            self.stdout.write(self.style.WARNING('Bỏ qua yolo_detect_loop (chưa cài opencv-python/ultralytics)'))
+
+        fake_pi = FakePiServer(latency_scale=options['latency_scale'], jitter=options['jitter'],
+                               failure_rate=options['failure_rate'], frames_dir=options['frames_dir'],
+                               seed=options['seed'])
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, keepdb=options['keepdb'])
+        try:
+            with fake_pi, tempfile.TemporaryDirectory(prefix='leafmed-bench-') as workdir, \
+                    override_settings(MEDIA_ROOT=Path(workdir) / 'media',
+                                      PI_IMAGE_CACHE_DIR=Path(workdir) / 'pi_image_cache',
+                                      PI_API_BASE_URL=fake_pi.base_url):
+                results = self._run(selected, fake_pi, Path(workdir), options)
+        finally:
+            pi_fleet.invalidate()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        report = {
+            'commit': _git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'config': {key: options[key] for key in ('iterations', 'concurrency', 'latency_scale', 'jitter',
+                                                     'failure_rate', 'frames_dir', 'seed')},
+            'scenarios': results,
+        }
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            Path(options['output']).write_text(output, encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f'✓ Đã ghi kết quả: {options["output"]}'))
+        self.stdout.write(output)
+
+    def _run(self, selected, fake_pi, workdir, options):
+        user = User.objects.create_user(scenarios.BENCH_USERNAME, password='bench-password')
+        PiDevice.objects.create(name='fake-pi', base_url=fake_pi.base_url)  # signal -> pi_fleet.invalidate()
+
+        results = {}
+        for name in selected:
+            setup = lambda: scenarios.logged_in_client(user)  # noqa: E731
+            if name == 'status_polling':
+                step = scenarios.status_polling
+            elif name == 'capture_analyze_save':
+                step = scenarios.capture_analyze_save
+            elif name == 'upload_burst':
+                step = scenarios.make_upload_burst(load_frames(options['frames_dir']))
+            else:
+                model_path = options['yolo_model'] or build_fixture_yolo_model(workdir / 'fixture_yolo.pt')
+                step = scenarios.make_yolo_detect_loop(f'{fake_pi.base_url}/stream/live', model_path)
+                setup = None
+
+            self.stdout.write(f'Đang chạy {name}...')
+            fake_pi.hits.clear()
+            summary = scenarios.run_scenario(step, options['iterations'], options['concurrency'], setup=setup)
+            summary['pi_requests'] = dict(fake_pi.hits)
+            results[name] = summary
+            self.stdout.write(f'  p50={summary["p50_ms"]}ms p95={summary["p95_ms"]}ms '
+                              f'p99={summary["p99_ms"]}ms {summary["throughput_rps"]} req/s '
+                              f'lỗi={summary["errors"]}')
+        return results
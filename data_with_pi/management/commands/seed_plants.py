@@ -1,7 +1,8 @@
-import csv
 import os
 from django.core.management.base import BaseCommand
 from data_with_pi.models import Plant
+from data_with_pi.services import catalog_cache
+from data_with_pi.services.csv_import import BulkCSVImporter, read_csv
 
 class Command(BaseCommand):
     help = 'Load danh sách plants từ file CSV vào database'
@@ -13,6 +14,17 @@ class Command(BaseCommand):
             default='plants.csv', 
             help='Đường dẫn tới file plants.csv'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Số dòng mỗi lô bulk_create/bulk_update (mặc định: 500)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Chạy thử: tính toán thay đổi nhưng không ghi vào database'
+        )
 
     def handle(self, *args, **options):
         file_path = options['file']
@@ -24,41 +36,37 @@ class Command(BaseCommand):
 
         self.stdout.write(f'Đang đọc file: {file_path}...')
 
-        created_count = 0
-        updated_count = 0
+        def build(row):
+            # Tìm Plant theo 'name': có rồi thì cập nhật các trường còn lại, chưa có thì tạo mới
+            return {
+                'name': row['name'].strip(),
+                'scientific_name': row['scientific_name'].strip(),
+                'english_name': row['english_name'].strip(),
+                'vietnamese_name': row['vietnamese_name'].strip(),
+                'description': row['description'].strip(),
+                'biological_info': row['biological_info'].strip(),
+                'medicinal_info': row['medicinal_info'].strip(),
+                'usage': row['usage'].strip(),
+                'common_locations': row['common_locations'].strip(),
+                'should_save': True
+            }
 
-        try:
-            with open(file_path, mode='r', encoding='utf-8') as csv_file:
-                reader = csv.DictReader(csv_file)
-                
-                for row in reader:
-                    # Sử dụng update_or_create để tránh trùng lặp nếu chạy lại script
-                    # Nó sẽ tìm Plant theo 'name', nếu có rồi thì update các trường còn lại, chưa có thì tạo mới.
-                    plant, created = Plant.objects.update_or_create(
-                        name=row['name'].strip(),
-                        defaults={
-                            'scientific_name': row['scientific_name'].strip(),
-                            'english_name': row['english_name'].strip(),
-                            'vietnamese_name': row['vietnamese_name'].strip(),
-                            'description': row['description'].strip(),
-                            'biological_info': row['biological_info'].strip(),
-                            'medicinal_info': row['medicinal_info'].strip(),
-                            'usage': row['usage'].strip(),
-                            'common_locations': row['common_locations'].strip(),
-                            'should_save': True
-                        }
-                    )
-
-                    if created:
-                        created_count += 1
-                        self.stdout.write(self.style.SUCCESS(f'Đã tạo mới: {plant.name}'))
-                    else:
-                        updated_count += 1
-                        self.stdout.write(f'Đã cập nhật: {plant.name}')
+        def invalidate(result):
+            # bulk_create/bulk_update không phát signal nên phải tự xóa cache danh mục
+            catalog_cache.invalidate_many(plant_ids=(pk for pk, in result.changed_keys))
 
+        importer = BulkCSVImporter(
+            Plant, key_fields=('name',),
+            batch_size=options['batch_size'], dry_run=options['dry_run'],
+        )
+        try:
+            result = importer.run((build(row) for row in read_csv(file_path)), on_commit=invalidate)
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Lỗi khi import: {str(e)}'))
+            self.stdout.write(self.style.ERROR(f'Lỗi khi import (đã rollback, không có thay đổi nào): {str(e)}'))
+            return
 
-        self.stdout.write(self.style.SUCCESS(f'\nHOÀN TẤT!'))
-        self.stdout.write(f'- Tạo mới: {created_count}')
-        self.stdout.write(f'- Cập nhật: {updated_count}')
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f'\nHOÀN TẤT!{" (DRY-RUN - đã rollback)" if result.dry_run else ""}'))
+        self.stdout.write(f'- Tạo mới: {result.created}')
+        self.stdout.write(f'- Cập nhật: {result.updated}')
+        self.stdout.write(f'- Không đổi: {result.unchanged}')
+        self.stdout.write(f'- Thời gian: {result.elapsed:.2f}s ({result.batches} lô)')
@@ -0,0 +1,137 @@
+"""
+Middleware của app data_with_pi
+"""
+import json
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import Resolver404, get_resolver
+
+from .services import metrics, perf, profiling
+
+perf_logger = logging.getLogger('data_with_pi.perf')
+
+
+def _route_name(request) -> str:
+    """Tên route (không chứa tham số) để histogram không bị bùng nổ nhãn"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.url_name or match.route or match.view_name
+
+
+def _resolve_route(request) -> str:
+    """Như _route_name nhưng dùng được trước khi Django resolve URL (trong __call__ của middleware)"""
+    try:
+        match = get_resolver(getattr(request, 'urlconf', None)).resolve(request.path_info)
+    except Resolver404:
+        return 'unmatched'
+    return match.url_name or match.route or match.view_name
+
+
+def _metric_name(name: str) -> str:
+    # Tên metric trong Server-Timing phải là token (không có khoảng trắng, '/', ...)
+    return ''.join(ch if ch.isalnum() or ch in '._-' else '_' for ch in name)
+
+
+class PerformanceMiddleware:
+    """
+    Đo mỗi request: tổng thời gian, số query / thời gian DB, các span (Pi, YOLO...)
+    và kích thước response.
+    - Header Server-Timing (xem trực tiếp trong DevTools của trình duyệt): chỉ cho staff,
+      hoặc mọi request khi PERF_SERVER_TIMING bật
+    - Log có cấu trúc (JSON) qua logger 'data_with_pi.perf'
+    - Histogram trong process (services.perf.histograms)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'PERF_ENABLED', True)
+        self.slow_ms = getattr(settings, 'PERF_SLOW_REQUEST_MS', 1000)
+        self.server_timing = getattr(settings, 'PERF_SERVER_TIMING', settings.DEBUG)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        profile = perf.RequestProfile()
+        token = perf.activate(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.db_wrapper))
+                response = self.get_response(request)
+        finally:
+            perf.deactivate(token)
+
+        self._report(request, response, profile)
+        return response
+
+    def _show_timing(self, request) -> bool:
+        if self.server_timing:
+            return True
+        user = getattr(request, 'user', None)
+        return bool(user is not None and user.is_authenticated and user.is_staff)
+
+    def _report(self, request, response, profile) -> None:
+        total_ms = profile.elapsed_ms()
+        route = _route_name(request)
+        # Response streaming (SSE, FileResponse): không biết trước kích thước
+        size = None if response.streaming else len(response.content)
+
+        histograms = perf.histograms
+        histograms.observe('request_duration_ms', total_ms, route=route, method=request.method)
+        metrics.HTTP_REQUEST_SECONDS.labels(route, request.method).observe(total_ms / 1000)
+        metrics.HTTP_REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+        histograms.observe('request_db_queries', profile.db_queries, perf.COUNT_BUCKETS, route=route)
+        histograms.observe('request_db_time_ms', profile.db_time_ms, route=route)
+        if size is not None:
+            histograms.observe('response_size_bytes', size, perf.SIZE_BUCKETS, route=route)
+
+        spans = profile.span_items()
+        if self._show_timing(request):
+            timing = [f'total;dur={total_ms:.1f}',
+                      f'db;dur={profile.db_time_ms:.1f};desc="{profile.db_queries} queries"']
+            timing += [f'{_metric_name(name)};dur={elapsed:.1f};desc="{count}x"'
+                       for name, (count, elapsed) in spans]
+            response['Server-Timing'] = ', '.join(timing)
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'db_queries': profile.db_queries,
+            'db_ms': round(profile.db_time_ms, 1),
+            'spans': {name: {'count': count, 'ms': round(elapsed, 1)}
+                      for name, (count, elapsed) in spans},
+            'response_bytes': size,
+        }
+        level = logging.WARNING if total_ms >= self.slow_ms else logging.INFO
+        perf_logger.log(level, json.dumps(record, ensure_ascii=False))
+
+
+class ProfilingMiddleware:
+    """
+    Profiling view theo yêu cầu (xem services.profiling). Đặt CUỐI MIDDLEWARE để
+    request.user đã có và profile chỉ chứa phần view.
+    Profiler bọc get_response chứ không tự gọi view: Django vẫn gọi view như khi không profile
+    (ATOMIC_REQUESTS, process_view / process_exception của các middleware khác, lỗi -> response 500).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            return self.get_response(request)
+        route = _resolve_route(request)
+        if not profiling.should_profile(request, route):
+            return self.get_response(request)
+        mode = request.headers.get(profiling.PROFILE_MODE_HEADER)
+        response, profile_id = profiling.run_profiled(self.get_response, request, (), {}, route, mode)
+        response['X-LeafMed-Profile-Id'] = profile_id
+        return response
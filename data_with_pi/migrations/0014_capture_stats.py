@@ -0,0 +1,77 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('data_with_pi', '0013_recipe_image_recipeimage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserPlantCaptureStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('capture_count', models.PositiveIntegerField(default=0, verbose_name='Số lần tra cứu')),
+                ('confidence_count', models.PositiveIntegerField(default=0, verbose_name='Số lần có độ tin cậy')),
+                ('confidence_sum', models.FloatField(default=0.0, verbose_name='Tổng độ tin cậy')),
+                ('confidence_min', models.FloatField(blank=True, null=True, verbose_name='Độ tin cậy thấp nhất')),
+                ('confidence_max', models.FloatField(blank=True, null=True, verbose_name='Độ tin cậy cao nhất')),
+                ('last_seen_at', models.DateTimeField(blank=True, null=True, verbose_name='Lần cuối tra cứu')),
+                ('plant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_capture_stats', to='data_with_pi.plant', verbose_name='Cây thuốc')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plant_capture_stats', to=settings.AUTH_USER_MODEL, verbose_name='Người dùng')),
+            ],
+            options={
+                'verbose_name': 'Thống kê theo người dùng',
+                'verbose_name_plural': 'Thống kê theo người dùng',
+                'ordering': ['-capture_count'],
+                'indexes': [models.Index(fields=['user', '-capture_count'], name='user_stats_count_idx')],
+                'unique_together': {('user', 'plant')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PlantCaptureStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('capture_count', models.PositiveIntegerField(default=0, verbose_name='Số lần tra cứu')),
+                ('confidence_count', models.PositiveIntegerField(default=0, verbose_name='Số lần có độ tin cậy')),
+                ('confidence_sum', models.FloatField(default=0.0, verbose_name='Tổng độ tin cậy')),
+                ('confidence_min', models.FloatField(blank=True, null=True, verbose_name='Độ tin cậy thấp nhất')),
+                ('confidence_max', models.FloatField(blank=True, null=True, verbose_name='Độ tin cậy cao nhất')),
+                ('last_seen_at', models.DateTimeField(blank=True, null=True, verbose_name='Lần cuối tra cứu')),
+                ('plant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='capture_stats', to='data_with_pi.plant', verbose_name='Cây thuốc')),
+            ],
+            options={
+                'verbose_name': 'Thống kê theo cây',
+                'verbose_name_plural': 'Thống kê theo cây',
+                'ordering': ['-capture_count'],
+                'indexes': [models.Index(fields=['-capture_count'], name='plant_stats_count_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyPlantCaptureStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('capture_count', models.PositiveIntegerField(default=0, verbose_name='Số lần tra cứu')),
+                ('confidence_count', models.PositiveIntegerField(default=0, verbose_name='Số lần có độ tin cậy')),
+                ('confidence_sum', models.FloatField(default=0.0, verbose_name='Tổng độ tin cậy')),
+                ('confidence_min', models.FloatField(blank=True, null=True, verbose_name='Độ tin cậy thấp nhất')),
+                ('confidence_max', models.FloatField(blank=True, null=True, verbose_name='Độ tin cậy cao nhất')),
+                ('last_seen_at', models.DateTimeField(blank=True, null=True, verbose_name='Lần cuối tra cứu')),
+                ('day', models.DateField(verbose_name='Ngày')),
+                ('plant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_capture_stats', to='data_with_pi.plant', verbose_name='Cây thuốc')),
+            ],
+            options={
+                'verbose_name': 'Thống kê theo ngày',
+                'verbose_name_plural': 'Thống kê theo ngày',
+                'ordering': ['-day', '-capture_count'],
+                'indexes': [models.Index(fields=['-day'], name='daily_stats_day_idx')],
+                'unique_together': {('day', 'plant')},
+            },
+        ),
+    ]
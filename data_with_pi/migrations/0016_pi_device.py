@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('data_with_pi', '0015_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PiDevice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Tên trạm')),
+                ('base_url', models.URLField(help_text='VD: http://192.168.137.251:8001', unique=True, verbose_name='Địa chỉ API')),
+                ('location', models.CharField(blank=True, default='', max_length=255, verbose_name='Vị trí')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Đang hoạt động')),
+                ('accepts_inference', models.BooleanField(default=True, help_text='Cho phép nhận ảnh phân tích từ các trạm khác (cân bằng tải)', verbose_name='Nhận phân tích')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('users', models.ManyToManyField(blank=True, help_text='Người dùng chụp ảnh tại trạm này', related_name='pi_stations', to=settings.AUTH_USER_MODEL, verbose_name='Người dùng')),
+            ],
+            options={
+                'verbose_name': 'Trạm Pi',
+                'verbose_name_plural': 'Trạm Pi',
+                'ordering': ['name'],
+            },
+        ),
+    ]
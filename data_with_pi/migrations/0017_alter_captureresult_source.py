@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_with_pi', '0016_pi_device'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='captureresult',
+            name='source',
+            field=models.CharField(choices=[('pi', 'Pi Capture'), ('upload', 'User Upload'), ('yolo_crop', 'YOLO Cropped')], default='pi', max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_with_pi', '0017_alter_captureresult_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='captureresult',
+            name='pi_device',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
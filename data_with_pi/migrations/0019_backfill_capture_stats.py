@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def backfill_capture_stats(apps, schema_editor):
+    """Tính các bảng thống kê từ CaptureResult đã có (0014 chỉ tạo bảng rỗng)"""
+    from data_with_pi.services.capture_stats import rebuild_capture_stats
+
+    rebuild_capture_stats(apps=apps)
+
+
+def noop(apps, schema_editor):
+    """Reverse migration - không làm gì, bảng thống kê bị xóa khi lùi 0014"""
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_with_pi', '0018_captureresult_pi_device'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_capture_stats, noop),
+    ]
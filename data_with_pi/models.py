@@ -1,7 +1,43 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
 
-class Plant(models.Model):
+
+class ImageVariantsModel(models.Model):
+    """Model có field image kèm các biến thể responsive (xem services/image_variants.py)"""
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def _variant_srcset(self, fmt):
+        variants = (self.image_variants or {}).get('variants', {})
+        # Ảnh gốc nhỏ có thể cho nhiều biến thể cùng chiều rộng - chỉ giữ một
+        by_width = {}
+        for info in variants.values():
+            if fmt in info:
+                by_width.setdefault(info['width'], info[fmt])
+        return ', '.join(f'{default_storage.url(path)} {width}w' for width, path in sorted(by_width.items()))
+
+    @property
+    def image_srcset(self):
+        """srcset JPEG (rỗng nếu chưa sinh biến thể)"""
+        return self._variant_srcset('jpeg')
+
+    @property
+    def image_webp_srcset(self):
+        """srcset WebP (rỗng nếu chưa sinh biến thể)"""
+        return self._variant_srcset('webp')
+
+    @property
+    def image_thumb_url(self):
+        """URL ảnh thumbnail, fallback về ảnh gốc"""
+        thumb = (self.image_variants or {}).get('variants', {}).get('thumb')
+        if thumb:
+            return default_storage.url(thumb['jpeg'])
+        return self.image.url if self.image else ''
+
+class Plant(ImageVariantsModel):
     """Bảng lưu thông tin cây/thực vật"""
     name = models.CharField(max_length=255, unique=True)  # Tên tiếng Việt (chính)
     scientific_name = models.CharField(max_length=255, blank=True, default='')  # Tên khoa học
@@ -30,6 +66,7 @@ class CaptureResult(models.Model):
     name = models.CharField(max_length=255, blank=True, default='')
     confidence = models.FloatField(null=True, blank=True)
     image_file = models.CharField(max_length=255, blank=True, default='')  # tên file trên Pi
+    pi_device = models.CharField(max_length=255, blank=True, default='')  # base_url trạm Pi đang giữ image_file
     local_image = models.ImageField(upload_to='captures/%Y/%m/%d/', null=True, blank=True)  # Ảnh lưu tại server
     source = models.CharField(max_length=16, default='pi', choices=[
         ('pi', 'Pi Capture'), 
@@ -50,6 +87,29 @@ class CaptureResult(models.Model):
     def __str__(self):
         return f'{self.created_at:%Y-%m-%d %H:%M:%S} - {self.user.username} - {self.name} ({self.confidence})'
 
+    STATS_FIELDS = ('plant_id', 'user_id', 'success', 'confidence', 'created_at')  # ảnh hưởng bảng thống kê
+
+    def save(self, *args, **kwargs):
+        """
+        Insert mới sẽ cập nhật bảng thống kê trong cùng transaction;
+        sửa cây / user / độ tin cậy thì tính lại các dòng thống kê cũ và mới
+        """
+        from .services.capture_stats import count_created, record_capture, refresh_stats, stat_keys
+
+        creating = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        tracked = not creating and (update_fields is None or
+                                    set(update_fields) & {*self.STATS_FIELDS, 'plant', 'user'})
+        with transaction.atomic():
+            previous = CaptureResult.objects.filter(pk=self.pk).only(*self.STATS_FIELDS).first() if tracked else None
+            super().save(*args, **kwargs)
+            if creating:
+                record_capture(self)
+                count_created([self])
+            elif previous is not None and any(getattr(previous, field) != getattr(self, field)
+                                              for field in self.STATS_FIELDS):
+                refresh_stats(stat_keys(previous) + stat_keys(self))
+
 class UserCameraPreset(models.Model):
     """Preset camera do user tự tạo"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='camera_presets')
@@ -69,7 +129,29 @@ class UserCameraPreset(models.Model):
     def __str__(self):
         return f'{self.user.username} - {self.name}'
 
-class Recipe(models.Model):
+class PiDevice(models.Model):
+    """Trạm chụp Raspberry Pi (một deployment có thể có nhiều Pi)"""
+    name = models.CharField(max_length=255, unique=True, verbose_name='Tên trạm')
+    base_url = models.URLField(unique=True, verbose_name='Địa chỉ API', help_text='VD: http://192.168.137.251:8001')
+    location = models.CharField(max_length=255, blank=True, default='', verbose_name='Vị trí')
+    is_active = models.BooleanField(default=True, verbose_name='Đang hoạt động')
+    accepts_inference = models.BooleanField(default=True, verbose_name='Nhận phân tích',
+                                            help_text='Cho phép nhận ảnh phân tích từ các trạm khác (cân bằng tải)')
+    users = models.ManyToManyField(User, blank=True, related_name='pi_stations', verbose_name='Người dùng',
+                                   help_text='Người dùng chụp ảnh tại trạm này')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Trạm Pi'
+        verbose_name_plural = 'Trạm Pi'
+        ordering = ['name']
+
+    def __str__(self):
+        return f'{self.name} ({self.base_url})'
+
+
+class Recipe(ImageVariantsModel):
     """Công thức thuốc từ cây"""
     RECIPE_TYPE_CHOICES = [
         ('tea', 'Trà/Nước sắc'),
@@ -154,7 +236,7 @@ class Recipe(models.Model):
         return f'{self.name} - {self.plant.name}'
 
 
-class RecipeImage(models.Model):
+class RecipeImage(ImageVariantsModel):
     """Ảnh bổ sung cho công thức (cho phép nhiều ảnh)"""
     recipe = models.ForeignKey('Recipe', on_delete=models.CASCADE, related_name='images', verbose_name='Công thức')
     image = models.ImageField(upload_to='recipes/gallery/', verbose_name='Ảnh')
@@ -172,4 +254,87 @@ class RecipeImage(models.Model):
         ]
     
     def __str__(self):
-        return f'{self.recipe.name} - Ảnh {self.order}'
\ No newline at end of file
+        return f'{self.recipe.name} - Ảnh {self.order}'
+
+class CaptureStatsBase(models.Model):
+    """Các cột thống kê dùng chung cho bảng tổng hợp CaptureResult (cập nhật tăng dần khi insert)"""
+    capture_count = models.PositiveIntegerField(default=0, verbose_name='Số lần tra cứu')
+    confidence_count = models.PositiveIntegerField(default=0, verbose_name='Số lần có độ tin cậy')
+    confidence_sum = models.FloatField(default=0.0, verbose_name='Tổng độ tin cậy')
+    confidence_min = models.FloatField(null=True, blank=True, verbose_name='Độ tin cậy thấp nhất')
+    confidence_max = models.FloatField(null=True, blank=True, verbose_name='Độ tin cậy cao nhất')
+    last_seen_at = models.DateTimeField(null=True, blank=True, verbose_name='Lần cuối tra cứu')
+
+    class Meta:
+        abstract = True
+
+    @property
+    def confidence_avg(self):
+        """Độ tin cậy trung bình (None nếu chưa có dữ liệu)"""
+        if not self.confidence_count:
+            return None
+        return self.confidence_sum / self.confidence_count
+
+    def add_capture(self, confidence, created_at):
+        """Cộng dồn một CaptureResult vào bản ghi thống kê (chưa save)"""
+        self.capture_count += 1
+        if confidence is not None:
+            confidence = float(confidence)
+            self.confidence_count += 1
+            self.confidence_sum += confidence
+            self.confidence_min = confidence if self.confidence_min is None else min(self.confidence_min, confidence)
+            self.confidence_max = confidence if self.confidence_max is None else max(self.confidence_max, confidence)
+        if self.last_seen_at is None or created_at > self.last_seen_at:
+            self.last_seen_at = created_at
+
+
+class PlantCaptureStats(CaptureStatsBase):
+    """Thống kê tra cứu theo từng cây (toàn hệ thống)"""
+    plant = models.OneToOneField('Plant', on_delete=models.CASCADE, related_name='capture_stats', verbose_name='Cây thuốc')
+
+    class Meta:
+        verbose_name = 'Thống kê theo cây'
+        verbose_name_plural = 'Thống kê theo cây'
+        ordering = ['-capture_count']
+        indexes = [
+            models.Index(fields=['-capture_count'], name='plant_stats_count_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.plant.name} - {self.capture_count}'
+
+
+class UserPlantCaptureStats(CaptureStatsBase):
+    """Thống kê tra cứu theo user và cây"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='plant_capture_stats', verbose_name='Người dùng')
+    plant = models.ForeignKey('Plant', on_delete=models.CASCADE, related_name='user_capture_stats', verbose_name='Cây thuốc')
+
+    class Meta:
+        verbose_name = 'Thống kê theo người dùng'
+        verbose_name_plural = 'Thống kê theo người dùng'
+        ordering = ['-capture_count']
+        unique_together = [['user', 'plant']]
+        indexes = [
+            models.Index(fields=['user', '-capture_count'], name='user_stats_count_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} - {self.plant.name} - {self.capture_count}'
+
+
+class DailyPlantCaptureStats(CaptureStatsBase):
+    """Thống kê tra cứu theo ngày và cây"""
+    day = models.DateField(verbose_name='Ngày')
+    plant = models.ForeignKey('Plant', on_delete=models.CASCADE, related_name='daily_capture_stats', verbose_name='Cây thuốc')
+
+    class Meta:
+        verbose_name = 'Thống kê theo ngày'
+        verbose_name_plural = 'Thống kê theo ngày'
+        ordering = ['-day', '-capture_count']
+        unique_together = [['day', 'plant']]
+        indexes = [
+            models.Index(fields=['-day'], name='daily_stats_day_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.day} - {self.plant.name} - {self.capture_count}'
@@ -0,0 +1,175 @@
+"""
+Service thống kê tra cứu (CaptureResult)
+Duy trì các bảng tổng hợp theo cây / user / ngày, cập nhật tăng dần khi insert
+để các trang plant_detail, profile đọc thống kê mà không cần GROUP BY.
+Xóa capture hoặc sửa cây / user / độ tin cậy (save(), admin) -> tính lại đúng các dòng thống kê
+bị ảnh hưởng. QuerySet.update() bỏ qua save() nên không được theo dõi: chạy rebuild_capture_stats.
+"""
+import logging
+from collections import Counter, defaultdict
+from typing import Iterable, List, Tuple
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .metrics import CAPTURE_RESULTS_CREATED
+from ..models import (
+    CaptureResult,
+    DailyPlantCaptureStats,
+    PlantCaptureStats,
+    UserPlantCaptureStats,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _bump(model, captures, **keys):
+    """Khóa (hoặc tạo) bản ghi thống kê theo keys rồi cộng dồn các capture"""
+    stats, _ = model.objects.select_for_update().get_or_create(**keys)
+    for capture in captures:
+        stats.add_capture(capture.confidence, capture.created_at or timezone.now())
+    stats.save()
+
+
+def stat_keys(capture: CaptureResult) -> List[Tuple]:
+    """Các dòng thống kê (model, khóa) mà một capture đóng góp vào (rỗng nếu không tính)"""
+    if not capture.success or capture.plant_id is None:
+        return []
+    created_at = capture.created_at or timezone.now()
+    keys = [
+        (PlantCaptureStats, (('plant_id', capture.plant_id),)),
+        (DailyPlantCaptureStats, (('day', timezone.localdate(created_at)), ('plant_id', capture.plant_id))),
+    ]
+    if capture.user_id is not None:
+        keys.append((UserPlantCaptureStats, (('user_id', capture.user_id), ('plant_id', capture.plant_id))))
+    return keys
+
+
+def _ordered(keys):
+    # Khóa theo thứ tự cố định để các transaction đồng thời không deadlock
+    return sorted(keys, key=lambda key: (key[0].__name__, str(key[1])))
+
+
+def record_captures(captures: Iterable[CaptureResult]) -> None:
+    """
+    Cộng dồn các CaptureResult vừa tạo vào các bảng thống kê
+    (mỗi bản ghi thống kê chỉ bị khóa/ghi một lần cho cả lô).
+    Chạy trong cùng transaction với insert (nếu có) để không lệch số liệu.
+    """
+    groups = defaultdict(list)
+    for capture in captures:
+        for key in stat_keys(capture):
+            groups[key].append(capture)
+
+    if not groups:
+        return
+    with transaction.atomic():
+        for model, keys in _ordered(groups):
+            _bump(model, groups[(model, keys)], **dict(keys))
+
+
+def refresh_stats(keys: Iterable[Tuple]) -> None:
+    """
+    Tính lại từ CaptureResult đúng các dòng thống kê cho trước (sau khi xóa / sửa capture:
+    min/max/last_seen không trừ ngược được). Dòng không còn capture nào bị xóa.
+    """
+    with transaction.atomic():
+        for model, keys in _ordered(set(keys)):
+            keys = dict(keys)
+            filters = {key: value for key, value in keys.items() if key != 'day'}
+            captures = CaptureResult.objects.filter(success=True, **filters)
+            if 'day' in keys:
+                captures = captures.filter(created_at__date=keys['day'])
+            row = next(iter(_aggregate(captures, 'plant_id')), None)
+            if row is None:
+                model.objects.filter(**keys).delete()
+                continue
+            row.pop('plant_id')
+            model.objects.update_or_create(**keys, defaults={**row, 'confidence_sum': row['confidence_sum'] or 0.0})
+
+
+def record_capture(capture: CaptureResult) -> None:
+    """Cộng dồn một CaptureResult vừa tạo vào các bảng thống kê"""
+    record_captures([capture])
+
+
+def bulk_create_captures(captures: List[CaptureResult], batch_size: int = 500) -> List[CaptureResult]:
+    """
+    Insert nhiều CaptureResult bằng bulk_create (không gọi save() của từng bản ghi)
+    và cập nhật thống kê trong cùng transaction.
+    """
+    with transaction.atomic():
+        created = CaptureResult.objects.bulk_create(captures, batch_size=batch_size)
+        record_captures(created)
+        count_created(created)
+    return created
+
+
+def count_created(captures: Iterable[CaptureResult]) -> None:
+    """Đếm capture mới vào metric khi transaction ngoài cùng commit (rollback -> không đếm)"""
+    sources = Counter(capture.source for capture in captures)
+
+    def inc():
+        for source, count in sources.items():
+            CAPTURE_RESULTS_CREATED.labels(source).inc(count)
+
+    transaction.on_commit(inc)
+
+
+def _aggregate(queryset, *group_by):
+    """GROUP BY trên CaptureResult, trả về các cột của CaptureStatsBase"""
+    return queryset.values(*group_by).annotate(
+        capture_count=Count('id'),
+        confidence_count=Count('confidence'),
+        confidence_sum=Sum('confidence'),
+        confidence_min=Min('confidence'),
+        confidence_max=Max('confidence'),
+        last_seen_at=Max('created_at'),
+    ).order_by()
+
+
+def rebuild_capture_stats(batch_size: int = 1000, apps=None) -> dict:
+    """
+    Tính lại toàn bộ bảng thống kê từ CaptureResult (dùng khi dữ liệu bị lệch,
+    ví dụ sau QuerySet.update() trên CaptureResult). Trả về số bản ghi đã tạo cho mỗi bảng.
+    apps: registry model lịch sử khi chạy trong migration (RunPython)
+    """
+    models = (CaptureResult, PlantCaptureStats, UserPlantCaptureStats, DailyPlantCaptureStats)
+    if apps is not None:
+        models = tuple(apps.get_model('data_with_pi', model.__name__) for model in models)
+    capture_model, plant_model, user_model, daily_model = models
+
+    captures = capture_model.objects.filter(success=True, plant__isnull=False)
+    counts = {}
+
+    with transaction.atomic():
+        plant_model.objects.all().delete()
+        user_model.objects.all().delete()
+        daily_model.objects.all().delete()
+
+        plant_rows = [
+            plant_model(**{**row, 'confidence_sum': row['confidence_sum'] or 0.0})
+            for row in _aggregate(captures, 'plant_id')
+        ]
+        plant_model.objects.bulk_create(plant_rows, batch_size=batch_size)
+        counts['plant'] = len(plant_rows)
+
+        user_rows = [
+            user_model(**{**row, 'confidence_sum': row['confidence_sum'] or 0.0})
+            for row in _aggregate(captures.filter(user__isnull=False), 'user_id', 'plant_id')
+        ]
+        user_model.objects.bulk_create(user_rows, batch_size=batch_size)
+        counts['user'] = len(user_rows)
+
+        daily_qs = captures.annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+        daily_rows = [
+            daily_model(**{**row, 'confidence_sum': row['confidence_sum'] or 0.0})
+            for row in _aggregate(daily_qs, 'day', 'plant_id')
+        ]
+        daily_model.objects.bulk_create(daily_rows, batch_size=batch_size)
+        counts['daily'] = len(daily_rows)
+
+    logger.info(f"Rebuilt capture stats: {counts}")
+    return counts
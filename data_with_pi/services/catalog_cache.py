@@ -0,0 +1,167 @@
+"""
+Cache cho các trang danh mục (home, plant_detail, recipe_detail)
+- Phiên bản (Last-Modified) của từng trang lấy từ Plant.updated_at / Recipe.updated_at,
+  lưu trong cache và bị xóa bởi signal khi dữ liệu thay đổi
+- Sinh ETag/Last-Modified cho decorator condition() để trả 304 khi trang không đổi
+"""
+import hashlib
+import logging
+from typing import Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .metrics import record_cache
+from ..models import CaptureResult, Plant, PlantCaptureStats, Recipe, RecipeImage, UserPlantCaptureStats
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 3600)
+
+HOME_KEY = 'catalog:home'
+PLANT_KEY = 'catalog:plant:{}'
+RECIPE_KEY = 'catalog:recipe:{}'
+
+
+def _latest(*values):
+    """Thời điểm mới nhất trong các giá trị (bỏ qua None)"""
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def _cached(key, compute):
+    value = cache.get(key)
+    record_cache('catalog', hit=value is not None)
+    if value is None:
+        value = compute()
+        if value is not None:
+            cache.set(key, value, CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+def home_last_modified():
+    """Thời điểm cập nhật mới nhất của danh sách cây trên trang chủ"""
+    return _cached(HOME_KEY, lambda: Plant.objects.aggregate(latest=Max('updated_at'))['latest'])
+
+
+def plant_last_modified(plant_id):
+    """Thời điểm cập nhật mới nhất của cây và các công thức của nó"""
+    def compute():
+        plant_updated = Plant.objects.filter(id=plant_id).values_list('updated_at', flat=True).first()
+        if plant_updated is None:
+            return None
+        recipes_updated = Recipe.objects.filter(plant_id=plant_id).aggregate(latest=Max('updated_at'))['latest']
+        return _latest(plant_updated, recipes_updated)
+    return _cached(PLANT_KEY.format(plant_id), compute)
+
+
+def recipe_last_modified(recipe_id):
+    """Thời điểm cập nhật mới nhất của công thức, cây của nó và ảnh minh họa"""
+    def compute():
+        row = Recipe.objects.filter(id=recipe_id).values('updated_at', 'plant__updated_at').first()
+        if row is None:
+            return None
+        images_updated = RecipeImage.objects.filter(recipe_id=recipe_id).aggregate(latest=Max('uploaded_at'))['latest']
+        return _latest(row['updated_at'], row['plant__updated_at'], images_updated)
+    return _cached(RECIPE_KEY.format(recipe_id), compute)
+
+
+INVALIDATE_QUERY_BATCH = 500
+
+
+def invalidate_many(plant_ids: Iterable = (), recipes: Iterable[Tuple] = ()) -> None:
+    """
+    Xóa phiên bản cache của nhiều cây / công thức bằng một lần delete_many
+    - plant_ids: trang chủ, trang cây và các công thức của cây
+    - recipes: các cặp (recipe_id, plant_id) -> trang công thức và trang cây chứa nó
+    """
+    plant_ids = sorted(set(plant_ids))
+    keys = {PLANT_KEY.format(plant_id) for plant_id in plant_ids}
+    if plant_ids:
+        keys.add(HOME_KEY)
+    for start in range(0, len(plant_ids), INVALIDATE_QUERY_BATCH):
+        chunk = plant_ids[start:start + INVALIDATE_QUERY_BATCH]
+        keys.update(RECIPE_KEY.format(recipe_id) for recipe_id in
+                    Recipe.objects.filter(plant_id__in=chunk).values_list('id', flat=True))
+    for recipe_id, plant_id in recipes:
+        keys.update((RECIPE_KEY.format(recipe_id), PLANT_KEY.format(plant_id)))
+    if keys:
+        cache.delete_many(sorted(keys))
+
+
+def invalidate_plant(plant_id) -> None:
+    """Xóa phiên bản cache của trang chủ, trang cây và các công thức của cây"""
+    invalidate_many(plant_ids=[plant_id])
+
+
+def invalidate_recipe(recipe_id, plant_id) -> None:
+    """Xóa phiên bản cache của công thức và trang cây chứa nó"""
+    invalidate_many(recipes=[(recipe_id, plant_id)])
+
+
+# ============================================================
+# ETag / Last-Modified cho decorator condition()
+# ============================================================
+
+def _cacheable(request) -> bool:
+    """Không trả 304 khi còn flash message chưa hiển thị (304 sẽ làm mất message)"""
+    return len(get_messages(request)) == 0
+
+
+def _etag(*parts) -> str:
+    return hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def _user_captures_version(user):
+    """Phiên bản lịch sử tra cứu của user (số lượng + id mới nhất)"""
+    if not user.is_authenticated:
+        return 'anonymous'
+    agg = CaptureResult.objects.filter(user=user).aggregate(count=Count('id'), latest=Max('id'))
+    return f"{user.pk}:{agg['count']}:{agg['latest']}"
+
+
+def _stats_version(stats) -> str:
+    return f'{stats.capture_count}:{stats.last_seen_at}' if stats else '-'
+
+
+def home_etag(request, **kwargs) -> Optional[str]:
+    if not _cacheable(request):
+        return None
+    return _etag('home', home_last_modified(), _user_captures_version(request.user))
+
+
+def home_last_modified_for(request, **kwargs):
+    # Trang chủ của user đăng nhập có số lần tra cứu riêng nên chỉ dùng ETag
+    if not _cacheable(request) or request.user.is_authenticated:
+        return None
+    return home_last_modified()
+
+
+def plant_etag(request, plant_id, **kwargs) -> Optional[str]:
+    # Trang cây có thống kê tra cứu thay đổi liên tục nên chỉ dùng ETag (không Last-Modified)
+    if not _cacheable(request):
+        return None
+    last_modified = plant_last_modified(plant_id)
+    if last_modified is None:
+        return None
+    plant_stats = PlantCaptureStats.objects.filter(plant_id=plant_id).first()
+    user_stats = UserPlantCaptureStats.objects.filter(plant_id=plant_id, user=request.user).first()
+    return _etag('plant', plant_id, last_modified, request.user.pk,
+                 _stats_version(plant_stats), _stats_version(user_stats))
+
+
+def recipe_etag(request, recipe_id, **kwargs) -> Optional[str]:
+    if not _cacheable(request):
+        return None
+    last_modified = recipe_last_modified(recipe_id)
+    if last_modified is None:
+        return None
+    return _etag('recipe', recipe_id, last_modified, request.user.pk)
+
+
+def recipe_last_modified_for(request, recipe_id, **kwargs):
+    if not _cacheable(request):
+        return None
+    return recipe_last_modified(recipe_id)
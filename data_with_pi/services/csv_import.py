@@ -0,0 +1,154 @@
+"""
+Engine import CSV dùng chung cho seed_plants / import_recipes
+- Đọc CSV theo kiểu streaming, xử lý theo lô (batch)
+- So sánh với bản ghi đã có để chỉ tạo mới / cập nhật những dòng thay đổi
+- Ghi bằng bulk_create / bulk_update trong MỘT transaction (lỗi -> rollback toàn bộ)
+- Hỗ trợ dry-run (chạy đầy đủ rồi rollback) và đo thời gian
+"""
+import csv
+import logging
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from django.db import models, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def read_csv(file_path: str) -> Iterator[Dict[str, str]]:
+    """Đọc file CSV từng dòng (không load toàn bộ file vào bộ nhớ)"""
+    with open(file_path, mode='r', encoding='utf-8', newline='') as csv_file:
+        yield from csv.DictReader(csv_file)
+
+
+def _batches(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+@dataclass
+class ImportResult:
+    """Kết quả một lần import"""
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    skipped: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+    dry_run: bool = False
+    # Chỉ giữ các field nhỏ (track_fields) của bản ghi tạo mới / cập nhật, không giữ cả model
+    changed_keys: List[Tuple] = field(default_factory=list)
+
+
+class BulkCSVImporter:
+    """
+    Import các dòng đã được chuyển thành dict giá trị field của model.
+
+    Args:
+        model: Model cần import
+        key_fields: Các field xác định một bản ghi (VD: ('name',) hoặc ('plant_id', 'name'))
+        batch_size: Số dòng mỗi lô
+        dry_run: Chạy đầy đủ nhưng rollback ở cuối
+        track_fields: Các field ghi vào ImportResult.changed_keys cho mỗi bản ghi thay đổi
+                      (VD: ('pk', 'plant_id') để xóa cache sau khi commit)
+    """
+
+    def __init__(self, model, key_fields: Sequence[str], batch_size: int = 500, dry_run: bool = False,
+                 track_fields: Sequence[str] = ('pk',)):
+        self.model = model
+        self.key_fields = tuple(key_fields)
+        self.track_fields = tuple(track_fields)
+        self.batch_size = max(1, batch_size)
+        self.dry_run = dry_run
+        self.has_updated_at = any(f.name == 'updated_at' for f in model._meta.concrete_fields)
+
+    def _key(self, values) -> Tuple:
+        if isinstance(values, dict):
+            return tuple(values[name] for name in self.key_fields)
+        return tuple(getattr(values, name) for name in self.key_fields)
+
+    def _existing(self, keys: List[Tuple]) -> Dict[Tuple, models.Model]:
+        """Lấy các bản ghi đã có của một lô bằng một query"""
+        lookup = {
+            f'{name}__in': {key[i] for key in keys}
+            for i, name in enumerate(self.key_fields)
+        }
+        return {self._key(obj): obj for obj in self.model.objects.filter(**lookup)}
+
+    def _apply_batch(self, rows: List[dict], result: ImportResult) -> None:
+        # Dòng trùng key trong cùng lô: dòng sau ghi đè dòng trước (giống update_or_create tuần tự)
+        unique_rows = {self._key(values): values for values in rows}
+        existing = self._existing(list(unique_rows))
+        now = timezone.now()
+
+        to_create, to_update, update_fields = [], [], set()
+        for key, values in unique_rows.items():
+            obj = existing.get(key)
+            if obj is None:
+                to_create.append(self.model(**values))
+                continue
+
+            changed = [name for name, value in values.items()
+                       if name not in self.key_fields and getattr(obj, name) != value]
+            if not changed:
+                result.unchanged += 1
+                continue
+            for name in changed:
+                setattr(obj, name, values[name])
+            if self.has_updated_at:
+                # bulk_update không tự cập nhật auto_now
+                obj.updated_at = now
+                changed.append('updated_at')
+            update_fields.update(changed)
+            to_update.append(obj)
+
+        if to_create:
+            self.model.objects.bulk_create(to_create, batch_size=self.batch_size)
+        if to_update:
+            self.model.objects.bulk_update(to_update, sorted(update_fields), batch_size=self.batch_size)
+
+        result.created += len(to_create)
+        result.updated += len(to_update)
+        result.changed_keys.extend(tuple(getattr(obj, name) for name in self.track_fields)
+                                   for obj in to_create + to_update)
+
+    def run(self, rows: Iterable[Optional[dict]],
+            on_commit: Optional[Callable[[ImportResult], None]] = None) -> ImportResult:
+        """
+        Import toàn bộ rows trong một transaction.
+        Phần tử None trong rows được tính là dòng bị bỏ qua.
+        on_commit được gọi sau khi transaction commit (không gọi khi dry-run).
+        """
+        result = ImportResult(dry_run=self.dry_run)
+        started = time.perf_counter()
+
+        def counted(rows):
+            for values in rows:
+                if values is None:
+                    result.skipped += 1
+                    continue
+                yield values
+
+        with transaction.atomic():
+            for batch in _batches(counted(rows), self.batch_size):
+                self._apply_batch(batch, result)
+                result.batches += 1
+            if self.dry_run:
+                transaction.set_rollback(True)
+            elif on_commit is not None:
+                transaction.on_commit(lambda: on_commit(result))
+
+        result.elapsed = time.perf_counter() - started
+        logger.info(
+            f"Imported {self.model.__name__}: created={result.created} updated={result.updated} "
+            f"unchanged={result.unchanged} skipped={result.skipped} in {result.elapsed:.2f}s"
+            f"{' (dry-run)' if self.dry_run else ''}"
+        )
+        return result
@@ -0,0 +1,195 @@
+"""
+Điều khiển tải cho phát hiện lá liên tục (api_detect_leaves)
+- Giới hạn số inference chạy đồng thời + hàng đợi có giới hạn: quá tải thì từ chối ngay
+  (503 + Retry-After) thay vì xếp hàng vô hạn
+- Theo dõi độ trễ của cả phần giữ suất (chụp frame + YOLO + encode, EWMA) và độ sâu hàng đợi:
+  + quá tải -> giảm kích thước ảnh đầu vào YOLO (imgsz; chế độ chia ô: kích thước đưa vào mạng
+    của từng ô và lượt cả frame) và giãn chu kỳ quét của mỗi stream
+  + còn dư -> tăng lại imgsz, rút ngắn chu kỳ
+- Mỗi stream không được quét nhanh hơn chu kỳ hiện tại: request đến sớm nhận lại kết quả gần nhất
+- Trạng thái nằm trong từng process (mỗi worker tự điều chỉnh theo tải của nó)
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """Hàng đợi inference đã đầy hoặc chờ quá lâu"""
+
+    def __init__(self, retry_after_ms: int):
+        super().__init__('Detection queue is full')
+        self.retry_after_ms = retry_after_ms
+
+
+class DetectionController:
+    """
+    Args:
+        imgsz_levels: Các mức kích thước đầu vào YOLO, từ cao tới thấp
+        target_latency_ms: Độ trễ inference mong muốn
+        min_interval_ms / max_interval_ms: Chu kỳ quét nhỏ nhất / lớn nhất của một stream
+        max_concurrent: Số inference chạy cùng lúc (CPU: 1)
+        max_queue: Số request được chờ thêm; vượt quá -> Overloaded
+        queue_timeout: Thời gian chờ tối đa trong hàng đợi (giây)
+        adjust_cooldown: Khoảng cách tối thiểu giữa hai lần đổi mức (giây)
+    """
+
+    def __init__(self, imgsz_levels: Sequence[int] = (640, 512, 416, 320), target_latency_ms: float = 500,
+                 min_interval_ms: int = 500, max_interval_ms: int = 5000, max_concurrent: int = 1,
+                 max_queue: int = 4, queue_timeout: float = 10, adjust_cooldown: float = 3, alpha: float = 0.3):
+        self.imgsz_levels = sorted(imgsz_levels, reverse=True)
+        self.target_latency_ms = target_latency_ms
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max_interval_ms
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.adjust_cooldown = adjust_cooldown
+        self.alpha = alpha
+
+        self.level = 0
+        self.interval_ms = float(min_interval_ms)
+        self.latency_ewma: Optional[float] = None
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._last_adjust = 0.0
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max_concurrent)
+        self._streams: Dict[str, tuple] = {}  # stream -> (thời điểm quét, kết quả)
+        # Gauge có giá trị ngay từ khi khởi động, không phải chờ lần đổi mức đầu tiên
+        metrics.DETECTION_IMGSZ.set(self.imgsz)
+        metrics.DETECTION_QUEUE_DEPTH.set(0)
+
+    @property
+    def imgsz(self) -> int:
+        return self.imgsz_levels[self.level]
+
+    @property
+    def queue_depth(self) -> int:
+        return self.running + self.waiting
+
+    # ---------- Chu kỳ theo stream ----------
+
+    def cached_result(self, stream: str) -> Optional[Dict]:
+        """Kết quả gần nhất nếu stream vừa được quét trong chu kỳ hiện tại"""
+        with self._lock:
+            entry = self._streams.get(stream)
+        if entry is None or (time.monotonic() - entry[0]) * 1000 >= self.interval_ms:
+            return None
+        return entry[1]
+
+    def remember(self, stream: str, result: Dict) -> None:
+        with self._lock:
+            self._streams[stream] = (time.monotonic(), result)
+            # Bỏ stream lâu không quét
+            stale = time.monotonic() - self.max_interval_ms / 1000 * 10
+            for key in [key for key, (at, _) in self._streams.items() if at < stale]:
+                del self._streams[key]
+
+    # ---------- Hàng đợi ----------
+
+    @contextmanager
+    def slot(self):
+        """Giữ một suất inference; raise Overloaded khi hàng đợi đầy hoặc chờ quá queue_timeout"""
+        with self._lock:
+            if self.queue_depth >= self.max_concurrent + self.max_queue:
+                self.rejected += 1
+                self._adjust(overloaded=True)
+                raise Overloaded(self.retry_after_ms())
+            self.waiting += 1
+            metrics.DETECTION_QUEUE_DEPTH.set(self.queue_depth)
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                self.rejected += 1
+                self._adjust(overloaded=True)
+                metrics.DETECTION_QUEUE_DEPTH.set(self.queue_depth)
+                raise Overloaded(self.retry_after_ms())
+            self.running += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self.running -= 1
+                metrics.DETECTION_QUEUE_DEPTH.set(self.queue_depth)
+            self._slots.release()
+
+    def retry_after_ms(self) -> int:
+        return int(max(self.interval_ms, self.latency_ewma or 0))
+
+    # ---------- Điều chỉnh ----------
+
+    def record(self, latency_ms: float) -> None:
+        """Ghi nhận thời gian giữ suất của một request (đo quanh phần chạy trong slot()) và điều chỉnh mức"""
+        with self._lock:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency_ms
+            else:
+                self.latency_ewma = self.alpha * latency_ms + (1 - self.alpha) * self.latency_ewma
+            overloaded = self.latency_ewma > self.target_latency_ms * 1.2 or self.waiting > 0
+            headroom = self.latency_ewma < self.target_latency_ms * 0.6 and self.waiting == 0
+            if overloaded or headroom:
+                self._adjust(overloaded=overloaded)
+
+    def _adjust(self, overloaded: bool) -> None:
+        """Đổi một bậc (gọi khi đang giữ self._lock)"""
+        now = time.monotonic()
+        if now - self._last_adjust < self.adjust_cooldown:
+            return
+        level, interval = self.level, self.interval_ms
+        if overloaded:
+            # Giảm độ phân giải trước, hết mức thì giãn chu kỳ (và cả hai khi hàng đợi đã có người chờ)
+            if self.level < len(self.imgsz_levels) - 1:
+                self.level += 1
+            if self.level == len(self.imgsz_levels) - 1 or self.waiting > 0:
+                self.interval_ms = min(self.max_interval_ms, self.interval_ms * 1.5)
+        else:
+            # Rút chu kỳ trước, rồi mới tăng độ phân giải
+            if self.interval_ms > self.min_interval_ms:
+                self.interval_ms = max(self.min_interval_ms, self.interval_ms / 1.5)
+            elif self.level > 0:
+                self.level -= 1
+        if (level, interval) != (self.level, self.interval_ms):
+            self._last_adjust = now
+            metrics.DETECTION_IMGSZ.set(self.imgsz)
+            logger.info(f"[Detection] {'Quá tải' if overloaded else 'Còn dư tài nguyên'}: imgsz={self.imgsz}, "
+                        f"interval={self.interval_ms:.0f}ms, latency={self.latency_ewma or 0:.0f}ms, "
+                        f"queue={self.queue_depth}")
+
+    def state(self) -> Dict:
+        return {
+            'imgsz': self.imgsz,
+            'next_interval_ms': int(self.interval_ms),
+            'latency_ewma_ms': round(self.latency_ewma, 1) if self.latency_ewma is not None else None,
+            'running': self.running,
+            'waiting': self.waiting,
+            'rejected': self.rejected,
+        }
+
+
+def _build_controller() -> DetectionController:
+    levels = [int(value) for value in getattr(settings, 'DETECTION_IMGSZ_LEVELS', [640, 512, 416, 320])]
+    return DetectionController(
+        imgsz_levels=levels,
+        target_latency_ms=getattr(settings, 'DETECTION_TARGET_LATENCY_MS', 500),
+        min_interval_ms=getattr(settings, 'DETECTION_MIN_INTERVAL_MS', 500),
+        max_interval_ms=getattr(settings, 'DETECTION_MAX_INTERVAL_MS', 5000),
+        max_concurrent=getattr(settings, 'DETECTION_MAX_CONCURRENT', 1),
+        max_queue=getattr(settings, 'DETECTION_MAX_QUEUE', 4),
+        queue_timeout=getattr(settings, 'DETECTION_QUEUE_TIMEOUT', 10),
+        adjust_cooldown=getattr(settings, 'DETECTION_ADJUST_COOLDOWN', 3),
+    )
+
+
+# Global instance
+detection_controller = _build_controller()
@@ -0,0 +1,404 @@
+"""
+Ring buffer frame trong shared memory (multiprocessing.shared_memory)
+- Tiến trình grabber đọc stream MJPEG của Pi, giải mã và ghi từng frame vào một ô (slot) của ring
+- Worker inference / đường crop ở tiến trình khác mở cùng vùng nhớ theo tên và đọc frame theo
+  số thứ tự (seq) dưới dạng view numpy chỉ đọc: không pickle, không copy
+- Mỗi slot mang seq của frame đang nằm trong nó. Grabber đặt seq = -1 trong lúc ghi, nên người
+  đọc kiểm tra lại seq sau khi dùng xong (RingFrame.valid()) để biết frame đã bị ghi đè hay chưa;
+  frame cần giữ lâu (vd. chạy inference) thì copy ra trước (RingFrame.copy())
+- Chỉ có một grabber (một người ghi) cho mỗi ring; số người đọc không giới hạn
+- Vùng nhớ không do resource_tracker quản lý (tracker dùng chung giữa cha/con spawn, sẽ xóa ring
+  của grabber khi một tiến trình đọc thoát): grabber tự unlink khi dừng, vùng nhớ sót lại của
+  grabber bị kill được xóa khi grabber mới tạo ring (theo pid trong header)
+
+Bố cục vùng nhớ: [header int64 x 8][meta int64 x slots x 5][slot 0][slot 1]...
+  header: head_seq, slots, max_height, max_width, channels, pid grabber
+  meta mỗi slot: seq, height, width, channels, timestamp (ns, time.time_ns)
+"""
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Optional
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER_FIELDS = 8
+META_FIELDS = 5
+SEQ, HEIGHT, WIDTH, CHANNELS, TIMESTAMP = range(META_FIELDS)
+OWNER_PID = 5  # vị trí pid grabber trong header
+WRITING = -1
+
+
+class FrameOverwritten(Exception):
+    """Slot đã chứa frame khác (bị ghi đè) hoặc frame chưa từng được ghi"""
+
+
+def ring_name(stream_url: str) -> str:
+    """Tên vùng nhớ cố định cho một stream, để mọi tiến trình tìm được cùng ring"""
+    return f"leafmed_{hashlib.sha1(stream_url.encode('utf-8')).hexdigest()[:16]}"
+
+
+# Python < 3.13 không có SharedMemory(track=False): đăng ký rồi hủy ngay (chỉ POSIX có tracker)
+_TRACK_ARG = sys.version_info >= (3, 13)
+_UNTRACK = not _TRACK_ARG and os.name == 'posix'
+
+
+def _open_shm(name: Optional[str], create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    """Mở/tạo vùng nhớ không để resource_tracker theo dõi"""
+    if _TRACK_ARG:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+    if _UNTRACK:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def _unlink_shm(shm: shared_memory.SharedMemory) -> None:
+    if _UNTRACK:
+        # unlink() của Python < 3.13 luôn hủy đăng ký -> đăng ký lại cho cân, tránh KeyError ở tracker
+        from multiprocessing import resource_tracker
+        resource_tracker.register(shm._name, 'shared_memory')
+    shm.unlink()
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Tiến trình của user khác
+    return True
+
+
+class RingFrame:
+    """Một frame đọc từ ring: image là view chỉ đọc vào shared memory"""
+
+    def __init__(self, ring: 'FrameRing', seq: int, image: np.ndarray, timestamp: float):
+        self.ring = ring
+        self.seq = seq
+        self.image = image
+        self.timestamp = timestamp
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.timestamp
+
+    def valid(self) -> bool:
+        """Frame vẫn còn nguyên (chưa bị grabber ghi đè) - gọi sau khi dùng xong view"""
+        return self.ring.slot_seq(self.seq) == self.seq
+
+    def copy(self) -> np.ndarray:
+        """Bản sao riêng của frame; raise FrameOverwritten nếu slot bị ghi đè trong lúc copy"""
+        image = self.image.copy()
+        if not self.valid():
+            raise FrameOverwritten(f'Frame {self.seq} bị ghi đè trong lúc copy')
+        return image
+
+
+class FrameRing:
+    """
+    Args:
+        name: Tên vùng nhớ (mặc định: tự sinh khi create, bắt buộc khi attach)
+        slots: Số frame giữ được cùng lúc - cần đủ lớn để frame không bị ghi đè trong lúc
+               worker inference (slots / fps > thời gian inference)
+        max_height / max_width / channels: Kích thước frame lớn nhất mỗi slot chứa được
+        create: True -> tạo vùng nhớ mới (grabber), False -> mở vùng nhớ đã có (người đọc)
+    """
+
+    def __init__(self, name: Optional[str] = None, slots: int = 8, max_height: int = 1080,
+                 max_width: int = 1920, channels: int = 3, create: bool = True):
+        self.owner = create
+        if create:
+            slot_bytes = max_height * max_width * channels
+            size = (HEADER_FIELDS + slots * META_FIELDS) * 8 + slots * slot_bytes
+            try:
+                self.shm = _open_shm(name, create=True, size=size)
+            except FileExistsError:
+                self._remove_stale(name)
+                self.shm = _open_shm(name, create=True, size=size)
+            header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf)
+            header[:] = 0
+            header[1:OWNER_PID + 1] = (slots, max_height, max_width, channels, os.getpid())
+            del header
+            self._map()
+            self.meta[:] = 0
+        else:
+            self.shm = _open_shm(name)
+            self._map()
+
+    @staticmethod
+    def _remove_stale(name: str) -> None:
+        """
+        Xóa vùng nhớ còn sót lại của grabber trước (bị kill); raise FileExistsError nếu grabber
+        tạo ra nó vẫn đang chạy (hoặc không kiểm tra được, ngoài POSIX)
+        """
+        stale = _open_shm(name)
+        try:
+            pid = int(np.ndarray((1,), dtype=np.int64, buffer=stale.buf, offset=OWNER_PID * 8)[0])
+        except (TypeError, ValueError):
+            pid = 0  # Vùng nhớ nhỏ hơn header -> không phải ring hợp lệ
+        stale.close()
+        if os.name != 'posix' or _pid_alive(pid):
+            raise FileExistsError(f'Ring "{name}" đang được grabber khác dùng (pid {pid})')
+        logger.warning(f"[FrameRing] Xóa vùng nhớ cũ {name} của grabber đã dừng (pid {pid})")
+        _unlink_shm(stale)
+
+    def _map(self):
+        buf = self.shm.buf
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=buf)
+        slots = int(self.header[1]) or 1
+        self.slots = slots
+        self.max_height, self.max_width, self.channels = (int(v) for v in self.header[2:5])
+        self.meta = np.ndarray((slots, META_FIELDS), dtype=np.int64, buffer=buf, offset=HEADER_FIELDS * 8)
+        self.slot_bytes = self.max_height * self.max_width * self.channels
+        data_offset = (HEADER_FIELDS + slots * META_FIELDS) * 8
+        self.data = np.ndarray((slots, self.slot_bytes), dtype=np.uint8, buffer=buf, offset=data_offset)
+
+    @classmethod
+    def create(cls, name: Optional[str] = None, slots: Optional[int] = None,
+               max_height: Optional[int] = None, max_width: Optional[int] = None) -> 'FrameRing':
+        return cls(name=name,
+                   slots=slots or getattr(settings, 'FRAME_RING_SLOTS', 8),
+                   max_height=max_height or getattr(settings, 'FRAME_RING_MAX_HEIGHT', 1080),
+                   max_width=max_width or getattr(settings, 'FRAME_RING_MAX_WIDTH', 1920))
+
+    @classmethod
+    def attach(cls, name: str) -> 'FrameRing':
+        return cls(name=name, create=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def head(self) -> int:
+        """seq của frame mới nhất (0: chưa có frame hoặc ring đã đóng)"""
+        header = self.header
+        return int(header[0]) if header is not None else 0
+
+    def slot_seq(self, seq: int) -> int:
+        meta = self.meta
+        return int(meta[seq % self.slots, SEQ]) if meta is not None else WRITING
+
+    # ---------- Ghi (chỉ grabber) ----------
+
+    def write(self, image: np.ndarray) -> int:
+        """Copy frame vào slot kế tiếp, trả về seq của nó"""
+        height, width = image.shape[:2]
+        channels = image.shape[2] if image.ndim == 3 else 1
+        if height > self.max_height or width > self.max_width or channels != self.channels:
+            raise ValueError(f'Frame {image.shape} vượt kích thước slot '
+                             f'({self.max_height}, {self.max_width}, {self.channels})')
+        seq = self.head + 1
+        meta = self.meta[seq % self.slots]
+        meta[SEQ] = WRITING
+        nbytes = height * width * channels
+        self.data[seq % self.slots, :nbytes].reshape(image.shape)[...] = image
+        meta[HEIGHT], meta[WIDTH], meta[CHANNELS] = height, width, channels
+        meta[TIMESTAMP] = time.time_ns()
+        meta[SEQ] = seq
+        self.header[0] = seq
+        return seq
+
+    # ---------- Đọc ----------
+
+    def read(self, seq: int) -> RingFrame:
+        """View chỉ đọc vào frame seq; raise FrameOverwritten nếu slot đã chứa frame khác"""
+        # Giữ view cục bộ: ring có thể bị close() ở thread khác (latest_frame bỏ ring cũ)
+        all_meta, data = self.meta, self.data
+        if all_meta is None or data is None:
+            raise FrameOverwritten(f'Ring đã đóng, không đọc được frame {seq}')
+        if seq <= 0:
+            raise FrameOverwritten(f'Frame {seq} không tồn tại')
+        slot = seq % self.slots
+        meta = all_meta[slot]
+        if int(meta[SEQ]) != seq:
+            raise FrameOverwritten(f'Frame {seq} đã bị ghi đè (slot đang giữ {int(meta[SEQ])})')
+        height, width, channels, timestamp = (int(v) for v in meta[HEIGHT:TIMESTAMP + 1])
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        image = data[slot, :height * width * channels].reshape(shape)
+        image.flags.writeable = False
+        frame = RingFrame(self, seq, image, timestamp / 1e9)
+        if not frame.valid():
+            raise FrameOverwritten(f'Frame {seq} bị ghi đè trong lúc đọc')
+        return frame
+
+    def latest(self) -> Optional[RingFrame]:
+        """Frame mới nhất (None nếu ring chưa có frame)"""
+        for _ in range(3):
+            seq = self.head
+            if seq == 0:
+                return None
+            try:
+                return self.read(seq)
+            except FrameOverwritten:
+                continue  # grabber vừa ghi frame mới -> đọc lại head
+        return None
+
+    def wait_newer(self, after_seq: int, timeout: float = 1.0, poll: float = 0.005) -> Optional[RingFrame]:
+        """Chờ tới khi có frame mới hơn after_seq"""
+        deadline = time.monotonic() + timeout
+        while self.head <= after_seq:
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+        return self.latest()
+
+    def close(self) -> None:
+        # Bỏ các view numpy trước khi đóng, nếu không mmap báo "exported pointers exist"
+        self.header = self.meta = self.data = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # Còn RingFrame đang giữ view -> vùng nhớ được giải phóng khi chúng bị thu hồi
+
+    def unlink(self) -> None:
+        _unlink_shm(self.shm)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        if self.owner:
+            self.unlink()
+
+
+class FrameGrabber(threading.Thread):
+    """
+    Đọc stream MJPEG và ghi liên tục vào ring; tự kết nối lại khi stream lỗi
+    YOLO_STREAM_DECODER='codec': tách JPEG từ HTTP và giải mã bằng image_codec (TurboJPEG nếu có),
+    'opencv': cv2.VideoCapture
+    Frame lớn hơn slot (FRAME_RING_MAX_WIDTH/HEIGHT) được thu nhỏ giữ tỉ lệ cho vừa slot
+    """
+
+    def __init__(self, stream_url: str, ring: FrameRing, reconnect_delay: float = 2.0):
+        super().__init__(name='FrameGrabber', daemon=True)
+        self.stream_url = stream_url
+        self.ring = ring
+        self.reconnect_delay = reconnect_delay
+        self.frames = 0
+        self.errors = 0
+        self._stop_event = threading.Event()
+        self._warned_oversize = False
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def _fit(self, frame: np.ndarray) -> np.ndarray:
+        """Thu nhỏ frame vượt kích thước slot (chỉ cảnh báo một lần)"""
+        height, width = frame.shape[:2]
+        if height <= self.ring.max_height and width <= self.ring.max_width:
+            return frame
+        from . import image_codec
+
+        ratio = min(self.ring.max_height / height, self.ring.max_width / width)
+        if not self._warned_oversize:
+            self._warned_oversize = True
+            logger.warning(f"[FrameRing] Frame {width}x{height} lớn hơn slot "
+                           f"{self.ring.max_width}x{self.ring.max_height}, thu nhỏ cho vừa "
+                           f"(tăng FRAME_RING_MAX_WIDTH/HEIGHT để giữ nguyên độ phân giải)")
+        return image_codec.resize_max_side(frame, max(1, int(max(height, width) * ratio)))
+
+    def _mjpeg_frames(self):
+        import requests
+
+        from . import image_codec
+
+        with requests.get(self.stream_url, stream=True, timeout=(3, 10)) as response:
+            response.raise_for_status()
+            for jpeg in image_codec.iter_mjpeg(response.iter_content(64 * 1024)):
+                yield image_codec.decode_jpeg(jpeg)
+
+    def _opencv_frames(self):
+        import cv2
+
+        cap = cv2.VideoCapture(self.stream_url)
+        try:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            if not cap.isOpened():
+                raise ConnectionError('Không mở được stream')
+            while True:
+                ok, frame = cap.read()
+                if not ok or frame is None:
+                    raise ConnectionError('Mất frame')
+                yield frame
+        finally:
+            cap.release()
+
+    def run(self) -> None:
+        codec = getattr(settings, 'YOLO_STREAM_DECODER', 'codec') == 'codec'
+        while not self._stop_event.is_set():
+            frames = self._mjpeg_frames() if codec else self._opencv_frames()
+            try:
+                for frame in frames:
+                    if self._stop_event.is_set():
+                        break
+                    self.ring.write(self._fit(frame))
+                    self.frames += 1
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"[FrameRing] Lỗi stream {self.stream_url}: {str(e)}, kết nối lại")
+            finally:
+                frames.close()
+            self._stop_event.wait(self.reconnect_delay)
+
+
+# Ring đã mở trong tiến trình này (mở một lần, dùng lại cho mọi request)
+_attached: Dict[str, FrameRing] = {}
+_attached_lock = threading.Lock()
+
+
+def get_ring(stream_url: str) -> Optional[FrameRing]:
+    """Ring của stream nếu có grabber đang chạy (tắt bằng FRAME_RING_ENABLED=False)"""
+    if not getattr(settings, 'FRAME_RING_ENABLED', True):
+        return None
+    name = ring_name(stream_url)
+    with _attached_lock:
+        ring = _attached.get(name)
+        if ring is None:
+            try:
+                ring = FrameRing.attach(name)
+            except (FileNotFoundError, ValueError):
+                return None
+            _attached[name] = ring
+    return ring
+
+
+def latest_frame(stream_url: str) -> Optional[RingFrame]:
+    """Frame mới nhất của stream từ ring, nếu còn đủ mới (FRAME_RING_MAX_AGE giây)"""
+    ring = get_ring(stream_url)
+    if ring is None:
+        return None
+    frame = ring.latest()
+    if frame is None or frame.age > getattr(settings, 'FRAME_RING_MAX_AGE', 1.0):
+        # Grabber đã dừng (hoặc chạy lại với vùng nhớ mới) -> đóng, lần sau mở lại theo tên
+        frame = None
+        with _attached_lock:
+            if _attached.get(ring_name(stream_url)) is ring:
+                del _attached[ring_name(stream_url)]
+        ring.close()
+        return None
+    return frame
+
+
+def read_frame(stream_url: str, seq: int) -> Optional[RingFrame]:
+    """Frame seq của stream (vd. frame YOLO đã detect, để crop đúng frame đó); None nếu không còn"""
+    ring = get_ring(stream_url)
+    if ring is None:
+        return None
+    try:
+        return ring.read(seq)
+    except FrameOverwritten:
+        return None
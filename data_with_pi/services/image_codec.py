@@ -0,0 +1,271 @@
+"""
+Mã hóa / giải mã JPEG dùng chung cho luồng YOLO và upload
+- Backend (IMAGE_CODEC_BACKEND='auto' chọn theo thứ tự):
+  + turbojpeg: PyTurboJPEG + libturbojpeg (SIMD), nhanh nhất
+  + opencv: cv2.imencode / cv2.imdecode
+  + pil: Pillow (bản wheel chính thức cũng build với libjpeg-turbo)
+- Giải mã thu nhỏ ngay trong miền DCT (1/2, 1/4, 1/8) khi chỉ cần ảnh nhỏ: rẻ hơn nhiều so với
+  giải mã đủ kích thước rồi resize. Cả ba backend đều hỗ trợ (turbojpeg scaling_factor,
+  cv2.IMREAD_REDUCED_COLOR_*, PIL Image.draft)
+- Chất lượng và chroma subsampling ('444', '422', '420', 'gray') cấu hình được
+  (IMAGE_JPEG_QUALITY, IMAGE_JPEG_SUBSAMPLING)
+
+Ảnh trong bộ nhớ luôn là mảng numpy BGR uint8 (như OpenCV).
+"""
+import logging
+import threading
+from io import BytesIO
+from typing import Iterable, Iterator, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('turbojpeg', 'opencv', 'pil')
+SUBSAMPLINGS = ('444', '422', '420', 'gray')
+DCT_SCALES = (8, 4, 2)  # mẫu số của hệ số thu nhỏ, ưu tiên nhỏ nhất
+
+SOI, EOI = b'\xff\xd8', b'\xff\xd9'
+
+_turbo = None
+_turbo_error: Optional[str] = None
+_turbo_lock = threading.Lock()
+
+
+def _get_turbo():
+    """TurboJPEG dùng chung (None nếu chưa cài PyTurboJPEG / không tìm thấy libturbojpeg)"""
+    global _turbo, _turbo_error
+    if _turbo is None and _turbo_error is None:
+        with _turbo_lock:
+            if _turbo is None and _turbo_error is None:
+                try:
+                    from turbojpeg import TurboJPEG
+                    _turbo = TurboJPEG(getattr(settings, 'TURBOJPEG_LIB_PATH', '') or None)
+                except Exception as e:  # ImportError, hoặc RuntimeError/OSError khi thiếu thư viện C
+                    _turbo_error = str(e)
+                    logger.info(f"TurboJPEG không khả dụng, dùng backend khác: {_turbo_error}")
+    return _turbo
+
+
+def _has_opencv() -> bool:
+    try:
+        import cv2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def available_backends() -> Tuple[str, ...]:
+    checks = {'turbojpeg': lambda: _get_turbo() is not None, 'opencv': _has_opencv, 'pil': lambda: True}
+    return tuple(name for name in BACKENDS if checks[name]())
+
+
+def backend(name: Optional[str] = None) -> str:
+    """Backend sẽ dùng: name / IMAGE_CODEC_BACKEND, 'auto' -> backend nhanh nhất đang có"""
+    name = name or getattr(settings, 'IMAGE_CODEC_BACKEND', 'auto')
+    available = available_backends()
+    if name != 'auto':
+        if name not in available:
+            raise ValueError(f"Image codec backend '{name}' không khả dụng (có: {', '.join(available)})")
+        return name
+    return available[0]
+
+
+def _quality(quality: Optional[int]) -> int:
+    return int(quality or getattr(settings, 'IMAGE_JPEG_QUALITY', 85))
+
+
+def _subsampling(subsampling: Optional[str]) -> str:
+    subsampling = subsampling or getattr(settings, 'IMAGE_JPEG_SUBSAMPLING', '420')
+    if subsampling not in SUBSAMPLINGS:
+        raise ValueError(f"Chroma subsampling không hợp lệ: {subsampling} (chọn: {', '.join(SUBSAMPLINGS)})")
+    return subsampling
+
+
+# ---------- Encode ----------
+
+def encode_jpeg(image, quality: Optional[int] = None, subsampling: Optional[str] = None,
+                using: Optional[str] = None) -> bytes:
+    """Mã hóa ảnh BGR thành JPEG"""
+    quality, subsampling = _quality(quality), _subsampling(subsampling)
+    name = backend(using)
+
+    if name == 'turbojpeg':
+        import turbojpeg
+        sampling = {'444': turbojpeg.TJSAMP_444, '422': turbojpeg.TJSAMP_422,
+                    '420': turbojpeg.TJSAMP_420, 'gray': turbojpeg.TJSAMP_GRAY}[subsampling]
+        return _get_turbo().encode(image, quality=quality, pixel_format=turbojpeg.TJPF_BGR,
+                                   jpeg_subsample=sampling)
+
+    if name == 'opencv':
+        import cv2
+        if subsampling == 'gray':
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        factor = getattr(cv2, f'IMWRITE_JPEG_SAMPLING_FACTOR_{subsampling}', None)
+        if factor is not None:  # OpenCV >= 4.5.5
+            params += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, factor]
+        ok, buffer = cv2.imencode('.jpg', image, params)
+        if not ok:
+            raise ValueError("Cannot encode image to JPEG")
+        return buffer.tobytes()
+
+    from PIL import Image
+
+    pil_image = Image.fromarray(image[:, :, ::-1] if image.ndim == 3 else image)
+    if subsampling == 'gray':
+        pil_image = pil_image.convert('L')
+    buffer = BytesIO()
+    options = {} if subsampling == 'gray' else {'subsampling': {'444': 0, '422': 1, '420': 2}[subsampling]}
+    pil_image.save(buffer, 'JPEG', quality=quality, **options)
+    return buffer.getvalue()
+
+
+# ---------- Decode ----------
+
+def jpeg_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) đọc từ header JPEG (không giải mã ảnh); None nếu không phải JPEG"""
+    if not data.startswith(SOI):
+        return None
+    turbo = _get_turbo()
+    try:
+        if turbo is not None:
+            width, height = turbo.decode_header(data)[:2]
+            return width, height
+        from PIL import Image
+        with Image.open(BytesIO(data)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def dct_scale(width: int, height: int, target_side: Optional[int]) -> int:
+    """Mẫu số thu nhỏ lớn nhất (8, 4, 2 hoặc 1) mà cạnh dài sau khi giải mã vẫn >= target_side"""
+    if not target_side:
+        return 1
+    longest = max(width, height)
+    return next((denominator for denominator in DCT_SCALES if longest / denominator >= target_side), 1)
+
+
+def decode_jpeg(data: bytes, target_side: Optional[int] = None, using: Optional[str] = None):
+    """
+    Giải mã JPEG thành ảnh BGR
+    target_side: cạnh dài nhỏ nhất cần có; giải mã thu nhỏ trong miền DCT xuống mức nhỏ nhất
+                 còn >= target_side (ảnh trả về có thể lớn hơn target_side, chưa resize)
+    """
+    import numpy as np
+
+    name = backend(using)
+    denominator = 1
+    if target_side:
+        dimensions = jpeg_dimensions(data)
+        if dimensions:
+            denominator = dct_scale(*dimensions, target_side)
+
+    if name == 'turbojpeg':
+        import turbojpeg
+        return _get_turbo().decode(data, pixel_format=turbojpeg.TJPF_BGR,
+                                   scaling_factor=(1, denominator) if denominator > 1 else None)
+
+    if name == 'opencv':
+        import cv2
+        flags = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}[denominator]
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+        if image is None:
+            raise ValueError("Cannot decode JPEG")
+        return image
+
+    from PIL import Image
+
+    with Image.open(BytesIO(data)) as pil_image:
+        if denominator > 1:
+            width, height = pil_image.size
+            pil_image.draft('RGB', (width // denominator, height // denominator))
+        if pil_image.mode != 'RGB':
+            pil_image = pil_image.convert('RGB')
+        return np.ascontiguousarray(np.asarray(pil_image)[:, :, ::-1])
+
+
+def resize_max_side(image, max_side: int):
+    """Thu nhỏ (giữ tỉ lệ) để cạnh dài <= max_side; ảnh nhỏ hơn giữ nguyên"""
+    height, width = image.shape[:2]
+    if max(height, width) <= max_side:
+        return image
+    ratio = max_side / max(height, width)
+    size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+    if _has_opencv():
+        import cv2
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+    import numpy as np
+    from PIL import Image
+
+    return np.asarray(Image.fromarray(image).resize(size, Image.BILINEAR, reducing_gap=2.0))
+
+
+def exif_orientation(data: bytes) -> int:
+    """Tag EXIF Orientation của ảnh (1 = đúng chiều; không có EXIF hoặc lỗi -> 1)"""
+    from PIL import Image
+
+    try:
+        with Image.open(BytesIO(data)) as pil_image:
+            orientation = int(pil_image.getexif().get(0x0112) or 1)
+    except Exception:
+        return 1
+    return orientation if 1 <= orientation <= 8 else 1
+
+
+def apply_orientation(image, orientation: int):
+    """Xoay/lật ảnh BGR theo EXIF Orientation cho đúng chiều hiển thị (như ImageOps.exif_transpose)"""
+    import numpy as np
+
+    if orientation in (5, 6, 7, 8):
+        image = np.rot90(image, -1 if orientation in (5, 6) else 1)  # 6: xoay 90° theo chiều kim đồng hồ
+    if orientation in (2, 3, 5, 7):
+        image = image[:, ::-1]
+    if orientation in (3, 4):
+        image = image[::-1]
+    return np.ascontiguousarray(image)
+
+
+def shrink_jpeg(data: bytes, max_side: int, quality: Optional[int] = None) -> bytes:
+    """
+    JPEG với cạnh dài <= max_side (giải mã thu nhỏ trong miền DCT rồi resize phần còn lại).
+    Ảnh mã hóa lại không mang EXIF nên được xoay đúng chiều theo Orientation trước.
+    Ảnh đã đủ nhỏ, không phải JPEG hoặc lỗi giải mã -> trả lại nguyên bytes gốc.
+    """
+    dimensions = jpeg_dimensions(data)
+    if not max_side or dimensions is None or max(dimensions) <= max_side:
+        return data
+    try:
+        image = resize_max_side(decode_jpeg(data, target_side=max_side), max_side)
+        return encode_jpeg(apply_orientation(image, exif_orientation(data)), quality)
+    except Exception as e:
+        logger.warning(f"Không thu nhỏ được JPEG, dùng ảnh gốc: {str(e)}")
+        return data
+
+
+# ---------- MJPEG ----------
+
+def iter_mjpeg(chunks: Iterable[bytes], max_frame_bytes: int = 8 * 1024 * 1024) -> Iterator[bytes]:
+    """
+    Tách các frame JPEG (SOI ... EOI) từ luồng multipart MJPEG (iter_content của requests)
+    Bộ đệm vượt max_frame_bytes mà chưa thấy frame hoàn chỉnh -> ValueError (không phải MJPEG)
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while True:
+            start = buffer.find(SOI)
+            if start < 0:
+                del buffer[:-1]  # Giữ byte cuối phòng marker bị cắt giữa hai chunk
+                break
+            end = buffer.find(EOI, start + 2)
+            if end < 0:
+                del buffer[:start]
+                break
+            yield bytes(buffer[start:end + 2])
+            del buffer[:end + 2]
+        if len(buffer) > max_frame_bytes:
+            raise ValueError('Stream không phải MJPEG (không tìm thấy frame JPEG hoàn chỉnh)')
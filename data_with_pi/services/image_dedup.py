@@ -0,0 +1,199 @@
+"""
+Lọc ảnh gần trùng (near-duplicate) trước khi đưa vào dataset
+- Perceptual hash 64 bit, tính theo lô bằng numpy:
+  + phash: DCT 2 chiều ảnh xám 32x32 (nhân ma trận cho cả lô) -> 8x8 hệ số tần số thấp so với median
+  + dhash: so sánh điểm ảnh kề nhau theo hàng trên ảnh xám 9x8
+- Ảnh chỉ giải mã kênh xám, thu nhỏ ngay trong miền DCT (PIL draft) -> rẻ cả với ảnh lớn;
+  giải mã chạy song song bằng luồng (libjpeg nhả GIL)
+- HammingIndex: multi-index hashing (LSH theo dải bit). Hash chia thành radius + 1 dải: hai hash
+  lệch nhau <= radius bit chắc chắn trùng khớp nguyên một dải -> chỉ so với ứng viên cùng bucket,
+  kết quả vẫn chính xác và không phải so từng cặp (O(n²))
+- Gom cụm theo thứ tự duyệt: ảnh đầu tiên của cụm là đại diện (giữ lại), ảnh sau cách đại diện
+  <= radius bit thuộc cụm đó (bỏ). Chỉ đại diện nằm trong index nên index nhỏ khi dữ liệu trùng nhiều
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+HASH_METHODS = ('phash', 'dhash')
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+_INPUT_SIZE = {'phash': (32, 32), 'dhash': (9, 8)}  # (width, height) ảnh xám đầu vào
+
+try:
+    _popcount = int.bit_count  # Python >= 3.10
+except AttributeError:
+    def _popcount(value: int) -> int:
+        return bin(value).count('1')
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Ma trận DCT-II trực chuẩn n x n (DCT 2 chiều của X = D @ X @ D.T)"""
+    k, i = np.arange(n)[:, None], np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+_DCT32 = _dct_matrix(32)
+
+
+# ---------- Hash ----------
+
+def _pack(bits: np.ndarray) -> List[int]:
+    """(N, 64) bool -> N số nguyên 64 bit"""
+    return np.packbits(bits, axis=1).view('>u8').ravel().tolist()
+
+
+def hash_batch(gray: np.ndarray, method: str = 'phash') -> List[int]:
+    """
+    Hash cả lô ảnh xám cùng kích thước (N, H, W) (xem input_size)
+    Trả về N số nguyên 64 bit
+    """
+    gray = np.asarray(gray, dtype=np.float32)
+    if method == 'phash':
+        coefficients = _DCT32 @ gray @ _DCT32.T
+        low = coefficients[:, :8, :8].reshape(len(gray), 64)
+        median = np.median(low[:, 1:], axis=1, keepdims=True)  # bỏ hệ số DC khi tính median
+        return _pack(low > median)
+    if method == 'dhash':
+        return _pack((gray[:, :, 1:] > gray[:, :, :-1]).reshape(len(gray), 64))
+    raise ValueError(f"Hash không hợp lệ: {method} (chọn: {', '.join(HASH_METHODS)})")
+
+
+def input_size(method: str) -> Tuple[int, int]:
+    """(width, height) ảnh xám mà hash_batch cần"""
+    return _INPUT_SIZE[method]
+
+
+def load_gray(path, method: str = 'phash') -> np.ndarray:
+    """Đọc ảnh thành mảng xám đúng kích thước cho hash (JPEG được giải mã thu nhỏ trong miền DCT)"""
+    from PIL import Image
+
+    size = input_size(method)
+    with Image.open(path) as image:
+        image.draft('L', size)
+        return np.asarray(image.convert('L').resize(size, Image.BILINEAR), dtype=np.float32)
+
+
+def hash_files(paths: Sequence, method: str = 'phash', batch: int = 256,
+               workers: int = 4) -> Iterator[Tuple[object, Optional[int]]]:
+    """
+    (path, hash) theo đúng thứ tự paths; ảnh không đọc được -> hash None
+    Giải mã song song bằng workers luồng, hash từng lô batch ảnh
+    """
+    def load(path):
+        try:
+            return load_gray(path, method)
+        except Exception as e:
+            logger.warning(f"Bỏ qua ảnh không đọc được {path}: {str(e)}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for start in range(0, len(paths), batch):
+            chunk = paths[start:start + batch]
+            arrays = list(pool.map(load, chunk))
+            valid = [array for array in arrays if array is not None]
+            hashes = iter(hash_batch(np.stack(valid), method) if valid else [])
+            for path, array in zip(chunk, arrays):
+                yield path, (next(hashes) if array is not None else None)
+
+
+# ---------- Index ----------
+
+class HammingIndex:
+    """
+    Index hash 64 bit tra cứu theo khoảng cách Hamming <= radius (multi-index hashing)
+    Mỗi dải bit có một bảng băm {giá trị dải: [id]}; tra cứu gom ứng viên từ radius + 1 bảng
+    rồi mới đếm bit khác nhau -> chính xác, chi phí theo kích thước bucket thay vì số phần tử
+    """
+
+    def __init__(self, radius: int, bits: int = HASH_BITS):
+        if not 0 <= radius < bits // 2:
+            raise ValueError(f"radius phải trong khoảng 0..{bits // 2 - 1}")
+        self.radius = radius
+        bands = radius + 1
+        widths = [bits // bands + (1 if i < bits % bands else 0) for i in range(bands)]
+        shifts = np.cumsum([0] + widths[:-1]).tolist()
+        self._bands = [(shift, (1 << width) - 1) for shift, width in zip(shifts, widths)]
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in self._bands]
+        self._hashes: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, value: int) -> int:
+        """Thêm hash, trả về id (thứ tự thêm vào)"""
+        item_id = len(self._hashes)
+        self._hashes.append(value)
+        for (shift, mask), table in zip(self._bands, self._tables):
+            table.setdefault((value >> shift) & mask, []).append(item_id)
+        return item_id
+
+    def query(self, value: int) -> List[Tuple[int, int]]:
+        """[(id, khoảng cách)] các hash cách value <= radius bit, gần nhất trước"""
+        found = {}
+        for (shift, mask), table in zip(self._bands, self._tables):
+            for item_id in table.get((value >> shift) & mask, ()):
+                if item_id not in found:
+                    found[item_id] = _popcount(value ^ self._hashes[item_id])
+        return sorted(((item_id, distance) for item_id, distance in found.items() if distance <= self.radius),
+                      key=lambda item: (item[1], item[0]))
+
+    def nearest(self, value: int) -> Optional[Tuple[int, int]]:
+        matches = self.query(value)
+        return matches[0] if matches else None
+
+
+# ---------- Gom cụm ----------
+
+def cluster_hashes(items: Iterable[Tuple[Hashable, Optional[int]]], radius: int) -> List[List[Hashable]]:
+    """
+    Gom (key, hash) thành cụm gần trùng, giữ thứ tự duyệt: cluster[0] là đại diện
+    Hash None (ảnh lỗi) không được gom
+    """
+    index = HammingIndex(radius)
+    clusters: List[List[Hashable]] = []
+    for key, value in items:
+        if value is None:
+            continue
+        match = index.nearest(value)
+        if match is None:
+            index.add(value)
+            clusters.append([key])
+        else:
+            clusters[match[0]].append(key)
+    return clusters
+
+
+def summarize_clusters(clusters: Sequence[Sequence], top: Optional[int] = 20) -> Dict:
+    """Báo cáo: tổng số ảnh, số giữ lại, số bỏ, phân bố kích thước cụm, top cụm lớn nhất (None = mọi cụm)"""
+    total = sum(len(cluster) for cluster in clusters)
+    histogram: Dict[int, int] = {}
+    for cluster in clusters:
+        histogram[len(cluster)] = histogram.get(len(cluster), 0) + 1
+    largest = sorted((cluster for cluster in clusters if len(cluster) > 1), key=len, reverse=True)
+    return {
+        'images': total,
+        'kept': len(clusters),
+        'duplicates': total - len(clusters),
+        'reduction': round(1 - len(clusters) / total, 4) if total else 0.0,
+        'cluster_sizes': {size: histogram[size] for size in sorted(histogram)},
+        'largest': [{'keep': str(cluster[0]), 'collapsed': len(cluster) - 1,
+                     'sample': [str(key) for key in cluster[1:6]]} for cluster in largest[:top]],
+    }
+
+
+def find_images(folders: Iterable) -> List[Path]:
+    """Mọi ảnh trong các thư mục (đệ quy), sắp theo đường dẫn (tên file có ngày giờ -> theo thời gian)"""
+    paths = []
+    for folder in folders:
+        folder = Path(folder)
+        if folder.is_dir():
+            paths += [path for path in folder.rglob('*') if path.suffix.lower() in IMAGE_SUFFIXES]
+    return sorted(paths)
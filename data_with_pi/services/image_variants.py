@@ -0,0 +1,118 @@
+"""
+Pipeline sinh ảnh responsive (thumb / medium, JPEG + WebP) cho ảnh danh mục
+(Plant.image, Recipe.image, RecipeImage.image)
+
+- Biến thể được lưu theo địa chỉ nội dung: variants/<2 ký tự đầu>/<sha256>/<tên>.<ext>
+  nên cùng một ảnh chỉ được xử lý/lưu một lần
+- render_variants() là hàm thuần (chỉ dùng PIL, không đụng ORM) để chạy được
+  trong ProcessPoolExecutor của lệnh generate_image_variants
+"""
+import hashlib
+import logging
+from io import BytesIO
+from typing import Dict, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Tên biến thể -> chiều rộng tối đa (px). Không phóng to ảnh nhỏ hơn.
+VARIANT_WIDTHS = {
+    'thumb': 320,
+    'medium': 960,
+}
+VARIANT_FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+VARIANTS_ROOT = 'variants'
+
+
+def content_digest(data: bytes) -> str:
+    """Địa chỉ nội dung của ảnh gốc"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def variant_path(digest: str, variant: str, ext: str) -> str:
+    return f'{VARIANTS_ROOT}/{digest[:2]}/{digest}/{variant}.{ext}'
+
+
+def render_variants(source: Union[bytes, str]) -> Tuple[str, int, Dict[str, Tuple[int, Dict[str, bytes]]]]:
+    """
+    Sinh các biến thể từ ảnh gốc (bytes hoặc đường dẫn file).
+
+    Returns:
+        (digest, chiều rộng gốc, {variant: (width, {format: bytes})})
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            source = f.read()
+
+    from PIL import Image, ImageOps  # import khi cần (không làm chậm lúc khởi động Django)
+
+    digest = content_digest(source)
+    with Image.open(BytesIO(source)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        original_width = image.width
+
+        rendered = {}
+        for variant, max_width in VARIANT_WIDTHS.items():
+            resized = image.copy()
+            resized.thumbnail((max_width, max_width * 4), Image.LANCZOS)
+            encoded = {}
+            for fmt, (pil_format, _, options) in VARIANT_FORMATS.items():
+                frame = resized.convert('RGB') if pil_format == 'JPEG' else resized
+                buffer = BytesIO()
+                frame.save(buffer, pil_format, **options)
+                encoded[fmt] = buffer.getvalue()
+            rendered[variant] = (resized.width, encoded)
+
+    return digest, original_width, rendered
+
+
+def store_variants(digest: str, original_width: int, rendered, storage=None) -> Dict:
+    """
+    Ghi các biến thể vào storage (bỏ qua file đã tồn tại) và trả về
+    dict lưu vào field image_variants của model.
+    Hai process cùng ghi một ảnh: storage.save() của bên chậm hơn trả về tên khác (đã đổi tên) ->
+    xóa bản trùng đó và dùng đường dẫn chuẩn (cùng nội dung vì đường dẫn theo sha256)
+    """
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    storage = storage or default_storage
+
+    variants = {}
+    for variant, (width, encoded) in rendered.items():
+        paths = {}
+        for fmt, data in encoded.items():
+            path = variant_path(digest, variant, VARIANT_FORMATS[fmt][1])
+            if not storage.exists(path):
+                saved = storage.save(path, ContentFile(data))
+                if saved != path:
+                    storage.delete(saved)
+            paths[fmt] = path
+        variants[variant] = {'width': width, **paths}
+
+    return {'digest': digest, 'width': original_width, 'variants': variants}
+
+
+def refresh_instance_variants(instance, field_name: str = 'image') -> None:
+    """
+    Sinh biến thể cho ảnh vừa upload của instance (gọi trong pre_save).
+    Ảnh đã có sẵn trong storage được xử lý bởi lệnh generate_image_variants.
+    """
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        instance.image_variants = {}
+        return
+    if field_file._committed:
+        return
+
+    try:
+        field_file.file.seek(0)
+        data = field_file.file.read()
+        field_file.file.seek(0)
+        instance.image_variants = store_variants(*render_variants(data))
+    except Exception as e:
+        logger.error(f"Failed to generate image variants for {instance.__class__.__name__}: {str(e)}")
+        instance.image_variants = {}
@@ -0,0 +1,85 @@
+"""
+Đo thời gian import module (thời gian khởi động process Django)
+- Chạy trong interpreter mới (subprocess) để không bị ảnh hưởng bởi module đã import sẵn
+- import_report(): phân tích output của `python -X importtime`
+- measure_import_ms(): thời gian import một module sau django.setup() (dùng cho test ngân sách)
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+from django.conf import settings
+
+# Thư viện nặng phải nằm sau ranh giới import lười (chỉ import khi dùng YOLO / xử lý ảnh)
+HEAVY_MODULES = ('cv2', 'numpy', 'ultralytics', 'torch', 'PIL', 'requests')
+
+_SETUP = 'import django; django.setup()'
+
+
+def _run(code: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'PBL_LeafMed.settings')
+    args = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    return subprocess.run(args, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True)
+
+
+def parse_importtime(output: str) -> List[Dict]:
+    """
+    Dòng 'import time:  self [us] | cumulative | imported package' -> danh sách
+    {module, self_us, cumulative_us, depth}
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            entries.append({
+                'module': name.strip(),
+                'self_us': int(self_us),
+                'cumulative_us': int(cumulative_us),
+                'depth': (len(name) - len(name.lstrip())) // 2,
+            })
+        except ValueError:
+            continue
+    return entries
+
+
+def import_report(module: str, after_setup: bool = True) -> Dict:
+    """Import module trong process mới với -X importtime; trả về từng module + tổng theo package"""
+    code = f'{_SETUP}; import {module}' if after_setup else f'import {module}'
+    result = _run(code, importtime=True)
+    entries = parse_importtime(result.stderr)
+    if after_setup:
+        # Chỉ giữ các module được import bởi `module` (sau django.setup())
+        setup_modules = {entry['module'] for entry in parse_importtime(_run(_SETUP, importtime=True).stderr)}
+        entries = [entry for entry in entries if entry['module'] not in setup_modules]
+
+    packages = defaultdict(int)
+    for entry in entries:
+        packages[entry['module'].split('.')[0]] += entry['self_us']
+    return {
+        'module': module,
+        'after_setup': after_setup,
+        'total_us': sum(entry['self_us'] for entry in entries),
+        'entries': entries,
+        'packages': dict(sorted(packages.items(), key=lambda item: item[1], reverse=True)),
+        'heavy_modules': [name for name in HEAVY_MODULES
+                          if any(entry['module'] == name for entry in entries)],
+    }
+
+
+def measure_import_ms(module: str) -> Dict:
+    """Thời gian import module (ms) sau django.setup() và các thư viện nặng đã bị kéo theo"""
+    code = (
+        f'{_SETUP}\n'
+        'import json, sys, time\n'
+        'started = time.perf_counter()\n'
+        f'import {module}\n'
+        'elapsed = (time.perf_counter() - started) * 1000\n'
+        f'print(json.dumps({{"ms": elapsed, "heavy": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n'
+    )
+    return json.loads(_run(code).stdout.strip().splitlines()[-1])
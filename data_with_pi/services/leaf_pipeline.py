@@ -0,0 +1,122 @@
+"""
+Pipeline một lần gọi: chụp frame -> YOLO detect -> cắt lá -> phân loại theo lô
+- Chỉ lấy MỘT frame từ stream; các lá được cắt trực tiếp trên mảng numpy trong bộ nhớ
+- Phân loại cả lô qua PiFleet (classifier cục bộ: một lần predict, Pi: upload song song có giới hạn)
+- Trả về thời gian từng bước (ms) trong response
+"""
+import base64
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+BBOX_KEYS = ('x1', 'y1', 'x2', 'y2')
+
+
+@contextmanager
+def stage(timings: Dict[str, float], name: str):
+    """Đo thời gian một bước (ms) vào timings[name]"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def normalize_bboxes(bboxes) -> Optional[List[Dict]]:
+    """Kiểm tra danh sách bbox do client gửi; None nếu không hợp lệ"""
+    if not isinstance(bboxes, list) or not bboxes:
+        return None
+    normalized = []
+    for bbox in bboxes:
+        if not isinstance(bbox, dict) or not all(key in bbox for key in BBOX_KEYS):
+            return None
+        try:
+            x1, y1, x2, y2 = (float(bbox[key]) for key in BBOX_KEYS)
+        except (TypeError, ValueError):
+            return None
+        normalized.append({'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2, 'width': x2 - x1, 'height': y2 - y1})
+    return normalized
+
+
+def run_leaf_pipeline(detector, fleet, stream_url: str, confidence: float = 0.5,
+                      bboxes: Optional[List[Dict]] = None, return_crops: bool = False,
+                      keep_jpeg: bool = False, filename_prefix: str = 'pipeline',
+                      frame_seq: Optional[int] = None) -> Dict:
+    """
+    Args:
+        detector: YOLOLeafDetector
+        fleet: PiFleet dùng để phân loại
+        stream_url: Stream của trạm Pi
+        confidence: Ngưỡng YOLO
+        bboxes: Các vùng lá đã chọn (bỏ qua bước detect); None -> mọi lá detect được
+        return_crops: Trả thêm ảnh lá đã cắt (base64 JPEG)
+        keep_jpeg: Giữ bytes JPEG của lá trong leaf['jpeg'] (để lưu file; cần pop trước khi trả JSON)
+        frame_seq: Frame trong ring shared memory mà bboxes được detect trên đó (nếu còn)
+    """
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    def done(payload: Dict) -> Dict:
+        timings['total'] = round((time.perf_counter() - started) * 1000, 1)
+        payload['timings_ms'] = timings
+        return payload
+
+    if bboxes is None and not detector.wait_ready():
+        return done({"success": False, "error": "YOLO model not loaded"})
+
+    with stage(timings, 'capture'):
+        frame, frame_seq = detector.capture_frame(stream_url, frame_seq=frame_seq)
+    if frame is None:
+        return done({"success": False, "error": "Cannot capture frame from stream"})
+
+    if bboxes is None:
+        with stage(timings, 'detect'):
+            detections = detector.detect_frame(frame, confidence)
+    else:
+        detections = [{'bbox': bbox, 'confidence': None, 'class_id': None, 'id': f"leaf_{i}"}
+                      for i, bbox in enumerate(bboxes)]
+
+    with stage(timings, 'crop'):
+        leaves, crops = [], []
+        for detection in detections:
+            crop = detector.crop_frame(frame, detection['bbox'])
+            if crop is not None:
+                leaves.append(detection)
+                crops.append(crop)
+
+    # Encode mỗi lá tối đa một lần (dùng lại cho upload lên Pi)
+    encoded = {}
+    if return_crops or keep_jpeg:
+        with stage(timings, 'encode'):
+            encoded = {id(crop): detector.encode_jpeg(crop) for crop in crops}
+
+    def encode(crop) -> bytes:
+        return encoded.get(id(crop)) or detector.encode_jpeg(crop)
+
+    timestamp = time.strftime('%Y%m%d_%H%M%S')
+    filenames = [f"{filename_prefix}_{timestamp}_{i}.jpg" for i in range(len(crops))]
+    with stage(timings, 'classify'):
+        results = fleet.classify_batch(
+            crops, filenames, encode=encode,
+            max_workers=getattr(settings, 'PI_FLEET_BATCH_WORKERS', 4),
+        )
+
+    for leaf, crop, result in zip(leaves, crops, results):
+        leaf['classification'] = result
+        leaf['crop_size'] = {'width': crop.shape[1], 'height': crop.shape[0]}
+        if return_crops:
+            leaf['cropped_image_b64'] = base64.b64encode(encoded[id(crop)]).decode('utf-8')
+        if keep_jpeg:
+            leaf['jpeg'] = encoded[id(crop)]
+
+    return done({
+        "success": True,
+        "leaves": leaves,
+        "total_leaves": len(leaves),
+        "classified": sum(1 for result in results if result.get('success')),
+        "image_width": frame.shape[1],
+        "image_height": frame.shape[0],
+        "frame_seq": frame_seq,
+    })
@@ -0,0 +1,105 @@
+"""
+Bộ phân loại lá chạy ngay trên server Django (dự phòng cho Pi)
+- Dùng cùng file trọng số classifier với Pi (ultralytics, task=classify)
+- Kết quả cùng dạng với response /upload của Pi: success, name, confidence, file
+- Có cùng interface upload_image() với PiClient để PiFleet dùng như một backend
+- Model chỉ được load ở lần phân loại đầu tiên (không làm chậm lúc khởi động)
+"""
+import logging
+import os
+import threading
+from io import BytesIO
+from typing import Dict, List, Optional, Sequence
+
+from django.conf import settings
+
+from . import perf
+
+logger = logging.getLogger(__name__)
+
+
+class LocalClassifier:
+    """Classifier trong process, an toàn khi gọi từ nhiều thread"""
+
+    base_url = 'local'
+
+    def __init__(self, model_path: str, imgsz: int = 224):
+        self.model_path = str(model_path)
+        self.imgsz = imgsz
+        self.model = None
+        self._load_lock = threading.Lock()
+        # Model ultralytics không an toàn khi predict đồng thời; torch tự dùng nhiều core cho một batch
+        self._predict_lock = threading.Lock()
+        self._load_error: Optional[str] = None
+
+    @property
+    def available(self) -> bool:
+        return self._load_error is None and os.path.exists(self.model_path)
+
+    def load_model(self):
+        with self._load_lock:
+            if self.model is None and self._load_error is None:
+                try:
+                    from ultralytics import YOLO
+                    self.model = YOLO(self.model_path, task='classify')
+                    logger.info(f"Local classifier loaded from {self.model_path}")
+                except Exception as e:
+                    self._load_error = str(e)
+                    logger.error(f"Failed to load local classifier: {str(e)}")
+        return self.model
+
+    @staticmethod
+    def _to_input(image):
+        # bytes -> ảnh PIL (RGB); mảng numpy được ultralytics hiểu là BGR (ảnh OpenCV)
+        if isinstance(image, (bytes, bytearray)):
+            from PIL import Image, ImageOps
+
+            with Image.open(BytesIO(image)) as pil_image:
+                return ImageOps.exif_transpose(pil_image).convert('RGB')
+        return image
+
+    def classify_batch(self, images: Sequence, filenames: Optional[Sequence[str]] = None) -> List[Dict]:
+        """Phân loại nhiều ảnh trong một lần predict"""
+        filenames = list(filenames) if filenames is not None else [''] * len(images)
+        if not images:
+            return []
+        if not self.available or self.load_model() is None:
+            error = self._load_error or f"Classifier model not found at {self.model_path}"
+            return [{"success": False, "error": error} for _ in images]
+
+        try:
+            inputs = [self._to_input(image) for image in images]
+            with self._predict_lock, perf.span('classifier.inference'):
+                results = self.model.predict(inputs, imgsz=self.imgsz, verbose=False)
+        except Exception as e:
+            logger.error(f"Local classification error: {str(e)}")
+            return [{"success": False, "error": str(e)} for _ in images]
+
+        output = []
+        for result, filename in zip(results, filenames):
+            probs = result.probs
+            output.append({
+                "success": True,
+                "name": result.names[int(probs.top1)],
+                "confidence": float(probs.top1conf),
+                "file": filename,
+                "backend": "local",
+            })
+        return output
+
+    def classify(self, image, filename: str = '') -> Dict:
+        return self.classify_batch([image], [filename])[0]
+
+    def upload_image(self, file_data: bytes, filename: str, content_type: str) -> Dict:
+        """Cùng chữ ký với PiClient.upload_image ('file' rỗng vì ảnh không được lưu trên Pi nào)"""
+        return self.classify(file_data)
+
+
+def build_local_classifier() -> Optional[LocalClassifier]:
+    """Classifier cục bộ theo settings (None nếu bị tắt)"""
+    if not getattr(settings, 'LOCAL_CLASSIFIER_ENABLED', False):
+        return None
+    return LocalClassifier(
+        settings.LOCAL_CLASSIFIER_MODEL_PATH,
+        imgsz=getattr(settings, 'LOCAL_CLASSIFIER_IMGSZ', 224),
+    )
@@ -0,0 +1,122 @@
+"""
+Metrics Prometheus cho toàn app (endpoint /metrics)
+- Dùng prometheus_client. Khi chạy nhiều worker (gunicorn/uvicorn), đặt biến môi trường
+  PROMETHEUS_MULTIPROC_DIR tới một thư mục rỗng TRƯỚC khi worker khởi động: mỗi process ghi
+  số liệu ra file mmap riêng và /metrics gộp số liệu của mọi worker
+- Chưa cài prometheus_client: các metric là no-op và /metrics trả 503
+"""
+import functools
+import os
+import time
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, multiprocess
+except ImportError:  # pragma: no cover - phụ thuộc tùy chọn
+    prometheus_client = None
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BOXES_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 20, 50, 100)
+BYTES_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 2 * 1024 * 1024, 5 * 1024 * 1024, 10 * 1024 * 1024)
+
+
+class _NoopMetric:
+    """Thay thế metric khi không có prometheus_client"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def set(self, value):
+        pass
+
+
+def _metric(kind: str, name: str, documentation: str, labelnames=(), **kwargs):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return getattr(prometheus_client, kind)(name, documentation, labelnames, **kwargs)
+
+
+# Pi
+PI_REQUEST_SECONDS = _metric('Histogram', 'leafmed_pi_request_seconds',
+                             'Thời gian gọi Pi theo method của PiClient', ['method'], buckets=SECONDS_BUCKETS)
+PI_REQUEST_ERRORS = _metric('Counter', 'leafmed_pi_request_errors_total',
+                            'Số lần gọi Pi bị lỗi theo method của PiClient', ['method'])
+PI_REQUEST_RETRIES = _metric('Counter', 'leafmed_pi_request_retries_total',
+                             'Số lần thử lại request tới Pi (PiClient._request)', ['endpoint'])
+
+# YOLO
+YOLO_INFERENCE_SECONDS = _metric('Histogram', 'leafmed_yolo_inference_seconds',
+                                 'Thời gian YOLO inference một frame', buckets=SECONDS_BUCKETS)
+YOLO_BOXES_PER_FRAME = _metric('Histogram', 'leafmed_yolo_boxes_per_frame',
+                               'Số lá YOLO phát hiện trên một frame', buckets=BOXES_BUCKETS)
+
+# Điều khiển tải phát hiện lá (services.detection_controller)
+DETECTION_IMGSZ = _metric('Gauge', 'leafmed_detection_imgsz',
+                          'Kích thước đầu vào YOLO hiện tại của phát hiện liên tục', multiprocess_mode='livemin')
+DETECTION_QUEUE_DEPTH = _metric('Gauge', 'leafmed_detection_queue_depth',
+                                'Số request phát hiện lá đang chạy + đang chờ', multiprocess_mode='livesum')
+DETECTION_REJECTED = _metric('Counter', 'leafmed_detection_rejected_total',
+                             'Số request phát hiện lá bị từ chối vì quá tải')
+
+# Upload / lưu kết quả
+UPLOAD_SIZE_BYTES = _metric('Histogram', 'leafmed_upload_size_bytes',
+                            'Kích thước ảnh người dùng gửi lên', ['source'], buckets=BYTES_BUCKETS)
+CAPTURE_RESULTS_CREATED = _metric('Counter', 'leafmed_capture_results_created_total',
+                                  'Số CaptureResult được tạo', ['source'])
+
+# Cache
+CACHE_REQUESTS = _metric('Counter', 'leafmed_cache_requests_total',
+                         'Số lần đọc cache theo kết quả (hit/miss)', ['cache', 'result'])
+
+# HTTP
+HTTP_REQUEST_SECONDS = _metric('Histogram', 'leafmed_http_request_seconds',
+                               'Thời gian xử lý request theo route', ['route', 'method'], buckets=SECONDS_BUCKETS)
+HTTP_REQUESTS = _metric('Counter', 'leafmed_http_requests_total',
+                        'Số request theo route và status', ['route', 'method', 'status'])
+
+
+def record_cache(cache_name: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache_name, 'hit' if hit else 'miss').inc()
+
+
+def track_pi_call(method):
+    """
+    Decorator cho method của PiClient: đo thời gian và đếm lỗi.
+    PiClient không raise mà trả về dict có 'error' (hoặc None) khi lỗi.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = method(*args, **kwargs)
+            failed = result is None or (isinstance(result, dict) and bool(result.get('error'))
+                                        and not result.get('success'))
+            return result
+        finally:
+            PI_REQUEST_SECONDS.labels(name).observe(time.perf_counter() - started)
+            if failed:
+                PI_REQUEST_ERRORS.labels(name).inc()
+    return wrapper
+
+
+def available() -> bool:
+    return prometheus_client is not None
+
+
+def render():
+    """(body, content_type) theo định dạng text của Prometheus"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,43 @@
+"""
+Khởi động model YOLO khi process web bắt đầu (gọi từ wsgi.py / asgi.py)
+- Import ultralytics/cv2 và load best.pt trong luồng nền: worker nhận request ngay,
+  request YOLO đầu tiên chỉ chờ phần còn lại (YOLO_LOAD_WAIT)
+- Không chạy với các lệnh manage.py khác (migrate, view_tables...)
+"""
+import logging
+import sys
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_preload_thread = None
+
+
+def _preload() -> None:
+    try:
+        from .yolo_service import yolo_detector
+        yolo_detector.start()
+    except Exception as e:
+        logger.error(f"[YOLO] Không khởi động được model: {e}", exc_info=True)
+
+
+def preload_models() -> None:
+    """Bắt đầu load model nền (một lần cho mỗi process)"""
+    global _preload_thread
+    if not getattr(settings, 'YOLO_PRELOAD', True) or _preload_thread is not None:
+        return
+    _preload_thread = threading.Thread(target=_preload, name='yolo-preload', daemon=True)
+    _preload_thread.start()
+
+
+def yolo_status() -> dict:
+    """Trạng thái model YOLO; không tự import yolo_service nếu process chưa import"""
+    module = sys.modules.get(f'{__package__}.yolo_service')
+    if module is None or not hasattr(module, 'yolo_detector'):
+        return {
+            'ready': False,
+            'state': 'importing' if _preload_thread is not None and _preload_thread.is_alive() else 'not_loaded',
+        }
+    return module.yolo_detector.status()
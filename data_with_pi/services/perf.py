@@ -0,0 +1,158 @@
+"""
+Đo hiệu năng theo request
+- span(name): đo thời gian một đoạn code (gọi Pi, YOLO capture/inference/encode...)
+  và cộng dồn vào request hiện tại (contextvars) + histogram trong process
+- RequestProfile: tổng hợp span, số query / thời gian DB của một request
+  (được tạo bởi PerformanceMiddleware)
+- Histogram: bucket cố định, an toàn khi dùng từ nhiều thread
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+# Bucket (ms) cho thời gian; giá trị khác (số query, bytes) dùng bucket riêng
+DURATION_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    """Histogram bucket cố định (đếm theo cận trên, như Prometheus)"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # phần tử cuối: +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {'buckets': self.buckets, 'counts': list(self.counts), 'count': self.count, 'sum': self.sum}
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Ước lượng phân vị theo cận trên của bucket"""
+        with self._lock:
+            if not self.count:
+                return None
+            target = q * self.count
+            running = 0
+            for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+                running += count
+                if running >= target:
+                    return bound
+        return None
+
+
+class HistogramRegistry:
+    """Các histogram theo (tên, nhãn)"""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, buckets=DURATION_BUCKETS_MS, **labels) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def observe(self, name: str, value: float, buckets=DURATION_BUCKETS_MS, **labels) -> None:
+        self.get(name, buckets, **labels).observe(value)
+
+    def items(self):
+        with self._lock:
+            return list(self._histograms.items())
+
+
+histograms = HistogramRegistry()
+
+
+class RequestProfile:
+    """Số liệu của một request: span (số lần, tổng ms) và DB"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: Dict[str, list] = {}
+        self.db_queries = 0
+        self.db_time_ms = 0.0
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, elapsed_ms: float) -> None:
+        with self._lock:
+            entry = self.spans.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed_ms
+
+    def add_query(self, elapsed_ms: float) -> None:
+        with self._lock:
+            self.db_queries += 1
+            self.db_time_ms += elapsed_ms
+
+    def span_items(self):
+        with self._lock:
+            return sorted((name, tuple(entry)) for name, entry in self.spans.items())
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        """connection.execute_wrapper: đếm query và thời gian DB"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add_query((time.perf_counter() - started) * 1000)
+
+
+_current: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar('perf_profile', default=None)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+def activate(profile: Optional[RequestProfile]):
+    return _current.set(profile)
+
+
+def deactivate(token) -> None:
+    _current.reset(token)
+
+
+@contextmanager
+def span(name: str):
+    """Đo thời gian một đoạn code: cộng vào request hiện tại (nếu có) và histogram span_duration_ms"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        profile = _current.get()
+        if profile is not None:
+            profile.add_span(name, elapsed_ms)
+        histograms.observe('span_duration_ms', elapsed_ms, span=name)
+
+
+def bind(fn: Callable) -> Callable:
+    """
+    Bọc fn để chạy trong context của request hiện tại (dùng cho ThreadPoolExecutor,
+    vì thread của pool không kế thừa contextvars)
+    """
+    context = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
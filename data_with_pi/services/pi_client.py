@@ -2,10 +2,39 @@
 Service layer để giao tiếp với Pi API
 Xử lý retry, error handling, và các tương tác với Pi
 """
-import requests
+import functools
+import hashlib
+import json
 import time
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Optional
 from django.conf import settings
+from django.core.cache import cache
+
+if TYPE_CHECKING:
+    import requests
+
+from . import perf
+from .metrics import PI_REQUEST_RETRIES, record_cache, track_pi_call
+
+CAMERA_STATE_KEY = 'pi:camera_state:{}'
+
+
+def _span_name(endpoint: str) -> str:
+    """VD: '/capture/preview' -> 'pi.capture.preview', '/history/image/a.jpg' -> 'pi.history.image'"""
+    parts = [part for part in endpoint.split('?')[0].split('/') if part and '.' not in part]
+    return '.'.join(['pi'] + parts)
+
+
+def changes_camera_state(method):
+    """Decorator: method làm đổi trạng thái camera -> bỏ bản get_camera_state đang cache"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.invalidate_camera_state()
+    return wrapper
 
 
 class PiClient:
@@ -14,9 +43,20 @@ class PiClient:
     def __init__(self, base_url: Optional[str] = None):
         self.base_url = (base_url or settings.PI_API_BASE_URL).rstrip('/')
         self.timeout = 30
+        # Giữ kết nối keep-alive tới Pi (pool đủ lớn cho các upload song song)
+        pool_size = getattr(settings, 'PI_CLIENT_POOL_SIZE', 10)
+        # requests chỉ được import khi tạo client đầu tiên (import data_with_pi.views nhanh hơn)
+        import requests
+        import requests.adapters
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
     
-    def _request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+    def _request(self, method: str, endpoint: str, **kwargs) -> 'requests.Response':
         """Thực hiện HTTP request với retry logic"""
+        import requests
+        
         url = f"{self.base_url}{endpoint}"
         max_retries = 3
         retry_delay = 1.0
@@ -24,14 +64,17 @@ class PiClient:
         for attempt in range(max_retries):
             try:
                 kwargs.setdefault('timeout', self.timeout)
-                response = requests.request(method, url, **kwargs)
+                with perf.span(_span_name(endpoint)):
+                    response = self.session.request(method, url, **kwargs)
                 return response
             except requests.exceptions.RequestException:
                 if attempt == max_retries - 1:
                     raise
+                PI_REQUEST_RETRIES.labels(_span_name(endpoint)).inc()
                 time.sleep(retry_delay * (attempt + 1))
         raise requests.exceptions.RequestException("Max retries exceeded")
     
+    @track_pi_call
     def get_status(self) -> Dict:
         """Lấy trạng thái hệ thống Pi"""
         try:
@@ -41,6 +84,7 @@ class PiClient:
         except Exception as e:
             return {"error": str(e), "camera": {"state": "error"}, "model_loaded": False}
     
+    @track_pi_call
     def pause_stream(self) -> Dict:
         """Tạm dừng stream"""
         try:
@@ -50,6 +94,7 @@ class PiClient:
         except Exception as e:
             return {"error": str(e)}
     
+    @track_pi_call
     def resume_stream(self) -> Dict:
         """Tiếp tục stream"""
         try:
@@ -59,6 +104,7 @@ class PiClient:
         except Exception as e:
             return {"error": str(e)}
     
+    @track_pi_call
     def capture_preview(self) -> Dict:
         """
         Capture ảnh và trả về ngay để hiển thị (preview) - KHÔNG phân tích
@@ -78,6 +124,7 @@ class PiClient:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    @track_pi_call
     def analyze_image(self, filename: str) -> Dict:
         """
         Phân tích ảnh đã capture từ preview
@@ -99,6 +146,7 @@ class PiClient:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    @track_pi_call
     def upload_image(self, file_data: bytes, filename: str, content_type: str) -> Dict:
         """Upload ảnh để phân tích"""
         try:
@@ -109,6 +157,7 @@ class PiClient:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    @track_pi_call
     def get_history(self, limit: int = 100) -> Dict:
         """Lấy danh sách lịch sử"""
         try:
@@ -120,8 +169,23 @@ class PiClient:
     
     def get_history_image_url(self, filename: str) -> str:
         """Lấy URL ảnh từ lịch sử"""
-        return f"{self.base_url}/history/image/{filename}"
+        from urllib.parse import quote
+
+        return f"{self.base_url}/history/image/{quote(filename)}"
+
+    @track_pi_call
+    def get_history_image(self, filename: str) -> Optional[bytes]:
+        """Tải nội dung ảnh từ lịch sử (None nếu không có hoặc lỗi)"""
+        from urllib.parse import quote
+
+        try:
+            response = self._request('GET', f'/history/image/{quote(filename)}')
+            response.raise_for_status()
+            return response.content
+        except Exception:
+            return None
     
+    @track_pi_call
     def get_settings(self) -> Dict:
         """Lấy cấu hình camera"""
         try:
@@ -131,6 +195,8 @@ class PiClient:
         except Exception as e:
             return {"error": str(e)}
     
+    @changes_camera_state
+    @track_pi_call
     def set_mode(self, mode: str) -> Dict:
         """Thiết lập chế độ camera"""
         try:
@@ -140,6 +206,8 @@ class PiClient:
         except Exception as e:
             return {"error": str(e)}
     
+    @changes_camera_state
+    @track_pi_call
     def restart_camera(self) -> Dict:
         """Khởi động lại camera"""
         try:
@@ -149,6 +217,7 @@ class PiClient:
         except Exception as e:
             return {"error": str(e)}
     
+    @track_pi_call
     def reload_model(self) -> Dict:
         """Tải lại model"""
         try:
@@ -162,6 +231,7 @@ class PiClient:
         """Lấy URL stream"""
         return f"{self.base_url}/stream/live"
     
+    @track_pi_call
     def get_camera_settings(self) -> Dict:
         """Lấy thông số camera hiện tại"""
         try:
@@ -171,6 +241,8 @@ class PiClient:
         except Exception as e:
             return {"error": str(e)}
     
+    @changes_camera_state
+    @track_pi_call
     def set_camera_settings(self, settings: Dict) -> Dict:
         """Thiết lập thông số camera"""
         try:
@@ -180,6 +252,8 @@ class PiClient:
         except Exception as e:
             return {"error": str(e)}
     
+    @changes_camera_state
+    @track_pi_call
     def apply_preset(self, preset_name: str) -> Dict:
         """Áp dụng preset"""
         try:
@@ -189,6 +263,7 @@ class PiClient:
         except Exception as e:
             return {"error": str(e)}
     
+    @track_pi_call
     def get_available_presets(self) -> Dict:
         """Lấy danh sách preset"""
         try:
@@ -198,7 +273,54 @@ class PiClient:
         except Exception as e:
             return {"error": str(e), "presets": []}
     
+    def _camera_state_key(self) -> str:
+        return CAMERA_STATE_KEY.format(hashlib.sha1(self.base_url.encode('utf-8')).hexdigest()[:12])
+
+    def invalidate_camera_state(self) -> None:
+        cache.delete(self._camera_state_key())
+
+    def get_camera_state(self) -> Dict:
+        """
+        Lấy toàn bộ trạng thái camera (settings, thông số camera, UI settings, resolution)
+        bằng 4 request song song tới Pi, gộp thành một document có version.
+        Kết quả được cache CAMERA_STATE_CACHE_SECONDS giây (dùng chung mọi worker nếu cache là
+        Redis/Memcached) và bị xóa ngay khi đổi mode/settings/preset/resolution qua client này,
+        nên các lần poll trong khoảng đó (kể cả trả 304) không gọi Pi.
+
+        Returns:
+            Dict với version (hash nội dung), settings, camera, ui_settings, resolution
+        """
+        key = self._camera_state_key()
+        state = cache.get(key)
+        record_cache('camera_state', hit=state is not None)
+        if state is not None:
+            return state
+
+        state = self.fetch_camera_state()
+        # Trạng thái có lỗi (Pi mất kết nối...) không cache để lần poll sau thử lại ngay
+        if not any(isinstance(part, dict) and part.get('error') for part in state.values()):
+            cache.set(key, state, getattr(settings, 'CAMERA_STATE_CACHE_SECONDS', 5))
+        return state
+
+    @track_pi_call
+    def fetch_camera_state(self) -> Dict:
+        """Gọi Pi lấy trạng thái camera (không qua cache), xem get_camera_state"""
+        calls = {
+            'settings': self.get_settings,
+            'camera': self.get_camera_settings,
+            'ui_settings': self.get_current_ui_settings,
+            'resolution': self.get_resolution_info,
+        }
+        with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+            futures = {key: pool.submit(perf.bind(call)) for key, call in calls.items()}
+            state = {key: future.result() for key, future in futures.items()}
+        
+        canonical = json.dumps(state, sort_keys=True, default=str).encode('utf-8')
+        state['version'] = hashlib.sha1(canonical).hexdigest()
+        return state
+    
     # Resolution methods
+    @track_pi_call
     def get_resolution_info(self) -> Dict:
         """Lấy thông tin resolution hiện tại"""
         try:
@@ -208,6 +330,8 @@ class PiClient:
         except Exception as e:
             return {"error": str(e)}
     
+    @changes_camera_state
+    @track_pi_call
     def change_resolution(self, profile_name: str) -> Dict:
         """Thay đổi resolution camera"""
         try:
@@ -217,6 +341,7 @@ class PiClient:
         except Exception as e:
             return {"error": str(e)}
     
+    @track_pi_call
     def get_resolution_profiles(self) -> Dict:
         """Lấy danh sách resolution profiles"""
         try:
@@ -227,6 +352,7 @@ class PiClient:
             return {"error": str(e), "profiles": {}}
     
     # UI Settings methods (user-friendly)
+    @track_pi_call
     def get_ui_settings_definitions(self) -> Dict:
         """Lấy definitions của UI settings"""
         try:
@@ -236,6 +362,7 @@ class PiClient:
         except Exception as e:
             return {"error": str(e), "ui_settings": {}}
     
+    @track_pi_call
     def get_current_ui_settings(self) -> Dict:
         """Lấy UI settings hiện tại"""
         try:
@@ -245,6 +372,8 @@ class PiClient:
         except Exception as e:
             return {"error": str(e)}
     
+    @changes_camera_state
+    @track_pi_call
     def apply_ui_settings(self, ui_settings: Dict) -> Dict:
         """Áp dụng UI settings"""
         try:
@@ -255,6 +384,7 @@ class PiClient:
             return {"error": str(e)}
 
     # Video recording methods (tạm thời - để tăng dataset)
+    @track_pi_call
     def start_video_recording(self, duration: int = None) -> Dict:
         """Bắt đầu quay video"""
         try:
@@ -267,6 +397,7 @@ class PiClient:
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    @track_pi_call
     def stop_video_recording(self) -> Dict:
         """Dừng quay video và lưu trên Pi"""
         try:
@@ -276,6 +407,7 @@ class PiClient:
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    @track_pi_call
     def get_video_recording_status(self) -> Dict:
         """Lấy trạng thái recording hiện tại"""
         try:
@@ -283,4 +415,39 @@ class PiClient:
             response.raise_for_status()
             return response.json()
         except Exception as e:
-            return {"success": False, "error": str(e), "recording": False}
\ No newline at end of file
+            return {"success": False, "error": str(e), "recording": False}
+
+    @track_pi_call
+    def list_videos(self) -> Dict:
+        """Danh sách video đã quay trên Pi: {"videos": [{"filename", "size"}, ...]}"""
+        try:
+            response = self._request('GET', '/video/list')
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            return {"success": False, "error": str(e), "videos": []}
+
+    @track_pi_call
+    def download_video(self, filename: str, destination) -> Dict:
+        """
+        Tải video về file destination, ghi từng khối (không giữ cả video trong bộ nhớ).
+        Ghi vào <destination>.part rồi đổi tên, nên file tồn tại nghĩa là đã tải xong.
+        """
+        from pathlib import Path
+        from urllib.parse import quote
+
+        destination = Path(destination)
+        partial = destination.with_name(destination.name + '.part')
+        try:
+            response = self._request('GET', f'/video/download/{quote(filename)}', stream=True, timeout=(10, 300))
+            response.raise_for_status()
+            size = 0
+            with response, open(partial, 'wb') as f:
+                for chunk in response.iter_content(1024 * 1024):
+                    f.write(chunk)
+                    size += len(chunk)
+            partial.replace(destination)
+            return {"success": True, "path": str(destination), "size": size}
+        except Exception as e:
+            partial.unlink(missing_ok=True)
+            return {"success": False, "error": str(e)}
@@ -0,0 +1,363 @@
+"""
+Quản lý nhiều trạm Raspberry Pi (fleet)
+- Mỗi trạm (PiDevice) có một PiClient riêng
+- Theo dõi sức khỏe từng trạm: số request đang chạy (độ sâu hàng đợi), độ trễ,
+  lỗi liên tiếp -> tạm loại trạm lỗi trong một khoảng thời gian (cooldown)
+- Chụp ảnh / stream / cài đặt camera luôn đi tới trạm của user
+- upload_image / analyze_image được cân bằng tải: chọn trạm khỏe có hàng đợi ngắn nhất,
+  lỗi thì chuyển sang trạm khác
+- Chưa đăng ký trạm nào thì dùng PI_API_BASE_URL như trước
+- Tùy chọn: classifier cục bộ (LocalClassifier) nhận việc khi hàng đợi Pi đã sâu hoặc Pi lỗi
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from . import perf
+from .local_classifier import build_local_classifier
+from .pi_client import PiClient
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PiDeviceState:
+    """Trạng thái một trạm Pi trong process hiện tại"""
+    name: str
+    base_url: str
+    client: PiClient
+    accepts_inference: bool = True
+    in_flight: int = 0
+    consecutive_failures: int = 0
+    unhealthy_since: Optional[float] = None
+    latency_ewma: Optional[float] = None
+    requests: int = 0
+    failures: int = 0
+    last_error: str = ''
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def healthy(self) -> bool:
+        return self.unhealthy_since is None
+
+    def available(self, now: float, cooldown: float) -> bool:
+        """Trạm khỏe, hoặc đã hết cooldown (cho thử lại một request)"""
+        return self.unhealthy_since is None or now - self.unhealthy_since >= cooldown
+
+    def as_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'base_url': self.base_url,
+            'healthy': self.healthy,
+            'accepts_inference': self.accepts_inference,
+            'in_flight': self.in_flight,
+            'latency_ms': round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            'requests': self.requests,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+        }
+
+
+def image_device(result: Dict) -> str:
+    """base_url trạm đang giữ result['file'] (mặc định là trạm đã xử lý request)"""
+    if not result.get('file'):
+        return ''
+    return result.get('image_device') or result.get('pi_device') or ''
+
+
+def _is_failure(result: Dict) -> bool:
+    # PiClient không raise mà trả về {"success": False, "error": ...} khi lỗi
+    return not result.get('success') and bool(result.get('error'))
+
+
+class PiFleet:
+    """
+    Danh sách trạm Pi + bộ lập lịch.
+
+    Args:
+        devices: Danh sách (name, base_url, accepts_inference) cố định.
+                 None -> đọc từ bảng PiDevice (có TTL, bị xóa khi PiDevice thay đổi)
+        failure_threshold: Số lỗi liên tiếp để đánh dấu trạm không khỏe
+        cooldown: Số giây trước khi thử lại trạm không khỏe
+        max_attempts: Số trạm tối đa được thử cho một request cân bằng tải
+        local_classifier: Backend phân loại cục bộ (None -> chỉ dùng Pi)
+        local_queue_depth: Độ sâu hàng đợi của Pi từ đó chuyển việc sang classifier cục bộ
+    """
+
+    def __init__(self, devices: Optional[Iterable[Tuple[str, str, bool]]] = None,
+                 failure_threshold: int = 3, cooldown: float = 30.0,
+                 max_attempts: int = 2, registry_ttl: float = 30.0,
+                 local_classifier=None, local_queue_depth: int = 2):
+        self.static_devices = list(devices) if devices is not None else None
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.max_attempts = max(1, max_attempts)
+        self.registry_ttl = registry_ttl
+        self._lock = threading.Lock()
+        self._schedule_lock = threading.Lock()
+        self._states: Dict[str, PiDeviceState] = {}
+        self._devices: Optional[List[PiDeviceState]] = None
+        self._loaded_at = 0.0
+        self.local_queue_depth = max(1, local_queue_depth)
+        self.local: Optional[PiDeviceState] = None
+        if local_classifier is not None:
+            self.local = PiDeviceState(name='local', base_url=local_classifier.base_url, client=local_classifier)
+
+    # ---------- Danh sách trạm ----------
+
+    def _load_registry(self) -> List[Tuple[str, str, bool]]:
+        if self.static_devices is not None:
+            return self.static_devices
+        from ..models import PiDevice
+        rows = list(PiDevice.objects.filter(is_active=True).values_list('name', 'base_url', 'accepts_inference'))
+        return rows or [('default', settings.PI_API_BASE_URL, True)]
+
+    def _state_for(self, name: str, base_url: str, accepts_inference: bool) -> PiDeviceState:
+        # Giữ lại trạng thái sức khỏe khi danh sách trạm được load lại
+        base_url = base_url.rstrip('/')
+        state = self._states.get(base_url)
+        if state is None:
+            state = PiDeviceState(name=name, base_url=base_url, client=PiClient(base_url))
+            self._states[base_url] = state
+        state.name = name
+        state.accepts_inference = accepts_inference
+        return state
+
+    def devices(self) -> List[PiDeviceState]:
+        """Các trạm đang hoạt động"""
+        with self._lock:
+            if self._devices is None or time.monotonic() - self._loaded_at > self.registry_ttl:
+                self._devices = [self._state_for(*row) for row in self._load_registry()]
+                self._loaded_at = time.monotonic()
+            return self._devices
+
+    def invalidate(self) -> None:
+        """Load lại danh sách trạm ở lần dùng tiếp theo"""
+        with self._lock:
+            self._devices = None
+
+    def device_for_url(self, base_url: str) -> Optional[PiDeviceState]:
+        base_url = (base_url or '').rstrip('/')
+        return next((d for d in self.devices() if d.base_url == base_url), None)
+
+    def default_device(self) -> PiDeviceState:
+        """Trạm mặc định: trạm có địa chỉ PI_API_BASE_URL, nếu không có thì trạm đầu tiên"""
+        return self.device_for_url(settings.PI_API_BASE_URL) or self.devices()[0]
+
+    def station_for(self, user) -> PiDeviceState:
+        """Trạm chụp của user (trạm được gán đầu tiên theo tên), mặc định là default_device()"""
+        if self.static_devices is None and getattr(user, 'is_authenticated', False):
+            base_url = user.pi_stations.filter(is_active=True).order_by('name').values_list('base_url', flat=True).first()
+            device = self.device_for_url(base_url) if base_url else None
+            if device is not None:
+                return device
+        return self.default_device()
+
+    def client_for_user(self, user) -> PiClient:
+        return self.station_for(user).client
+
+    # ---------- Lập lịch ----------
+
+    def _candidates(self, exclude=()) -> List[PiDeviceState]:
+        now = time.monotonic()
+        devices = [d for d in self.devices()
+                   if d.accepts_inference and d.base_url not in exclude and d.available(now, self.cooldown)]
+        # Hàng đợi ngắn nhất trước, cùng độ sâu thì ưu tiên trạm phản hồi nhanh hơn
+        return sorted(devices, key=lambda d: (d.in_flight, d.latency_ewma or 0.0))
+
+    def pick(self, exclude=()) -> Optional[PiDeviceState]:
+        """Trạm khỏe có hàng đợi ngắn nhất (None nếu không còn trạm nào)"""
+        candidates = self._candidates(exclude)
+        return candidates[0] if candidates else None
+
+    def _record(self, device: PiDeviceState, elapsed: float, result: Dict) -> None:
+        with device.lock:
+            device.requests += 1
+            if _is_failure(result):
+                device.failures += 1
+                device.consecutive_failures += 1
+                device.last_error = str(result.get('error'))[:200]
+                if device.consecutive_failures >= self.failure_threshold and device.healthy:
+                    logger.warning(f"Pi {device.name} marked unhealthy: {device.last_error}")
+                if device.consecutive_failures >= self.failure_threshold:
+                    # Hết cooldown mà vẫn lỗi -> bắt đầu cooldown mới
+                    device.unhealthy_since = time.monotonic()
+            else:
+                if not device.healthy:
+                    logger.info(f"Pi {device.name} is healthy again")
+                device.consecutive_failures = 0
+                device.unhealthy_since = None
+                device.latency_ewma = elapsed if device.latency_ewma is None else 0.8 * device.latency_ewma + 0.2 * elapsed
+
+    def _acquire(self, exclude=(), first: Optional[PiDeviceState] = None) -> Optional[PiDeviceState]:
+        # Chọn trạm và tăng hàng đợi trong cùng một lock để các request đồng thời không dồn về một trạm
+        with self._schedule_lock:
+            device = first or self.pick(exclude)
+            if device is not None:
+                with device.lock:
+                    device.in_flight += 1
+            return device
+
+    def _run(self, device: PiDeviceState, fn: Callable[[PiClient], Dict]) -> Dict:
+        started = time.perf_counter()
+        try:
+            result = fn(device.client)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        finally:
+            with device.lock:
+                device.in_flight -= 1
+        self._record(device, time.perf_counter() - started, result)
+        return result
+
+    def call(self, device: PiDeviceState, fn: Callable[[PiClient], Dict]) -> Dict:
+        """Gọi fn(client) trên một trạm, cập nhật hàng đợi và sức khỏe"""
+        return self._run(self._acquire(first=device), fn)
+
+    def dispatch(self, fn: Callable[[PiClient], Dict], first: Optional[PiDeviceState] = None) -> Dict:
+        """
+        Chạy fn trên trạm tốt nhất (hoặc first nếu có), lỗi thì thử trạm kế tiếp.
+        Kết quả có thêm 'pi_device' là base_url của trạm đã xử lý.
+        """
+        tried = set()
+        device = self._acquire(first=first)
+        result = {"success": False, "error": "Không có trạm Pi nào khả dụng"}
+        while device is not None:
+            tried.add(device.base_url)
+            result = self._run(device, fn)
+            result['pi_device'] = device.base_url
+            result.setdefault('backend', 'pi')
+            if not _is_failure(result) or len(tried) >= self.max_attempts:
+                break
+            logger.warning(f"Pi {device.name} failed, trying another device: {result.get('error')}")
+            device = self._acquire(exclude=tried)
+        return result
+
+    def _use_local(self, device: Optional[PiDeviceState]) -> bool:
+        """Chính sách định tuyến: dùng classifier cục bộ khi Pi không khả dụng hoặc hàng đợi Pi đã sâu"""
+        if self.local is None or not self.local.client.available:
+            return False
+        if device is None or not device.available(time.monotonic(), self.cooldown):
+            return True
+        return device.in_flight >= self.local_queue_depth and self.local.in_flight <= device.in_flight
+
+    def _run_local(self, fn: Callable) -> Dict:
+        result = self._run(self._acquire(first=self.local), fn)
+        result['pi_device'] = self.local.base_url
+        result['backend'] = 'local'
+        return result
+
+    def upload_image(self, file_data: bytes, filename: str, content_type: str) -> Dict:
+        """Upload ảnh để phân tích trên trạm có hàng đợi ngắn nhất (hoặc classifier cục bộ)"""
+        def upload(client):
+            return client.upload_image(file_data, filename, content_type)
+
+        if self._use_local(self.pick()):
+            return self._run_local(upload)
+        result = self.dispatch(upload)
+        if _is_failure(result) and self._use_local(None):
+            logger.warning(f"All Pi devices failed, classifying locally: {result.get('error')}")
+            result = self._run_local(upload)
+        return result
+
+    def classify_batch(self, images: Sequence, filenames: Sequence[str],
+                       encode: Callable[[object], bytes], max_workers: int = 4) -> List[Dict]:
+        """
+        Phân loại nhiều ảnh (VD: các lá cắt từ một frame).
+        Classifier cục bộ: một lần predict cho cả lô (ảnh numpy dùng trực tiếp, không encode).
+        Pi: encode JPEG rồi upload song song (tối đa max_workers request), mỗi ảnh được định tuyến riêng.
+        """
+        if not images:
+            return []
+        local = self.local
+        if self._use_local(self.pick()) and hasattr(local.client, 'classify_batch'):
+            device = self._acquire(first=local)
+            started = time.perf_counter()
+            try:
+                results = local.client.classify_batch(images, filenames)
+            except Exception as e:
+                results = [{"success": False, "error": str(e)} for _ in images]
+            finally:
+                with device.lock:
+                    device.in_flight -= 1
+            failed = next((r for r in results if _is_failure(r)), None)
+            self._record(device, time.perf_counter() - started, failed or {"success": True})
+            for result in results:
+                result['pi_device'] = local.base_url
+                result['backend'] = 'local'
+            return results
+
+        def classify_one(item):
+            image, filename = item
+            try:
+                data = encode(image)
+            except Exception as e:
+                return {"success": False, "error": str(e)}
+            return self.upload_image(data, filename, 'image/jpeg')
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(images)))) as pool:
+            return list(pool.map(perf.bind(classify_one), zip(images, filenames)))
+
+    def analyze_image(self, station: PiDeviceState, filename: str) -> Dict:
+        """
+        Phân tích ảnh đã capture trên station.
+        Nếu trạm khác rảnh hơn (hoặc hàng đợi Pi đã sâu): lấy ảnh từ station rồi upload sang
+        trạm đó / phân loại cục bộ. 'file' trong kết quả vẫn là tên file trên station,
+        'image_device' là base_url của station (lịch sử / proxy ảnh lấy ảnh từ đó).
+        """
+        target = self.pick()
+        if target is None or station.in_flight <= target.in_flight:
+            target = station
+        if target is station and not self._use_local(station):
+            # File chỉ có trên station nên không chuyển trạm khi lỗi
+            result = self.call(station, lambda client: client.analyze_image(filename))
+            result['pi_device'] = station.base_url
+            result.setdefault('backend', 'pi')
+            return result
+
+        image = station.client.get_history_image(filename)
+        if image is None:
+            return {"success": False, "error": f"Không lấy được ảnh {filename} từ trạm {station.name}",
+                    "pi_device": station.base_url}
+
+        def upload(client):
+            return client.upload_image(image, filename, 'image/jpeg')
+
+        result = self._run_local(upload) if self._use_local(target) else self.dispatch(upload, first=target)
+        if result.get('success'):
+            result['file'] = filename
+            result['image_device'] = station.base_url
+        return result
+
+    # ---------- Sức khỏe ----------
+
+    def check_health(self) -> List[Dict]:
+        """Gọi /status của mọi trạm song song và cập nhật sức khỏe"""
+        devices = self.devices()
+
+        def probe(device):
+            status = self.call(device, lambda client: client.get_status())
+            return {**device.as_dict(), 'status': status}
+
+        with ThreadPoolExecutor(max_workers=max(1, len(devices))) as pool:
+            return list(pool.map(perf.bind(probe), devices))
+
+    def snapshot(self) -> List[Dict]:
+        backends = self.devices() + ([self.local] if self.local is not None else [])
+        return [device.as_dict() for device in backends]
+
+
+pi_fleet = PiFleet(
+    failure_threshold=getattr(settings, 'PI_FLEET_FAILURE_THRESHOLD', 3),
+    cooldown=getattr(settings, 'PI_FLEET_COOLDOWN', 30.0),
+    max_attempts=getattr(settings, 'PI_FLEET_MAX_ATTEMPTS', 2),
+    registry_ttl=getattr(settings, 'PI_FLEET_REGISTRY_TTL', 30.0),
+    local_classifier=build_local_classifier(),
+    local_queue_depth=getattr(settings, 'LOCAL_CLASSIFIER_QUEUE_DEPTH', 2),
+)
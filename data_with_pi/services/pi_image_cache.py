@@ -0,0 +1,229 @@
+"""
+Cache ảnh chụp từ Pi trên đĩa (LRU, giới hạn dung lượng)
+- Mỗi ảnh chỉ được tải từ Pi một lần, sau đó phục vụ từ đĩa của Django
+- Giới hạn dung lượng tính trên toàn bộ PI_IMAGE_CACHE_DIR (mọi Pi, mọi tiến trình worker):
+  mỗi lần ghi đếm lại dung lượng thực trên đĩa - rẻ so với lần tải ảnh từ Pi vừa xảy ra
+- Sinh thumbnail để trang lịch sử không phải tải ảnh gốc
+- Prefetch nền cho các dòng lịch sử
+"""
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+SIZES = ('full', 'thumb')
+THUMB_SIZE = (320, 320)
+
+
+def is_valid_filename(filename: str) -> bool:
+    """Chỉ chấp nhận tên file đơn giản (không có thư mục, không ẩn)"""
+    return bool(filename) and os.path.basename(filename) == filename and not filename.startswith('.')
+
+
+class PiImageCache:
+    """
+    Cache LRU trên đĩa: thời điểm truy cập lưu bằng mtime của file
+    budget_root: thư mục mà max_bytes áp dụng cho (mặc định: root); nhiều cache dùng chung
+                 một budget_root (mỗi Pi một thư mục con) thì chia sẻ cùng giới hạn dung lượng
+    """
+
+    def __init__(self, pi_client, root, max_bytes: int, prefetch_workers: int = 2, budget_root=None):
+        self.pi_client = pi_client
+        self.root = Path(root)
+        self.budget_root = Path(budget_root) if budget_root is not None else self.root
+        self.max_bytes = max_bytes
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._size_lock = threading.Lock()
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix='pi-image-prefetch')
+        self._prefetching = set()
+
+    def _path(self, filename: str, size: str) -> Path:
+        digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+        return self.root / digest[:2] / f'{digest}_{size}.jpg'
+
+    @contextmanager
+    def _file_lock(self, filename: str):
+        """
+        Một lock cho mỗi ảnh để nhiều request cùng lúc chỉ tải từ Pi một lần.
+        Lock được đếm tham chiếu: chỉ bỏ khỏi bảng khi không còn thread nào giữ hoặc đang chờ
+        (bỏ sớm -> thread đến sau tạo lock mới và tải trùng)
+        """
+        with self._locks_guard:
+            entry = self._locks.setdefault(filename, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._locks.pop(filename, None)
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        """(mtime, size, path) của mọi ảnh trên đĩa trong budget_root (kể cả của Pi / tiến trình khác)"""
+        entries = []
+        for path in self.budget_root.glob('**/*.jpg'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # Tiến trình khác vừa evict
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def disk_usage(self) -> int:
+        """Dung lượng thực trên đĩa của budget_root"""
+        return sum(size for _, size, _ in self._entries())
+
+    def _write(self, path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        with self._size_lock:
+            entries = self._entries()
+            if sum(size for _, size, _ in entries) > self.max_bytes:
+                self._evict(entries)
+
+    def _evict(self, entries: List[Tuple[float, int, Path]]) -> None:
+        """Xóa các ảnh ít được truy cập nhất cho đến khi còn 90% dung lượng cho phép"""
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= target:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except FileNotFoundError:
+                total -= size  # Tiến trình khác đã xóa
+        logger.info(f"Pi image cache evicted down to {total} bytes")
+
+    @staticmethod
+    def _make_thumbnail(data: bytes) -> bytes:
+        from PIL import Image, ImageOps
+
+        with Image.open(BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            image.thumbnail(THUMB_SIZE, Image.LANCZOS)
+            buffer = BytesIO()
+            image.save(buffer, 'JPEG', quality=80, optimize=True)
+            return buffer.getvalue()
+
+    @staticmethod
+    def _touch(path: Path) -> bool:
+        """Đánh dấu vừa truy cập (LRU); False nếu file không còn (chưa có hoặc vừa bị evict)"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get(self, filename: str, size: str = 'full') -> Optional[Path]:
+        """
+        Lấy đường dẫn file cache của ảnh (tải từ Pi nếu chưa có).
+        Trả về None nếu Pi không có ảnh hoặc không kết nối được.
+        File có thể bị evict ngay sau khi trả về: cần đọc nội dung thì dùng open().
+        """
+        path = self._path(filename, size)
+        if self._touch(path):
+            record_cache('pi_image', hit=True)
+            return path
+        record_cache('pi_image', hit=False)
+
+        with self._file_lock(filename):
+            if self._touch(path):
+                return path
+
+            full_path = self._path(filename, 'full')
+            try:
+                data = full_path.read_bytes()
+                os.utime(full_path)
+            except FileNotFoundError:
+                data = self.pi_client.get_history_image(filename)
+                if data is None:
+                    return None
+                self._write(full_path, data)
+
+            if size == 'thumb':
+                try:
+                    self._write(path, self._make_thumbnail(data))
+                except Exception as e:
+                    logger.warning(f"Cannot create thumbnail for {filename}: {str(e)}")
+                    return full_path if full_path.exists() else None
+            return path if path.exists() else None
+
+    def open(self, filename: str, size: str = 'full', attempts: int = 2) -> Optional[BinaryIO]:
+        """
+        Mở file ảnh đã cache để đọc (tải từ Pi nếu chưa có); None nếu không lấy được ảnh.
+        File bị evict giữa get() và open() -> coi như miss và lấy lại.
+        File đã mở vẫn đọc được dù sau đó bị evict (unlink không ảnh hưởng file đang mở).
+        """
+        for _ in range(attempts):
+            path = self.get(filename, size)
+            if path is None:
+                return None
+            try:
+                return open(path, 'rb')
+            except FileNotFoundError:
+                logger.info(f"Pi image {filename} evicted before open, fetching again")
+        return None
+
+    def prefetch(self, filenames: Iterable[str], size: str = 'thumb') -> None:
+        """Tải trước ảnh ở chế độ nền (bỏ qua ảnh đã có hoặc đang được tải)"""
+        for filename in filenames:
+            if not is_valid_filename(filename) or self._path(filename, size).exists():
+                continue
+            with self._locks_guard:
+                if filename in self._prefetching:
+                    continue
+                self._prefetching.add(filename)
+            self._prefetch_pool.submit(self._prefetch_one, filename, size)
+
+    def _prefetch_one(self, filename: str, size: str) -> None:
+        try:
+            self.get(filename, size)
+        except Exception as e:
+            logger.warning(f"Prefetch Pi image {filename} failed: {str(e)}")
+        finally:
+            with self._locks_guard:
+                self._prefetching.discard(filename)
+
+
+def build_default_cache(pi_client) -> PiImageCache:
+    root = Path(getattr(settings, 'PI_IMAGE_CACHE_DIR', Path(settings.BASE_DIR) / 'pi_image_cache'))
+    # Mỗi Pi một thư mục con: tên file trên các Pi khác nhau có thể trùng nhau;
+    # giới hạn dung lượng áp dụng cho cả root (dùng chung cho mọi Pi)
+    device_dir = hashlib.sha1(pi_client.base_url.encode('utf-8')).hexdigest()[:12]
+    return PiImageCache(
+        pi_client,
+        root=root / device_dir,
+        max_bytes=getattr(settings, 'PI_IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024),
+        budget_root=root,
+    )
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_image_cache(pi_client) -> PiImageCache:
+    """Cache dùng chung cho mỗi Pi (theo base_url)"""
+    with _caches_lock:
+        cache = _caches.get(pi_client.base_url)
+        if cache is None:
+            cache = build_default_cache(pi_client)
+            _caches[pi_client.base_url] = cache
+        return cache
@@ -0,0 +1,113 @@
+"""
+Feed trạng thái Pi cho trình duyệt (Server-Sent Events)
+- MỘT thread poll /status của Pi cho mỗi Pi (trong mỗi process), bất kể bao nhiêu tab đang mở
+- So sánh snapshot, chỉ đẩy sự kiện khi trạng thái thay đổi
+- Thread tự dừng khi không còn subscriber và khởi động lại khi có subscriber mới
+"""
+import json
+import logging
+import queue
+import threading
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PiStatusFeed:
+    """Poller dùng chung + danh sách subscriber (mỗi subscriber là một queue)"""
+
+    def __init__(self, pi_client, interval: float = 2.0, ignored_fields=()):
+        self.pi_client = pi_client
+        self.interval = interval
+        self.ignored_fields = set(ignored_fields)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._version = 0
+        self._status: Optional[Dict] = None
+
+    def snapshot(self) -> Tuple[int, Optional[Dict]]:
+        """(version, status) mới nhất"""
+        with self._lock:
+            return self._version, self._status
+
+    def subscribe(self) -> queue.Queue:
+        """Đăng ký nhận thay đổi; nhận ngay snapshot hiện tại nếu đã có"""
+        subscriber = queue.Queue(maxsize=8)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._status is not None:
+                subscriber.put_nowait((self._version, self._status))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='pi-status-feed', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            if not self._subscribers:
+                self._wakeup.set()
+
+    def _normalize(self, status: Dict) -> Dict:
+        # Bỏ các field thay đổi liên tục (thời gian...) để không phát sự kiện giả
+        return {key: value for key, value in status.items() if key not in self.ignored_fields}
+
+    def _publish(self, status: Dict) -> None:
+        with self._lock:
+            if status == self._status:
+                return
+            self._version += 1
+            self._status = status
+            event = (self._version, status)
+            for subscriber in self._subscribers:
+                try:
+                    subscriber.put_nowait(event)
+                except queue.Full:
+                    # Subscriber chậm: bỏ sự kiện cũ nhất, chỉ cần trạng thái mới nhất
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+                    subscriber.put_nowait(event)
+
+    def _run(self) -> None:
+        logger.info(f"Pi status feed started for {self.pi_client.base_url}")
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    logger.info(f"Pi status feed stopped for {self.pi_client.base_url}")
+                    return
+            try:
+                self._publish(self._normalize(self.pi_client.get_status()))
+            except Exception as e:
+                logger.warning(f"Pi status poll failed: {str(e)}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+
+def format_sse(version: int, status: Dict) -> str:
+    """Định dạng một sự kiện SSE"""
+    return f"id: {version}\nevent: status\ndata: {json.dumps(status, default=str)}\n\n"
+
+
+_feeds: Dict[str, PiStatusFeed] = {}
+_feeds_lock = threading.Lock()
+
+
+def get_status_feed(pi_client) -> PiStatusFeed:
+    """Feed dùng chung cho mỗi Pi (theo base_url)"""
+    with _feeds_lock:
+        feed = _feeds.get(pi_client.base_url)
+        if feed is None:
+            feed = PiStatusFeed(
+                pi_client,
+                interval=getattr(settings, 'PI_STATUS_POLL_INTERVAL', 2.0),
+                ignored_fields=getattr(settings, 'PI_STATUS_IGNORED_FIELDS', ()),
+            )
+            _feeds[pi_client.base_url] = feed
+        return feed
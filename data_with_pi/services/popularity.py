@@ -0,0 +1,128 @@
+"""
+Bộ đếm lượt xem (popularity) cho Recipe theo kiểu write-behind
+Gom các lượt tăng trong bộ nhớ của process rồi flush định kỳ bằng
+một câu UPDATE duy nhất với F(), tránh read-modify-write trên mỗi lượt xem
+- Flush khi đủ flush_threshold lượt, hoặc bởi thread nền sau mỗi flush_interval giây
+  (worker rảnh không còn giữ số liệu cũ), và khi process thoát bình thường (atexit)
+- Process bị kill -9 chỉ mất tối đa các lượt của flush_interval giây cuối
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Value, When
+
+logger = logging.getLogger(__name__)
+
+
+class PopularityCounter:
+    """Bộ đếm process-local, thread-safe, flush theo thời gian hoặc số lượng"""
+
+    def __init__(self, flush_interval: float = 30.0, flush_threshold: int = 100):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._pending: Dict[int, int] = {}
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_pid: Optional[int] = None
+        self._stop = threading.Event()
+
+    def _ensure_flusher(self) -> None:
+        """Khởi động thread flush theo thời gian (lười, sau fork của gunicorn mỗi worker có thread riêng)"""
+        if self._flusher is not None and self._flusher.is_alive() and self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive() or self._flusher_pid != os.getpid():
+                self._stop.clear()
+                self._flusher_pid = os.getpid()
+                self._flusher = threading.Thread(target=self._run, name='popularity-flush', daemon=True)
+                self._flusher.start()
+
+    def _run(self) -> None:
+        from django.db import connection
+
+        while not self._stop.wait(self.flush_interval):
+            with self._lock:
+                due = bool(self._pending)
+            if due:
+                self.flush()
+                connection.close()  # Kết nối DB của thread nền, không giữ mở giữa các lần flush
+
+    def stop(self) -> None:
+        """Dừng thread flush (lượt đang chờ vẫn còn trong buffer, gọi flush() nếu cần)"""
+        self._stop.set()
+
+    def increment(self, recipe_id: int, amount: int = 1) -> int:
+        """
+        Ghi nhận lượt xem (chưa ghi DB). Tự flush khi đến hạn.
+
+        Returns:
+            Số lượt chưa có trong bản ghi đã đọc của recipe này (để hiển thị số liệu mới nhất)
+        """
+        with self._lock:
+            pending = self._pending.get(recipe_id, 0) + amount
+            self._pending[recipe_id] = pending
+            self._pending_total += amount
+            due = (
+                self._pending_total >= self.flush_threshold
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+        else:
+            self._ensure_flusher()
+        return pending
+
+    def pending(self, recipe_id: int) -> int:
+        """Số lượt đang chờ flush của một recipe"""
+        with self._lock:
+            return self._pending.get(recipe_id, 0)
+
+    def flush(self) -> int:
+        """
+        Ghi toàn bộ lượt xem đang chờ vào DB bằng một câu UPDATE.
+        Nếu lỗi, các lượt xem được trả lại buffer để lần sau flush tiếp.
+
+        Returns:
+            Số recipe đã được cập nhật
+        """
+        from ..models import Recipe
+
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._pending_total = 0
+            self._last_flush = time.monotonic()
+
+        if not batch:
+            return 0
+
+        try:
+            increment = Case(
+                *[When(id=recipe_id, then=Value(amount)) for recipe_id, amount in batch.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+            updated = Recipe.objects.filter(id__in=batch.keys()).update(popularity=F('popularity') + increment)
+            logger.info(f"Flushed popularity for {updated} recipes ({sum(batch.values())} views)")
+            return updated
+        except Exception as e:
+            logger.error(f"Failed to flush recipe popularity: {str(e)}")
+            with self._lock:
+                for recipe_id, amount in batch.items():
+                    self._pending[recipe_id] = self._pending.get(recipe_id, 0) + amount
+                    self._pending_total += amount
+            return 0
+
+
+# Global instance
+popularity_counter = PopularityCounter(
+    flush_interval=getattr(settings, 'RECIPE_POPULARITY_FLUSH_INTERVAL', 30.0),
+    flush_threshold=getattr(settings, 'RECIPE_POPULARITY_FLUSH_THRESHOLD', 100),
+)
+atexit.register(popularity_counter.flush)
@@ -0,0 +1,220 @@
+"""
+Profiling theo yêu cầu cho các view (bật riêng, mặc định tắt)
+- Bật cho một request: header X-LeafMed-Profile (staff, hoặc giá trị header = PROFILING_TOKEN)
+- Hoặc lấy mẫu ngẫu nhiên PROFILING_SAMPLE_RATE (0..1) lượng request của các route trong PROFILING_ROUTES
+- Hai chế độ:
+  + 'sampling': luồng phụ chụp stack của luồng xử lý request mỗi PROFILING_INTERVAL_MS,
+    ghi file .folded (collapsed stacks) - mở bằng speedscope hoặc flamegraph.pl
+  + 'cprofile': cProfile, ghi file .prof (pstats) - mở bằng snakeviz / flameprof
+- Mỗi profile kèm file .json (route, thời gian, user...) để trang staff liệt kê profile chậm nhất
+"""
+import cProfile
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-LeafMed-Profile'
+PROFILE_MODE_HEADER = 'X-LeafMed-Profile-Mode'
+MODES = ('sampling', 'cprofile')
+
+# Python 3.12+ chỉ cho một cProfile hoạt động trong process: request cprofile đồng thời chuyển sang sampling
+_cprofile_lock = threading.Lock()
+
+
+class StackSampler:
+    """Profiler thống kê: chụp stack của một luồng theo chu kỳ (overhead thấp, không đổi hành vi view)"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _label(frame) -> str:
+        code = frame.f_code
+        return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'.replace(';', ',')
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack = []
+        while frame is not None:
+            stack.append(self._label(frame))
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='leafmed-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write(self, path: Path) -> None:
+        """Định dạng collapsed stacks: 'root;child;leaf <số mẫu>' mỗi dòng"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class ProfileStore:
+    """Thư mục chứa profile: <id>.folded|.prof + <id>.json, giữ tối đa `keep` profile mới nhất"""
+
+    def __init__(self, root, keep: int = 200):
+        self.root = Path(root)
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def new_id(self, route: str) -> str:
+        safe_route = ''.join(ch if ch.isalnum() or ch in '_-' else '_' for ch in route)[:60]
+        return f'{datetime.now():%Y%m%d-%H%M%S}-{safe_route}-{uuid.uuid4().hex[:8]}'
+
+    def path_for(self, profile_id: str, suffix: str) -> Path:
+        return self.root / f'{profile_id}{suffix}'
+
+    def save_meta(self, profile_id: str, meta: Dict) -> None:
+        self.path_for(profile_id, '.json').write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+        self._prune()
+
+    def _prune(self) -> None:
+        with self._lock:
+            metas = sorted(self.root.glob('*.json'), key=lambda path: path.stat().st_mtime)
+            for meta_path in metas[:max(0, len(metas) - self.keep)]:
+                for path in self.root.glob(f'{meta_path.stem}.*'):
+                    path.unlink(missing_ok=True)
+
+    def list(self) -> List[Dict]:
+        profiles = []
+        for meta_path in self.root.glob('*.json'):
+            try:
+                profiles.append(json.loads(meta_path.read_text(encoding='utf-8')))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def slowest(self, limit: int = 50) -> List[Dict]:
+        return sorted(self.list(), key=lambda meta: meta.get('duration_ms', 0), reverse=True)[:limit]
+
+    def file_path(self, filename: str) -> Optional[Path]:
+        """Đường dẫn file profile theo tên (chặn path traversal)"""
+        path = (self.root / filename).resolve()
+        if path.parent != self.root.resolve() or path.suffix not in ('.folded', '.prof') or not path.exists():
+            return None
+        return path
+
+
+_stores: Dict[Path, ProfileStore] = {}
+
+
+def get_store() -> ProfileStore:
+    root = Path(getattr(settings, 'PROFILING_DIR', Path(settings.BASE_DIR) / 'profiles'))
+    keep = getattr(settings, 'PROFILING_KEEP', 200)
+    store = _stores.get(root)
+    if store is None:
+        store = _stores.setdefault(root, ProfileStore(root, keep))
+    return store
+
+
+def should_profile(request, route: str) -> bool:
+    """Header (staff hoặc đúng token) hoặc lấy mẫu theo tỉ lệ trên các route được chọn"""
+    if not getattr(settings, 'PROFILING_ENABLED', False):
+        return False
+    header = request.headers.get(PROFILE_HEADER)
+    if header:
+        token = getattr(settings, 'PROFILING_TOKEN', '')
+        user = getattr(request, 'user', None)
+        if (token and hmac.compare_digest(header.encode(), token.encode())) or \
+                (user is not None and user.is_staff):
+            return True
+    rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+    routes = getattr(settings, 'PROFILING_ROUTES', ())
+    return rate > 0 and (not routes or route in routes) and random.random() < rate
+
+
+def run_profiled(view_func, request, args, kwargs, route: str, mode: Optional[str] = None):
+    """
+    Chạy view_func(request, *args, **kwargs) dưới profiler (middleware truyền get_response của nó),
+    lưu file profile; trả về (response, profile_id)
+    """
+    store = get_store()
+    store.root.mkdir(parents=True, exist_ok=True)
+    mode = mode if mode in MODES else getattr(settings, 'PROFILING_MODE', 'sampling')
+    profile_id = store.new_id(route)
+    interval = getattr(settings, 'PROFILING_INTERVAL_MS', 5) / 1000
+
+    locked = False
+    profiler = None
+    started = time.perf_counter()
+    status = 500
+    try:
+        # Lock và enable() nằm trong try: enable() lỗi (profiler khác đang chạy) vẫn trả lock
+        if mode == 'cprofile':
+            locked = _cprofile_lock.acquire(blocking=False)
+            mode = 'cprofile' if locked else 'sampling'
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = StackSampler(threading.get_ident(), interval)
+            profiler.start()
+        response = view_func(request, *args, **kwargs)
+        status = response.status_code
+        return response, profile_id
+    finally:
+        try:
+            if isinstance(profiler, cProfile.Profile):
+                profiler.disable()
+            elif profiler is not None:
+                profiler.stop()
+        finally:
+            if locked:
+                _cprofile_lock.release()
+        duration_ms = (time.perf_counter() - started) * 1000
+        if profiler is not None:
+            try:
+                suffix = '.prof' if mode == 'cprofile' else '.folded'
+                if mode == 'cprofile':
+                    profiler.dump_stats(store.path_for(profile_id, suffix))
+                else:
+                    profiler.write(store.path_for(profile_id, suffix))
+                user = getattr(request, 'user', None)
+                store.save_meta(profile_id, {
+                    'id': profile_id,
+                    'file': f'{profile_id}{suffix}',
+                    'mode': mode,
+                    'route': route,
+                    'method': request.method,
+                    'path': request.path,
+                    'status': status,
+                    'duration_ms': round(duration_ms, 1),
+                    'samples': getattr(profiler, 'samples', None),
+                    'user': user.username if user is not None and user.is_authenticated else '',
+                    'created_at': datetime.now().isoformat(timespec='seconds'),
+                })
+            except OSError as e:
+                logger.error(f"[Profiling] Không ghi được profile {profile_id}: {e}")
@@ -0,0 +1,134 @@
+"""
+Suy luận theo ô (sliced inference) cho frame độ phân giải cao
+- Chia frame thành các ô tile x tile chồng lấn nhau (overlap) phủ kín frame
+- Box của từng ô được dời về tọa độ frame rồi gộp bằng NMS (IoU) thông thường
+- Lá nằm vắt qua đường nối giữa hai ô cho ra hai box cắt cụt; IoU của chúng thấp nên
+  NMS không loại được -> merge_seams ghép (hợp) các mảnh đó theo IoS (giao / diện tích box nhỏ hơn),
+  nhưng chỉ khi box chạm đường nối của ô mình và ô của box kia nhìn được qua đường nối đó
+
+Chỉ dùng numpy (không cần ultralytics) để test được độc lập.
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+
+def tile_origins(length: int, tile: int, overlap: float) -> List[int]:
+    """Vị trí bắt đầu các ô trên một trục; ô cuối được kéo về để chạm mép frame"""
+    if tile < 1 or not 0 <= overlap < 1:
+        raise ValueError(f"Ô {tile}px / overlap {overlap} không hợp lệ (cần tile >= 1, 0 <= overlap < 1)")
+    if length <= tile:
+        return [0]
+    stride = int(tile * (1 - overlap))
+    if stride < 1:
+        raise ValueError(f"Overlap {overlap} quá lớn với ô {tile}px (bước < 1px)")
+    origins = list(range(0, length - tile, stride))
+    origins.append(length - tile)
+    return origins
+
+
+def make_tiles(height: int, width: int, tile: int, overlap: float) -> List[Tuple[int, int, int, int]]:
+    """Danh sách ô (x1, y1, x2, y2) phủ kín frame"""
+    return [(x, y, min(x + tile, width), min(y + tile, height))
+            for y in tile_origins(height, tile, overlap)
+            for x in tile_origins(width, tile, overlap)]
+
+
+def should_tile(height: int, width: int, threshold: int) -> bool:
+    """Chỉ chia ô khi cạnh dài của frame vượt ngưỡng (threshold <= 0: tắt)"""
+    return threshold > 0 and max(height, width) > threshold
+
+
+def box_overlap(box: np.ndarray, boxes: np.ndarray, metric: str = 'ios') -> np.ndarray:
+    """IoU hoặc IoS giữa một box và mảng boxes (xyxy)"""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if metric == 'iou':
+        denominator = area + areas - intersection
+    else:
+        denominator = np.minimum(area, areas)
+    return intersection / np.maximum(denominator, 1e-9)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray,
+        threshold: float = 0.5) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    NMS (IoU) theo từng lớp: giữ box điểm cao nhất, loại các box cùng lớp có IoU > threshold
+    Returns: (boxes, scores, class_ids) giữ lại, điểm giảm dần
+    """
+    if len(boxes) == 0:
+        return boxes, scores, class_ids
+    order = np.argsort(-scores, kind='stable')
+    boxes, scores, class_ids = boxes[order], scores[order], class_ids[order]
+    alive = np.ones(len(boxes), dtype=bool)
+    for i in range(len(boxes)):
+        if not alive[i]:
+            continue
+        candidates = np.where(alive & (class_ids == class_ids[i]))[0]
+        candidates = candidates[candidates > i]
+        alive[candidates[box_overlap(boxes[i], boxes[candidates], 'iou') > threshold]] = False
+    return boxes[alive], scores[alive], class_ids[alive]
+
+
+def _seam_cuts(boxes: np.ndarray, rects: np.ndarray, frame_size: Tuple[int, int], margin: float) -> np.ndarray:
+    """(n, 4) bool: box chạm cạnh trái / trên / phải / dưới của ô mình mà cạnh đó là đường nối (nằm trong frame)"""
+    width, height = frame_size
+    return np.stack([
+        (rects[:, 0] > 0) & (boxes[:, 0] <= rects[:, 0] + margin),
+        (rects[:, 1] > 0) & (boxes[:, 1] <= rects[:, 1] + margin),
+        (rects[:, 2] < width) & (boxes[:, 2] >= rects[:, 2] - margin),
+        (rects[:, 3] < height) & (boxes[:, 3] >= rects[:, 3] - margin),
+    ], axis=1)
+
+
+def _sees_past(cuts: np.ndarray, rects: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """Ô others có vượt qua đường nối mà box (cuts, rects) bị cắt hay không (mảng cùng số dòng)"""
+    return ((cuts[:, 0] & (others[:, 0] < rects[:, 0])) | (cuts[:, 1] & (others[:, 1] < rects[:, 1])) |
+            (cuts[:, 2] & (others[:, 2] > rects[:, 2])) | (cuts[:, 3] & (others[:, 3] > rects[:, 3])))
+
+
+def merge_seams(boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray, rects: np.ndarray,
+                frame_size: Tuple[int, int], threshold: float = 0.5,
+                margin: float = 2.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Ghép các mảnh lá bị đường nối ô cắt cụt thành box cả lá.
+    Hai box cùng lớp được thay bằng hợp của chúng (giữ điểm cao hơn) chỉ khi:
+    nằm ở hai ô khác nhau, IoS > threshold, và một box chạm đường nối của ô mình
+    mà ô của box kia nhìn qua được. Các box khác giữ nguyên (để NMS xử lý).
+
+    Args:
+        rects: (n, 4) ô (x1, y1, x2, y2) sinh ra từng box; lượt cả frame dùng (0, 0, width, height)
+        frame_size: (width, height)
+        margin: Box cách cạnh ô <= margin px được xem là chạm cạnh
+    """
+    if len(boxes) == 0:
+        return boxes, scores, class_ids
+    order = np.argsort(-scores, kind='stable')
+    boxes, scores, class_ids, rects = boxes[order], scores[order], class_ids[order], rects[order]
+    cuts = _seam_cuts(boxes, rects, frame_size, margin)
+    alive = np.ones(len(boxes), dtype=bool)
+    merged = boxes.copy()
+    for i in range(len(boxes)):
+        if not alive[i]:
+            continue
+        # So với box đã mở rộng cho tới khi không còn mảnh nào được ghép thêm (lá vắt qua nhiều ô)
+        while True:
+            candidates = np.where(alive & (class_ids == class_ids[i]) & (rects != rects[i]).any(axis=1))[0]
+            candidates = candidates[candidates > i]
+            if len(candidates) == 0:
+                break
+            mine = np.broadcast_to(rects[i], (len(candidates), 4))
+            shared = (_sees_past(np.broadcast_to(cuts[i], (len(candidates), 4)), mine, rects[candidates]) |
+                      _sees_past(cuts[candidates], rects[candidates], mine))
+            fragments = candidates[shared & (box_overlap(merged[i], boxes[candidates], 'ios') > threshold)]
+            if len(fragments) == 0:
+                break
+            group = np.vstack([merged[i], boxes[fragments]])
+            merged[i] = [group[:, 0].min(), group[:, 1].min(), group[:, 2].max(), group[:, 3].max()]
+            alive[fragments] = False
+    return merged[alive], scores[alive], class_ids[alive]
@@ -0,0 +1,332 @@
+"""
+Trích frame từ video đã quay (start/stop_video_recording) thành dataset YOLO
+- Giải mã kiểu streaming: từng frame một, không nạp cả video vào bộ nhớ
+  + .mjpeg/.mjpg: tách JPEG bằng image_codec.iter_mjpeg; mỗi frame chỉ giải mã thu nhỏ (miền DCT)
+    để so cảnh, frame được giữ mới giải mã đủ kích thước
+  + định dạng khác (.mp4, .h264, ...): cv2.VideoCapture, frame bỏ qua theo stride chỉ grab()
+- Lấy mẫu theo thay đổi cảnh: so ảnh xám nhỏ với frame giữ gần nhất (SceneSampler)
+- Gán nhãn trước bằng YOLO theo lô (detect_batch), ghi images/<split>/*.jpg + labels/<split>/*.txt
+- Video dài được chia thành đoạn (job) để chạy song song trên nhiều tiến trình
+- Tiếp tục được: mỗi job ghi tiến độ vào <out>/.progress/<job>.json sau mỗi lô
+- Lọc gần trùng toàn dataset sau khi trích (image_dedup): bản trùng chuyển sang <out>/duplicates/
+
+Các hàm ở đây không đụng ORM để chạy được trong ProcessPoolExecutor (xem lệnh build_video_dataset).
+"""
+import json
+import logging
+import os
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import image_codec, image_dedup
+
+logger = logging.getLogger(__name__)
+
+VIDEO_SUFFIXES = ('.mp4', '.h264', '.avi', '.mkv', '.mov', '.mjpeg', '.mjpg')
+MJPEG_SUFFIXES = ('.mjpeg', '.mjpg')
+THUMB_SIDE = 64
+PROGRESS_DIR = '.progress'
+DUPLICATES_DIR = 'duplicates'
+
+
+# ---------- Đọc video ----------
+
+def _thumb(image: np.ndarray, side: int = THUMB_SIDE) -> np.ndarray:
+    """Ảnh xám nhỏ (float32) để so cảnh"""
+    gray = image.mean(axis=2) if image.ndim == 3 else image
+    step = max(1, max(gray.shape) // side)
+    return gray[::step, ::step].astype(np.float32)
+
+
+def probe_frame_count(path) -> Optional[int]:
+    """Số frame của video (None nếu không biết trước - MJPEG thô, hoặc chưa có OpenCV)"""
+    if Path(path).suffix.lower() in MJPEG_SUFFIXES:
+        return None
+    try:
+        import cv2
+    except ImportError:
+        return None
+    cap = cv2.VideoCapture(str(path))
+    try:
+        count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        return count if count > 0 else None
+    finally:
+        cap.release()
+
+
+def _iter_mjpeg_file(path, start: int, end: Optional[int], stride: int):
+    with open(path, 'rb') as f:
+        chunks = iter(lambda: f.read(1024 * 1024), b'')
+        for index, jpeg in enumerate(image_codec.iter_mjpeg(chunks)):
+            if end is not None and index >= end:
+                break
+            if index < start or (index - start) % stride:
+                continue
+            thumb = _thumb(image_codec.decode_jpeg(jpeg, target_side=THUMB_SIDE))
+            yield index, thumb, (lambda jpeg=jpeg: image_codec.decode_jpeg(jpeg))
+
+
+def _iter_opencv(path, start: int, end: Optional[int], stride: int):
+    import cv2
+
+    cap = cv2.VideoCapture(str(path))
+    try:
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        index = start
+        while end is None or index < end:
+            if (index - start) % stride:
+                if not cap.grab():  # Giải nén nhưng không chuyển sang BGR
+                    break
+            else:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                yield index, _thumb(frame), (lambda frame=frame: frame)
+            index += 1
+    finally:
+        cap.release()
+
+
+def iter_video_frames(path, start: int = 0, end: Optional[int] = None,
+                      stride: int = 1) -> Iterator[Tuple[int, np.ndarray, Callable[[], np.ndarray]]]:
+    """
+    Yield (chỉ số frame, ảnh xám nhỏ, hàm lấy frame BGR đủ kích thước) cho mỗi frame thứ stride
+    trong [start, end). Frame đủ kích thước chỉ được giải mã khi gọi hàm (MJPEG).
+    """
+    stride = max(1, stride)
+    if Path(path).suffix.lower() in MJPEG_SUFFIXES:
+        return _iter_mjpeg_file(path, start, end, stride)
+    return _iter_opencv(path, start, end, stride)
+
+
+class SceneSampler:
+    """
+    Giữ frame khi cảnh đã đổi đủ nhiều so với frame giữ gần nhất
+    Độ thay đổi = tỉ lệ điểm ảnh (ảnh xám nhỏ) lệch hơn pixel_delta mức xám: một chiếc lá dịch chuyển
+    ở góc frame vẫn được tính, còn nhiễu cảm biến thì không (khác với chênh lệch trung bình)
+    Args:
+        threshold: Tỉ lệ điểm ảnh thay đổi tối thiểu (0..1)
+        min_gap: Số frame tối thiểu giữa hai frame giữ
+        max_gap: Quá số frame này thì giữ một frame dù cảnh không đổi (0: không giới hạn)
+    """
+
+    def __init__(self, threshold: float = 0.05, min_gap: int = 5, max_gap: int = 0, pixel_delta: int = 25):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.min_gap = min_gap
+        self.max_gap = max_gap
+        self.last_index: Optional[int] = None
+        self.last_thumb: Optional[np.ndarray] = None
+
+    def accept(self, index: int, thumb: np.ndarray) -> bool:
+        if self.last_thumb is not None:
+            gap = index - self.last_index
+            if gap < self.min_gap:
+                return False
+            if thumb.shape == self.last_thumb.shape:
+                change = float((np.abs(thumb - self.last_thumb) > self.pixel_delta).mean())
+            else:
+                change = 1.0  # Đổi độ phân giải giữa chừng
+            if change < self.threshold and not (self.max_gap and gap >= self.max_gap):
+                return False
+        self.last_index, self.last_thumb = index, thumb
+        return True
+
+
+# ---------- Dataset YOLO ----------
+
+def split_for(name: str, val_fraction: float) -> str:
+    """train/val cố định theo tên file (chạy lại / tiếp tục cho cùng kết quả)"""
+    return 'val' if (zlib.crc32(name.encode('utf-8')) % 1000) < val_fraction * 1000 else 'train'
+
+
+def yolo_label_lines(detections: Sequence[Dict], width: int, height: int) -> List[str]:
+    """Detection (bbox pixel) -> dòng nhãn YOLO 'class cx cy w h' (chuẩn hóa 0..1)"""
+    lines = []
+    for detection in detections:
+        bbox = detection['bbox']
+        x1, x2 = max(0.0, bbox['x1']), min(float(width), bbox['x2'])
+        y1, y2 = max(0.0, bbox['y1']), min(float(height), bbox['y2'])
+        if x2 <= x1 or y2 <= y1:
+            continue
+        lines.append(f"{int(detection.get('class_id') or 0)} {(x1 + x2) / 2 / width:.6f} "
+                     f"{(y1 + y2) / 2 / height:.6f} {(x2 - x1) / width:.6f} {(y2 - y1) / height:.6f}")
+    return lines
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    partial = path.with_name(path.name + '.part')
+    partial.write_bytes(data)
+    os.replace(partial, path)
+
+
+def write_sample(out_dir: Path, name: str, image: np.ndarray, detections: Optional[Sequence[Dict]],
+                 val_fraction: float, quality: int) -> str:
+    """Ghi ảnh (+ nhãn nếu có detections) vào split tương ứng, trả về split"""
+    split = split_for(name, val_fraction)
+    images_dir, labels_dir = out_dir / 'images' / split, out_dir / 'labels' / split
+    images_dir.mkdir(parents=True, exist_ok=True)
+    _atomic_write(images_dir / f'{name}.jpg', image_codec.encode_jpeg(image, quality))
+    if detections is not None:
+        labels_dir.mkdir(parents=True, exist_ok=True)
+        lines = yolo_label_lines(detections, image.shape[1], image.shape[0])
+        _atomic_write(labels_dir / f'{name}.txt', ('\n'.join(lines) + '\n' if lines else '').encode('utf-8'))
+    return split
+
+
+def write_data_yaml(out_dir: Path, names: Dict[int, str]) -> Path:
+    """data.yaml cho ultralytics (viết tay, không cần PyYAML)"""
+    lines = [f'path: {out_dir.resolve()}', 'train: images/train', 'val: images/val', 'names:']
+    lines += [f'  {index}: {json.dumps(name, ensure_ascii=False)}' for index, name in sorted(names.items())]
+    path = out_dir / 'data.yaml'
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return path
+
+
+# ---------- Job + tiến độ ----------
+
+def plan_jobs(videos: Sequence, segment_frames: int = 0) -> List[Dict]:
+    """
+    Chia video thành job [start, end). Video biết số frame (OpenCV) và dài hơn segment_frames
+    được cắt thành nhiều đoạn để chạy song song; MJPEG thô là một job.
+    """
+    jobs = []
+    for video in videos:
+        video = Path(video)
+        total = probe_frame_count(video) if segment_frames > 0 else None
+        bounds = [(0, None)]
+        if total and total > segment_frames:
+            bounds = [(start, min(start + segment_frames, total)) for start in range(0, total, segment_frames)]
+        for start, end in bounds:
+            jobs.append({'id': f'{video.stem}_{start:07d}', 'video': str(video), 'start': start, 'end': end})
+    return jobs
+
+
+def _source_key(video: Path) -> Dict:
+    stat = video.stat()
+    return {'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+
+def load_progress(out_dir: Path, job: Dict) -> Dict:
+    """Tiến độ đã lưu của job (bắt đầu lại nếu file video đã thay đổi)"""
+    path = out_dir / PROGRESS_DIR / f"{job['id']}.json"
+    fresh = {'next_frame': job['start'], 'last_kept': None, 'kept': 0, 'boxes': 0, 'done': False,
+             'source': _source_key(Path(job['video']))}
+    try:
+        progress = json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return fresh
+    return progress if progress.get('source') == fresh['source'] else fresh
+
+
+def save_progress(out_dir: Path, job: Dict, progress: Dict) -> None:
+    directory = out_dir / PROGRESS_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    _atomic_write(directory / f"{job['id']}.json", json.dumps(progress).encode('utf-8'))
+
+
+# ---------- Worker ----------
+
+_detector = None
+
+
+def init_worker(model_path: Optional[str], threads: int = 0) -> None:
+    """Initializer của ProcessPoolExecutor: mỗi tiến trình load model YOLO một lần"""
+    global _detector
+    if threads:
+        try:
+            import torch
+            torch.set_num_threads(threads)  # Tránh N tiến trình x N thread tranh nhau CPU
+        except ImportError:
+            pass
+    if model_path:
+        from .yolo_service import YOLOLeafDetector
+
+        _detector = YOLOLeafDetector(model_path=model_path)
+        if _detector.model is None:
+            raise RuntimeError(f'Không load được model YOLO: {_detector.error}')
+
+
+def process_job(job: Dict, out_dir: str, options: Dict) -> Dict:
+    """
+    Trích + gán nhãn một job; ghi tiến độ sau mỗi lô nên job bị ngắt sẽ tiếp tục từ lô chưa xong.
+    options: stride, threshold, min_gap, max_gap, batch, confidence, imgsz, val_fraction, quality
+    """
+    out_dir = Path(out_dir)
+    progress = load_progress(out_dir, job)
+    if progress['done']:
+        return {**progress, 'job': job['id'], 'skipped': True, 'names': model_names()}
+
+    sampler = SceneSampler(options['threshold'], options['min_gap'], options['max_gap'])
+    batch: List[Tuple[int, np.ndarray]] = []
+    stem = Path(job['video']).stem
+
+    def flush(next_frame: int) -> None:
+        images = [image for _, image in batch]
+        if _detector is not None:
+            labels = _detector.detect_batch(images, options['confidence'], options.get('imgsz'))
+        else:
+            labels = [None] * len(images)
+        for (index, image), detections in zip(batch, labels):
+            write_sample(out_dir, f'{stem}_{index:07d}', image, detections,
+                         options['val_fraction'], options['quality'])
+            progress['boxes'] += len(detections or ())
+        progress['kept'] += len(batch)
+        progress['last_kept'] = batch[-1][0]
+        progress['next_frame'] = next_frame
+        save_progress(out_dir, job, progress)
+        batch.clear()
+
+    # Tiếp tục: đọc lại từ frame giữ cuối cùng để SceneSampler so cảnh như lần chạy trước
+    resume_from = progress.get('last_kept')
+    start = resume_from if resume_from is not None else progress['next_frame']
+    for index, thumb, load in iter_video_frames(job['video'], start, job['end'], options['stride']):
+        if index == resume_from:
+            sampler.accept(index, thumb)
+            continue
+        if sampler.accept(index, thumb):
+            batch.append((index, load()))
+            if len(batch) >= options['batch']:
+                flush(index + 1)
+    if batch:
+        flush(batch[-1][0] + 1)
+    progress['done'] = True
+    save_progress(out_dir, job, progress)
+    return {**progress, 'job': job['id'], 'skipped': False, 'names': model_names()}
+
+
+def model_names() -> Optional[Dict[int, str]]:
+    """Tên lớp của model YOLO trong tiến trình này (None khi không gán nhãn)"""
+    names = getattr(getattr(_detector, 'model', None), 'names', None)
+    return {int(index): str(name) for index, name in dict(names).items()} if names else None
+
+
+# ---------- Lọc gần trùng ----------
+
+def remove_near_duplicates(out_dir: Path, radius: int, method: str = 'phash', workers: int = 4) -> Dict:
+    """
+    Gom cụm ảnh gần trùng trên toàn dataset (mọi video, mọi split), giữ ảnh đầu mỗi cụm theo thứ tự
+    frame; ảnh còn lại + nhãn được chuyển sang <out>/duplicates/ (không xóa). Ghi <out>/dedup_report.json
+    """
+    out_dir = Path(out_dir)
+    paths = sorted(image_dedup.find_images([out_dir / 'images']), key=lambda path: path.name)
+    clusters = image_dedup.cluster_hashes(image_dedup.hash_files(paths, method, workers=workers), radius)
+    for cluster in clusters:
+        for image_path in cluster[1:]:
+            relative = image_path.relative_to(out_dir)
+            label_path = out_dir / 'labels' / relative.parent.name / f'{image_path.stem}.txt'
+            for source in (image_path, label_path):
+                if source.exists():
+                    target = out_dir / DUPLICATES_DIR / source.relative_to(out_dir)
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(source, target)
+
+    report = image_dedup.summarize_clusters(
+        [[path.relative_to(out_dir) for path in cluster] for cluster in clusters], top=None)
+    report.update({'method': method, 'radius': radius})
+    (out_dir / 'dedup_report.json').write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+    return report
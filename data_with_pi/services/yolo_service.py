@@ -1,59 +1,214 @@
 """
 YOLO Service for Leaf Detection
 Handles real-time leaf detection on video stream
+
+Heavy dependencies: only import this module lazily (inside views / background
+threads). ultralytics (and torch) is imported on first model load, not here.
 """
 import cv2
 import numpy as np
-from ultralytics import YOLO
 from django.conf import settings
 import os
 import base64
-import requests
-from io import BytesIO
-from PIL import Image
 import logging
+import threading
+import time
+
+from . import frame_ring, image_codec, metrics, perf, tiling
 
 logger = logging.getLogger(__name__)
 
 class YOLOLeafDetector:
-    def __init__(self):
-        self.model_path = os.path.join(settings.BASE_DIR, 'model', 'best.pt')
+    """
+    Model lifecycle:
+    - start(): load the model in a background thread, run a warm-up inference on a
+      dummy frame, then watch best.pt and hot-reload it when it changes
+    - A reload builds and warms up the new model first, then swaps self.model in a
+      single assignment; in-flight requests keep using the model they already hold
+    - A failed (re)load keeps the previous model and is reported by status()
+    """
+    NOT_LOADED, LOADING, READY, FAILED = 'not_loaded', 'loading', 'ready', 'failed'
+    
+    def __init__(self, model_path=None, autoload=True):
+        self.model_path = str(model_path or getattr(
+            settings, 'YOLO_MODEL_PATH', os.path.join(settings.BASE_DIR, 'model', 'best.pt')))
         self.model = None
-        self.load_model()
+        self.state = self.NOT_LOADED
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.loaded_at = None
+        self.loaded_mtime = None
+        self.reloads = 0
+        self._ready = threading.Event()
+        self._load_lock = threading.Lock()
+        self._started = False
+        self._stop = threading.Event()
+        if autoload:
+            self.load_model()
     
-    def load_model(self):
-        """Load YOLO model"""
+    def _model_mtime(self):
         try:
-            if os.path.exists(self.model_path):
-                self.model = YOLO(self.model_path)
-                logger.info(f"YOLO model loaded successfully from {self.model_path}")
-            else:
+            return os.path.getmtime(self.model_path)
+        except OSError:
+            return None
+    
+    def _warm_up(self, model):
+        """First inference allocates buffers / fuses layers; do it before serving requests"""
+        size = getattr(settings, 'YOLO_WARMUP_SIZE', 640)
+        started = time.perf_counter()
+        model(np.zeros((size, size, 3), dtype=np.uint8), verbose=False)
+        return time.perf_counter() - started
+    
+    def load_model(self):
+        """Load (or reload) the YOLO model, warm it up and swap it in. Returns True on success."""
+        with self._load_lock:
+            mtime = self._model_mtime()
+            if mtime is None:
                 logger.error(f"YOLO model not found at {self.model_path}")
+                self.error = f"YOLO model not found at {self.model_path}"
+                if self.model is None:
+                    self.state = self.FAILED
+                    self._ready.set()
+                return False
+            
+            if self.model is None:
+                self.state = self.LOADING
+            try:
+                started = time.perf_counter()
+                from ultralytics import YOLO
+                model = YOLO(self.model_path)
+                load_seconds = time.perf_counter() - started
+                warmup_seconds = self._warm_up(model)
+            except Exception as e:
+                logger.error(f"Failed to load YOLO model: {str(e)}")
+                self.error = str(e)
+                if self.model is None:
+                    self.state = self.FAILED
+                    self._ready.set()
+                return False
+            
+            if self.model is not None:
+                self.reloads += 1
+            self.model = model  # Atomic swap
+            self.state = self.READY
+            self.error = None
+            self.load_seconds = load_seconds
+            self.warmup_seconds = warmup_seconds
+            self.loaded_at = time.time()
+            self.loaded_mtime = mtime
+            self._ready.set()
+            logger.info(f"YOLO model loaded from {self.model_path} "
+                        f"(load {load_seconds:.2f}s, warm-up {warmup_seconds:.2f}s)")
+            return True
+    
+    def start(self):
+        """Background load + best.pt watcher (idempotent, called once at process start)"""
+        with self._load_lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name='yolo-model', daemon=True).start()
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _run(self):
+        if self.model is None:
+            self.load_model()
+        interval = getattr(settings, 'YOLO_RELOAD_INTERVAL', 5)
+        if interval <= 0:
+            return
+        seen = self.loaded_mtime
+        failed_mtime = None  # loaded_mtime only tracks the model actually being served
+        while not self._stop.wait(interval):
+            mtime = self._model_mtime()
+            if mtime is None or mtime in (self.loaded_mtime, failed_mtime):
+                seen = mtime
+                continue
+            # Only reload once the file has stopped changing (avoid half-copied best.pt)
+            if mtime == seen:
+                logger.info(f"YOLO model file changed, reloading {self.model_path}")
+                if not self.load_model():
+                    # Failed: don't retry until the file changes again
+                    failed_mtime = mtime
+            seen = mtime
+    
+    def wait_ready(self, timeout=None):
+        """Wait for the first load to finish (start() is called if needed). True if a model is usable."""
+        if self.model is not None:
+            return True
+        self.start()
+        if timeout is None:
+            timeout = getattr(settings, 'YOLO_LOAD_WAIT', 30)
+        self._ready.wait(timeout)
+        return self.model is not None
+    
+    def status(self):
+        return {
+            'ready': self.model is not None,
+            'state': self.state,
+            'model_path': self.model_path,
+            'error': self.error,
+            'load_seconds': round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            'warmup_seconds': round(self.warmup_seconds, 3) if self.warmup_seconds is not None else None,
+            'loaded_at': self.loaded_at,
+            'model_mtime': self.loaded_mtime,
+            'reloads': self.reloads,
+        }
+    
+    def _capture_mjpeg(self, stream_url):
+        """
+        Read the first complete JPEG of the MJPEG stream over HTTP and decode it with
+        image_codec (TurboJPEG when available); no ffmpeg/VideoCapture session per frame
+        Returns OpenCV image or None (not an MJPEG stream, connection error)
+        """
+        import requests
+        
+        response = None
+        try:
+            with perf.span('yolo.capture'):
+                response = requests.get(stream_url, stream=True, timeout=(3, 10))
+                response.raise_for_status()
+                for jpeg in image_codec.iter_mjpeg(response.iter_content(64 * 1024)):
+                    return image_codec.decode_jpeg(jpeg)
         except Exception as e:
-            logger.error(f"Failed to load YOLO model: {str(e)}")
-            self.model = None
+            logger.warning(f"MJPEG capture failed, falling back to OpenCV: {str(e)}")
+        finally:
+            if response is not None:
+                response.close()
+        return None
     
     def capture_frame_from_stream(self, stream_url):
         """
-        Capture a single frame from Pi stream using OpenCV VideoCapture
+        Capture a single frame from Pi stream
+        YOLO_STREAM_DECODER='codec' parses the MJPEG stream and decodes with image_codec,
+        falling back to OpenCV VideoCapture; 'opencv' always uses VideoCapture
         Returns OpenCV image (numpy array) or None if failed
         """
+        if getattr(settings, 'YOLO_STREAM_DECODER', 'codec') == 'codec':
+            frame = self._capture_mjpeg(stream_url)
+            if frame is not None:
+                logger.info(f"Successfully captured frame: {frame.shape}")
+                return frame
+        
         cap = None
         try:
             logger.info(f"Connecting to stream with OpenCV: {stream_url}")
             
-            # Use OpenCV to capture from stream
-            cap = cv2.VideoCapture(stream_url)
-            
-            # Set timeout and buffer size
-            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Reduce buffer to get latest frame
-            
-            if not cap.isOpened():
-                logger.error("Failed to open stream with OpenCV")
-                return None
-            
-            # Read frame
-            ret, frame = cap.read()
+            with perf.span('yolo.capture'):
+                # Use OpenCV to capture from stream
+                cap = cv2.VideoCapture(stream_url)
+                
+                # Set timeout and buffer size
+                cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Reduce buffer to get latest frame
+                
+                if not cap.isOpened():
+                    logger.error("Failed to open stream with OpenCV")
+                    return None
+                
+                # Read frame
+                ret, frame = cap.read()
             
             if ret and frame is not None:
                 logger.info(f"Successfully captured frame: {frame.shape}")
@@ -70,62 +225,60 @@ class YOLOLeafDetector:
                 cap.release()
                 logger.info("Released OpenCV VideoCapture")
 
-    def detect_leaves_from_url(self, image_url, confidence_threshold=0.5):
+    def capture_frame(self, stream_url, frame_seq=None):
+        """
+        Private copy of a stream frame
+        Uses the shared-memory frame ring when a grabber runs for this stream (frame_seq:
+        that exact frame if it is still in the ring, else the newest one), else a direct capture.
+        Returns (image, seq); seq is None for a direct capture
+        """
+        frame = frame_ring.read_frame(stream_url, frame_seq) if frame_seq else None
+        if frame is None:
+            frame = frame_ring.latest_frame(stream_url)
+        if frame is not None:
+            try:
+                return frame.copy(), frame.seq
+            except frame_ring.FrameOverwritten:
+                logger.warning(f"Ring frame {frame.seq} overwritten while copying, capturing directly")
+        return self.capture_frame_from_stream(stream_url), None
+    
+    def _on_stream_frame(self, stream_url, func, frame_seq=None):
+        """
+        Run func(image) on a private copy of a stream frame (see capture_frame)
+        The grabber may overwrite a ring slot at any time, so func never sees the shared-memory view;
+        one memcpy per request is cheap next to inference.
+        Returns (result, seq) or (None, None) when no frame is available
+        """
+        image_cv, seq = self.capture_frame(stream_url, frame_seq=frame_seq)
+        if image_cv is None:
+            return None, None
+        return func(image_cv), seq
+
+    def detect_leaves_from_url(self, image_url, confidence_threshold=0.5, tiled=None, imgsz=None):
         """
         Detect leaves from image URL (stream)
         Returns list of bounding boxes with coordinates and confidence
+        tiled, imgsz: see detect_frame
         """
         logger.info(f"=== YOLO DETECT FROM URL START ===")
         logger.info(f"Image URL: {image_url}")
         logger.info(f"Confidence threshold: {confidence_threshold}")
         
-        if not self.model:
+        if not self.wait_ready():
             logger.error("YOLO model not loaded")
             return {"success": False, "error": "YOLO model not loaded"}
         
-        try:
-            # Capture frame from stream using OpenCV
-            logger.info("Capturing frame from Pi stream with OpenCV...")
-            image_cv = self.capture_frame_from_stream(image_url)
-            
-            if image_cv is None:
-                logger.error("Failed to capture frame from stream")
-                return {"success": False, "error": "Cannot capture frame from stream"}
-            
-            logger.info("Frame captured successfully, proceeding with YOLO detection...")
-            
+        def detect(image_cv):
             logger.info("Running YOLO detection...")
-            # Run YOLO detection
-            results = self.model(image_cv, conf=confidence_threshold)
-            
-            # Extract bounding boxes
-            detections = []
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        # Get coordinates (xyxy format)
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        confidence = float(box.conf[0].cpu().numpy())
-                        class_id = int(box.cls[0].cpu().numpy())
-                        
-                        detections.append({
-                            'bbox': {
-                                'x1': float(x1),
-                                'y1': float(y1), 
-                                'x2': float(x2),
-                                'y2': float(y2),
-                                'width': float(x2 - x1),
-                                'height': float(y2 - y1)
-                            },
-                            'confidence': confidence,
-                            'class_id': class_id,
-                            'id': f"leaf_{len(detections)}"  # Unique ID for frontend
-                        })
+            use_tiled = self.use_tiling(image_cv, tiled)
+            started = time.perf_counter()
+            detections = self.detect_frame(image_cv, confidence_threshold, tiled=use_tiled, imgsz=imgsz)
+            inference_ms = (time.perf_counter() - started) * 1000
             
             # Convert image with annotations to base64 for preview
             annotated_image = self.draw_bounding_boxes(image_cv, detections)
-            _, buffer = cv2.imencode('.jpg', annotated_image)
+            with perf.span('yolo.encode'):
+                buffer = image_codec.encode_jpeg(annotated_image, getattr(settings, 'YOLO_PREVIEW_QUALITY', 80))
             annotated_b64 = base64.b64encode(buffer).decode('utf-8')
             
             return {
@@ -134,54 +287,187 @@ class YOLOLeafDetector:
                 "total_leaves": len(detections),
                 "image_width": image_cv.shape[1],
                 "image_height": image_cv.shape[0],
+                "tiled": use_tiled,
+                "inference_ms": round(inference_ms, 1),
                 "annotated_image_b64": annotated_b64
             }
+        
+        try:
+            # Frame from the shared-memory ring (grabber running) or a direct OpenCV capture
+            logger.info("Capturing frame from Pi stream...")
+            result, frame_seq = self._on_stream_frame(image_url, detect)
+            
+            if result is None:
+                logger.error("Failed to capture frame from stream")
+                return {"success": False, "error": "Cannot capture frame from stream"}
+            
+            # Crop requests can pass frame_seq back to crop exactly this frame
+            result["frame_seq"] = frame_seq
+            return result
             
         except Exception as e:
             logger.error(f"YOLO detection error: {str(e)}")
             return {"success": False, "error": str(e)}
     
-    def crop_leaf_from_stream(self, image_url, bbox):
+    def detect_frame(self, image_cv, confidence_threshold=0.5, tiled=None, imgsz=None):
+        """
+        Run YOLO on an already captured frame (no stream access)
+        tiled: None = automatic (frame larger than YOLO_TILE_THRESHOLD), True/False to force
+        imgsz: YOLO input size (None = model default); when tiled, each tile and the
+               full-frame pass are fed to the network at this size
+        Returns list of detections with bbox, confidence, class_id and id
+        """
+        model = self.model  # Keep one model for the whole call even if a reload swaps it
+        tiled = self.use_tiling(image_cv, tiled)
+        started = time.perf_counter()
+        with perf.span('yolo.inference'):
+            if tiled:
+                xyxy, confidences, class_ids = self._predict_tiled(model, image_cv, confidence_threshold, imgsz)
+            else:
+                xyxy, confidences, class_ids = self._predict(model, image_cv, confidence_threshold, imgsz)
+        metrics.YOLO_INFERENCE_SECONDS.observe(time.perf_counter() - started)
+        return self._to_detections(xyxy, confidences, class_ids)
+    
+    def detect_batch(self, images, confidence_threshold=0.5, imgsz=None):
+        """
+        Run YOLO on several frames in one predict call (single pass, no tiling)
+        Returns one detection list per image, in order
+        """
+        if not images:
+            return []
+        model = self.model
+        options = {'imgsz': imgsz} if imgsz else {}
+        started = time.perf_counter()
+        with perf.span('yolo.inference'):
+            results = model(list(images), conf=confidence_threshold, verbose=False, **options)
+        metrics.YOLO_INFERENCE_SECONDS.observe(time.perf_counter() - started)
+        return [self._to_detections(*self._collect([result])) for result in results]
+    
+    @staticmethod
+    def _to_detections(xyxy, confidences, class_ids):
+        detections = []
+        for (x1, y1, x2, y2), confidence, class_id in zip(xyxy, confidences, class_ids):
+            detections.append({
+                'bbox': {
+                    'x1': float(x1),
+                    'y1': float(y1),
+                    'x2': float(x2),
+                    'y2': float(y2),
+                    'width': float(x2 - x1),
+                    'height': float(y2 - y1)
+                },
+                'confidence': float(confidence),
+                'class_id': int(class_id),
+                'id': f"leaf_{len(detections)}"  # Unique ID for frontend
+            })
+        metrics.YOLO_BOXES_PER_FRAME.observe(len(detections))
+        return detections
+    
+    @staticmethod
+    def use_tiling(image_cv, tiled=None):
+        """Tile frames whose long side exceeds YOLO_TILE_THRESHOLD unless forced on/off"""
+        if tiled is not None:
+            return bool(tiled)
+        height, width = image_cv.shape[:2]
+        return tiling.should_tile(height, width, getattr(settings, 'YOLO_TILE_THRESHOLD', 1280))
+    
+    @staticmethod
+    def _collect(results, offsets=None):
+        """ultralytics results -> (xyxy, conf, cls) arrays, one CPU transfer per image"""
+        xyxy, confidences, class_ids = [], [], []
+        for index, result in enumerate(results):
+            boxes = result.boxes
+            if boxes is None or len(boxes) == 0:
+                continue
+            boxes_xyxy = boxes.xyxy.cpu().numpy()
+            if offsets is not None:
+                x, y = offsets[index]
+                boxes_xyxy = boxes_xyxy + np.array([x, y, x, y], dtype=boxes_xyxy.dtype)
+            xyxy.append(boxes_xyxy)
+            confidences.append(boxes.conf.cpu().numpy())
+            class_ids.append(boxes.cls.cpu().numpy())
+        if not xyxy:
+            return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+        return np.concatenate(xyxy), np.concatenate(confidences), np.concatenate(class_ids)
+    
+    def _predict(self, model, image_cv, confidence_threshold, imgsz=None):
+        options = {'imgsz': imgsz} if imgsz else {}
+        return self._collect(model(image_cv, conf=confidence_threshold, verbose=False, **options))
+    
+    def _predict_tiled(self, model, image_cv, confidence_threshold, imgsz=None):
+        """
+        Sliced inference: overlapping tiles run as batches at native resolution,
+        plus (optionally) one downscaled full-frame pass for leaves larger than a tile.
+        imgsz below the tile size (load controller) downscales every tile and the full frame.
+        Leaf fragments cut by a tile seam are merged first, then plain IoU NMS
+        removes duplicates from the overlap regions (see services/tiling.py).
+        """
+        tile = getattr(settings, 'YOLO_TILE_SIZE', 640)
+        overlap = getattr(settings, 'YOLO_TILE_OVERLAP', 0.2)
+        batch_size = max(1, getattr(settings, 'YOLO_TILE_BATCH', 8))
+        height, width = image_cv.shape[:2]
+        
+        tiles = tiling.make_tiles(height, width, tile, overlap)
+        parts = []
+        for i in range(0, len(tiles), batch_size):
+            batch = tiles[i:i + batch_size]
+            crops = [image_cv[y1:y2, x1:x2] for x1, y1, x2, y2 in batch]
+            results = model(crops, conf=confidence_threshold, imgsz=min(tile, imgsz or tile), verbose=False)
+            for rect, result in zip(batch, results):
+                parts.append(self._collect([result], offsets=[rect[:2]]) + (rect,))
+        if getattr(settings, 'YOLO_TILE_FULL_FRAME', True):
+            parts.append(self._predict(model, image_cv, confidence_threshold, imgsz) + ((0, 0, width, height),))
+        
+        xyxy = np.concatenate([part[0] for part in parts])
+        confidences = np.concatenate([part[1] for part in parts])
+        class_ids = np.concatenate([part[2] for part in parts])
+        rects = np.concatenate([np.tile(np.asarray(part[3], dtype=np.float32), (len(part[0]), 1))
+                                for part in parts])
+        merged = tiling.merge_seams(xyxy, confidences, class_ids, rects, (width, height),
+                                    threshold=getattr(settings, 'YOLO_TILE_SEAM_THRESHOLD', 0.5))
+        return tiling.nms(*merged, threshold=getattr(settings, 'YOLO_TILE_NMS_THRESHOLD', 0.5))
+    
+    def crop_frame(self, image_cv, bbox, padding=10):
+        """
+        Crop a bounding box (with padding) from a frame
+        Returns a numpy view into the frame, or None if the box is empty
+        """
+        h, w = image_cv.shape[:2]
+        x1 = max(0, int(bbox['x1']) - padding)
+        y1 = max(0, int(bbox['y1']) - padding)
+        x2 = min(w, int(bbox['x2']) + padding)
+        y2 = min(h, int(bbox['y2']) + padding)
+        
+        cropped = image_cv[y1:y2, x1:x2]
+        return cropped if cropped.size else None
+    
+    def encode_jpeg(self, image_cv, quality=90):
+        """Encode an OpenCV image to JPEG bytes (image_codec backend, IMAGE_JPEG_SUBSAMPLING)"""
+        with perf.span('yolo.encode'):
+            return image_codec.encode_jpeg(image_cv, quality)
+    
+    def crop_leaf_from_stream(self, image_url, bbox, frame_seq=None):
         """
         Crop specific leaf from stream image based on bounding box
+        frame_seq: ring frame the bbox was detected on (from detect_leaves_from_url); when it
+        is still in the ring the crop comes from that exact frame, else from the newest one
         Returns cropped image as base64
         """
-        try:
-            # Capture frame from stream using OpenCV (same as detection)
-            logger.info(f"Capturing frame for cropping from: {image_url}")
-            image_cv = self.capture_frame_from_stream(image_url)
-            
-            if image_cv is None:
-                logger.error("Failed to capture frame for cropping")
-                return {"success": False, "error": "Cannot capture frame from stream"}
-            
-            # Extract bounding box coordinates
-            x1 = int(bbox['x1'])
-            y1 = int(bbox['y1'])
-            x2 = int(bbox['x2'])
-            y2 = int(bbox['y2'])
+        def crop(image_cv):
+            # Crop image (with padding)
+            cropped = self.crop_frame(image_cv, bbox)
             
-            # Add padding (optional)
-            padding = 10
-            h, w = image_cv.shape[:2]
-            x1 = max(0, x1 - padding)
-            y1 = max(0, y1 - padding)
-            x2 = min(w, x2 + padding)
-            y2 = min(h, y2 + padding)
-            
-            # Crop image
-            cropped = image_cv[y1:y2, x1:x2]
-            
-            if cropped.size == 0:
+            if cropped is None:
                 return {"success": False, "error": "Invalid crop coordinates"}
             
             # Convert to base64
-            _, buffer = cv2.imencode('.jpg', cropped)
-            cropped_b64 = base64.b64encode(buffer).decode('utf-8')
-            
-            # Also create thumbnail
-            thumbnail = cv2.resize(cropped, (200, 200))
-            _, thumb_buffer = cv2.imencode('.jpg', thumbnail)
+            with perf.span('yolo.encode'):
+                buffer = image_codec.encode_jpeg(cropped, 90)
+                cropped_b64 = base64.b64encode(buffer).decode('utf-8')
+                
+                # Also create thumbnail
+                thumbnail = cv2.resize(cropped, (200, 200), interpolation=cv2.INTER_AREA)
+                thumb_buffer = image_codec.encode_jpeg(thumbnail, getattr(settings, 'IMAGE_THUMB_QUALITY', 75))
             thumbnail_b64 = base64.b64encode(thumb_buffer).decode('utf-8')
             
             return {
@@ -190,9 +476,22 @@ class YOLOLeafDetector:
                 "thumbnail_b64": thumbnail_b64,
                 "crop_info": {
                     "original_bbox": bbox,
-                    "cropped_size": {"width": x2-x1, "height": y2-y1}
+                    "cropped_size": {"width": cropped.shape[1], "height": cropped.shape[0]}
                 }
             }
+        
+        try:
+            logger.info(f"Capturing frame for cropping from: {image_url}")
+            result, seq = self._on_stream_frame(image_url, crop, frame_seq=frame_seq)
+            
+            if result is None:
+                logger.error("Failed to capture frame for cropping")
+                return {"success": False, "error": "Cannot capture frame from stream"}
+            
+            if result["success"]:
+                result["crop_info"]["frame_seq"] = seq
+                result["crop_info"]["same_frame"] = bool(frame_seq) and seq == frame_seq
+            return result
             
         except Exception as e:
             logger.error(f"Crop leaf error: {str(e)}")
@@ -227,5 +526,5 @@ class YOLOLeafDetector:
         
         return annotated
 
-# Global instance
-yolo_detector = YOLOLeafDetector()
\ No newline at end of file
+# Global instance (loaded in the background by start(), see PBL_LeafMed/wsgi.py)
+yolo_detector = YOLOLeafDetector(autoload=False)
\ No newline at end of file
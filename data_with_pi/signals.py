@@ -0,0 +1,59 @@
+"""
+Signal handlers của app data_with_pi
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import CaptureResult, PiDevice, Plant, Recipe, RecipeImage
+from .services.capture_stats import refresh_stats, stat_keys
+from .services.catalog_cache import invalidate_plant, invalidate_recipe
+from .services.image_variants import refresh_instance_variants
+
+
+@receiver(pre_save, sender=Plant)
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=RecipeImage)
+def generate_image_variants(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Sinh ảnh thumb/medium/WebP khi upload ảnh mới"""
+    if raw or (update_fields is not None and 'image' not in update_fields):
+        return
+    refresh_instance_variants(instance)
+
+
+@receiver([post_save, post_delete], sender=Plant)
+def invalidate_plant_cache(sender, instance, **kwargs):
+    """Xóa cache trang chủ / trang cây khi cây thay đổi"""
+    invalidate_plant(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe_cache(sender, instance, **kwargs):
+    """Xóa cache công thức và trang cây khi công thức thay đổi"""
+    invalidate_recipe(instance.pk, instance.plant_id)
+
+
+@receiver([post_save, post_delete], sender=RecipeImage)
+def invalidate_recipe_image_cache(sender, instance, **kwargs):
+    """Xóa cache công thức khi ảnh minh họa thay đổi"""
+    recipes = Recipe.objects.filter(pk=instance.recipe_id)
+    # Đánh dấu công thức đã cập nhật để phiên bản cache (updated_at) thay đổi
+    recipes.update(updated_at=timezone.now())
+    recipe = recipes.values('pk', 'plant_id').first()
+    if recipe:
+        invalidate_recipe(recipe['pk'], recipe['plant_id'])
+
+
+@receiver([post_save, post_delete], sender=PiDevice)
+@receiver(m2m_changed, sender=PiDevice.users.through)
+def reload_pi_fleet(sender, **kwargs):
+    """Load lại danh sách trạm Pi khi trạm hoặc người dùng của trạm thay đổi"""
+    from .services.pi_fleet import pi_fleet
+
+    pi_fleet.invalidate()
+
+
+@receiver(post_delete, sender=CaptureResult)
+def refresh_capture_stats(sender, instance, **kwargs):
+    """Tính lại các dòng thống kê mà capture vừa xóa đóng góp vào (cùng transaction với lệnh xóa)"""
+    refresh_stats(stat_keys(instance))
@@ -1,3 +1,1515 @@
-from django.test import TestCase
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from importlib.util import find_spec
+from unittest import skipUnless
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .services import metrics
+from .services.import_profile import measure_import_ms
+from .services.pi_client import PiClient
+from .services.pi_fleet import PiFleet, image_device
+
+
+class FakePi:
+    """Pi giả chạy trên localhost: /status, /upload, /capture/analyze, /history/image/<file>"""
+
+    def __init__(self, name, delay=0.0, fail=False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.uploads = 0
+        self.analyzes = 0
+        self.images = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _json(self, payload, status=200):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if fake.fail:
+                    return self._json({'detail': 'down'}, status=503)
+                if self.path.startswith('/history/image/'):
+                    fake.images += 1
+                    body = b'jpeg-bytes'
+                    self.send_response(200)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                self._json({'camera': {'state': 'ready'}, 'model_loaded': True})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if fake.fail:
+                    return self._json({'detail': 'down'}, status=503)
+                time.sleep(fake.delay)
+                if self.path == '/upload':
+                    fake.uploads += 1
+                elif self.path == '/capture/analyze':
+                    fake.analyzes += 1
+                self._json({'success': True, 'name': 'Ocimum', 'confidence': 0.9, 'file': f'{fake.name}.jpg'})
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class PiFleetSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.pis = [FakePi('pi1', delay=0.2), FakePi('pi2', delay=0.2), FakePi('pi3', fail=True)]
+        self.fleet = PiFleet(
+            devices=[(pi.name, pi.base_url, True) for pi in self.pis],
+            failure_threshold=1, cooldown=60,
+        )
+
+    def tearDown(self):
+        for pi in self.pis:
+            pi.close()
+
+    def test_uploads_are_spread_by_queue_depth(self):
+        self.pis[2].fail = False
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            results = list(pool.map(lambda _: self.fleet.upload_image(b'x', 'a.jpg', 'image/jpeg'), range(6)))
+
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual([pi.uploads for pi in self.pis], [2, 2, 2])
+
+    def test_failed_device_is_skipped_after_failover(self):
+        results = [self.fleet.upload_image(b'x', 'a.jpg', 'image/jpeg') for _ in range(6)]
+
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(sum(pi.uploads for pi in self.pis), 6)
+        dead = self.fleet.device_for_url(self.pis[2].base_url)
+        self.assertFalse(dead.healthy)
+        self.assertEqual(dead.requests, 1)
+        self.assertNotIn(self.pis[2].base_url, {result['pi_device'] for result in results})
+
+    def test_analyze_offloads_from_busy_station(self):
+        station = self.fleet.device_for_url(self.pis[0].base_url)
+        station.in_flight = 5  # trạm của user đang bận
+
+        result = self.fleet.analyze_image(station, 'capture.jpg')
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['file'], 'capture.jpg')
+        self.assertEqual(result['pi_device'], self.pis[1].base_url)
+        self.assertEqual(image_device(result), self.pis[0].base_url)  # ảnh vẫn nằm trên station
+        self.assertEqual((self.pis[0].analyzes, self.pis[1].uploads), (0, 1))
+
+
+class StubClassifier:
+    """Classifier cục bộ giả (cùng interface với LocalClassifier)"""
+    base_url = 'local'
+    available = True
+
+    def __init__(self):
+        self.calls = 0
+
+    def upload_image(self, file_data, filename, content_type):
+        self.calls += 1
+        return {'success': True, 'name': 'Ocimum', 'confidence': 0.8, 'file': '', 'backend': 'local'}
+
+
+class LocalClassifierRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.pi = FakePi('pi1')
+        self.local = StubClassifier()
+        self.fleet = PiFleet(devices=[('pi1', self.pi.base_url, True)], failure_threshold=1,
+                             cooldown=60, local_classifier=self.local, local_queue_depth=2)
+        self.device = self.fleet.device_for_url(self.pi.base_url)
+
+    def tearDown(self):
+        self.pi.close()
+
+    def test_idle_pi_keeps_the_work(self):
+        result = self.fleet.upload_image(b'x', 'a.jpg', 'image/jpeg')
+
+        self.assertEqual((result['backend'], self.pi.uploads, self.local.calls), ('pi', 1, 0))
+
+    def test_deep_pi_queue_routes_to_local(self):
+        self.device.in_flight = 2
+
+        result = self.fleet.upload_image(b'x', 'a.jpg', 'image/jpeg')
+
+        self.assertEqual((result['backend'], self.pi.uploads, self.local.calls), ('local', 0, 1))
+        self.assertIsNotNone(self.fleet.local.latency_ewma)
+
+    def test_failed_pi_falls_back_to_local(self):
+        self.pi.fail = True
+
+        first = self.fleet.upload_image(b'x', 'a.jpg', 'image/jpeg')
+        second = self.fleet.upload_image(b'x', 'a.jpg', 'image/jpeg')
+
+        self.assertEqual((first['backend'], second['backend']), ('local', 'local'))
+        self.assertEqual(self.device.requests, 1)
+
+
+class FakeLeafDetector:
+    """YOLOLeafDetector giả: frame numpy cố định, bbox cho trước, cắt bằng slicing như detector thật"""
+
+    def __init__(self, bboxes):
+        self.bboxes = bboxes
+        self.captures = 0
+
+    def wait_ready(self):
+        return True
+
+    def capture_frame(self, stream_url, frame_seq=None):
+        import numpy as np
+
+        self.captures += 1
+        return np.zeros((120, 160, 3), dtype=np.uint8), 7
+
+    def detect_frame(self, frame, confidence):
+        return [{'bbox': bbox, 'confidence': 0.9, 'class_id': 0, 'id': f'leaf_{i}'}
+                for i, bbox in enumerate(self.bboxes)]
+
+    def crop_frame(self, frame, bbox):
+        cropped = frame[int(bbox['y1']):int(bbox['y2']), int(bbox['x1']):int(bbox['x2'])]
+        return cropped if cropped.size else None
+
+    def encode_jpeg(self, crop):
+        return f'jpeg-{crop.shape[1]}x{crop.shape[0]}'.encode()
+
+
+@contextmanager
+def fake_yolo_service(detector):
+    """
+    Thay riêng module yolo_service (cần cv2 + ultralytics) bằng detector giả trong sys.modules
+    (không dùng patch.dict(sys.modules): module import lần đầu trong block sẽ bị gỡ khi thoát)
+    """
+    import sys
+    from types import SimpleNamespace
+
+    service = 'data_with_pi.services.yolo_service'
+    original = sys.modules.get(service)
+    sys.modules[service] = SimpleNamespace(yolo_detector=detector)
+    try:
+        yield detector
+    finally:
+        if original is None:
+            sys.modules.pop(service, None)
+        else:
+            sys.modules[service] = original
+
+
+LEAF_BBOXES = [{'x1': 0, 'y1': 0, 'x2': 40, 'y2': 30}, {'x1': 50, 'y1': 50, 'x2': 50, 'y2': 90},
+               {'x1': 100, 'y1': 20, 'x2': 160, 'y2': 120}]  # bbox thứ hai rỗng -> bị bỏ
+
+
+@skipUnless(find_spec('numpy'), 'numpy chưa được cài đặt')
+class LeafPipelineTests(SimpleTestCase):
+    def setUp(self):
+        self.pis = [FakePi('pi1'), FakePi('pi2')]
+        self.fleet = PiFleet(devices=[(pi.name, pi.base_url, True) for pi in self.pis])
+
+    def tearDown(self):
+        for pi in self.pis:
+            pi.close()
+
+    def test_one_frame_is_cropped_and_classified_per_leaf(self):
+        from .services.leaf_pipeline import run_leaf_pipeline
+
+        detector = FakeLeafDetector(LEAF_BBOXES)
+        result = run_leaf_pipeline(detector, self.fleet, 'http://stream', keep_jpeg=True, filename_prefix='t')
+
+        self.assertTrue(result['success'])
+        self.assertEqual((detector.captures, result['total_leaves'], result['classified']), (1, 2, 2))
+        self.assertEqual([leaf['crop_size'] for leaf in result['leaves']],
+                         [{'width': 40, 'height': 30}, {'width': 60, 'height': 100}])
+        self.assertEqual([leaf['jpeg'] for leaf in result['leaves']], [b'jpeg-40x30', b'jpeg-60x100'])
+        self.assertEqual(sum(pi.uploads for pi in self.pis), 2)
+        self.assertEqual((result['image_width'], result['image_height'], result['frame_seq']), (160, 120, 7))
+        self.assertTrue({'capture', 'detect', 'crop', 'encode', 'classify', 'total'} <= set(result['timings_ms']))
+
+    def test_local_classifier_predicts_the_whole_batch_at_once(self):
+        from .services.leaf_pipeline import run_leaf_pipeline
+
+        class BatchClassifier(StubClassifier):
+            def classify_batch(self, images, filenames):
+                self.calls += 1
+                return [{'success': True, 'name': 'Ocimum', 'confidence': 0.8, 'file': ''} for _ in images]
+
+        local = BatchClassifier()
+        fleet = PiFleet(devices=[('pi1', self.pis[0].base_url, True)], local_classifier=local, local_queue_depth=1)
+        fleet.device_for_url(self.pis[0].base_url).in_flight = 1  # Pi bận -> classifier cục bộ
+
+        result = run_leaf_pipeline(FakeLeafDetector(LEAF_BBOXES), fleet, 'http://stream', bboxes=LEAF_BBOXES)
+
+        self.assertEqual((result['classified'], local.calls, self.pis[0].uploads), (2, 1, 0))
+        self.assertEqual({leaf['classification']['backend'] for leaf in result['leaves']}, {'local'})
+        self.assertNotIn('detect', result['timings_ms'])  # bbox client gửi -> bỏ qua detect
+
+
+@skipUnless(find_spec('numpy'), 'numpy chưa được cài đặt')
+class BatchCropViewTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.pi = FakePi('pi1')
+        self.fleet = PiFleet(devices=[('pi1', self.pi.base_url, True)])
+        self.user = User.objects.create_user('batch', password='x')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        self.pi.close()
+
+    def test_every_leaf_is_saved_with_one_bulk_insert(self):
+        import tempfile
+        from unittest import mock
+        from . import views
+        from .models import CaptureResult, PlantCaptureStats
+
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media), \
+                fake_yolo_service(FakeLeafDetector(LEAF_BBOXES)), \
+                mock.patch.object(views, 'pi_fleet', self.fleet), \
+                mock.patch.object(PiClient, 'get_stream_url', return_value='http://stream'), \
+                mock.patch.object(CaptureResult, 'save', side_effect=AssertionError('save() per leaf')):
+            response = self.client.post('/api/yolo/crop/', json.dumps({'bboxes': 'all'}),
+                                        content_type='application/json')
+            saved = [os.path.exists(os.path.join(media, leaf['saved_file_path']))
+                     for leaf in response.json()['leaves']]
+
+        body = response.json()
+        self.assertEqual((response.status_code, body['saved_count']), (200, 2))
+        self.assertEqual(saved, [True, True])
+        captures = CaptureResult.objects.filter(user=self.user).order_by('id')
+        self.assertEqual([leaf['capture_id'] for leaf in body['leaves']], [c.id for c in captures])
+        self.assertEqual({(c.source, c.image_file, c.pi_device) for c in captures},
+                         {('yolo_crop', 'pi1.jpg', self.pi.base_url)})
+        self.assertEqual(PlantCaptureStats.objects.get(plant__name='Ocimum').capture_count, 2)
+
+    def test_non_numeric_confidence_is_a_bad_request(self):
+        from unittest import mock
+
+        with fake_yolo_service(FakeLeafDetector(LEAF_BBOXES)), \
+                mock.patch.object(PiClient, 'get_stream_url', return_value='http://stream'):
+            for url in ('/api/yolo/crop/', '/api/yolo/pipeline/'):
+                for confidence in ('cao', None, [1], 'nan'):
+                    response = self.client.post(url, json.dumps({'bboxes': 'all', 'confidence': confidence}),
+                                                content_type='application/json')
+                    self.assertEqual(response.status_code, 400, (url, confidence))
+                    self.assertEqual(response.json()['error'], 'Confidence không hợp lệ')
+
+
+@skipUnless(metrics.available(), 'prometheus_client chưa được cài đặt')
+class MetricsEndpointTests(TestCase):
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_are_exposed_in_prometheus_format(self):
+        pi = FakePi('pi1', fail=True)
+        try:
+            PiClient(pi.base_url).get_status()
+        finally:
+            pi.close()
+        metrics.record_cache('catalog', hit=True)
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('leafmed_pi_request_errors_total{method="get_status"}', body)
+        self.assertIn('leafmed_pi_request_seconds_bucket{le="0.005",method="get_status"}', body)
+        self.assertIn('leafmed_cache_requests_total{cache="catalog",result="hit"}', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secreT').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_only_staff_without_token(self):
+        from django.contrib.auth.models import User
+
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 401)
+        self.client.force_login(User.objects.create_user('viewer', password='x'))
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.force_login(User.objects.create_user('ops', password='x', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_created_captures_are_counted_only_after_commit(self):
+        from django.db import transaction
+        from prometheus_client import REGISTRY
+        from .models import CaptureResult
+        from .services.capture_stats import bulk_create_captures
+
+        def created():
+            return REGISTRY.get_sample_value('leafmed_capture_results_created_total', {'source': 'upload'}) or 0
+
+        before = created()
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    CaptureResult.objects.create(name='a', source='upload', success=True)
+                    raise RuntimeError('rollback')
+            except RuntimeError:
+                pass
+        self.assertEqual((len(callbacks), created()), (0, before))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CaptureResult.objects.create(name='a', source='upload', success=True)
+            bulk_create_captures([CaptureResult(name='b', source='upload', success=True) for _ in range(2)])
+            self.assertEqual(created(), before)  # chưa commit
+        self.assertEqual(created(), before + 3)
+
+
+@override_settings(PERF_SERVER_TIMING=False)
+class ServerTimingTests(TestCase):
+    def _login_page(self):
+        from .services import perf
+
+        histogram = perf.histograms.get('request_duration_ms', route='login', method='GET')
+        before = histogram.count
+        response = self.client.get('/login/')
+        self.assertEqual(histogram.count, before + 1)  # histogram luôn được ghi
+        return response
+
+    def test_header_is_hidden_from_regular_users(self):
+        from django.contrib.auth.models import User
+
+        self.assertNotIn('Server-Timing', self._login_page())
+        self.client.force_login(User.objects.create_user('regular', password='x'))
+        self.assertNotIn('Server-Timing', self._login_page())
+
+    def test_header_is_sent_to_staff(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        self.assertTrue(self._login_page()['Server-Timing'].startswith('total;dur='))
+
+    @override_settings(PERF_SERVER_TIMING=True)
+    def test_setting_sends_header_to_everyone(self):
+        self.assertIn('Server-Timing', self._login_page())
+
+
+class ExceptionRecordingMiddleware:
+    """Middleware đặt sau ProfilingMiddleware trong test: ghi lại view và lỗi mà Django chuyển cho nó"""
+    views, exceptions = [], []
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.views.append(view_func.__name__)
+
+    def process_exception(self, request, exception):
+        self.exceptions.append(str(exception))
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.contrib.auth.models import User
+
+        self.workdir = tempfile.TemporaryDirectory()
+        self.staff = User.objects.create_user('profiler', password='x', is_staff=True)
+        self.user = User.objects.create_user('visitor', password='x')
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def _request(self, user, header=None):
+        from django.test import RequestFactory
+        from .services.profiling import PROFILE_HEADER
+
+        headers = {f'HTTP_{PROFILE_HEADER.upper().replace("-", "_")}': header} if header else {}
+        request = RequestFactory().get('/', **headers)
+        request.user = user
+        return request
+
+    @override_settings(PROFILING_ENABLED=True, PROFILING_TOKEN='tok', PROFILING_SAMPLE_RATE=0)
+    def test_header_needs_staff_or_exact_token(self):
+        from .services.profiling import should_profile
+
+        self.assertTrue(should_profile(self._request(self.staff, '1'), 'home'))
+        self.assertTrue(should_profile(self._request(self.user, 'tok'), 'home'))
+        self.assertFalse(should_profile(self._request(self.user, 'to'), 'home'))
+        self.assertFalse(should_profile(self._request(self.staff), 'home'))
+        with override_settings(PROFILING_ENABLED=False):
+            self.assertFalse(should_profile(self._request(self.staff, '1'), 'home'))
+
+    @override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0, PROFILING_ROUTES=['search'])
+    def test_sampling_only_covers_selected_routes(self):
+        from .services.profiling import should_profile
+
+        self.assertTrue(should_profile(self._request(self.user), 'search'))
+        self.assertFalse(should_profile(self._request(self.user), 'home'))
+
+    def test_middleware_writes_profile_for_staff_header(self):
+        from .services.profiling import PROFILE_HEADER
+
+        self.client.force_login(self.staff)
+        with override_settings(PROFILING_ENABLED=True, PROFILING_DIR=self.workdir.name, PROFILING_SAMPLE_RATE=0):
+            profiled = self.client.get('/login/', **{f'HTTP_{PROFILE_HEADER.upper().replace("-", "_")}': '1'})
+            plain = self.client.get('/login/')
+            listing = self.client.get('/staff/profiles/?limit=abc')
+
+        profile_id = profiled['X-LeafMed-Profile-Id']
+        self.assertNotIn('X-LeafMed-Profile-Id', plain)
+        self.assertTrue(os.path.exists(os.path.join(self.workdir.name, f'{profile_id}.json')))
+        self.assertEqual(listing.status_code, 200)  # limit không hợp lệ -> mặc định
+        self.assertEqual([meta['id'] for meta in listing.context['profiles']], [profile_id])
+
+    def test_profiled_view_keeps_the_normal_middleware_and_error_path(self):
+        from unittest import mock
+        from django.conf import settings
+        from . import views
+        from .services.profiling import PROFILE_HEADER
+
+        ExceptionRecordingMiddleware.views, ExceptionRecordingMiddleware.exceptions = [], []
+        self.client.force_login(self.staff)
+        self.client.raise_request_exception = False
+        middleware = settings.MIDDLEWARE + ['data_with_pi.tests.ExceptionRecordingMiddleware']
+        with override_settings(PROFILING_ENABLED=True, PROFILING_DIR=self.workdir.name, PROFILING_SAMPLE_RATE=0,
+                               MIDDLEWARE=middleware), \
+                mock.patch.object(views, 'redirect', side_effect=RuntimeError('view lỗi')), \
+                self.assertLogs('django.request', 'ERROR'):
+            response = self.client.get('/login/', **{f'HTTP_{PROFILE_HEADER.upper().replace("-", "_")}': '1'})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual((ExceptionRecordingMiddleware.views, ExceptionRecordingMiddleware.exceptions),
+                         (['login_view'], ['view lỗi']))
+        with open(os.path.join(self.workdir.name, f"{response['X-LeafMed-Profile-Id']}.json")) as f:
+            meta = json.load(f)
+        self.assertEqual((meta['route'], meta['status']), ('login', 500))
+
+    def test_cprofile_lock_is_released_when_enable_fails(self):
+        import cProfile
+        from unittest import mock
+        from .services import profiling
+
+        with override_settings(PROFILING_DIR=self.workdir.name), \
+                mock.patch.object(cProfile.Profile, 'enable', side_effect=ValueError('profiler already active')):
+            with self.assertRaises(ValueError):
+                profiling.run_profiled(lambda request: None, self._request(self.staff), (), {}, 'home', 'cprofile')
+
+        self.assertFalse(profiling._cprofile_lock.locked())
+
+
+class YoloReadinessTests(TestCase):
+    FAILED = {'ready': False, 'state': 'failed', 'model_path': '/srv/model/best.pt',
+              'error': "No module named 'ultralytics'", 'reloads': 0}
+
+    def test_anonymous_callers_only_see_readiness(self):
+        from unittest import mock
+        from .services import model_lifecycle
+
+        with mock.patch.object(model_lifecycle, 'yolo_status', return_value=dict(self.FAILED)):
+            response = self.client.get('/api/yolo/ready/')
+
+        self.assertEqual((response.status_code, response.json()), (503, {'ready': False}))
+
+    def test_staff_get_the_details(self):
+        from django.contrib.auth.models import User
+        from unittest import mock
+        from .services import model_lifecycle
+
+        self.client.force_login(User.objects.create_user('ops', password='x', is_staff=True))
+        with mock.patch.object(model_lifecycle, 'yolo_status', return_value=dict(self.FAILED)):
+            response = self.client.get('/api/yolo/ready/')
+
+        self.assertEqual((response.status_code, response.json()), (503, self.FAILED))
+
+    @skipUnless(find_spec('cv2'), 'opencv chưa được cài đặt')
+    def test_failed_reload_keeps_the_served_mtime(self):
+        import tempfile
+        from unittest import mock
+        from .services.yolo_service import YOLOLeafDetector
+
+        with tempfile.NamedTemporaryFile(suffix='.pt') as model_file, \
+                override_settings(YOLO_RELOAD_INTERVAL=0.01):
+            detector = YOLOLeafDetector(model_path=model_file.name, autoload=False)
+            detector.model, detector.loaded_mtime = object(), 1.0  # model cũ đang chạy
+            with mock.patch.object(detector, 'load_model', return_value=False) as load:
+                detector.start()
+                time.sleep(0.2)
+                detector.stop()
+
+        self.assertEqual((detector.loaded_mtime, load.call_count), (1.0, 1))
+
+
+class ImportTimeBudgetTests(SimpleTestCase):
+    """Import data_with_pi.views phải nhanh: thư viện CV/ML chỉ được import khi dùng tới"""
+
+    # Có thể nới ngân sách trên máy chậm: VIEWS_IMPORT_BUDGET_MS=400 python manage.py test
+    budget_ms = float(os.getenv('VIEWS_IMPORT_BUDGET_MS', '200'))
+
+    def test_views_import_stays_within_budget(self):
+        result = measure_import_ms('data_with_pi.views')
+
+        self.assertEqual(result['heavy'], [], f'Thư viện nặng bị import cùng views: {result["heavy"]}')
+        self.assertLess(result['ms'], self.budget_ms,
+                        f'Import data_with_pi.views mất {result["ms"]:.0f} ms (ngân sách {self.budget_ms:.0f} ms), '
+                        'xem: python manage.py importtime_report')
+
+
+@skipUnless(find_spec('numpy'), 'numpy chưa được cài đặt')
+class TilingTests(SimpleTestCase):
+    def test_tiles_cover_frame_with_overlap(self):
+        from .services.tiling import make_tiles
+
+        tiles = make_tiles(2160, 3840, 640, 0.2)
+
+        self.assertEqual(max(x2 for _, _, x2, _ in tiles), 3840)
+        self.assertEqual(max(y2 for _, _, _, y2 in tiles), 2160)
+        self.assertTrue(all(x2 - x1 == 640 and y2 - y1 == 640 for x1, y1, x2, y2 in tiles))
+        xs = sorted({x1 for x1, _, _, _ in tiles})
+        self.assertTrue(all(b - a <= 512 for a, b in zip(xs, xs[1:])))
+
+    def test_overlap_must_leave_a_positive_step(self):
+        from .services.tiling import tile_origins
+
+        self.assertEqual(tile_origins(1000, 640, 0.5), [0, 320, 360])
+        for overlap in (1.0, 0.999, -0.1):
+            with self.assertRaises(ValueError):
+                tile_origins(1000, 640, overlap)
+
+    def test_nms_is_plain_iou(self):
+        import numpy as np
+        from .services.tiling import nms
+
+        # Lá nhỏ nằm trong lá lớn (IoS = 1, IoU thấp) phải được giữ nguyên, box trùng thì bị loại
+        boxes = np.array([[0, 0, 400, 400], [100, 100, 160, 160], [5, 0, 400, 400]], dtype=np.float32)
+        scores = np.array([0.9, 0.8, 0.7])
+
+        kept, kept_scores, _ = nms(boxes, scores, np.zeros(3))
+
+        self.assertEqual(kept.tolist(), [[0, 0, 400, 400], [100, 100, 160, 160]])
+        self.assertEqual(kept_scores.tolist(), [0.9, 0.8])
+
+    def test_merge_seams_only_joins_fragments_cut_by_a_shared_seam(self):
+        import numpy as np
+        from .services.tiling import merge_seams, nms
+
+        # Hai ô 0..640 và 512..1152 (đường nối x=640 và x=512); frame 1152x640
+        left, right = (0, 0, 640, 640), (512, 0, 1152, 640)
+        boxes = np.array([[560, 100, 640, 200],    # ô trái, bị cắt ở x=640
+                          [512, 100, 700, 200],    # ô phải, bị cắt ở x=512
+                          [300, 300, 360, 360],    # lá khác trong ô trái
+                          [320, 300, 390, 360]],   # lá chồng lá trên (IoS 0.67), cùng ô -> không ghép
+                         dtype=np.float32)
+        rects = np.array([left, right, left, left], dtype=np.float32)
+        scores = np.array([0.9, 0.8, 0.7, 0.6])
+
+        merged = merge_seams(boxes, scores, np.zeros(4), rects, (1152, 640))
+        kept, kept_scores, _ = nms(*merged)
+
+        self.assertEqual(kept.tolist(), [[512, 100, 700, 200], [300, 300, 360, 360], [320, 300, 390, 360]])
+        self.assertEqual(kept_scores.tolist(), [0.9, 0.7, 0.6])
+
+    def test_merge_seams_ignores_boxes_away_from_seams(self):
+        import numpy as np
+        from .services.tiling import merge_seams
+
+        # Cùng vùng nhưng không box nào chạm đường nối -> giữ cả hai (NMS quyết định)
+        boxes = np.array([[100, 100, 200, 200], [120, 100, 200, 200]], dtype=np.float32)
+        rects = np.array([(0, 0, 640, 640), (0, 0, 1152, 640)], dtype=np.float32)
+
+        merged, _, _ = merge_seams(boxes, np.array([0.9, 0.8]), np.zeros(2), rects, (1152, 640))
+
+        self.assertEqual(len(merged), 2)
+
+
+class DetectionControllerTests(SimpleTestCase):
+    def test_degrades_under_load_and_recovers(self):
+        from .services.detection_controller import DetectionController
+
+        controller = DetectionController(imgsz_levels=(640, 320), target_latency_ms=100, min_interval_ms=500,
+                                         adjust_cooldown=0, alpha=1)
+
+        controller.record(400)
+        self.assertEqual(controller.imgsz, 320)
+        self.assertEqual(controller.state()['next_interval_ms'], 750)
+
+        controller.record(20)
+        controller.record(20)
+        self.assertEqual(controller.imgsz, 640)
+        self.assertEqual(controller.state()['next_interval_ms'], 500)
+
+    def test_rejects_when_queue_is_full(self):
+        from .services.detection_controller import DetectionController, Overloaded
+
+        controller = DetectionController(max_concurrent=1, max_queue=0, adjust_cooldown=0)
+
+        with controller.slot():
+            with self.assertRaises(Overloaded):
+                with controller.slot():
+                    pass
+        self.assertEqual(controller.state()['rejected'], 1)
+        with controller.slot():
+            self.assertEqual(controller.queue_depth, 1)
+
+
+    @skipUnless(metrics.available(), 'prometheus_client chưa được cài đặt')
+    def test_imgsz_gauge_is_set_at_startup(self):
+        from prometheus_client import REGISTRY
+        from .services.detection_controller import DetectionController
+
+        DetectionController(imgsz_levels=(320, 416))
+
+        self.assertEqual(REGISTRY.get_sample_value('leafmed_detection_imgsz'), 416)
+
+
+class DetectionViewTests(TestCase):
+    class SlowDetector:
+        """Chụp + encode chậm, inference nhanh: controller phải thấy cả khoảng thời gian giữ suất"""
+
+        def __init__(self):
+            self.imgsz = []
+
+        def detect_leaves_from_url(self, stream_url, confidence, tiled=None, imgsz=None):
+            self.imgsz.append(imgsz)
+            time.sleep(0.05)
+            return {'success': True, 'detections': [], 'total_leaves': 0, 'inference_ms': 1.0}
+
+    def test_controller_measures_the_whole_gated_span(self):
+        from unittest import mock
+        from django.contrib.auth.models import User
+        from .services import detection_controller as controller_module
+        from .services.detection_controller import DetectionController
+
+        self.client.force_login(User.objects.create_user('detect', password='x'))
+        controller = DetectionController(imgsz_levels=(512, 320), adjust_cooldown=0, alpha=1)
+        with fake_yolo_service(self.SlowDetector()) as detector, \
+                mock.patch.object(controller_module, 'detection_controller', controller), \
+                mock.patch.object(PiClient, 'get_stream_url', return_value='http://stream'):
+            response = self.client.get('/api/yolo/detect/')
+
+        self.assertEqual((response.status_code, detector.imgsz), (200, [512]))
+        self.assertGreaterEqual(controller.latency_ewma, 50)
+
+
+@skipUnless(find_spec('numpy'), 'numpy chưa được cài đặt')
+class FrameRingTests(SimpleTestCase):
+    def test_reader_sees_frames_by_seq_and_detects_overwrite(self):
+        import numpy as np
+        from .services.frame_ring import FrameOverwritten, FrameRing
+
+        with FrameRing(slots=2, max_height=4, max_width=6) as ring:
+            reader = FrameRing.attach(ring.name)
+            first = ring.write(np.full((4, 6, 3), 1, dtype=np.uint8))
+            frame = reader.read(first)
+            self.assertEqual(frame.image.shape, (4, 6, 3))
+            self.assertFalse(frame.image.flags.writeable)
+
+            ring.write(np.full((2, 3, 3), 2, dtype=np.uint8))
+            self.assertTrue(frame.valid())
+            ring.write(np.full((4, 6, 3), 3, dtype=np.uint8))
+
+            self.assertFalse(frame.valid())
+            with self.assertRaises(FrameOverwritten):
+                reader.read(first)
+            self.assertEqual(reader.latest().seq, 3)
+            self.assertEqual(int(reader.read(2).image.max()), 2)
+            reader.close()
+
+    def test_grabber_downscales_frames_larger_than_slot(self):
+        import numpy as np
+        from unittest import mock
+        from .services.frame_ring import FrameGrabber, FrameRing
+
+        with FrameRing(slots=2, max_height=4, max_width=6) as ring:
+            grabber = FrameGrabber('http://stream', ring, reconnect_delay=0)
+
+            def frames():
+                yield np.full((8, 12, 3), 5, dtype=np.uint8)
+                yield np.full((8, 12, 3), 6, dtype=np.uint8)
+                grabber.stop()
+
+            with mock.patch.object(grabber, '_mjpeg_frames', frames), \
+                    self.assertLogs('data_with_pi.services.frame_ring', 'WARNING') as logs:
+                grabber.run()
+
+            self.assertEqual((grabber.frames, grabber.errors, len(logs.output)), (2, 0, 1))
+            self.assertEqual(ring.latest().image.shape, (4, 6, 3))
+
+    def test_create_keeps_live_segment_and_replaces_stale_one(self):
+        import os
+        from .services.frame_ring import OWNER_PID, FrameRing
+
+        name = f'leafmed_test_{os.getpid()}'
+        with FrameRing(name=name, slots=2, max_height=4, max_width=6) as live:
+            with self.assertRaises(FileExistsError):
+                FrameRing(name=name, slots=2, max_height=4, max_width=6)
+            self.assertEqual(FrameRing.attach(name).slots, 2)
+
+        stale = FrameRing(name=name, slots=2, max_height=4, max_width=6)
+        stale.header[OWNER_PID] = 0  # Grabber đã chết
+        with self.assertLogs('data_with_pi.services.frame_ring', 'WARNING'), \
+                FrameRing(name=name, slots=3, max_height=4, max_width=6) as ring:
+            self.assertEqual(FrameRing.attach(name).slots, 3)
+            self.assertEqual(int(ring.header[OWNER_PID]), os.getpid())
+        stale.close()
+
+    def test_latest_frame_closes_stale_ring(self):
+        import numpy as np
+        from django.test import override_settings
+        from .services import frame_ring
+
+        stream_url = f'http://stream-{id(self)}'
+        with frame_ring.FrameRing(name=frame_ring.ring_name(stream_url), slots=2, max_height=4,
+                                  max_width=6) as ring:
+            ring.write(np.zeros((4, 6, 3), dtype=np.uint8))
+            attached = frame_ring.get_ring(stream_url)
+            with override_settings(FRAME_RING_MAX_AGE=-1):
+                self.assertIsNone(frame_ring.latest_frame(stream_url))
+
+            self.assertNotIn(ring.name, frame_ring._attached)
+            self.assertIsNone(attached.header)
+            self.assertIsNone(attached.latest())
+
+
+@skipUnless(find_spec('numpy'), 'numpy chưa được cài đặt')
+class ImageCodecTests(SimpleTestCase):
+    def setUp(self):
+        import numpy as np
+
+        self.image = np.zeros((480, 640, 3), dtype=np.uint8)
+        self.image[:, :, 2] = 200  # Đỏ (BGR)
+
+    def test_pil_roundtrip_keeps_bgr_and_scales_in_dct_domain(self):
+        from .services import image_codec
+
+        data = image_codec.encode_jpeg(self.image, quality=90, subsampling='444', using='pil')
+
+        self.assertEqual(image_codec.jpeg_dimensions(data), (640, 480))
+        full = image_codec.decode_jpeg(data, using='pil')
+        self.assertEqual(full.shape, (480, 640, 3))
+        self.assertGreater(int(full[:, :, 2].mean()), 180)
+        self.assertLess(int(full[:, :, 0].mean()), 20)
+        self.assertEqual(image_codec.dct_scale(640, 480, 150), 4)
+        self.assertEqual(image_codec.decode_jpeg(data, target_side=150, using='pil').shape, (120, 160, 3))
+
+    def test_shrink_jpeg_only_touches_large_jpegs(self):
+        from .services import image_codec
+
+        data = image_codec.encode_jpeg(self.image, using='pil')
+
+        self.assertEqual(image_codec.jpeg_dimensions(image_codec.shrink_jpeg(data, 320)), (320, 240))
+        self.assertIs(image_codec.shrink_jpeg(data, 1280), data)
+        self.assertEqual(image_codec.shrink_jpeg(b'\x89PNG....', 320), b'\x89PNG....')
+
+    def test_shrink_jpeg_applies_exif_orientation(self):
+        from io import BytesIO
+        from PIL import Image
+        from .services import image_codec
+
+        shrunk = image_codec.shrink_jpeg(rotated_exif_jpeg(3000, 2000, orientation=6), 1280)
+
+        with Image.open(BytesIO(shrunk)) as image:
+            self.assertEqual(image.size, (853, 1280))
+            self.assertEqual(image.getexif().get(0x0112, 1), 1)
+            red, green, _ = image.convert('RGB').getpixel((840, 10))  # góc trên-trái xoay 90° -> trên-phải
+        self.assertGreater(red, 150)
+        self.assertLess(green, 100)
+        self.assertEqual(image_codec.exif_orientation(shrunk), 1)
+
+    def test_iter_mjpeg_splits_frames_across_chunks(self):
+        from .services.image_codec import iter_mjpeg
+
+        stream = (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n\xff\xd8one\xff\xd9\r\n'
+                  b'--frame\r\n\r\n\xff\xd8two\xff\xd9\r\n')
+        chunks = [stream[i:i + 5] for i in range(0, len(stream), 5)]
+
+        self.assertEqual(list(iter_mjpeg(chunks)), [b'\xff\xd8one\xff\xd9', b'\xff\xd8two\xff\xd9'])
+
+
+@skipUnless(find_spec('numpy'), 'numpy chưa được cài đặt')
+class VideoDatasetTests(SimpleTestCase):
+    OPTIONS = {'stride': 1, 'threshold': 0.05, 'min_gap': 2, 'max_gap': 0, 'batch': 2, 'confidence': 0.25,
+               'imgsz': None, 'val_fraction': 0.0, 'quality': 80}
+
+    class FakeDetector:
+        model = None
+
+        def detect_batch(self, images, confidence_threshold=0.5, imgsz=None):
+            return [[{'bbox': {'x1': 10.0, 'y1': 20.0, 'x2': 110.0, 'y2': 70.0}, 'class_id': 0}] for _ in images]
+
+    def test_samples_scene_changes_prelabels_and_resumes(self):
+        import tempfile
+        from pathlib import Path
+        from unittest import mock
+        from .benchmarks.fixtures import synthetic_leaf_jpegs
+        from .services import video_dataset
+
+        with tempfile.TemporaryDirectory() as workdir:
+            video = Path(workdir) / 'rec.mjpeg'
+            # 3 cảnh, mỗi cảnh 4 frame giống nhau
+            video.write_bytes(b''.join(jpeg for jpeg in synthetic_leaf_jpegs(3, (320, 240)) for _ in range(4)))
+            out = Path(workdir) / 'dataset'
+            job = video_dataset.plan_jobs([video])[0]
+
+            with mock.patch.object(video_dataset, '_detector', self.FakeDetector()):
+                result = video_dataset.process_job(job, str(out), self.OPTIONS)
+
+            self.assertEqual(result['kept'], 3)
+            self.assertEqual(sorted(p.name for p in (out / 'images' / 'train').iterdir()),
+                             ['rec_0000000.jpg', 'rec_0000004.jpg', 'rec_0000008.jpg'])
+            label = (out / 'labels' / 'train' / 'rec_0000004.txt').read_text().split()
+            self.assertEqual(label, ['0', '0.187500', '0.187500', '0.312500', '0.208333'])
+
+            # Job bị ngắt sau lô đầu tiên -> chạy lại chỉ xử lý phần còn lại
+            video_dataset.save_progress(out, job, {**result, 'next_frame': 5, 'last_kept': 4, 'kept': 2,
+                                                   'done': False})
+            resumed = video_dataset.process_job(job, str(out), self.OPTIONS)
+            self.assertEqual((resumed['kept'], resumed['skipped']), (3, False))
+            self.assertTrue(video_dataset.process_job(job, str(out), self.OPTIONS)['skipped'])
+
+
+@skipUnless(find_spec('numpy'), 'numpy chưa được cài đặt')
+class ImageDedupTests(SimpleTestCase):
+    def test_index_matches_brute_force(self):
+        import random
+        from .services.image_dedup import HammingIndex
+
+        rng = random.Random(7)
+        hashes = [rng.getrandbits(64) for _ in range(300)]
+        hashes += [value ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for value in hashes[:100]]
+        index = HammingIndex(radius=3)
+        for value in hashes:
+            index.add(value)
+        for value in hashes[:50]:
+            expected = sorted(i for i, other in enumerate(hashes) if bin(value ^ other).count('1') <= 3)
+            self.assertEqual(sorted(item_id for item_id, _ in index.query(value)), expected)
+
+    def test_dataset_near_duplicates_are_moved_with_labels(self):
+        import tempfile
+        from pathlib import Path
+        from .benchmarks.fixtures import synthetic_leaf_jpegs
+        from .services import image_codec, video_dataset
+
+        with tempfile.TemporaryDirectory() as workdir:
+            out = Path(workdir)
+            (out / 'images' / 'train').mkdir(parents=True)
+            (out / 'labels' / 'train').mkdir(parents=True)
+            # 3 cảnh khác nhau, mỗi cảnh thêm 2 bản mã hóa lại ở chất lượng thấp hơn
+            for scene, jpeg in enumerate(synthetic_leaf_jpegs(3, (320, 240))):
+                image = image_codec.decode_jpeg(jpeg, using='pil')
+                for copy, quality in enumerate((90, 60, 40)):
+                    name = f'rec_{scene * 3 + copy:07d}'
+                    (out / 'images' / 'train' / f'{name}.jpg').write_bytes(
+                        image_codec.encode_jpeg(image, quality, using='pil'))
+                    (out / 'labels' / 'train' / f'{name}.txt').write_text('0 0.5 0.5 0.1 0.1\n')
+
+            report = video_dataset.remove_near_duplicates(out, radius=4, workers=2)
+
+            self.assertEqual((report['images'], report['kept'], report['duplicates']), (9, 3, 6))
+            self.assertEqual([cluster['collapsed'] for cluster in report['largest']], [2, 2, 2])
+            self.assertEqual(sorted(p.name for p in (out / 'images' / 'train').iterdir()),
+                             ['rec_0000000.jpg', 'rec_0000003.jpg', 'rec_0000006.jpg'])
+            self.assertEqual(len(list((out / 'duplicates' / 'labels' / 'train').iterdir())), 6)
+            self.assertTrue((out / 'dedup_report.json').exists())
+
+
+class CaptureStatsTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from .models import Plant
+
+        self.user = User.objects.create_user('stats', password='x')
+        self.mint = Plant.objects.create(name='Bạc hà')
+        self.basil = Plant.objects.create(name='Húng quế')
+
+    def capture(self, plant, confidence, **kwargs):
+        from .models import CaptureResult
+        return CaptureResult.objects.create(**{'user': self.user, 'plant': plant, 'confidence': confidence,
+                                               'success': True, **kwargs})
+
+    def assert_stats(self, plant, count, minimum=None, maximum=None):
+        from .models import DailyPlantCaptureStats, PlantCaptureStats, UserPlantCaptureStats
+
+        for model, keys in ((PlantCaptureStats, {}), (UserPlantCaptureStats, {'user': self.user}),
+                            (DailyPlantCaptureStats, {})):
+            rows = model.objects.filter(plant=plant, **keys)
+            if not count:
+                self.assertFalse(rows.exists(), model.__name__)
+                continue
+            row = rows.get()
+            self.assertEqual((row.capture_count, row.confidence_min, row.confidence_max),
+                             (count, minimum, maximum), model.__name__)
+
+    def test_insert_delete_and_plant_change_keep_tables_exact(self):
+        from .services.capture_stats import rebuild_capture_stats
+
+        low = self.capture(self.mint, 0.5)
+        high = self.capture(self.mint, 0.9)
+        self.capture(self.mint, None, name='không có độ tin cậy')
+        self.capture(self.mint, 0.99, success=False)  # tra cứu thất bại không được tính
+        self.assert_stats(self.mint, 3, 0.5, 0.9)
+
+        high.delete()
+        self.assert_stats(self.mint, 2, 0.5, 0.5)
+
+        low.plant = self.basil
+        low.save()
+        self.assert_stats(self.mint, 1)
+        self.assert_stats(self.basil, 1, 0.5, 0.5)
+
+        low.confidence = 0.7
+        low.save(update_fields=['confidence'])
+        self.assert_stats(self.basil, 1, 0.7, 0.7)
+
+        low.delete()
+        self.assert_stats(self.basil, 0)
+
+        # Số liệu tăng dần phải khớp với tính lại từ đầu
+        from .models import PlantCaptureStats
+        incremental = list(PlantCaptureStats.objects.values_list('plant_id', 'capture_count', 'confidence_count'))
+        rebuild_capture_stats()
+        self.assertEqual(list(PlantCaptureStats.objects.values_list('plant_id', 'capture_count', 'confidence_count')),
+                         incremental)
+
+    def test_migration_backfills_existing_captures(self):
+        from importlib import import_module
+        from django.db import connection
+        from django.db.migrations.loader import MigrationLoader
+        from .models import PlantCaptureStats
+
+        self.capture(self.mint, 0.5)
+        self.capture(self.mint, 0.9)
+        PlantCaptureStats.objects.all().delete()  # Dữ liệu có từ trước khi có bảng thống kê
+
+        migration = import_module('data_with_pi.migrations.0019_backfill_capture_stats')
+        with override_settings(MIGRATION_MODULES={}):  # Bộ test có thể tắt migration
+            loader = MigrationLoader(connection)
+        state = loader.project_state(('data_with_pi', '0019_backfill_capture_stats'))
+        migration.backfill_capture_stats(state.apps, None)  # Model lịch sử như khi migrate
+
+        self.assert_stats(self.mint, 2, 0.5, 0.9)
+
+
+class PopularityCounterTests(TestCase):
+    def setUp(self):
+        from .models import Plant, Recipe
+
+        plant = Plant.objects.create(name='Gừng')
+        self.recipes = [Recipe.objects.create(plant=plant, name=f'Trà gừng {i}', main_ingredient='gừng',
+                                              preparation_steps='sắc', usage_method='oral', dosage='1 chén')
+                        for i in range(2)]
+
+    def test_buffers_then_flushes_in_one_update(self):
+        from .services.popularity import PopularityCounter
+
+        counter = PopularityCounter(flush_interval=3600, flush_threshold=5)
+        first, second = self.recipes
+        self.assertEqual([counter.increment(first.id) for _ in range(3)], [1, 2, 3])
+        counter.increment(second.id)
+        counter.stop()
+        first.refresh_from_db()
+        self.assertEqual((first.popularity, counter.pending(first.id)), (0, 3))
+
+        with self.assertNumQueries(1):
+            counter.increment(second.id)  # đủ ngưỡng -> flush
+        for recipe in self.recipes:
+            recipe.refresh_from_db()
+        self.assertEqual([recipe.popularity for recipe in self.recipes], [3, 2])
+        self.assertEqual(counter.pending(first.id), 0)
+
+    def test_failed_flush_keeps_views_for_next_time(self):
+        from unittest import mock
+        from .models import Recipe
+        from .services.popularity import PopularityCounter
+
+        counter = PopularityCounter(flush_interval=3600, flush_threshold=1000)
+        counter.increment(self.recipes[0].id, 4)
+        counter.stop()
+        with mock.patch.object(Recipe.objects, 'filter', side_effect=RuntimeError('db down')):
+            self.assertEqual(counter.flush(), 0)
+        self.assertEqual(counter.pending(self.recipes[0].id), 4)
+        self.assertEqual(counter.flush(), 1)
+        self.recipes[0].refresh_from_db()
+        self.assertEqual(self.recipes[0].popularity, 4)
+
+    def test_idle_worker_is_flushed_by_timer(self):
+        from unittest import mock
+        from .services.popularity import PopularityCounter
+
+        counter = PopularityCounter(flush_interval=0.05, flush_threshold=1000)
+        flushed = threading.Event()
+        with mock.patch.object(counter, 'flush', side_effect=lambda: flushed.set()):
+            counter.increment(self.recipes[0].id)
+            self.assertTrue(flushed.wait(2))
+            counter.stop()
+
+
+class CsvImportTests(TestCase):
+    FIELDS = ['name', 'scientific_name', 'english_name', 'vietnamese_name', 'description', 'biological_info',
+              'medicinal_info', 'usage', 'common_locations']
+
+    def write_csv(self, directory, rows):
+        import csv
+        path = os.path.join(directory, 'plants.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, self.FIELDS)
+            writer.writeheader()
+            for name, scientific_name in rows:
+                writer.writerow({**dict.fromkeys(self.FIELDS, ''), 'name': name, 'scientific_name': scientific_name})
+        return path
+
+    def seed(self, path, *args):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('seed_plants', '--file', path, '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_seed_plants_creates_updates_and_dry_runs(self):
+        import tempfile
+        from .models import Plant
+
+        with tempfile.TemporaryDirectory() as workdir:
+            rows = [('Bạc hà', 'Mentha'), ('Gừng', 'Zingiber'), ('Nghệ', 'Curcuma')]
+            path = self.write_csv(workdir, rows)
+
+            self.assertIn('DRY-RUN', self.seed(path, '--dry-run'))
+            self.assertFalse(Plant.objects.exists())
+
+            output = self.seed(path)
+            self.assertIn('- Tạo mới: 3', output)
+            self.assertEqual(Plant.objects.get(name='Gừng').scientific_name, 'Zingiber')
+
+            # Sửa một dòng + dòng trùng tên trong cùng lô (dòng sau thắng)
+            path = self.write_csv(workdir, rows[:2] + [('Nghệ', 'Curcuma longa'), ('Nghệ', 'Curcuma longa L.')])
+            output = self.seed(path)
+            self.assertIn('- Cập nhật: 1', output)
+            self.assertIn('- Không đổi: 2', output)
+            self.assertEqual(Plant.objects.get(name='Nghệ').scientific_name, 'Curcuma longa L.')
+            self.assertEqual(Plant.objects.count(), 3)
+
+    def test_error_rolls_back_every_batch(self):
+        from .models import Plant
+        from .services.csv_import import BulkCSVImporter
+
+        def rows():
+            for i in range(5):
+                yield {'name': f'Cây {i}'}
+            raise ValueError('dòng lỗi')
+
+        with self.assertRaises(ValueError):
+            BulkCSVImporter(Plant, key_fields=('name',), batch_size=2).run(rows())
+        self.assertFalse(Plant.objects.exists())
+
+    def test_changed_keys_invalidate_catalog_in_one_delete_many(self):
+        from unittest import mock
+        from .models import Plant, Recipe
+        from .services import catalog_cache
+        from .services.csv_import import BulkCSVImporter
+
+        mint, ginger = Plant.objects.create(name='Bạc hà'), Plant.objects.create(name='Gừng')
+        tea = Recipe.objects.create(plant=ginger, name='Trà gừng', main_ingredient='gừng')
+        rows = [{'plant_id': mint.id, 'name': 'Trà bạc hà', 'main_ingredient': 'bạc hà'},
+                {'plant_id': ginger.id, 'name': 'Trà gừng', 'main_ingredient': 'gừng tươi'},
+                {'plant_id': ginger.id, 'name': 'Trà gừng', 'main_ingredient': 'gừng tươi'}]
+        importer = BulkCSVImporter(Recipe, key_fields=('plant_id', 'name'), batch_size=2,
+                                   track_fields=('pk', 'plant_id'))
+        committed = []
+        with self.captureOnCommitCallbacks(execute=True):
+            result = importer.run(rows, on_commit=committed.append)
+
+        created = Recipe.objects.get(name='Trà bạc hà')
+        self.assertEqual(committed, [result])
+        self.assertEqual(sorted(result.changed_keys), sorted([(created.pk, mint.id), (tea.pk, ginger.id)]))
+
+        with mock.patch.object(catalog_cache.cache, 'delete_many') as delete_many:
+            catalog_cache.invalidate_many(plant_ids=[mint.id, ginger.id], recipes=result.changed_keys)
+        delete_many.assert_called_once()
+        self.assertEqual(set(delete_many.call_args.args[0]), {
+            catalog_cache.HOME_KEY, *(catalog_cache.PLANT_KEY.format(pk) for pk in (mint.id, ginger.id)),
+            *(catalog_cache.RECIPE_KEY.format(pk) for pk in (created.pk, tea.pk))})
+
+
+class CatalogConditionalTests(TestCase):
+    """ETag / 304 của trang chủ, trang cây, trang công thức và việc xóa cache khi dữ liệu đổi"""
+
+    def setUp(self):
+        import tempfile
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        from .models import Plant, Recipe
+
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(User.objects.create_user('catalog', password='x'))
+        self.plant = Plant.objects.create(name='Gừng', scientific_name='Zingiber')
+        self.recipe = Recipe.objects.create(plant=self.plant, name='Trà gừng', main_ingredient='gừng',
+                                            is_verified=True)
+        self.urls = {'home': '/', 'plant': f'/plant/{self.plant.id}/', 'recipe': f'/recipe/{self.recipe.id}/'}
+
+    def etag(self, page):
+        response = self.client.get(self.urls[page])
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def revalidate(self, page, etag):
+        return self.client.get(self.urls[page], HTTP_IF_NONE_MATCH=etag).status_code
+
+    def test_repeat_get_with_etag_returns_304(self):
+        for page in self.urls:
+            self.assertEqual(self.revalidate(page, self.etag(page)), 304, page)
+
+    def test_saving_plant_recipe_or_image_changes_etag(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .models import RecipeImage
+
+        etags = {page: self.etag(page) for page in self.urls}
+        self.plant.scientific_name = 'Zingiber officinale'
+        self.plant.save()
+        for page in self.urls:
+            self.assertEqual(self.revalidate(page, etags[page]), 200, page)
+
+        etags = {page: self.etag(page) for page in ('plant', 'recipe')}
+        self.recipe.dosage = '2 lần/ngày'
+        self.recipe.save()
+        for page in ('plant', 'recipe'):
+            self.assertEqual(self.revalidate(page, etags[page]), 200, page)
+
+        etag = self.etag('recipe')
+        RecipeImage.objects.create(recipe=self.recipe, image=SimpleUploadedFile('tra.jpg', rotated_exif_jpeg()))
+        self.assertEqual(self.revalidate('recipe', etag), 200)
+
+    def test_new_capture_changes_plant_etag(self):
+        from django.contrib.auth.models import User
+        from .models import CaptureResult
+
+        etag = self.etag('plant')
+        CaptureResult.objects.create(user=User.objects.get(username='catalog'), plant=self.plant,
+                                     confidence=0.9, success=True)
+        self.assertEqual(self.revalidate('plant', etag), 200)
+
+    def test_pending_flash_message_disables_304(self):
+        etag = self.etag('home')
+        with self.assertLogs('data_with_pi.views', 'ERROR'):
+            self.client.post('/upload/')  # Không có file -> flash message lỗi, redirect
+
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Vui lòng chọn file ảnh.')
+        self.assertEqual(self.revalidate('home', etag), 304)  # Message đã hiển thị
+
+    def test_bulk_csv_import_invalidates_catalog(self):
+        import csv
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+
+        def write(path, fields, row):
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fields)
+                writer.writeheader()
+                writer.writerow({**dict.fromkeys(fields, ''), **row})
+
+        etags = {page: self.etag(page) for page in self.urls}
+        with tempfile.TemporaryDirectory() as workdir:
+            plants_csv, recipes_csv = os.path.join(workdir, 'plants.csv'), os.path.join(workdir, 'recipes.csv')
+            write(plants_csv, CsvImportTests.FIELDS, {'name': 'Gừng', 'scientific_name': 'Zingiber officinale'})
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('seed_plants', '--file', plants_csv, stdout=StringIO())
+            for page in ('home', 'plant'):
+                self.assertEqual(self.revalidate(page, etags[page]), 200, page)
+
+            etag = self.etag('recipe')
+            write(recipes_csv, ['plant_name', 'name', 'recipe_type', 'difficulty', 'usage_method', 'description',
+                                'treats', 'benefits', 'main_ingredient', 'preparation_steps', 'preparation_time',
+                                'dosage', 'notes'],
+                  {'plant_name': 'Gừng', 'name': 'Trà gừng', 'main_ingredient': 'gừng tươi'})
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('import_recipes', '--file', recipes_csv, stdout=StringIO())
+            self.assertEqual(self.revalidate('recipe', etag), 200)
+
+
+def rotated_exif_jpeg(width=600, height=400, orientation=6):
+    """JPEG ngang width x height có tag EXIF Orientation (6 = xoay 90° -> hiển thị dọc)"""
+    from io import BytesIO
+    from PIL import Image
+
+    image = Image.new('RGB', (width, height), (40, 160, 60))
+    image.paste((200, 30, 30), (0, 0, width // 4, height // 4))  # góc đánh dấu để kiểm tra hướng
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=90, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+class ImageVariantsTests(TestCase):
+    def test_variants_are_upright_and_content_addressed(self):
+        import tempfile
+        from django.core.files.storage import FileSystemStorage
+        from .services.image_variants import render_variants, store_variants
+
+        digest, width, rendered = render_variants(rotated_exif_jpeg(1200, 800))
+        self.assertEqual(width, 800)  # đã xoay theo EXIF: ảnh dọc 800x1200
+        self.assertEqual(rendered['thumb'][0], 320)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            storage = FileSystemStorage(location=workdir)
+            first = store_variants(digest, width, rendered, storage)
+            self.assertEqual(store_variants(digest, width, rendered, storage), first)
+
+            class RacingStorage(FileSystemStorage):
+                """Lần exists() đầu của mỗi file trả về False, như khi process khác ghi xen giữa exists() và save()"""
+                checked = set()
+
+                def exists(self, name):
+                    if name not in self.checked:
+                        self.checked.add(name)
+                        return False
+                    return super().exists(name)
+
+            raced = store_variants(digest, width, rendered, RacingStorage(location=workdir))
+            self.assertEqual(raced, first)
+            files = [name for _, _, names in os.walk(workdir) for name in names]
+            self.assertEqual(len(files), 4)  # thumb/medium x jpeg/webp, không có bản trùng
+
+    def test_upload_generates_variants_on_save(self):
+        import tempfile
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .models import Plant
+
+        with tempfile.TemporaryDirectory() as workdir, override_settings(MEDIA_ROOT=workdir):
+            plant = Plant.objects.create(name='Tía tô', image=SimpleUploadedFile('tia_to.jpg', rotated_exif_jpeg()))
+            self.assertEqual(sorted(plant.image_variants['variants']), ['medium', 'thumb'])
+            self.assertTrue(plant.image_thumb_url.endswith('/thumb.jpg'))
+            self.assertIn(' 320w', plant.image_srcset)
+
+
+class PiImageDeviceTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.pis = [FakePi('station'), FakePi('other')]
+        self.fleet = PiFleet(devices=[(pi.name, pi.base_url, True) for pi in self.pis])
+        self.user = User.objects.create_user('images', password='x')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        for pi in self.pis:
+            pi.close()
+
+    def test_history_image_is_served_by_the_device_that_stored_it(self):
+        import tempfile
+        from unittest import mock
+        from . import views
+        from .models import CaptureResult
+
+        CaptureResult.objects.create(user=self.user, name='Ocimum', image_file='other_1.jpg',
+                                     pi_device=self.pis[1].base_url, success=True)
+        with tempfile.TemporaryDirectory() as media, override_settings(PI_IMAGE_CACHE_DIR=media), \
+                mock.patch.object(views, 'pi_fleet', self.fleet):
+            saved = self.client.get('/api/pi/image/other_1.jpg/')
+            preview = self.client.get('/api/pi/image/station_1.jpg/')  # chưa lưu -> trạm của user
+
+        self.assertEqual((saved.status_code, preview.status_code), (200, 200))
+        self.assertEqual([pi.images for pi in self.pis], [1, 1])
+
+
+class PiImageCacheTests(SimpleTestCase):
+    class SlowPi:
+        base_url = 'http://pi.test'
+
+        def __init__(self, size=1000, delay=0.0, payload=None, fail_first=False):
+            self.size = size
+            self.delay = delay
+            self.payload = payload
+            self.fail_first = fail_first
+            self.fetches = []
+            self.active = self.max_active = 0
+            self._lock = threading.Lock()
+
+        def get_history_image(self, filename):
+            with self._lock:
+                self.fetches.append(filename)
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            time.sleep(self.delay)
+            with self._lock:
+                self.active -= 1
+                if self.fail_first and len(self.fetches) == 1:
+                    return None  # Pi lỗi lần đầu, các request đang chờ sẽ tải lại
+            return self.payload or filename.encode().ljust(self.size, b'\0')
+
+    def test_evicts_least_recently_used(self):
+        import tempfile
+        from .services.pi_image_cache import PiImageCache
+
+        with tempfile.TemporaryDirectory() as workdir:
+            pi = self.SlowPi(size=1000)
+            cache = PiImageCache(pi, workdir, max_bytes=2500)
+            for age, filename in enumerate(('a.jpg', 'b.jpg')):
+                os.utime(cache.get(filename), (1000 + age, 1000 + age))  # mtime cố định: b mới hơn a
+            cache.get('a.jpg')  # truy cập lại -> a thành mới nhất
+            cache.get('c.jpg')  # vượt 2500 byte -> evict về 90%
+
+            self.assertTrue(cache._path('a.jpg', 'full').exists())
+            self.assertFalse(cache._path('b.jpg', 'full').exists())
+            self.assertTrue(cache._path('c.jpg', 'full').exists())
+            self.assertEqual(cache.disk_usage(), 2000)
+
+            with cache.open('b.jpg') as f:  # đã bị evict -> tải lại
+                self.assertTrue(f.read().startswith(b'b.jpg'))
+            self.assertEqual(pi.fetches, ['a.jpg', 'b.jpg', 'c.jpg', 'b.jpg'])
+
+    def test_concurrent_gets_never_download_twice_at_once(self):
+        import tempfile
+        from .services.pi_image_cache import PiImageCache
+
+        with tempfile.TemporaryDirectory() as workdir:
+            pi = self.SlowPi(delay=0.1, payload=rotated_exif_jpeg(), fail_first=True)
+            cache = PiImageCache(pi, workdir, max_bytes=10 ** 6)
+
+            def fetch(i):
+                time.sleep(0.01 * i)  # đến lệch nhau trong suốt hai lần tải
+                return cache.get('leaf.jpg', 'thumb' if i % 2 else 'full')
+
+            with ThreadPoolExecutor(max_workers=24) as pool:
+                paths = list(pool.map(fetch, range(24)))
+
+            self.assertEqual((pi.max_active, len(pi.fetches)), (1, 2))
+            self.assertIsNone(paths[0])  # request đầu nhận lỗi của Pi
+            self.assertEqual({path.name.rsplit('_', 1)[1] for path in paths[1:]}, {'full.jpg', 'thumb.jpg'})
+            self.assertEqual(cache._locks, {})
+
+    def test_open_treats_eviction_race_as_miss(self):
+        import tempfile
+        from unittest import mock
+        from .services.pi_image_cache import PiImageCache
+
+        with tempfile.TemporaryDirectory() as workdir:
+            pi = self.SlowPi()
+            cache = PiImageCache(pi, workdir, max_bytes=10 ** 6)
+            real_get = cache.get
+
+            def get_then_evict(filename, size='full'):
+                path = real_get(filename, size)
+                if len(pi.fetches) == 1:
+                    path.unlink()  # bị evict ngay sau khi get() trả về
+                return path
+
+            with mock.patch.object(cache, 'get', side_effect=get_then_evict):
+                with cache.open('x.jpg') as f:
+                    self.assertTrue(f.read().startswith(b'x.jpg'))
+            self.assertEqual(len(pi.fetches), 2)
+
+    def test_size_cap_is_shared_by_every_pi_and_process(self):
+        import tempfile
+        from .services.pi_image_cache import PiImageCache, build_default_cache
+
+        with tempfile.TemporaryDirectory() as workdir, \
+                override_settings(PI_IMAGE_CACHE_DIR=workdir, PI_IMAGE_CACHE_MAX_BYTES=2500):
+            first, second = self.SlowPi(size=1000), self.SlowPi(size=1000)
+            first.base_url, second.base_url = 'http://pi-1:5000', 'http://pi-2:5000'
+            first_cache, second_cache = build_default_cache(first), build_default_cache(second)
+            os.utime(first_cache.get('a.jpg'), (1000, 1000))
+            os.utime(second_cache.get('a.jpg'), (1001, 1001))
+            # Worker khác của cùng Pi: không có bộ đếm chung trong tiến trình, chỉ có đĩa
+            other_worker = PiImageCache(first, first_cache.root, max_bytes=2500, budget_root=workdir)
+            other_worker.get('b.jpg')  # 3000 byte trên đĩa -> evict ảnh cũ nhất (của pi-1) về 90%
+
+            self.assertFalse(first_cache._path('a.jpg', 'full').exists())
+            self.assertTrue(second_cache._path('a.jpg', 'full').exists())
+            self.assertEqual(first_cache.disk_usage(), 2000)
+
+    def test_history_image_filename_is_quoted(self):
+        from unittest import mock
+
+        client = PiClient('http://pi:5000')
+        with mock.patch.object(client, '_request') as request:
+            client.get_history_image('lá #1?x=%20.jpg')
+
+        self.assertEqual(request.call_args.args, ('GET', '/history/image/l%C3%A1%20%231%3Fx%3D%2520.jpg'))
+        self.assertEqual(client.get_history_image_url('a#b.jpg'), 'http://pi:5000/history/image/a%23b.jpg')
+
+
+class CameraStatusTests(TestCase):
+    STATE = {'settings': {'mode': 'still'}, 'camera': {}, 'ui_settings': {}, 'resolution': {}, 'version': 'v1'}
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+
+        cache.clear()
+        self.client.force_login(User.objects.create_user('camera', password='x'))
+
+    def test_conditional_poll_does_not_call_pi_until_state_changes(self):
+        from unittest import mock
+        from .services.pi_client import PiClient
+
+        with mock.patch.object(PiClient, 'fetch_camera_state', return_value=dict(self.STATE)) as fetch, \
+                mock.patch.object(PiClient, '_request') as pi_request:
+            first = self.client.get('/api/camera/status/')
+            self.assertEqual((first.status_code, first['ETag']), (200, '"v1"'))
+
+            for _ in range(3):
+                self.assertEqual(self.client.get('/api/camera/status/', HTTP_IF_NONE_MATCH='"v1"').status_code, 304)
+            self.assertEqual(fetch.call_count, 1)
+
+            # Đổi mode qua server -> bỏ cache, lần poll sau hỏi lại Pi
+            pi_request.return_value.json.return_value = {'success': True}
+            self.client.post('/api/settings/mode/', {'mode': 'video'})
+            fetch.return_value = {**self.STATE, 'version': 'v2'}
+            changed = self.client.get('/api/camera/status/', HTTP_IF_NONE_MATCH='"v1"')
+            self.assertEqual((changed.status_code, changed['ETag'], fetch.call_count), (200, '"v2"', 2))
+
+    def test_error_state_is_not_cached(self):
+        from unittest import mock
+        from .services.pi_client import PiClient
+
+        broken = {**self.STATE, 'camera': {'error': 'timeout'}}
+        with mock.patch.object(PiClient, 'fetch_camera_state', return_value=broken) as fetch:
+            PiClient('http://pi.test').get_camera_state()
+            PiClient('http://pi.test').get_camera_state()
+        self.assertEqual(fetch.call_count, 2)
+
+
+class StatusStreamTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_user('stream', password='x'))
+
+    @override_settings(PI_STATUS_STREAM_MAX_AGE=1, PI_STATUS_POLL_INTERVAL=0.05)
+    def test_streams_snapshot_then_closes_for_reconnect(self):
+        from unittest import mock
+        from .services import pi_status_feed
+        from .services.pi_client import PiClient
+
+        pi_status_feed._feeds.clear()
+        with mock.patch.object(PiClient, 'get_status', return_value={'camera': {'state': 'streaming'}}):
+            started = time.monotonic()
+            response = self.client.get('/api/status/stream/')
+            body = b''.join(response.streaming_content).decode()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertTrue(body.startswith('retry: 3000'))
+        self.assertIn('event: status\ndata: {"camera": {"state": "streaming"}}', body)
+        self.assertEqual(body.count('event: status'), 1)  # trạng thái không đổi -> không phát lại
+
+    def test_rejects_non_get(self):
+        self.assertEqual(self.client.post('/api/status/stream/').status_code, 405)
@@ -22,11 +22,18 @@ urlpatterns = [
     path('api/capture/save/', views.api_save_capture_result, name='api_save_capture_result'),
     path('api/upload/analyze/', views.api_upload_analyze, name='api_upload_analyze'),
     path('api/status/', views.api_status, name='api_status'),
+    path('api/status/stream/', views.api_status_stream, name='api_status_stream'),
+    path('api/pi/fleet/', views.api_fleet_status, name='api_fleet_status'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('staff/profiles/', views.profiles_view, name='profiles'),
+    path('staff/profiles/<str:filename>', views.profile_download, name='profile_download'),
+    path('api/pi/image/<str:filename>/', views.api_pi_image, name='api_pi_image'),
     path('api/stream/pause/', views.api_pause_stream, name='api_pause_stream'),
     path('api/stream/resume/', views.api_resume_stream, name='api_resume_stream'),
     path('api/settings/', views.api_get_settings, name='api_get_settings'),
     path('api/settings/mode/', views.api_set_mode, name='api_set_mode'),
     path('api/settings/camera/', views.api_get_camera_settings, name='api_get_camera_settings'),
+    path('api/camera/status/', views.api_camera_status, name='api_camera_status'),
     path('api/settings/camera/set/', views.api_set_camera_settings, name='api_set_camera_settings'),
     path('api/settings/preset/', views.api_apply_preset, name='api_apply_preset'),
     path('api/settings/presets/', views.api_get_presets, name='api_get_presets'),
@@ -53,4 +60,6 @@ urlpatterns = [
     path('api/yolo/detect/', views.api_detect_leaves, name='api_detect_leaves'),
     path('api/yolo/crop/', views.api_crop_leaf, name='api_crop_leaf'),
     path('api/yolo/analyze/', views.api_analyze_cropped_leaf, name='api_analyze_cropped_leaf'),
+    path('api/yolo/pipeline/', views.api_yolo_pipeline, name='api_yolo_pipeline'),
+    path('api/yolo/ready/', views.api_yolo_ready, name='api_yolo_ready'),
 ]
\ No newline at end of file
@@ -8,25 +8,60 @@ from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 from django.contrib import messages
 from django.contrib.auth import login, authenticate
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.decorators.http import require_http_methods
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
-from .models import CaptureResult, Plant, UserCameraPreset
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from .models import CaptureResult, Plant, UserCameraPreset, PlantCaptureStats, UserPlantCaptureStats
 from .forms import UserProfileForm
 from .services.pi_client import PiClient
+from .services.popularity import popularity_counter
+from .services import catalog_cache, image_codec, metrics, perf, profiling
+from .services.pi_fleet import image_device, pi_fleet
+from .services.pi_image_cache import SIZES as PI_IMAGE_SIZES, get_image_cache, is_valid_filename
+from .services.pi_status_feed import format_sse, get_status_feed
 
-# Khởi tạo Pi client
-pi_client = PiClient()
 logger = logging.getLogger(__name__)
 
+
+def get_pi_station(request):
+    """Trạm Pi (PiDeviceState) của user, chỉ tra cứu một lần cho mỗi request"""
+    if not hasattr(request, '_pi_station'):
+        request._pi_station = pi_fleet.station_for(request.user)
+    return request._pi_station
+
+
+def get_pi_client(request) -> PiClient:
+    """PiClient của trạm chụp gắn với user (chụp ảnh, stream, cài đặt camera)"""
+    return get_pi_station(request).client
+
+
+def get_image_client(request, pi_device: str = '') -> PiClient:
+    """PiClient của trạm đang giữ ảnh (CaptureResult.pi_device); trạm không còn / chưa lưu -> trạm của user"""
+    device = pi_fleet.device_for_url(pi_device) if pi_device else None
+    return device.client if device is not None else get_pi_client(request)
+
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=catalog_cache.home_etag, last_modified_func=catalog_cache.home_last_modified_for)
 def home(request):
     """Trang chủ - hiển thị khác nhau cho user đã đăng nhập/chưa đăng nhập"""
-    # Lấy 34 cây thuốc từ database
+    # Lấy 34 cây thuốc từ database (queryset lazy - chỉ chạy khi fragment cache hết hạn)
     plants = Plant.objects.exclude(name__in=['Background', 'Green_but_not_leaf']).order_by('name')[:34]
-    return render(request, 'home.html', {'plants': plants})
+    capture_count = request.user.captures.count() if request.user.is_authenticated else 0
+    return render(request, 'home.html', {
+        'plants': plants,
+        'capture_count': capture_count,
+        'catalog_version': catalog_cache.home_last_modified(),
+        'catalog_timeout': catalog_cache.CATALOG_CACHE_TIMEOUT,
+    })
 
 
 def register(request):
@@ -78,7 +113,14 @@ def logout_view(request):
 @login_required
 def profile(request):
     """Xem thông tin tài khoản"""
-    return render(request, 'profile.html')
+    # Thống kê đọc từ bảng tổng hợp (không GROUP BY trên CaptureResult)
+    plant_stats = list(
+        UserPlantCaptureStats.objects.filter(user=request.user).select_related('plant').order_by('-capture_count')
+    )
+    return render(request, 'profile.html', {
+        'plant_stats': plant_stats[:10],
+        'total_captures': sum(stats.capture_count for stats in plant_stats),
+    })
 
 
 @login_required
@@ -98,24 +140,24 @@ def edit_profile(request):
 @login_required
 def search(request):
     """Trang tra cứu - yêu cầu đăng nhập"""
-    status = pi_client.get_status()
-    stream_url = pi_client.get_stream_url()
+    status = get_pi_client(request).get_status()
+    stream_url = get_pi_client(request).get_stream_url()
     return render(request, 'search.html', {
         'stream_url': stream_url,
         'pi_status': status,
-        'pi_base': pi_client.base_url,
+        'pi_base': get_pi_client(request).base_url,
     })
 
 
 @login_required
 def record(request):
     """Trang quay video - yêu cầu đăng nhập"""
-    status = pi_client.get_status()
-    stream_url = pi_client.get_stream_url()
+    status = get_pi_client(request).get_status()
+    stream_url = get_pi_client(request).get_stream_url()
     return render(request, 'record.html', {
         'stream_url': stream_url,
         'pi_status': status,
-        'pi_base': pi_client.base_url,
+        'pi_base': get_pi_client(request).base_url,
     })
 
 
@@ -179,6 +221,7 @@ def api_save_capture_result(request):
             name=label,
             confidence=confidence,
             image_file=file,
+            pi_device=get_pi_station(request).base_url if file else '',
             local_image=None,
             success=True,
             source='pi',
@@ -211,7 +254,7 @@ def api_save_capture_result(request):
                 'medicinal_info': plant.medicinal_info or '',
                 'confidence': confidence,
                 'image_file': file,
-                'image_url': image_url or f"{pi_client.base_url}/history/image/{file}",
+                'image_url': image_url or (reverse('api_pi_image', args=[file]) if file else ''),
                 'image_size_bytes': image_size_bytes,
                 'created_at': capture_record.created_at.isoformat(),
             }
@@ -223,6 +266,17 @@ def api_save_capture_result(request):
         logger.error(f"[Save Capture] Error: {e}", exc_info=True)
         return JsonResponse({"success": False, "error": str(e)}, status=500)
 
+def _classifier_payload(data_bytes):
+    """
+    Ảnh gửi Pi để phân loại: classifier chỉ cần ảnh nhỏ, nên JPEG có cạnh dài > IMAGE_UPLOAD_MAX_SIDE
+    được giải mã thu nhỏ (miền DCT), xoay đúng chiều theo EXIF và mã hóa lại; PNG/WebP và ảnh nhỏ gửi nguyên
+    """
+    from django.conf import settings as django_settings
+    
+    with perf.span('upload.shrink'):
+        return image_codec.shrink_jpeg(data_bytes, django_settings.IMAGE_UPLOAD_MAX_SIDE)
+
+
 @login_required
 @require_http_methods(["POST"])
 def upload_analyze(request):
@@ -247,9 +301,10 @@ def upload_analyze(request):
     
     # Đọc file vào memory
     data_bytes = f.read()
+    metrics.UPLOAD_SIZE_BYTES.labels('upload').observe(len(data_bytes))
     
-    # Gọi Pi API
-    resp = pi_client.upload_image(data_bytes, f.name, f.content_type)
+    # Gọi Pi API (ảnh JPEG lớn được thu nhỏ trước khi gửi, file lưu local vẫn là ảnh gốc)
+    resp = pi_fleet.upload_image(_classifier_payload(data_bytes), f.name, f.content_type)
     
     if not resp.get('success'):
         error_msg = resp.get('error', 'Lỗi không xác định')
@@ -282,6 +337,7 @@ def upload_analyze(request):
             name=label,
             confidence=resp.get('confidence'),
             image_file=resp.get('file', ''),
+            pi_device=image_device(resp),
             local_image=local_path,
             success=True,
             source='upload',
@@ -316,9 +372,10 @@ def api_upload_analyze(request):
     try:
         # Read file
         data_bytes = f.read()
+        metrics.UPLOAD_SIZE_BYTES.labels('api_upload').observe(len(data_bytes))
         
         # Call Pi API
-        resp = pi_client.upload_image(data_bytes, f.name, f.content_type)
+        resp = pi_fleet.upload_image(_classifier_payload(data_bytes), f.name, f.content_type)
         
         if not resp.get('success'):
             error_msg = resp.get('error', 'Unknown error from Pi server')
@@ -341,31 +398,40 @@ def api_upload_analyze(request):
 @login_required
 def history(request):
     """Lịch sử tra cứu - chỉ hiển thị của user hiện tại"""
-    # Lấy lịch sử từ Pi (optional)
-    pi_history = pi_client.get_history(limit=50)
-    pi_files = pi_history.get('files', []) if pi_history.get('success') else []
-    
     # Lấy kết quả từ database
-    results = CaptureResult.objects.filter(user=request.user).select_related('plant').order_by('-created_at')[:50]
+    results = list(CaptureResult.objects.filter(user=request.user).select_related('plant').order_by('-created_at')[:50])
+    
+    # Ảnh nằm trên Pi được tải trước vào cache của server (chạy nền), theo trạm đang giữ ảnh
+    by_device = {}
+    for r in results:
+        if r.image_file and not r.local_image:
+            by_device.setdefault(r.pi_device, []).append(r.image_file)
+    for pi_device, filenames in by_device.items():
+        get_image_cache(get_image_client(request, pi_device)).prefetch(filenames)
     
     return render(request, 'history.html', {
-        'pi_base': pi_client.base_url,
-        'pi_files': pi_files,
         'results': results,
     })
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=catalog_cache.plant_etag)
 def plant_detail(request, plant_id):
     """Trang chi tiết thông tin cây/thực vật"""
-    plant = get_object_or_404(Plant.objects.prefetch_related('captures', 'recipes'), id=plant_id)
+    plant = get_object_or_404(Plant, id=plant_id)
     recent_captures = plant.captures.filter(user=request.user).order_by('-created_at')[:10]
     recipes = plant.recipes.filter(is_verified=True).order_by('-popularity', 'name')
+    plant_stats = PlantCaptureStats.objects.filter(plant=plant).first()
+    user_stats = UserPlantCaptureStats.objects.filter(plant=plant, user=request.user).first()
     return render(request, 'plant_detail.html', {
         'plant': plant,
         'recent_captures': recent_captures,
         'recipes': recipes,
-        'pi_base': pi_client.base_url,
+        'plant_stats': plant_stats,
+        'user_stats': user_stats,
+        'catalog_version': catalog_cache.plant_last_modified(plant.id),
+        'catalog_timeout': catalog_cache.CATALOG_CACHE_TIMEOUT,
     })
 
 
@@ -373,36 +439,62 @@ def plant_detail(request, plant_id):
 def test(request):
     """Trang test - copy của search page để test các tính năng mới"""
     return render(request, 'test.html', {
-        'pi_base': pi_client.base_url,
-        'stream_url': pi_client.get_stream_url(),
+        'pi_base': get_pi_client(request).base_url,
+        'stream_url': get_pi_client(request).get_stream_url(),
     })
 
 
 @login_required
 def recipe_detail(request, recipe_id):
     """Trang chi tiết công thức thuốc"""
+    # Tăng độ phổ biến khi xem - kể cả khi trả 304 (ghi DB theo lô)
+    pending_views = popularity_counter.increment(recipe_id)
+    return _render_recipe_detail(request, recipe_id=recipe_id, pending_views=pending_views)
+
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=catalog_cache.recipe_etag, last_modified_func=catalog_cache.recipe_last_modified_for)
+def _render_recipe_detail(request, recipe_id, pending_views=0):
+    """Render trang công thức (ETag không tính lượt xem nên số lượt xem có thể cũ khi trả 304)"""
     from .models import Recipe
-    recipe = get_object_or_404(
-        Recipe.objects.select_related('plant', 'created_by').prefetch_related('images'),
-        id=recipe_id
-    )
-    
-    # Tăng độ phổ biến khi xem
-    recipe.popularity += 1
-    recipe.save(update_fields=['popularity'])
+    recipe = get_object_or_404(Recipe.objects.select_related('plant', 'created_by'), id=recipe_id)
+    recipe.popularity += pending_views
     
     return render(request, 'recipe_detail.html', {
         'recipe': recipe,
+        'catalog_version': catalog_cache.recipe_last_modified(recipe.id),
+        'catalog_timeout': catalog_cache.CATALOG_CACHE_TIMEOUT,
     })
 
 
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def api_pi_image(request, filename):
+    """Proxy ảnh chụp trên Pi qua cache đĩa của server (?size=thumb để lấy thumbnail)"""
+    size = request.GET.get('size', 'full')
+    if size not in PI_IMAGE_SIZES or not is_valid_filename(filename):
+        raise Http404("Ảnh không hợp lệ")
+    
+    # Ảnh đã lưu lịch sử được lấy từ trạm ghi trong CaptureResult (user có thể đã đổi trạm)
+    pi_device = (CaptureResult.objects.filter(user=request.user, image_file=filename)
+                 .values_list('pi_device', flat=True).first()) or ''
+    image_file = get_image_cache(get_image_client(request, pi_device)).open(filename, size)
+    if image_file is None:
+        raise Http404("Không tìm thấy ảnh trên Pi")
+    
+    response = FileResponse(image_file, content_type='image/jpeg')
+    # Tên file trên Pi là duy nhất nên nội dung không đổi
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
 # API endpoints cho AJAX calls
 @login_required
 @require_http_methods(["POST"])
 def api_capture_preview(request):
     """API endpoint: Capture ảnh và trả về ngay để hiển thị (preview) - KHÔNG phân tích"""
     try:
-        result = pi_client.capture_preview()
+        result = get_pi_client(request).capture_preview()
         return JsonResponse(result)
     except Exception as e:
         logger.error(f"[API] Error in capture preview: {e}", exc_info=True)
@@ -421,7 +513,7 @@ def api_analyze_image(request):
         if not filename:
             return JsonResponse({"success": False, "error": "filename is required"}, status=400)
         
-        result = pi_client.analyze_image(filename)
+        result = pi_fleet.analyze_image(get_pi_station(request), filename)
         return JsonResponse(result)
     except json.JSONDecodeError:
         return JsonResponse({"success": False, "error": "Invalid JSON"}, status=400)
@@ -433,15 +525,111 @@ def api_analyze_image(request):
 @login_required
 def api_status(request):
     """API endpoint: Lấy trạng thái Pi"""
-    status = pi_client.get_status()
+    status = get_pi_client(request).get_status()
     return JsonResponse(status)
 
 
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """
+    Metrics định dạng Prometheus (gộp mọi worker nếu đặt PROMETHEUS_MULTIPROC_DIR)
+    Chỉ staff hoặc request có "Authorization: Bearer <METRICS_TOKEN>"; chưa đặt token -> chỉ staff
+    """
+    import hmac
+    from django.conf import settings as django_settings
+    
+    token = django_settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    token_ok = bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    if not token_ok and not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    if not metrics.available():
+        return HttpResponse('prometheus_client chưa được cài đặt', status=503, content_type='text/plain; charset=utf-8')
+    
+    body, content_type = metrics.render()
+    return HttpResponse(body, content_type=content_type)
+
+
+@staff_member_required
+def profiles_view(request):
+    """Trang staff: các profile chậm nhất gần đây (xem services.profiling)"""
+    from django.conf import settings as django_settings
+    
+    try:
+        limit = max(1, min(500, int(request.GET.get('limit', 50))))
+    except (TypeError, ValueError):
+        limit = 50
+    return render(request, 'profiles.html', {
+        'profiles': profiling.get_store().slowest(limit),
+        'enabled': django_settings.PROFILING_ENABLED,
+        'sample_rate': django_settings.PROFILING_SAMPLE_RATE,
+        'routes': django_settings.PROFILING_ROUTES,
+        'header': profiling.PROFILE_HEADER,
+    })
+
+
+@staff_member_required
+def profile_download(request, filename):
+    """Tải file profile (.folded / .prof)"""
+    path = profiling.get_store().file_path(filename)
+    if path is None:
+        raise Http404('Không tìm thấy profile')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
+
+
+@login_required
+def api_fleet_status(request):
+    """API endpoint: Sức khỏe các trạm Pi (?probe=1 để gọi /status của từng trạm) - chỉ staff"""
+    if not request.user.is_staff:
+        return JsonResponse({"success": False, "error": "Không có quyền truy cập"}, status=403)
+    devices = pi_fleet.check_health() if request.GET.get('probe') == '1' else pi_fleet.snapshot()
+    return JsonResponse({
+        "success": True,
+        "station": get_pi_station(request).base_url,
+        "devices": devices,
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def api_status_stream(request):
+    """
+    API endpoint: Stream thay đổi trạng thái Pi (Server-Sent Events)
+    Kết nối đóng sau PI_STATUS_STREAM_MAX_AGE giây, EventSource tự kết nối lại.
+    Cần worker gthread/ASGI: mỗi kết nối giữ một thread trong suốt thời gian đó.
+    """
+    import queue
+    import time
+    from django.conf import settings as django_settings
+    
+    feed = get_status_feed(get_pi_client(request))
+    max_age = django_settings.PI_STATUS_STREAM_MAX_AGE
+    
+    def events():
+        subscriber = feed.subscribe()
+        deadline = time.monotonic() + max_age
+        try:
+            yield "retry: 3000\n\n"
+            while time.monotonic() < deadline:
+                try:
+                    version, status = subscriber.get(timeout=max(0.1, min(15, deadline - time.monotonic())))
+                    yield format_sse(version, status)
+                except queue.Empty:
+                    yield ": ping\n\n"  # heartbeat giữ kết nối
+        finally:
+            feed.unsubscribe(subscriber)
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 @require_http_methods(["POST"])
 def api_pause_stream(request):
     """API endpoint: Tạm dừng stream"""
-    result = pi_client.pause_stream()
+    result = get_pi_client(request).pause_stream()
     return JsonResponse(result)
 
 
@@ -449,23 +637,40 @@ def api_pause_stream(request):
 @require_http_methods(["POST"])
 def api_resume_stream(request):
     """API endpoint: Tiếp tục stream"""
-    result = pi_client.resume_stream()
+    result = get_pi_client(request).resume_stream()
     return JsonResponse(result)
 
 
 @login_required
 def api_get_settings(request):
     """API endpoint: Lấy cấu hình camera"""
-    settings = pi_client.get_settings()
+    settings = get_pi_client(request).get_settings()
     return JsonResponse(settings)
 
 
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def api_camera_status(request):
+    """API endpoint: Trạng thái camera gộp (settings + camera + UI settings + resolution), hỗ trợ If-None-Match"""
+    # Trạng thái được cache phía server (CAMERA_STATE_CACHE_SECONDS): so ETag với bản cache,
+    # chỉ khi hết hạn mới gọi 4 request tới Pi
+    state = get_pi_client(request).get_camera_state()
+    etag = quote_etag(state['version'])
+    
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(state)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @login_required
 @require_http_methods(["POST"])
 def api_set_mode(request):
     """API endpoint: Thiết lập chế độ camera"""
     mode = request.POST.get('mode', 'still')
-    result = pi_client.set_mode(mode)
+    result = get_pi_client(request).set_mode(mode)
     return JsonResponse(result)
 
 
@@ -473,7 +678,7 @@ def api_set_mode(request):
 @require_http_methods(["POST"])
 def api_restart_camera(request):
     """API endpoint: Khởi động lại camera"""
-    result = pi_client.restart_camera()
+    result = get_pi_client(request).restart_camera()
     return JsonResponse(result)
 
 
@@ -481,14 +686,14 @@ def api_restart_camera(request):
 @require_http_methods(["POST"])
 def api_reload_model(request):
     """API endpoint: Tải lại model"""
-    result = pi_client.reload_model()
+    result = get_pi_client(request).reload_model()
     return JsonResponse(result)
 
 
 @login_required
 def api_get_camera_settings(request):
     """API endpoint: Lấy thông số camera hiện tại"""
-    settings = pi_client.get_camera_settings()
+    settings = get_pi_client(request).get_camera_settings()
     return JsonResponse(settings)
 
 
@@ -499,7 +704,7 @@ def api_set_camera_settings(request):
     import json
     try:
         data = json.loads(request.body)
-        result = pi_client.set_camera_settings(data)
+        result = get_pi_client(request).set_camera_settings(data)
         return JsonResponse(result)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
@@ -513,7 +718,7 @@ def api_apply_preset(request):
     try:
         data = json.loads(request.body)
         preset_name = data.get("preset", "daylight")
-        result = pi_client.apply_preset(preset_name)
+        result = get_pi_client(request).apply_preset(preset_name)
         return JsonResponse(result)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
@@ -522,14 +727,14 @@ def api_apply_preset(request):
 @login_required
 def api_get_presets(request):
     """API endpoint: Lấy danh sách preset hệ thống"""
-    result = pi_client.get_available_presets()
+    result = get_pi_client(request).get_available_presets()
     return JsonResponse(result)
 
 
 @login_required
 def api_get_resolution_info(request):
     """API endpoint: Lấy thông tin resolution hiện tại"""
-    result = pi_client.get_resolution_info()
+    result = get_pi_client(request).get_resolution_info()
     return JsonResponse(result)
 
 
@@ -541,7 +746,7 @@ def api_change_resolution(request):
     try:
         data = json.loads(request.body)
         profile_name = data.get("profile")
-        result = pi_client.change_resolution(profile_name)
+        result = get_pi_client(request).change_resolution(profile_name)
         return JsonResponse(result)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
@@ -550,7 +755,7 @@ def api_change_resolution(request):
 @login_required
 def api_get_resolution_profiles(request):
     """API endpoint: Lấy danh sách resolution profiles"""
-    result = pi_client.get_resolution_profiles()
+    result = get_pi_client(request).get_resolution_profiles()
     return JsonResponse(result)
 
 
@@ -558,14 +763,14 @@ def api_get_resolution_profiles(request):
 @login_required
 def api_get_ui_settings_definitions(request):
     """API endpoint: Lấy definitions của UI settings"""
-    result = pi_client.get_ui_settings_definitions()
+    result = get_pi_client(request).get_ui_settings_definitions()
     return JsonResponse(result)
 
 
 @login_required
 def api_get_current_ui_settings(request):
     """API endpoint: Lấy UI settings hiện tại"""
-    result = pi_client.get_current_ui_settings()
+    result = get_pi_client(request).get_current_ui_settings()
     return JsonResponse(result)
 
 
@@ -579,7 +784,7 @@ def api_apply_ui_settings(request):
         ui_settings = data.get("ui_settings", {})
         if not ui_settings:
             return JsonResponse({"error": "Missing ui_settings"}, status=400)
-        result = pi_client.apply_ui_settings(ui_settings)
+        result = get_pi_client(request).apply_ui_settings(ui_settings)
         return JsonResponse(result)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
@@ -656,7 +861,7 @@ def api_load_user_preset(request):
         preset = get_object_or_404(UserCameraPreset, id=preset_id, user=request.user)
         
         # Áp dụng settings lên Pi
-        result = pi_client.set_camera_settings(preset.settings)
+        result = get_pi_client(request).set_camera_settings(preset.settings)
         
         if result.get('error'):
             return JsonResponse({"error": result['error']}, status=400)
@@ -704,7 +909,7 @@ def api_start_video_recording(request):
         data = json.loads(request.body) if request.body else {}
         duration = data.get('duration')  # Optional: thời gian quay (giây)
         
-        result = pi_client.start_video_recording(duration=duration)
+        result = get_pi_client(request).start_video_recording(duration=duration)
         return JsonResponse(result)
     except json.JSONDecodeError:
         return JsonResponse({"success": False, "error": "Invalid JSON"}, status=400)
@@ -718,7 +923,7 @@ def api_start_video_recording(request):
 def api_stop_video_recording(request):
     """API endpoint: Dừng quay video và lưu trên Pi - KHÔNG lưu vào DB"""
     try:
-        result = pi_client.stop_video_recording()
+        result = get_pi_client(request).stop_video_recording()
         # Video được lưu trực tiếp trên Pi, không cần lưu vào Django DB
         return JsonResponse(result)
     except Exception as e:
@@ -729,7 +934,7 @@ def api_stop_video_recording(request):
 @login_required
 def api_get_video_recording_status(request):
     """API endpoint: Lấy trạng thái recording"""
-    status = pi_client.get_video_recording_status()
+    status = get_pi_client(request).get_video_recording_status()
     return JsonResponse(status)
 
 
@@ -744,9 +949,12 @@ def api_detect_leaves(request):
     
     print("=== YOLO DETECT API CALLED - PRINT TEST ===")
     
+    import time
+    
     try:
         print("Step 1: Importing YOLO detector...")
         from .services.yolo_service import yolo_detector
+        from .services.detection_controller import Overloaded, detection_controller
         print("Step 2: YOLO detector imported successfully")
         
         logger.info("=== YOLO DETECT API CALLED ===")
@@ -754,7 +962,7 @@ def api_detect_leaves(request):
         # Get stream URL
         print("Step 3: Getting stream URL...")
         logger.info("Getting stream URL from Pi client...")
-        stream_url = pi_client.get_stream_url()
+        stream_url = get_pi_client(request).get_stream_url()
         print(f"Step 4: Stream URL = {stream_url}")
         logger.info(f"Stream URL: {stream_url}")
         
@@ -769,6 +977,9 @@ def api_detect_leaves(request):
         print(f"Step 6: Using confidence = {confidence}")
         logger.info(f"Using confidence threshold: {confidence}")
         
+        # ?tiled=1 / ?tiled=0 bắt buộc bật/tắt suy luận theo ô (mặc định: tùy kích thước frame)
+        tiled = {'1': True, '0': False}.get(request.GET.get('tiled'))
+        
         # Run YOLO detection
         print("Step 7: Starting YOLO detection...")
         logger.info("Starting YOLO detection...")
@@ -776,12 +987,41 @@ def api_detect_leaves(request):
         # Use YOLO service with snapshot capture
         print(f"Step 7a: Using Pi stream URL with snapshot capture: {stream_url}")
         
-        result = yolo_detector.detect_leaves_from_url(stream_url, confidence)
+        # Stream vừa được quét trong chu kỳ hiện tại -> trả lại kết quả gần nhất (không chạy YOLO)
+        stream_key = f"{stream_url}|{confidence}|{tiled}"
+        cached = detection_controller.cached_result(stream_key)
+        if cached is not None:
+            state = detection_controller.state()
+            return JsonResponse({**cached, "cached": True, "controller": state,
+                                 "next_interval_ms": state['next_interval_ms']})
+        
+        try:
+            with detection_controller.slot():
+                # Đo đúng phần giữ suất (chụp + YOLO + encode ảnh preview) cho EWMA của controller
+                started = time.perf_counter()
+                result = yolo_detector.detect_leaves_from_url(stream_url, confidence, tiled=tiled,
+                                                              imgsz=detection_controller.imgsz)
+                busy_ms = (time.perf_counter() - started) * 1000
+        except Overloaded as e:
+            metrics.DETECTION_REJECTED.inc()
+            response = JsonResponse({
+                "success": False,
+                "error": "Server đang quá tải, thử lại sau",
+                "retry_after_ms": e.retry_after_ms,
+                "next_interval_ms": e.retry_after_ms,
+            }, status=503)
+            response['Retry-After'] = str(max(1, round(e.retry_after_ms / 1000)))
+            return response
+        
+        if result.get('success'):
+            detection_controller.record(busy_ms)
+            detection_controller.remember(stream_key, result)
         print(f"Step 8: YOLO detection completed with result: {result.get('success', False) if result else 'None'}")
         logger.info(f"YOLO detection result: {result.get('success', False) if result else 'None'}")
         
         print("Step 9: Returning JSON response")
-        return JsonResponse(result)
+        state = detection_controller.state()
+        return JsonResponse({**result, "controller": state, "next_interval_ms": state['next_interval_ms']})
         
     except Exception as e:
         print(f"EXCEPTION in api_detect_leaves: {str(e)}")
@@ -789,15 +1029,143 @@ def api_detect_leaves(request):
         return JsonResponse({"success": False, "error": str(e)}, status=500)
 
 
+def _resolve_plants(labels):
+    """Tìm Plant cho nhiều nhãn bằng một query (tạo mới nhãn chưa có, giống luồng một lá)"""
+    labels = {label for label in labels if label}
+    if not labels:
+        return {}
+    query = Q()
+    for label in labels:
+        query |= Q(scientific_name__iexact=label) | Q(name__iexact=label)
+    
+    plants = {}
+    for plant in Plant.objects.filter(query).order_by('id'):
+        for key in (plant.scientific_name, plant.name):
+            plants.setdefault((key or '').lower(), plant)
+    
+    resolved = {}
+    for label in labels:
+        plant = plants.get(label.lower())
+        if plant is None:
+            plant = Plant.objects.create(scientific_name=label, name=label, should_save=True)
+            plants[label.lower()] = plant
+        resolved[label] = plant
+    return resolved
+
+
+def _frame_seq(data):
+    """frame_seq client gửi lại từ kết quả detect (frame trong ring shared memory), None nếu không có"""
+    try:
+        seq = int(data.get('frame_seq') or 0)
+    except (TypeError, ValueError):
+        return None
+    return seq if seq > 0 else None
+
+
+def _confidence(data):
+    """Ngưỡng confidence trong body (mặc định 0.5, kẹp trong 0.1-0.9); None nếu không phải số"""
+    import math
+
+    try:
+        confidence = float(data.get('confidence', 0.5))
+    except (TypeError, ValueError):
+        return None
+    return max(0.1, min(0.9, confidence)) if math.isfinite(confidence) else None
+
+
+def _crop_leaves_batch(request, data):
+    """
+    Chế độ nhiều lá của api_crop_leaf: bboxes = danh sách bbox hoặc "all" (mọi lá YOLO tìm thấy).
+    Một frame, cắt bằng slicing, phân loại theo lô, lưu CaptureResult bằng bulk_create.
+    """
+    from .services.yolo_service import yolo_detector
+    from .services.leaf_pipeline import normalize_bboxes, run_leaf_pipeline, stage
+    from .services.capture_stats import bulk_create_captures
+    
+    bboxes = None
+    if data.get('bboxes') != 'all':
+        bboxes = normalize_bboxes(data.get('bboxes'))
+        if bboxes is None:
+            return JsonResponse({"success": False, "error": "Bounding box không hợp lệ"}, status=400)
+    
+    stream_url = get_pi_client(request).get_stream_url()
+    if not stream_url:
+        return JsonResponse({"success": False, "error": "Stream không khả dụng"}, status=400)
+    
+    confidence = _confidence(data)
+    if confidence is None:
+        return JsonResponse({"success": False, "error": "Confidence không hợp lệ"}, status=400)
+    timestamp = dj_timezone.now()
+    prefix = f"yolo_crop_{request.user.id}_{timestamp.strftime('%Y%m%d_%H%M%S')}"
+    result = run_leaf_pipeline(
+        yolo_detector, pi_fleet, stream_url,
+        confidence=confidence, bboxes=bboxes, keep_jpeg=True, filename_prefix=prefix,
+        frame_seq=_frame_seq(data),
+    )
+    if not result['success']:
+        return JsonResponse(result, status=400)
+    
+    leaves = result['leaves']
+    with stage(result['timings_ms'], 'save'):
+        plants = _resolve_plants(
+            (leaf['classification'].get('name') or '').strip()
+            for leaf in leaves if leaf['classification'].get('success')
+        )
+        captures, captured_leaves = [], []
+        for i, leaf in enumerate(leaves):
+            saved_path = default_storage.save(
+                f"yolo_crops/{timestamp:%Y/%m/%d}/{prefix}_{i}.jpg", ContentFile(leaf.pop('jpeg'))
+            )
+            leaf['saved_file_path'] = saved_path
+            leaf['saved_file_url'] = default_storage.url(saved_path)
+            
+            classification = leaf['classification']
+            label = (classification.get('name') or '').strip()
+            plant = plants.get(label)
+            if not classification.get('success') or plant is None:
+                leaf['saved_to_history'] = False
+                continue
+            
+            leaf['analysis'] = {'name': label, 'confidence': classification.get('confidence', 0), 'plant_id': plant.id}
+            leaf['saved_to_history'] = plant.should_save
+            if plant.should_save:
+                captures.append(CaptureResult(
+                    user=request.user,
+                    plant=plant,
+                    name=label,
+                    confidence=classification.get('confidence', 0),
+                    image_file=classification.get('file', ''),
+                    pi_device=image_device(classification),
+                    local_image=saved_path,
+                    success=True,
+                    source='yolo_crop',
+                    raw=classification,
+                ))
+                captured_leaves.append(leaf)
+        
+        for leaf, capture in zip(captured_leaves, bulk_create_captures(captures)):
+            leaf['capture_id'] = capture.id
+    timings = result['timings_ms']
+    timings['total'] = round(timings['total'] + timings['save'], 1)
+    
+    result['saved_count'] = len(captures)
+    result['message'] = f"Đã phân tích {result['classified']}/{result['total_leaves']} lá, lưu {len(captures)} kết quả"
+    logger.info(f"YOLO batch crop: {result['message']}, timings={result['timings_ms']}")
+    return JsonResponse(result)
+
+
 @login_required
 @require_http_methods(["POST"])
 def api_crop_leaf(request):
-    """API endpoint: Crop specific leaf from stream and analyze"""
+    """API endpoint: Crop specific leaf from stream and analyze (bboxes=[...] hoặc "all" để xử lý nhiều lá)"""
     from .services.yolo_service import yolo_detector
     import json
     
     try:
         data = json.loads(request.body)
+        if 'bboxes' in data:
+            return _crop_leaves_batch(request, data)
+        
         bbox = data.get('bbox')
         
         if not bbox:
@@ -809,12 +1177,12 @@ def api_crop_leaf(request):
             return JsonResponse({"success": False, "error": "Bounding box không hợp lệ"}, status=400)
         
         # Get stream URL
-        stream_url = pi_client.get_stream_url()
+        stream_url = get_pi_client(request).get_stream_url()
         if not stream_url:
             return JsonResponse({"success": False, "error": "Stream không khả dụng"}, status=400)
         
         # Crop leaf from stream
-        crop_result = yolo_detector.crop_leaf_from_stream(stream_url, bbox)
+        crop_result = yolo_detector.crop_leaf_from_stream(stream_url, bbox, frame_seq=_frame_seq(data))
         
         if not crop_result['success']:
             return JsonResponse(crop_result, status=400)
@@ -852,7 +1220,7 @@ def api_crop_leaf(request):
                 
                 # Use Pi client to upload and analyze
                 pi_filename = f"yolo_crop_{timestamp.strftime('%Y%m%d_%H%M%S')}.jpg"
-                upload_result = pi_client.upload_image(cropped_image_data, pi_filename, 'image/jpeg')
+                upload_result = pi_fleet.upload_image(cropped_image_data, pi_filename, 'image/jpeg')
                 
                 if upload_result.get('success'):
                     # Extract analysis results (same as upload_analyze logic)
@@ -883,6 +1251,7 @@ def api_crop_leaf(request):
                             name=label,
                             confidence=confidence,
                             image_file=upload_result.get('file', ''),
+                            pi_device=image_device(upload_result),
                             local_image=saved_path,
                             success=True,
                             source='yolo_crop',
@@ -922,6 +1291,62 @@ def api_crop_leaf(request):
         return JsonResponse({"success": False, "error": str(e)}, status=500)
 
 
+@login_required
+@require_http_methods(["POST"])
+def api_yolo_pipeline(request):
+    """API endpoint: Một lần gọi - chụp frame, detect, cắt và phân loại các lá (kèm thời gian từng bước)"""
+    from .services.yolo_service import yolo_detector
+    from .services.leaf_pipeline import normalize_bboxes, run_leaf_pipeline
+    import json
+    
+    try:
+        data = json.loads(request.body or b'{}')
+        confidence = _confidence(data)
+        if confidence is None:
+            return JsonResponse({"success": False, "error": "Confidence không hợp lệ"}, status=400)
+        
+        bboxes = None
+        if data.get('bboxes') not in (None, 'all'):
+            bboxes = normalize_bboxes(data.get('bboxes'))
+            if bboxes is None:
+                return JsonResponse({"success": False, "error": "Bounding box không hợp lệ"}, status=400)
+        
+        stream_url = get_pi_client(request).get_stream_url()
+        if not stream_url:
+            return JsonResponse({"success": False, "error": "Stream không khả dụng"}, status=400)
+        
+        result = run_leaf_pipeline(
+            yolo_detector, pi_fleet, stream_url,
+            confidence=confidence,
+            bboxes=bboxes,
+            return_crops=bool(data.get('return_crops', False)),
+            filename_prefix=f"yolo_crop_{request.user.id}",
+            frame_seq=_frame_seq(data),
+        )
+        logger.info(f"YOLO pipeline: {result.get('total_leaves', 0)} leaves, timings={result['timings_ms']}")
+        return JsonResponse(result, status=200 if result['success'] else 400)
+        
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return JsonResponse({"success": False, "error": "Invalid JSON data"}, status=400)
+    except Exception as e:
+        logger.error(f"YOLO pipeline error: {str(e)}", exc_info=True)
+        return JsonResponse({"success": False, "error": str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+def api_yolo_ready(request):
+    """
+    Readiness: 200 khi model YOLO đã sẵn sàng, 503 khi đang load / lỗi (dùng cho health check)
+    Chi tiết (đường dẫn model, lỗi, thời gian load) chỉ trả cho staff
+    """
+    from .services.model_lifecycle import yolo_status
+
+    status = yolo_status()
+    if not request.user.is_staff:
+        status = {'ready': status['ready']}
+    return JsonResponse(status, status=200 if status['ready'] else 503)
+
+
 @login_required
 @require_http_methods(["POST"]) 
 def api_analyze_cropped_leaf(request):
@@ -942,12 +1367,13 @@ def api_analyze_cropped_leaf(request):
             image_data = base64.b64decode(image_b64)
         except Exception as e:
             return JsonResponse({"success": False, "error": "Ảnh không hợp lệ"}, status=400)
+        metrics.UPLOAD_SIZE_BYTES.labels('yolo_crop').observe(len(image_data))
         
         # Send to Pi for analysis (integrate with existing Pi analysis pipeline)
         filename = f"yolo_crop_{dj_timezone.now().strftime('%Y%m%d_%H%M%S')}.jpg"
         
         # Upload to Pi
-        upload_result = pi_client.upload_image(image_data, filename, 'image/jpeg')
+        upload_result = pi_fleet.upload_image(image_data, filename, 'image/jpeg')
         
         if not upload_result.get('success'):
             return JsonResponse({
@@ -955,8 +1381,13 @@ def api_analyze_cropped_leaf(request):
                 "error": upload_result.get('error', 'Upload failed')
             }, status=400)
         
-        # Analyze uploaded image
-        analysis_result = pi_client.analyze_image(filename)
+        # Analyze uploaded image (trên chính trạm đã nhận ảnh)
+        if upload_result.get('backend') == 'local':
+            # Classifier cục bộ đã trả kết quả phân loại ngay khi upload
+            analysis_result = upload_result
+        else:
+            device = pi_fleet.device_for_url(upload_result.get('pi_device')) or get_pi_station(request)
+            analysis_result = pi_fleet.call(device, lambda client: client.analyze_image(filename))
         
         if not analysis_result.get('success'):
             return JsonResponse({
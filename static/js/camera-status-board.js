@@ -51,6 +51,9 @@ class CameraStatusBoard {
             profile: 'full_hd'
         };
         
+        // Version của trạng thái camera lần load gần nhất (ETag từ server)
+        this.version = null;
+        
         // Listeners để notify khi có thay đổi
         this.listeners = [];
     }
@@ -153,16 +156,25 @@ class CameraStatusBoard {
         try {
             console.log('[StatusBoard] Loading from camera...');
             
+            // Một request gộp cả 4 nguồn (server gọi Pi song song, trả 304 nếu không đổi)
+            const response = await fetch('/api/camera/status/', { cache: 'no-cache' });
+            const state = await response.json();
+            
+            if (state.version && state.version === this.version) {
+                // Không đổi (server trả 304, trình duyệt dùng lại body đã cache) -> không vẽ lại
+                console.log('[StatusBoard] Camera state unchanged');
+                return;
+            }
+            this.version = state.version || null;
+            
             // Load system settings
-            const settingsResponse = await fetch('/api/settings/');
-            const settingsData = await settingsResponse.json();
+            const settingsData = state.settings || {};
             if (!settingsData.error) {
                 this.updateSystemInfo(settingsData);
             }
             
             // Load technical settings
-            const cameraResponse = await fetch('/api/settings/camera/');
-            const cameraData = await cameraResponse.json();
+            const cameraData = state.camera || {};
             
             if (!cameraData.error) {
                 let settings = cameraData.settings || cameraData;
@@ -172,8 +184,7 @@ class CameraStatusBoard {
             }
             
             // Load UI settings
-            const uiResponse = await fetch('/api/ui/settings/current/');
-            const uiData = await uiResponse.json();
+            const uiData = state.ui_settings || {};
             
             if (!uiData.error) {
                 let uiSettings = uiData.ui_settings || uiData;
@@ -184,8 +195,7 @@ class CameraStatusBoard {
             }
             
             // Load resolution info
-            const resolutionResponse = await fetch('/api/resolution/');
-            const resolutionData = await resolutionResponse.json();
+            const resolutionData = state.resolution || {};
             
             if (!resolutionData.error && resolutionData.resolution_main) {
                 this.updateResolutionInfo(resolutionData);
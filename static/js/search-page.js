@@ -25,9 +25,8 @@ document.addEventListener('DOMContentLoaded', function() {
 });
 
 function initializeSearchPage() {
-    // Kiểm tra trạng thái khi load
-    checkPiStatus();
-    setInterval(checkPiStatus, 30000);
+    // Nhận trạng thái Pi qua SSE (server poll Pi một lần cho mọi tab)
+    subscribePiStatus();
     loadUnifiedPresets();
     
     // Load camera status từ StatusBoard khi trang load
@@ -280,7 +279,7 @@ function setupCaptureForm() {
             captureBtn.textContent = '🔍 Đang phân tích...';
             showAnalysisPanelLoading({
                 file: data.file,
-                image_url: capturedImageUrl || (data.image_url ? (data.image_url.startsWith('/') ? window.PI_BASE_URL + data.image_url : data.image_url) : ''),
+                image_url: capturedImageUrl || (data.image_url ? (data.image_url.startsWith('/') ? piImageUrl(data.image_url) : data.image_url) : ''),
                 image_size_bytes: data.image_size_bytes
             });
             
@@ -316,12 +315,27 @@ function setupCaptureForm() {
     });
 }
 
+/**
+ * URL ảnh trên Pi - đi qua proxy cache của server (/api/pi/image/) thay vì tải trực tiếp từ Pi
+ */
+function piImageUrl(imageUrlOrFile) {
+    const historyPrefix = '/history/image/';
+    if (imageUrlOrFile.startsWith('/api/pi/image/')) {
+        return imageUrlOrFile;
+    } else if (imageUrlOrFile.startsWith(historyPrefix)) {
+        imageUrlOrFile = imageUrlOrFile.slice(historyPrefix.length);
+    } else if (imageUrlOrFile.startsWith('/')) {
+        return window.PI_BASE_URL + imageUrlOrFile;
+    }
+    return '/api/pi/image/' + encodeURIComponent(imageUrlOrFile) + '/';
+}
+
 function getCapturedImageUrl(data) {
     // Ưu tiên dùng image_url hoặc file path để có ảnh full size, tránh dùng thumbnail bị resize sai tỷ lệ
     if (data.image_url) {
-        return data.image_url.startsWith('/') ? window.PI_BASE_URL + data.image_url : data.image_url;
+        return data.image_url.startsWith('/') ? piImageUrl(data.image_url) : data.image_url;
     } else if (data.file) {
-        return window.PI_BASE_URL + '/history/image/' + data.file;
+        return piImageUrl(data.file);
     } else if (data.image_b64) {
         return 'data:image/jpeg;base64,' + data.image_b64;
     } else if (data.image_b64_thumbnail) {
@@ -494,10 +508,10 @@ function updateAnalysisPanelWithResult(analysisResult) {
         preservedImageUrl = currentAnalysisData.image_url;
     } else if (analysisResult.image_url) {
         preservedImageUrl = analysisResult.image_url.startsWith('/') ? 
-                            window.PI_BASE_URL + analysisResult.image_url : 
+                            piImageUrl(analysisResult.image_url) : 
                             analysisResult.image_url;
     } else if (analysisResult.file) {
-        preservedImageUrl = window.PI_BASE_URL + '/history/image/' + analysisResult.file;
+        preservedImageUrl = piImageUrl(analysisResult.file);
     }
     
     const { image_url: _, ...analysisResultWithoutImageUrl } = analysisResult;
@@ -5,28 +5,7 @@ async function checkPiStatus() {
     try {
         const response = await fetch('/api/status/');
         const data = await response.json();
-        
-        const statusEl = document.getElementById('piStatus');
-        const statusText = document.getElementById('statusText');
-        
-        if (data.error) {
-            statusEl.style.background = '#fee';
-            statusEl.style.color = '#c00';
-            statusText.textContent = '❌ Pi không khả dụng: ' + data.error;
-        } else {
-            const cameraState = data.camera?.state || 'unknown';
-            const modelLoaded = data.model_loaded || false;
-            
-            if (cameraState === 'streaming' && modelLoaded) {
-                statusEl.style.background = '#efe';
-                statusEl.style.color = '#060';
-                statusText.textContent = '✅ Pi sẵn sàng - Camera: ' + cameraState + ', Model: Đã tải';
-            } else {
-                statusEl.style.background = '#ffe';
-                statusEl.style.color = '#660';
-                statusText.textContent = '⚠️ Pi: Camera=' + cameraState + ', Model=' + (modelLoaded ? 'Đã tải' : 'Chưa tải');
-            }
-        }
+        renderPiStatus(data);
     } catch (error) {
         const statusEl = document.getElementById('piStatus');
         const statusText = document.getElementById('statusText');
@@ -36,6 +15,54 @@ async function checkPiStatus() {
     }
 }
 
+// Nhận thay đổi trạng thái Pi từ server (SSE) thay vì poll mỗi 30 giây
+function subscribePiStatus() {
+    if (window.piStatusSource) return;
+    
+    if (!window.EventSource) {
+        // Trình duyệt không hỗ trợ SSE: quay lại cách poll cũ
+        checkPiStatus();
+        setInterval(checkPiStatus, 30000);
+        window.piStatusSource = 'polling';
+        return;
+    }
+    
+    const source = new EventSource('/api/status/stream/');
+    source.addEventListener('status', (event) => {
+        try {
+            renderPiStatus(JSON.parse(event.data));
+        } catch (error) {
+            console.error('[PiStatus] Invalid status event:', error);
+        }
+    });
+    window.piStatusSource = source;
+}
+
+// Hiển thị trạng thái Pi
+function renderPiStatus(data) {
+    const statusEl = document.getElementById('piStatus');
+    const statusText = document.getElementById('statusText');
+    
+    if (data.error) {
+        statusEl.style.background = '#fee';
+        statusEl.style.color = '#c00';
+        statusText.textContent = '❌ Pi không khả dụng: ' + data.error;
+    } else {
+        const cameraState = data.camera?.state || 'unknown';
+        const modelLoaded = data.model_loaded || false;
+        
+        if (cameraState === 'streaming' && modelLoaded) {
+            statusEl.style.background = '#efe';
+            statusEl.style.color = '#060';
+            statusText.textContent = '✅ Pi sẵn sàng - Camera: ' + cameraState + ', Model: Đã tải';
+        } else {
+            statusEl.style.background = '#ffe';
+            statusEl.style.color = '#660';
+            statusText.textContent = '⚠️ Pi: Camera=' + cameraState + ', Model=' + (modelLoaded ? 'Đã tải' : 'Chưa tải');
+        }
+    }
+}
+
 // Pause stream
 async function pauseStream() {
     try {
@@ -598,6 +625,7 @@ async function refreshCameraStatus() {
 // Export functions to global scope
 window.getCsrfToken = getCsrfToken;
 window.checkPiStatus = checkPiStatus;
+window.subscribePiStatus = subscribePiStatus;
 window.pauseStream = pauseStream;
 window.resumeStream = resumeStream;
 window.restartCamera = restartCamera;
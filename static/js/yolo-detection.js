@@ -57,21 +57,22 @@ class YOLOLeafDetector {
         this.isDetecting = true;
         this.showDetectionStatus('🔄 Đang quét lá...', 'info');
         
-        // Run initial detection
-        await this.runDetection();
-        
-        // Set up interval for continuous detection
-        this.detectionInterval = setInterval(async () => {
+        // Quét liên tục: lần sau chỉ bắt đầu khi lần trước xong, chờ theo chu kỳ server đề nghị
+        // (next_interval_ms giãn ra khi server quá tải), không có thì dùng intervalMs
+        const loop = async () => {
+            if (!this.isDetecting) return;
+            const nextMs = await this.runDetection();
             if (this.isDetecting) {
-                await this.runDetection();
+                this.detectionInterval = setTimeout(loop, nextMs || intervalMs);
             }
-        }, intervalMs);
+        };
+        await loop();
     }
     
     stopDetection() {
         this.isDetecting = false;
         if (this.detectionInterval) {
-            clearInterval(this.detectionInterval);
+            clearTimeout(this.detectionInterval);
             this.detectionInterval = null;
         }
         this.clearCanvas();
@@ -121,8 +122,14 @@ class YOLOLeafDetector {
             const result = await response.json();
             console.log('Response data:', result);
             
+            if (response.status === 503 && result.retry_after_ms) {
+                this.showDetectionStatus('⏳ Server đang bận, sẽ thử lại...', 'info');
+                return result.retry_after_ms;
+            }
+            
             if (result.success) {
                 this.detections = result.detections || [];
+                this.frameSeq = result.frame_seq || null;  // Crop đúng frame đã detect (nếu server còn giữ)
                 console.log('Detections found:', this.detections.length);
                 this.drawBoundingBoxes();
                 this.showDetectionStatus(`🍃 Tìm thấy ${result.total_leaves} lá`, 'success');
@@ -131,6 +138,9 @@ class YOLOLeafDetector {
                 this.showDetectionStatus(`❌ Lỗi: ${result.error}`, 'error');
             }
             
+            console.log('=== YOLO DETECTION DEBUG END ===');
+            return result.next_interval_ms;
+            
         } catch (error) {
             console.error('YOLO detection error:', error);
             console.log('Error details:', {
@@ -316,6 +326,7 @@ class YOLOLeafDetector {
                 },
                 body: JSON.stringify({
                     bbox: detection.bbox,
+                    frame_seq: this.frameSeq,
                     auto_analyze: false  // Just crop and save locally
                 })
             });
@@ -440,6 +451,7 @@ class YOLOLeafDetector {
                 },
                 body: JSON.stringify({
                     bbox: detection.bbox,
+                    frame_seq: this.frameSeq,
                     auto_analyze: false
                 })
             });